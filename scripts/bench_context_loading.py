@@ -0,0 +1,142 @@
+"""
+Benchmark: round trips y latencia por mensaje al cargar el contexto de una conversación.
+
+Compara el camino anterior de process_message_batch():
+    get_or_create_user → get_latest_conversation → save_message → get_conversation_history
+contra el cargador combinado:
+    load_conversation_context → save_message
+y contra el mismo cargador con las cachés en proceso calientes (identidad + buffer
+de historial), que es el estado estable de un prospecto que sigue escribiendo.
+
+Cada iteración corre en su propia sesión y hace rollback, así que la BD no crece.
+Los datos de prueba se crean bajo el tenant 'bench_tenant' y se borran al final.
+
+Uso:
+    python scripts/bench_context_loading.py                 # usa DATABASE_URL del .env
+    python scripts/bench_context_loading.py --iterations 500 --history 40
+    python scripts/bench_context_loading.py --url mysql+aiomysql://root:@127.0.0.1:3306/comm_agent_test
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+# Asegurar que el path sea correcto para importar desde src
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import delete, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from src.database import crud
+from src.database.connection import DATABASE_URL
+from src.database.history_buffer import history_buffer
+from src.database.identity_cache import identity_cache
+from src.database.models import Conversation, Message, User
+from src.models.message import IncomingMessage
+
+TENANT = "bench_tenant"
+HISTORY_LIMIT = 10
+
+
+def make_message(text: str) -> IncomingMessage:
+    return IncomingMessage(platform="web", platform_user_id="bench_user", tenant_id=TENANT, content=text)
+
+
+async def seed(session_factory, history: int):
+    async with session_factory() as session:
+        user = await crud.get_or_create_user(session, make_message("seed"))
+        conversation = await crud.get_or_create_active_conversation(session, user.id, TENANT)
+        for i in range(history):
+            role = "user" if i % 2 == 0 else "assistant"
+            await crud.save_message(session, conversation.id, TENANT, role=role, content=f"Mensaje de prueba #{i}")
+        await session.commit()
+
+
+async def cleanup(session_factory):
+    async with session_factory() as session:
+        await session.execute(delete(Message).where(Message.tenant_id == TENANT))
+        await session.execute(delete(Conversation).where(Conversation.tenant_id == TENANT))
+        await session.execute(delete(User).where(User.tenant_id == TENANT))
+        await session.commit()
+
+
+async def legacy_path(session: AsyncSession, message: IncomingMessage):
+    user = await crud.get_or_create_user(session, message)
+    conversation = await crud.get_latest_conversation(session, user.id, message.tenant_id)
+    await crud.save_message(session, conversation.id, message.tenant_id, role="user", content=message.content)
+    return await crud.get_conversation_history(session, conversation.id, message.tenant_id, limit=HISTORY_LIMIT)
+
+
+async def loader_path(session: AsyncSession, message: IncomingMessage):
+    user, conversation, context = await crud.load_conversation_context(session, message, history_limit=HISTORY_LIMIT)
+    await crud.save_message(session, conversation.id, message.tenant_id, role="user", content=message.content)
+    context.append({"role": "user", "content": message.content})
+    return context[-HISTORY_LIMIT:]
+
+
+async def measure(name, path, session_factory, counter, iterations, warm=False):
+    latencies = []
+    round_trips = []
+    for i in range(iterations):
+        # Cada iteración hace rollback: el buffer no puede conservar el mensaje descartado
+        identity_cache.clear()
+        history_buffer.clear()
+        if warm:
+            async with session_factory() as session:
+                await crud.load_conversation_context(session, make_message("warm"), history_limit=HISTORY_LIMIT)
+        async with session_factory() as session:
+            # Calentar la conexión fuera de la medición (pool_pre_ping, BEGIN, etc.)
+            await session.connection()
+            counter["n"] = 0
+            start = time.perf_counter()
+            await path(session, make_message(f"¿Tienen pHmetros? #{i}"))
+            latencies.append((time.perf_counter() - start) * 1000)
+            round_trips.append(counter["n"])
+            await session.rollback()
+
+    latencies.sort()
+    return {
+        "path": name,
+        "round_trips": statistics.mean(round_trips),
+        "mean_ms": statistics.mean(latencies),
+        "p50_ms": latencies[len(latencies) // 2],
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+
+async def main(url: str, iterations: int, history: int):
+    engine = create_async_engine(url, pool_pre_ping=True)
+    counter = {"n": 0}
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def count_statement(*_):
+        counter["n"] += 1
+
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False, autoflush=False)
+    await cleanup(session_factory)
+    await seed(session_factory, history)
+    try:
+        results = [
+            await measure("antes (4 pasos)", legacy_path, session_factory, counter, iterations),
+            await measure("después (cargador)", loader_path, session_factory, counter, iterations),
+            await measure("cachés calientes", loader_path, session_factory, counter, iterations, warm=True),
+        ]
+    finally:
+        await cleanup(session_factory)
+        await engine.dispose()
+
+    print(f"\n📊 Carga de contexto — {iterations} iteraciones, historial de {history} mensajes\n")
+    print(f"{'camino':<22}{'round trips':>12}{'media ms':>10}{'p50 ms':>9}{'p95 ms':>9}")
+    for r in results:
+        print(f"{r['path']:<22}{r['round_trips']:>12.1f}{r['mean_ms']:>10.2f}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=DATABASE_URL, help="URL async de SQLAlchemy (por defecto la del .env)")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--history", type=int, default=30, help="Mensajes previos en la conversación de prueba")
+    args = parser.parse_args()
+    asyncio.run(main(args.url, args.iterations, args.history))
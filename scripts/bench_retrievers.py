@@ -0,0 +1,100 @@
+"""
+Benchmark: latencia y coincidencia del top-k entre motores del RAG (ChromaDB vs .npy mapeado).
+
+Un motor con sufijo "+hybrid" se envuelve en HybridRetriever (BM25 + códigos exactos + RRF).
+Ambos motores deben tener el catálogo indexado con el mismo modelo, por ejemplo:
+    python scripts/ingest_catalog.py --dump catalogo.json --backend chroma
+    python scripts/ingest_catalog.py --dump catalogo.json --backend numpy
+
+Todos los motores comparten una sola instancia del Embedder, y su tiempo se mide aparte
+(línea "solo embedding"): la diferencia entre motores es la búsqueda en sí. La columna
+"coincidencia" es la fracción del top-k del primer motor que también devuelve cada uno.
+
+Uso:
+    python scripts/bench_retrievers.py
+    python scripts/bench_retrievers.py --backends chroma,numpy --queries consultas.txt -k 8 --iterations 20
+    python scripts/bench_retrievers.py --backends numpy,numpy+hybrid
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+# Asegurar que el path sea correcto para importar desde src
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.core.retrieval.catalog_retrieval import RAG_DEFAULT_CATALOG, RAG_TOP_K, build_retriever
+from src.core.retrieval.embedder import Embedder
+
+DEFAULT_QUERIES = [
+    "¿Tienen turbidímetros portátiles?",
+    "medidor de pH para agua cruda",
+    "columna C18 para HPLC de 250 mm",
+    "balanza analítica con precisión de 0,1 mg",
+    "espectrofotómetro UV-Vis de doble haz",
+    "equipo para medir oxígeno disuelto en efluentes",
+    "precio del TN-100",
+]
+
+
+def percentile(ordered, p):
+    return ordered[max(0, int(len(ordered) * p) - 1)]
+
+
+async def main(args):
+    queries = DEFAULT_QUERIES
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+
+    # Sin caché de embeddings: cada búsqueda paga el embedding, igual que una consulta nueva
+    embedder = Embedder(cache=None)
+    embedder.warm_up()
+    retrievers = []
+    for backend in args.backends.split(","):
+        name, _, hybrid = backend.strip().partition("+")
+        retriever = build_retriever(name, hybrid=hybrid == "hybrid")
+        getattr(retriever, "vector", retriever).embedder = embedder
+        retriever.warm_up()
+        retrievers.append((backend.strip(), retriever))
+
+    embed_ms = []
+    for _ in range(args.iterations):
+        for query in queries:
+            start = time.perf_counter()
+            embedder.embed([query])
+            embed_ms.append((time.perf_counter() - start) * 1000)
+
+    results, reference = [], {}
+    for label, retriever in retrievers:
+        latencies, overlap = [], []
+        for i in range(args.iterations):
+            for query in queries:
+                start = time.perf_counter()
+                passages = await retriever.search(args.catalog, query, args.k)
+                latencies.append((time.perf_counter() - start) * 1000)
+                if i == 0:
+                    ids = {p.id for p in passages}
+                    expected = reference.setdefault(query, ids)
+                    overlap.append(len(ids & expected) / len(expected) if expected else 1.0)
+        latencies.sort()
+        results.append((label, statistics.mean(latencies), percentile(latencies, 0.5), percentile(latencies, 0.95), statistics.mean(overlap)))
+
+    embed_ms.sort()
+    print(f"\n📊 Búsqueda en '{args.catalog}' — {len(queries)} consultas x {args.iterations}, top-{args.k}\n")
+    print(f"{'motor':<16}{'media ms':>10}{'p50 ms':>9}{'p95 ms':>9}{'coincidencia':>14}")
+    print(f"{'solo embedding':<16}{statistics.mean(embed_ms):>10.2f}{percentile(embed_ms, 0.5):>9.2f}{percentile(embed_ms, 0.95):>9.2f}{'':>14}")
+    for name, mean, p50, p95, overlap in results:
+        print(f"{name:<16}{mean:>10.2f}{p50:>9.2f}{p95:>9.2f}{overlap:>13.0%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default="chroma,numpy", help="Motores separados por coma; el primero es la referencia")
+    parser.add_argument("--catalog", default=RAG_DEFAULT_CATALOG)
+    parser.add_argument("--queries", help="Archivo con una consulta por línea")
+    parser.add_argument("-k", type=int, default=RAG_TOP_K)
+    parser.add_argument("--iterations", type=int, default=10)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,69 @@
+"""
+Ingesta incremental del catálogo de la web PHP en el índice del RAG.
+
+Solo calcula embeddings para los fragmentos nuevos o cuyo texto cambió desde la
+corrida anterior; los productos borrados o inactivos salen del índice. Al final
+imprime cuántos fragmentos se agregaron, cambiaron, se saltaron y se eliminaron.
+
+Uso:
+    python scripts/ingest_catalog.py                              # lee CATALOG_DATABASE_URL del .env
+    python scripts/ingest_catalog.py --dump catalogo.json         # volcado {tabla: [filas]} o .jsonl
+    python scripts/ingest_catalog.py --catalog inasc --dry-run    # solo cuenta, no escribe
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+
+# Asegurar que el path sea correcto para importar desde src
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.core.retrieval.catalog_retrieval import RAG_BACKEND, RAG_DEFAULT_CATALOG, build_retriever
+from src.core.retrieval.ingestion import (
+    CATALOG_BASE_URL,
+    CATALOG_DATABASE_URL,
+    CatalogIngestor,
+    load_products_from_db,
+    load_products_from_dump,
+)
+
+
+def main(args) -> int:
+    if args.dump:
+        products = load_products_from_dump(args.dump, args.base_url)
+    else:
+        products = asyncio.run(load_products_from_db(args.url, args.base_url))
+    print(f"📦 {len(products)} fichas activas leídas de {args.dump or 'la BD del catálogo'}")
+
+    ingestor = CatalogIngestor(build_retriever(args.backend))
+    try:
+        report = ingestor.run(args.catalog, products, allow_empty=args.allow_empty, dry_run=args.dry_run)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+
+    mode = " (dry-run: no se escribió nada)" if args.dry_run else ""
+    print(f"\n📊 Catálogo '{report.catalog}' — {report.products} fichas en {report.seconds:.1f} s{mode}")
+    print(f"   agregados: {report.added}   cambiados: {report.changed}   "
+          f"sin cambios: {report.skipped}   eliminados: {report.removed}")
+    if ingestor.lexical is not None:
+        print(f"   índice léxico (BM25 + códigos): {report.lexical} fragmentos actualizados")
+    cache = ingestor.embedder.cache.stats() if getattr(ingestor.embedder, "cache", None) else None
+    if cache:
+        print(f"   caché de embeddings: {cache['memory_hits'] + cache['disk_hits']} aciertos, "
+              f"{cache['misses']} calculados (hit rate {cache['hit_rate']:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dump", help="Volcado .json / .jsonl en lugar de la BD")
+    parser.add_argument("--url", default=CATALOG_DATABASE_URL, help="URL async de SQLAlchemy de la BD del catálogo")
+    parser.add_argument("--catalog", default=RAG_DEFAULT_CATALOG, help="Catálogo del índice a sincronizar")
+    parser.add_argument("--backend", default=RAG_BACKEND, help="Motor del índice (RAG_BACKEND)")
+    parser.add_argument("--base-url", default=CATALOG_BASE_URL, help="Dominio para las URLs de las fichas")
+    parser.add_argument("--dry-run", action="store_true", help="Cuenta los cambios sin calcular embeddings ni escribir")
+    parser.add_argument("--allow-empty", action="store_true", help="Permite vaciar el índice si la fuente no trae fichas")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,187 @@
+"""
+Load test: techo de concurrencia del worker frente al pool de conexiones de MySQL.
+
+Lanza N conversaciones a la vez con un LLM simulado (asyncio.sleep) y compara:
+    sesión retenida        el turno mantiene su sesión abierta durante la llamada al LLM
+                           (estructura anterior de process_message_batch)
+    transacciones cortas   process_message_batch actual: commit de los entrantes,
+                           LLM sin conexión, segunda transacción para la respuesta
+
+Con sesión retenida, las llamadas al LLM simultáneas nunca superan
+pool_size + max_overflow; el resto de turnos espera una conexión (o falla por
+pool_timeout). Con transacciones cortas el techo lo pone el LLM, no el pool.
+
+Los datos se crean bajo el tenant 'load_tenant' y se borran al final.
+
+Con una URL sqlite+aiosqlite el script crea el esquema y usa el mismo QueuePool que
+MySQL, pero SQLite admite un solo escritor: con sesión retenida los turnos se
+serializan y parte falla con "database is locked". Sirve como prueba de humo; el
+techo del pool solo se mide contra MySQL.
+
+Uso:
+    python scripts/load_test_db_pool.py                         # usa DATABASE_URL del .env
+    python scripts/load_test_db_pool.py --conversations 300 --llm-latency 3
+    python scripts/load_test_db_pool.py --url mysql+aiomysql://root:@127.0.0.1:3306/comm_agent_test
+    python scripts/load_test_db_pool.py --url sqlite+aiosqlite:////tmp/pool.db   # crea el esquema
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from unittest.mock import patch
+
+# Asegurar que el path sea correcto para importar desde src
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import BigInteger, delete
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from src import main as agent
+from src.database import crud
+from src.database.base import Base
+from src.database.connection import DATABASE_URL
+from src.database.history_buffer import history_buffer
+from src.database.identity_cache import identity_cache
+from src.database.models import Conversation, Message, User
+from src.models.message import IncomingMessage
+
+TENANT = "load_tenant"
+
+
+@compiles(BigInteger, "sqlite")
+def _sqlite_bigint(type_, compiler, **kw):
+    # SQLite solo autoincrementa "INTEGER PRIMARY KEY"; los ids del modelo son BIGINT (MySQL)
+    return "INTEGER"
+
+
+class FakeLLM:
+    """LLM simulado: latencia fija y registro del pico de llamadas simultáneas."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.in_flight = 0
+        self.peak = 0
+
+    async def generate_response(self, context, tenant_id="default", conversation_id=None):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            return "Respuesta simulada."
+        finally:
+            self.in_flight -= 1
+
+
+def make_message(i: int) -> IncomingMessage:
+    return IncomingMessage(platform="telegram", platform_user_id=f"load_{i}", tenant_id=TENANT, content=f"Hola #{i}")
+
+
+async def held_session_turn(session_factory, llm: FakeLLM, message: IncomingMessage):
+    """Estructura anterior: una sola sesión abierta durante todo el turno."""
+    async with session_factory() as session:
+        user = await crud.get_or_create_user(session, message)
+        conversation = await crud.get_or_create_active_conversation(session, user.id, message.tenant_id)
+        await crud.save_message(session, conversation.id, message.tenant_id, role="user", content=message.content)
+        context = await crud.get_conversation_history(session, conversation.id, message.tenant_id, limit=10)
+        response_text = await llm.generate_response(context, tenant_id=message.tenant_id)
+        await crud.save_message(session, conversation.id, message.tenant_id, role="assistant", content=response_text)
+        await session.commit()
+    await agent.telegram_responder.send_message(message.platform_user_id, response_text)
+
+
+async def short_transactions_turn(session_factory, llm: FakeLLM, message: IncomingMessage):
+    """process_message_batch real, con el LLM y el canal de salida simulados."""
+    await agent.process_message_batch([message])
+
+
+async def cleanup(session_factory):
+    async with session_factory() as session:
+        await session.execute(delete(Message).where(Message.tenant_id == TENANT))
+        await session.execute(delete(Conversation).where(Conversation.tenant_id == TENANT))
+        await session.execute(delete(User).where(User.tenant_id == TENANT))
+        await session.commit()
+
+
+async def run_scenario(name, turn, args):
+    sqlite = args.url.startswith("sqlite")
+    engine = create_async_engine(
+        args.url,
+        pool_pre_ping=True,
+        # aiosqlite usa NullPool por defecto, que no acepta pool_size: se fuerza el mismo pool que MySQL
+        poolclass=AsyncAdaptedQueuePool if sqlite else None,
+        pool_size=args.pool_size,
+        max_overflow=args.max_overflow,
+        pool_timeout=args.pool_timeout,
+    )
+    if sqlite:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False, autoflush=False)
+    llm = FakeLLM(args.llm_latency)
+    identity_cache.clear()
+    history_buffer.clear()
+    await cleanup(session_factory)
+
+    # Un turno cuenta como exitoso si la respuesta llega al canal de salida
+    # (process_message_batch captura y registra sus propios errores)
+    delivered = []
+
+    async def send_message(recipient_id, text):
+        delivered.append(recipient_id)
+
+    async def guarded(message):
+        try:
+            await turn(session_factory, llm, message)
+        except Exception:
+            pass
+
+    try:
+        with (
+            patch.object(agent, "async_session_factory", session_factory),
+            patch.object(agent.llm_engine, "generate_response", llm.generate_response),
+            patch.object(agent.telegram_responder, "send_message", send_message),
+            patch.object(agent.queue_manager, "mark_task_done", lambda message=None: None),
+        ):
+            start = time.perf_counter()
+            await asyncio.gather(*(guarded(make_message(i)) for i in range(args.conversations)))
+            elapsed = time.perf_counter() - start
+    finally:
+        await cleanup(session_factory)
+        await engine.dispose()
+
+    return {
+        "scenario": name,
+        "peak_llm": llm.peak,
+        "elapsed_s": elapsed,
+        "turns_per_s": len(delivered) / elapsed,
+        "errors": args.conversations - len(delivered),
+    }
+
+
+async def main(args):
+    results = [
+        await run_scenario("sesión retenida", held_session_turn, args),
+        await run_scenario("transacciones cortas", short_transactions_turn, args),
+    ]
+    pool = args.pool_size + args.max_overflow
+    print(
+        f"\n📊 {args.conversations} conversaciones simultáneas, LLM de {args.llm_latency:.1f} s, "
+        f"pool de {pool} conexiones\n"
+    )
+    print(f"{'escenario':<24}{'LLM simultáneos':>16}{'tiempo s':>10}{'turnos/s':>10}{'errores':>9}")
+    for r in results:
+        print(f"{r['scenario']:<24}{r['peak_llm']:>16}{r['elapsed_s']:>10.2f}{r['turns_per_s']:>10.1f}{r['errors']:>9}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=DATABASE_URL, help="URL async de SQLAlchemy (por defecto la del .env)")
+    parser.add_argument("--conversations", type=int, default=200)
+    parser.add_argument("--llm-latency", type=float, default=2.0, help="Segundos que tarda el LLM simulado")
+    parser.add_argument("--pool-size", type=int, default=10)
+    parser.add_argument("--max-overflow", type=int, default=20)
+    parser.add_argument("--pool-timeout", type=float, default=30.0)
+    asyncio.run(main(parser.parse_args()))
@@ -1,17 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, Header, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, WebSocket, WebSocketDisconnect
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import joinedload
-from typing import List
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
 from pydantic import BaseModel
 import logging
 
 from src.database.connection import get_db_session
 from src.database import crud
 from src.database.models import Conversation
+from src.database.identity_cache import identity_cache
 from src.core.whatsapp_responder import whatsapp_responder
 from src.core.telegram_responder import telegram_responder
 from src.core.connection_manager import connection_manager
+from src.core.llm import llm_engine
+from src.core.usage_ledger import LLM_LATENCY_BUCKETS_MS, daily_usage, top_conversations
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +24,23 @@ router = APIRouter(prefix="/api/dashboard", tags=["Dashboard"])
 class ReplyRequest(BaseModel):
     content: str
 
+class TenantConfigRequest(BaseModel):
+    # Un campo omitido no cambia; enviado como null vuelve al valor por defecto
+    system_prompt: Optional[str] = None
+    model: Optional[str] = None
+    provider: Optional[str] = None
+    temperature: Optional[float] = None
+    token_budget: Optional[int] = None
+
+def serialize_tenant_settings(settings):
+    return {
+        "system_prompt": settings.system_prompt,
+        "model": settings.model,
+        "provider": settings.provider,
+        "temperature": settings.temperature,
+        "token_budget": settings.token_budget,
+    }
+
 @router.get("/conversations")
 async def list_conversations(
     x_tenant_id: str = Header(..., alias="X-Tenant-ID"),
@@ -129,8 +150,75 @@ async def close_conversation(
         raise HTTPException(status_code=404, detail="Conversation not found")
     
     await db.commit()
+    # Tras el commit: el bot debe retomar la conversación desde el próximo mensaje
+    identity_cache.invalidate_conversation(x_tenant_id, conversation_id)
     return {"ok": True, "status": "active"}
 
+@router.get("/config")
+async def get_tenant_config(
+    x_tenant_id: str = Header(..., alias="X-Tenant-ID")
+):
+    """Configuración efectiva del agente para el tenant (la que usa el LLMEngine)."""
+    return serialize_tenant_settings(llm_engine.tenant_configs.get(x_tenant_id))
+
+@router.put("/config")
+async def update_tenant_config(
+    request: TenantConfigRequest,
+    x_tenant_id: str = Header(..., alias="X-Tenant-ID"),
+    db: AsyncSession = Depends(get_db_session)
+):
+    values = request.model_dump(exclude_unset=True)
+    if not values:
+        raise HTTPException(status_code=400, detail="No fields to update")
+
+    config = await crud.upsert_tenant_config(db, x_tenant_id, values)
+    await db.commit()
+    # Este proceso aplica el cambio ya; los demás lo ven en su próximo refresco
+    llm_engine.tenant_configs.apply(config)
+    return serialize_tenant_settings(llm_engine.tenant_configs.get(x_tenant_id))
+
+def _usage_since(days: int) -> datetime:
+    """Inicio (UTC, medianoche) de los últimos `days` días, hoy incluido."""
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    return today - timedelta(days=days - 1)
+
+@router.get("/usage")
+async def get_llm_usage(
+    days: int = Query(default=7, ge=1, le=31),
+    x_tenant_id: str = Header(..., alias="X-Tenant-ID"),
+    db: AsyncSession = Depends(get_db_session)
+):
+    """
+    Consumo del LLM del tenant por día (UTC): llamadas por resultado, tokens y latencia
+    p50/p95, con el desglose por proveedor y modelo, más las conversaciones que más tokens
+    consumieron en el periodo. Todo se agrega en SQL (SUM / COUNT / GROUP BY).
+    Los registros de los últimos segundos pueden no estar escritos aún (se escriben por lotes).
+    """
+    since = _usage_since(days)
+    groups = await crud.get_llm_usage_by_day(db, x_tenant_id, since=since)
+    histogram = await crud.get_llm_latency_histogram(db, x_tenant_id, since=since, bounds=LLM_LATENCY_BUCKETS_MS)
+    top = await crud.get_llm_top_conversations(db, x_tenant_id, since=since)
+    return {
+        "days": daily_usage(groups, histogram),
+        "top_conversations": top_conversations(top),
+    }
+
+@router.get("/usage/calls")
+async def list_llm_calls(
+    days: int = Query(default=1, ge=1, le=31),
+    limit: int = Query(default=100, ge=1, le=500),
+    offset: int = Query(default=0, ge=0),
+    x_tenant_id: str = Header(..., alias="X-Tenant-ID"),
+    db: AsyncSession = Depends(get_db_session)
+):
+    """Llamadas individuales al LLM del tenant, de la más reciente a la más antigua, paginadas."""
+    rows = await crud.get_llm_calls(db, x_tenant_id, since=_usage_since(days), limit=limit, offset=offset)
+    return {
+        "limit": limit,
+        "offset": offset,
+        "calls": [dict(row._mapping) for row in rows],
+    }
+
 @router.websocket("/ws")
 async def dashboard_websocket(
     websocket: WebSocket,
@@ -1,5 +1,5 @@
-from fastapi import APIRouter
-from src.core.queue_manager import queue_manager
+from fastapi import APIRouter, HTTPException
+from src.core.queue_manager import queue_manager, QueueFullError
 from src.models.message import IncomingMessage
 
 router = APIRouter(prefix="/simulate", tags=["Testing"])
@@ -11,8 +11,11 @@ async def simulate_incoming_message(message: IncomingMessage):
     Notice how this endpoint responds immediately, leaving the actual processing 
     to the background Agent Loop.
     """
-    # 1. Empuja a la cola de asyncio
-    await queue_manager.enqueue_message(message)
+    # 1. Empuja a la cola de asyncio (503 si el carril del tenant está lleno)
+    try:
+        await queue_manager.enqueue_message(message)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     
     # 2. Responde instantáneamente (HTTP 200 OK)
     return {
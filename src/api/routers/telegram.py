@@ -5,6 +5,7 @@ from typing import Any, Dict
 from fastapi import APIRouter, Header, HTTPException, Request
 
 from src.core.producers.telegram_producer import TelegramProducer, TENANT_ID as TELEGRAM_TENANT_ID
+from src.core.queue_manager import QueueFullError
 
 logger = logging.getLogger(__name__)
 
@@ -29,6 +30,7 @@ async def telegram_webhook(
     2. Parsear el body JSON del update.
     3. Si no tiene 'message.text' → ignorar (fotos, stickers, comandos, etc.).
     4. TelegramProducer normaliza el payload → IncomingMessage → Queue.
+       Si el carril del tenant está lleno (política 'reject') → 503 y Telegram reintenta.
     5. Responder 200 OK inmediatamente (Telegram requiere < 60s o reintenta).
 
     IMPORTANTE: La respuesta al usuario se envía de forma asíncrona por
@@ -63,6 +65,9 @@ async def telegram_webhook(
     except ValueError as e:
         # process_payload puede levantar ValueError para updates sin texto
         logger.info(f"[TelegramWebhook] Update descartado: {e}")
+    except QueueFullError as e:
+        logger.warning(f"[TelegramWebhook] Cola llena, Telegram reintentará: {e}")
+        raise HTTPException(status_code=503, detail="Queue full", headers={"Retry-After": "5"})
 
     # --- 5. Responder 200 inmediatamente ---
     return {"ok": True}
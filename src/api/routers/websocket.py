@@ -5,6 +5,7 @@ from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 
 from src.core.connection_manager import connection_manager
 from src.core.producers.websocket_producer import WebSocketProducer
+from src.core.queue_manager import QueueFullError
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +15,12 @@ router = APIRouter(tags=["WebSocket"])
 # distintos tenants sin redeployar. Definir WEB_CHANNEL_TENANT_ID en .env
 WEB_TENANT_ID = os.getenv("WEB_CHANNEL_TENANT_ID", "inasc_web")
 
+# Respuesta al widget cuando el carril del tenant está lleno (contrapresión).
+QUEUE_FULL_MESSAGE = (
+    "En este momento estamos atendiendo muchas consultas. "
+    "Por favor, envía tu mensaje de nuevo en unos segundos. 🙏"
+)
+
 
 @router.websocket("/ws/chat/{client_id}")
 async def websocket_endpoint(websocket: WebSocket, client_id: str):
@@ -23,8 +30,16 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
     Flujo completo por turno de conversación:
     1. Cliente envía JSON: {"text": "...", "user_name": "..."}
     2. WebSocketProducer normaliza y encola en el brain (queue_manager global).
-    3. El Agent Loop procesa en background y llama a connection_manager.send_to_client().
-    4. Este endpoint recibe la respuesta de su cola privada y la envía al socket.
+    3. El Agent Loop procesa en background. Mientras el LLM genera, deposita
+       fragmentos con connection_manager.send_stream_delta() y al final la
+       respuesta completa con connection_manager.send_to_client().
+    4. Este endpoint reenvía cada elemento de su cola privada al socket:
+         {"role": "agent", "type": "delta",   "content": "<fragmento>"}  (0..N)
+         {"role": "agent", "type": "message", "content": "<texto final>"} (cierra el turno)
+         {"role": "agent", "type": "abort"}  (cierra el turno sin respuesta del bot)
+       El texto final reemplaza lo acumulado por los deltas en el widget
+       (ej: cuando el turno termina en un handoff); abort lo descarta (un asesor
+       tomó la conversación mientras el LLM generaba).
 
     Ver ADR completo en implementation_plan.md para el razonamiento de diseño.
     """
@@ -42,17 +57,36 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
             data["client_id"] = client_id
 
             # 3. Normalizar y enqueue en el brain (retorna de inmediato)
-            await producer.enqueue(data)
+            try:
+                await producer.enqueue(data)
+            except QueueFullError as e:
+                logger.warning(f"[WS] Cola llena para client '{client_id}': {e}")
+                await websocket.send_json({"role": "agent", "content": QUEUE_FULL_MESSAGE})
+                continue
 
             # 4. Esperar la respuesta del LLM en la cola privada de este cliente
-            #    (bloquea asíncronamente sin congelar el event loop)
-            response_text = await response_queue.get()
-
-            # 5. Enviar la respuesta al Widget JS
-            await websocket.send_json({
-                "role": "agent",
-                "content": response_text
-            })
+            #    (bloquea asíncronamente sin congelar el event loop).
+            #    Los deltas de streaming se reenvían al vuelo hasta la respuesta final.
+            while True:
+                item = await response_queue.get()
+                if isinstance(item, dict) and item.get("type") == "delta":
+                    await websocket.send_json({
+                        "role": "agent",
+                        "type": "delta",
+                        "content": item["content"]
+                    })
+                    continue
+                if isinstance(item, dict) and item.get("type") == "abort":
+                    await websocket.send_json({"role": "agent", "type": "abort"})
+                    break
+
+                # 5. Enviar la respuesta final al Widget JS
+                await websocket.send_json({
+                    "role": "agent",
+                    "type": "message",
+                    "content": item
+                })
+                break
 
     except WebSocketDisconnect:
         logger.info(f"[WS] Client '{client_id}' disconnected gracefully.")
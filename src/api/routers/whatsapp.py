@@ -5,6 +5,7 @@ from typing import Any, Dict
 from fastapi import APIRouter, HTTPException, Query, Request
 
 from src.core.producers.whatsapp_producer import WhatsAppProducer, TENANT_ID as WA_TENANT_ID
+from src.core.queue_manager import QueueFullError
 
 logger = logging.getLogger(__name__)
 
@@ -65,6 +66,7 @@ async def whatsapp_webhook_receive(request: Request):
     1. Parsear el body JSON del update de Meta.
     2. Verificar que contiene mensajes de texto (ignorar otros tipos).
     3. WhatsAppProducer normaliza payload → IncomingMessage → Queue.
+       Si el carril del tenant está lleno (política 'reject') → 503 y Meta reintenta.
     4. Responder 200 OK inmediatamente.
        (Meta reintenta si no recibe 200 en < 20s)
 
@@ -100,6 +102,9 @@ async def whatsapp_webhook_receive(request: Request):
     except ValueError as e:
         # process_payload levanta ValueError para mensajes no-texto (fotos, audio)
         logger.info(f"[WhatsApp] Mensaje descartado: {e}")
+    except QueueFullError as e:
+        logger.warning(f"[WhatsApp] Cola llena, Meta reintentará: {e}")
+        raise HTTPException(status_code=503, detail="Queue full", headers={"Retry-After": "5"})
 
     # --- 4. Responder 200 inmediatamente (Meta requiere < 20s) ---
     return {"ok": True}
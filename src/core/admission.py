@@ -0,0 +1,263 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from src.core.config_utils import parse_tenant_weights
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Límites globales del proveedor LLM por minuto: peticiones y tokens (prompt + respuesta).
+# 0 = sin límite.
+LLM_ADMISSION_RPM = float(os.getenv("LLM_ADMISSION_RPM", "0"))
+LLM_ADMISSION_TPM = float(os.getenv("LLM_ADMISSION_TPM", "0"))
+# Límites por tenant, mismo formato que QUEUE_TENANT_WEIGHTS: "inasc_001:60,otro:20"
+LLM_TENANT_RPM = os.getenv("LLM_TENANT_RPM", "")
+LLM_TENANT_TPM = os.getenv("LLM_TENANT_TPM", "")
+# Ráfaga permitida: cada cubeta acumula como máximo estos segundos de su tasa.
+LLM_ADMISSION_BURST_SECONDS = float(os.getenv("LLM_ADMISSION_BURST_SECONDS", "10"))
+# Espera máxima en la cola de admisión antes de rendirse (respuesta de contingencia).
+LLM_ADMISSION_DEADLINE_SECONDS = float(os.getenv("LLM_ADMISSION_DEADLINE_SECONDS", "20"))
+# Tokens de respuesta que se reservan por llamada; se ajusta con el usage real al terminar.
+LLM_ADMISSION_COMPLETION_TOKENS = int(os.getenv("LLM_ADMISSION_COMPLETION_TOKENS", "300"))
+
+
+class AdmissionTimeoutError(Exception):
+    """La llamada no obtuvo cupo del rate limit antes de su deadline."""
+
+
+class TokenBucket:
+    """
+    Cubeta de tokens: se rellena a `rate` unidades por segundo hasta `capacity`.
+    Una petición mayor que la capacidad se admite con la cubeta llena (queda en negativo).
+    """
+
+    def __init__(self, per_minute: float, burst_seconds: float = LLM_ADMISSION_BURST_SECONDS):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Segundos hasta que haya cupo para `amount` (0 si ya lo hay)."""
+        self._refill()
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.level -= amount
+
+    def give_back(self, amount: float) -> None:
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+
+@dataclass
+class _Waiter:
+    tokens: float
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class AdmissionController:
+    """
+    Control de admisión de llamadas al LLM con cubetas de tokens.
+
+    Cada llamada debe obtener cupo en cuatro cubetas: peticiones y tokens globales
+    (el rate limit del proveedor) y peticiones y tokens de su tenant. Si no hay
+    cupo, la llamada espera en el carril de su tenant en lugar de fallar con un 429.
+    Los carriles se atienden en round robin, así un tenant con una ráfaga no deja
+    sin cupo a los demás. Pasado `deadline` segundos se lanza AdmissionTimeoutError.
+
+    Los tokens reservados son una estimación (prompt + LLM_ADMISSION_COMPLETION_TOKENS);
+    settle() corrige las cubetas con el usage real de la respuesta.
+    """
+
+    def __init__(
+        self,
+        rpm: float = LLM_ADMISSION_RPM,
+        tpm: float = LLM_ADMISSION_TPM,
+        tenant_rpm: Optional[Dict[str, float]] = None,
+        tenant_tpm: Optional[Dict[str, float]] = None,
+        deadline: float = LLM_ADMISSION_DEADLINE_SECONDS,
+        burst_seconds: float = LLM_ADMISSION_BURST_SECONDS,
+        samples: int = 1000,
+    ):
+        self.burst_seconds = burst_seconds
+        self.deadline = deadline
+        self._global_requests = TokenBucket(rpm, burst_seconds) if rpm > 0 else None
+        self._global_tokens = TokenBucket(tpm, burst_seconds) if tpm > 0 else None
+        self.tenant_rpm = tenant_rpm if tenant_rpm is not None else parse_tenant_weights(LLM_TENANT_RPM)
+        self.tenant_tpm = tenant_tpm if tenant_tpm is not None else parse_tenant_weights(LLM_TENANT_TPM)
+        self._tenant_requests: Dict[str, TokenBucket] = {}
+        self._tenant_tokens: Dict[str, TokenBucket] = {}
+        # Carriles de espera por tenant, en orden de round robin
+        self._lanes: "OrderedDict[str, Deque[_Waiter]]" = OrderedDict()
+        self._wakeup = asyncio.Event()
+        self._pump_task: Optional[asyncio.Task] = None
+        # True mientras la cabeza de algún carril espera cupo global
+        self._global_blocked = False
+        self._waits: Deque[float] = deque(maxlen=samples)
+        self.admitted = 0
+        self.queued = 0
+        self.timed_out = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._global_requests or self._global_tokens or self.tenant_rpm or self.tenant_tpm)
+
+    def _buckets(self, tenant_id: str) -> List[Optional[TokenBucket]]:
+        """Cubetas de la llamada: peticiones y tokens globales, peticiones y tokens del tenant (None = sin límite)."""
+        if tenant_id in self.tenant_rpm and tenant_id not in self._tenant_requests:
+            self._tenant_requests[tenant_id] = TokenBucket(self.tenant_rpm[tenant_id], self.burst_seconds)
+        if tenant_id in self.tenant_tpm and tenant_id not in self._tenant_tokens:
+            self._tenant_tokens[tenant_id] = TokenBucket(self.tenant_tpm[tenant_id], self.burst_seconds)
+        return [
+            self._global_requests, self._global_tokens,
+            self._tenant_requests.get(tenant_id), self._tenant_tokens.get(tenant_id),
+        ]
+
+    def _wait_times(self, tenant_id: str, tokens: float) -> Tuple[float, float]:
+        """Segundos hasta tener cupo (en los límites globales, en los del tenant)."""
+        requests_global, tokens_global, requests_tenant, tokens_tenant = self._buckets(tenant_id)
+        global_wait = max(
+            requests_global.wait_time(1) if requests_global else 0.0,
+            tokens_global.wait_time(tokens) if tokens_global else 0.0,
+        )
+        tenant_wait = max(
+            requests_tenant.wait_time(1) if requests_tenant else 0.0,
+            tokens_tenant.wait_time(tokens) if tokens_tenant else 0.0,
+        )
+        return global_wait, tenant_wait
+
+    def _take(self, tenant_id: str, tokens: float) -> None:
+        requests_global, tokens_global, requests_tenant, tokens_tenant = self._buckets(tenant_id)
+        for bucket, amount in ((requests_global, 1), (tokens_global, tokens), (requests_tenant, 1), (tokens_tenant, tokens)):
+            if bucket:
+                bucket.take(amount)
+
+    async def acquire(self, tenant_id: str, tokens: float) -> float:
+        """
+        Espera cupo para una llamada de `tokens` tokens estimados.
+        Retorna los segundos de espera; lanza AdmissionTimeoutError al vencer el deadline.
+        """
+        if not self.enabled:
+            return 0.0
+        # Camino rápido: nadie del tenant esperando, nadie esperando cupo global, y hay cupo
+        if tenant_id not in self._lanes and not self._global_blocked and self._wait_times(tenant_id, tokens) == (0.0, 0.0):
+            self._take(tenant_id, tokens)
+            self.admitted += 1
+            self._waits.append(0.0)
+            return 0.0
+
+        waiter = _Waiter(tokens=tokens, future=asyncio.get_running_loop().create_future())
+        self._lanes.setdefault(tenant_id, deque()).append(waiter)
+        self.queued += 1
+        self._wakeup.set()
+        if self._pump_task is None:
+            self._pump_task = asyncio.create_task(self._pump())
+        try:
+            await asyncio.wait_for(waiter.future, timeout=self.deadline)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            lane = self._lanes.get(tenant_id)
+            if lane is not None and waiter in lane:
+                lane.remove(waiter)
+                if not lane:
+                    del self._lanes[tenant_id]
+            logger.warning(f"[{tenant_id}] ⏳ Sin cupo en el rate limit del LLM tras {self.deadline:.0f}s de espera.")
+            raise AdmissionTimeoutError(f"No LLM capacity for tenant '{tenant_id}' within {self.deadline:.1f}s")
+        waited = time.monotonic() - waiter.enqueued_at
+        self._waits.append(waited)
+        return waited
+
+    def settle(self, tenant_id: str, reserved: float, actual: Optional[float]) -> None:
+        """Corrige las cubetas de tokens con el consumo real (`actual`) de una llamada ya admitida."""
+        if actual is None or not self.enabled:
+            return
+        delta = actual - reserved
+        for bucket in (self._global_tokens, self._tenant_tokens.get(tenant_id)):
+            if bucket is None:
+                continue
+            if delta > 0:
+                bucket.take(delta)
+            else:
+                bucket.give_back(-delta)
+        if delta > 0:
+            self._wakeup.set()
+
+    async def _pump(self) -> None:
+        """Reparte el cupo entre los carriles en round robin mientras haya llamadas esperando."""
+        try:
+            while self._lanes:
+                self._wakeup.clear()
+                pause = self._grant_ready()
+                if not self._lanes:
+                    break
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=pause)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._pump_task = None
+
+    def _grant_ready(self) -> float:
+        """
+        Admite lo que cabe ahora, una llamada por carril por vuelta. Un carril frenado por
+        su propio límite se salta; si falta cupo global se detiene todo el reparto, para que
+        las llamadas pequeñas no se adelanten indefinidamente a una grande.
+        Retorna la pausa hasta el próximo cupo.
+        """
+        pauses: List[float] = []
+        self._global_blocked = False
+        progress = True
+        while progress:
+            progress = False
+            pauses = []
+            for tenant_id in list(self._lanes):
+                lane = self._lanes[tenant_id]
+                while lane and lane[0].future.done():
+                    lane.popleft()  # Venció su deadline
+                if not lane:
+                    del self._lanes[tenant_id]
+                    continue
+                global_wait, tenant_wait = self._wait_times(tenant_id, lane[0].tokens)
+                if global_wait > 0:
+                    self._global_blocked = True
+                    return max(0.001, global_wait)
+                if tenant_wait > 0:
+                    pauses.append(tenant_wait)
+                    continue
+                waiter = lane.popleft()
+                self._take(tenant_id, waiter.tokens)
+                waiter.future.set_result(None)
+                self.admitted += 1
+                self._lanes.move_to_end(tenant_id)
+                progress = True
+        return max(0.001, min(pauses)) if pauses else 0.0
+
+    def stats(self) -> dict:
+        recent = sorted(self._waits)
+        return {
+            "enabled": self.enabled,
+            "admitted": self.admitted,
+            "queued_total": self.queued,
+            "waiting": sum(len(lane) for lane in self._lanes.values()),
+            "timed_out": self.timed_out,
+            "wait_ms_p50": round(recent[len(recent) // 2] * 1000, 1) if recent else 0.0,
+            "wait_ms_p95": round(recent[max(0, math.ceil(len(recent) * 0.95) - 1)] * 1000, 1) if recent else 0.0,
+            "wait_ms_max": round(recent[-1] * 1000, 1) if recent else 0.0,
+        }
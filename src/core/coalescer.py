@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Set
+
+from dotenv import load_dotenv
+
+from src.core.worker_pool import conversation_key
+from src.models.message import IncomingMessage
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Ventana de debounce: si el prospecto escribe otra vez antes de que pase, se
+# reinicia la espera y los mensajes se fusionan en un solo turno del LLM.
+COALESCE_WINDOW_MS = float(os.getenv("COALESCE_WINDOW_MS", "1500"))
+# Espera máxima desde el primer mensaje del lote (evita esperar para siempre
+# a un usuario que escribe sin parar).
+COALESCE_MAX_WINDOW_MS = float(os.getenv("COALESCE_MAX_WINDOW_MS", "5000"))
+# Tamaño máximo de un lote; al alcanzarlo se despacha sin esperar.
+COALESCE_MAX_BATCH = int(os.getenv("COALESCE_MAX_BATCH", "5"))
+# Canales donde se aplica. El widget web espera una respuesta por mensaje,
+# así que por defecto solo se fusionan Telegram y WhatsApp.
+COALESCE_PLATFORMS = os.getenv("COALESCE_PLATFORMS", "telegram,whatsapp")
+
+Dispatch = Callable[[Hashable, List[IncomingMessage]], Awaitable[None]]
+
+
+@dataclass
+class _Buffer:
+    messages: List[IncomingMessage]
+    started_at: float
+    deadline: float
+    timer: Optional[asyncio.Task] = field(default=None)
+
+
+class MessageCoalescer:
+    """
+    Etapa de debounce entre la cola y el pool de workers.
+
+    Agrupa los mensajes de una misma conversación que llegan dentro de la ventana
+    y los entrega como UN lote a `dispatch`. Así "hola" + "tienen pHmetros?" +
+    "para agua residual" producen una sola llamada al LLM y una sola respuesta.
+
+    Los mensajes de canales no incluidos en `platforms` (o con ventana 0) se
+    despachan de inmediato como lotes de un elemento.
+    """
+
+    def __init__(
+        self,
+        dispatch: Dispatch,
+        window_ms: float = COALESCE_WINDOW_MS,
+        max_window_ms: float = COALESCE_MAX_WINDOW_MS,
+        max_batch: int = COALESCE_MAX_BATCH,
+        platforms: Optional[Set[str]] = None,
+    ):
+        self.dispatch = dispatch
+        self.window = window_ms / 1000.0
+        self.max_window = max(max_window_ms, window_ms) / 1000.0
+        self.max_batch = max_batch
+        self.platforms = platforms if platforms is not None else {
+            p.strip() for p in COALESCE_PLATFORMS.split(",") if p.strip()
+        }
+        self._buffers: Dict[Hashable, _Buffer] = {}
+        self._messages_in = 0
+        self._batches_out = 0
+
+    async def add(self, message: IncomingMessage) -> None:
+        """Recibe un mensaje de la cola. Retorna sin esperar a que se procese."""
+        self._messages_in += 1
+        if self.window <= 0 or message.platform not in self.platforms:
+            await self._dispatch(conversation_key(message), [message])
+            return
+
+        key = conversation_key(message)
+        now = asyncio.get_running_loop().time()
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            buffer = _Buffer(messages=[message], started_at=now, deadline=now + self.window)
+            buffer.timer = asyncio.create_task(self._wait_and_flush(key, buffer))
+            self._buffers[key] = buffer
+            return
+
+        buffer.messages.append(message)
+        if len(buffer.messages) >= self.max_batch:
+            buffer.timer.cancel()
+            await self._flush(key, buffer)
+            return
+        # Debounce: cada mensaje nuevo extiende la ventana, sin pasar del máximo
+        buffer.deadline = min(now + self.window, buffer.started_at + self.max_window)
+
+    async def _wait_and_flush(self, key: Hashable, buffer: _Buffer) -> None:
+        loop = asyncio.get_running_loop()
+        while (delay := buffer.deadline - loop.time()) > 0:
+            await asyncio.sleep(delay)
+        await self._flush(key, buffer)
+
+    async def _flush(self, key: Hashable, buffer: _Buffer) -> None:
+        if self._buffers.get(key) is buffer:
+            del self._buffers[key]
+            await self._dispatch(key, buffer.messages)
+
+    async def _dispatch(self, key: Hashable, messages: List[IncomingMessage]) -> None:
+        self._batches_out += 1
+        if len(messages) > 1:
+            logger.info(f"[Coalescer] {len(messages)} mensajes de {key} fusionados en un solo turno.")
+        try:
+            await self.dispatch(key, messages)
+        except Exception as e:
+            logger.error(f"[Coalescer] Error despachando lote de {key}: {e}")
+
+    async def shutdown(self) -> None:
+        """
+        Descarta los lotes aún en ventana (apagado del servidor).
+        Con el WAL activo esos mensajes no tienen ack y se reprocesan al reiniciar.
+        """
+        timers = [buffer.timer for buffer in self._buffers.values() if buffer.timer]
+        self._buffers.clear()
+        for timer in timers:
+            timer.cancel()
+        await asyncio.gather(*timers, return_exceptions=True)
+
+    def stats(self) -> dict:
+        """Métricas para /metrics: cuántas llamadas al LLM se ahorran al fusionar."""
+        return {
+            "window_ms": self.window * 1000,
+            "buffered_conversations": len(self._buffers),
+            "buffered_messages": sum(len(b.messages) for b in self._buffers.values()),
+            "messages_in": self._messages_in,
+            "batches_out": self._batches_out,
+            "merged": self._messages_in - self._batches_out - sum(len(b.messages) for b in self._buffers.values()),
+        }
@@ -0,0 +1,14 @@
+from typing import Dict
+
+
+def parse_tenant_weights(raw: str) -> Dict[str, float]:
+    """
+    Convierte "tenant_a:3,tenant_b:1" en {"tenant_a": 3.0, "tenant_b": 1.0}.
+    Formato común de las variables por tenant (QUEUE_TENANT_WEIGHTS, CONTEXT_TENANT_BUDGETS,
+    LLM_TENANT_RPM / LLM_TENANT_TPM). Un tenant sin valor explícito recibe 1.
+    """
+    weights: Dict[str, float] = {}
+    for item in filter(None, (part.strip() for part in raw.split(","))):
+        tenant, _, weight = item.partition(":")
+        weights[tenant.strip()] = float(weight or 1)
+    return weights
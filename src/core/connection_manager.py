@@ -64,6 +64,35 @@ class ConnectionManager:
         await self.response_queues[client_id].put(message)
         logger.info(f"[WS] Response queued for client '{client_id}'.")
 
+    async def send_stream_delta(self, client_id: str, delta: str):
+        """
+        Deposita un fragmento parcial de la respuesta (streaming del LLM).
+
+        Protocolo de la cola privada:
+          - dict {"type": "delta", "content": "..."} → fragmento incremental.
+          - dict {"type": "abort"}                   → el turno termina sin respuesta del bot;
+            el widget descarta lo recibido por deltas (ver send_stream_abort).
+          - str                                      → respuesta final completa;
+            cierra el turno (el endpoint WS deja de leer deltas).
+        """
+        if client_id not in self.response_queues:
+            return
+        await self.response_queues[client_id].put({"type": "delta", "content": delta})
+
+    async def send_stream_abort(self, client_id: str):
+        """
+        Cierra el turno sin respuesta final: la conversación pasó a un asesor mientras
+        el LLM generaba y la respuesta del bot se descartó. Sin este frame el endpoint WS
+        seguiría esperando la respuesta y el widget mostraría la burbuja a medias.
+        """
+        if client_id not in self.response_queues:
+            return
+        await self.response_queues[client_id].put({"type": "abort"})
+
+    def is_connected(self, client_id: str) -> bool:
+        """True si el cliente tiene un WebSocket activo en este proceso."""
+        return client_id in self.response_queues
+
     def get_response_queue(self, client_id: str) -> asyncio.Queue:
         """
         Retorna la cola privada de respuesta para que el endpoint WS
@@ -0,0 +1,231 @@
+import logging
+import math
+import os
+import re
+import threading
+from collections import OrderedDict, deque
+from functools import lru_cache
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from src.core.config_utils import parse_tenant_weights
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Presupuesto de tokens del historial enviado al LLM (sin contar el system prompt).
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+# Presupuestos por tenant, mismo formato que QUEUE_TENANT_WEIGHTS: "inasc_001:3000,otro:1500"
+CONTEXT_TENANT_BUDGETS = os.getenv("CONTEXT_TENANT_BUDGETS", "")
+# Turnos que se cargan de la BD como candidatos (no debe superar HISTORY_BUFFER_TURNS).
+CONTEXT_MAX_TURNS = int(os.getenv("CONTEXT_MAX_TURNS", "20"))
+# Textos distintos cuyo conteo de tokens se recuerda entre turnos.
+CONTEXT_TOKEN_CACHE_SIZE = int(os.getenv("CONTEXT_TOKEN_CACHE_SIZE", "50000"))
+# Encoding de tiktoken. DeepSeek no publica el suyo; cl100k_base es una buena aproximación.
+CONTEXT_TOKENIZER = os.getenv("CONTEXT_TOKENIZER", "cl100k_base")
+# Al recortar la ventana de una conversación se deja en esta fracción del presupuesto y de
+# CONTEXT_MAX_TURNS: los turnos siguientes se agregan sin mover su inicio, así el prompt
+# conserva el mismo prefijo y el proveedor lo sirve desde su caché. 1 = recortar turno a turno.
+CONTEXT_TRIM_RATIO = float(os.getenv("CONTEXT_TRIM_RATIO", "0.75"))
+# Conversaciones cuyo inicio de ventana se recuerda en memoria (LRU).
+CONTEXT_MAX_TRACKED = int(os.getenv("CONTEXT_MAX_TRACKED", "10000"))
+
+# Tokens de formato que el API agrega por mensaje (role, separadores)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Palabras, números y cualquier símbolo suelto
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+# Encoding cargado en el primer conteo (no al importar: get_encoding puede descargar el BPE).
+# _UNLOADED = todavía no se intentó; None = tiktoken no disponible, se usa el estimador.
+_UNLOADED = object()
+_encoding: Any = _UNLOADED
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    """tiktoken es opcional: sin él (o sin su archivo BPE) se usa el estimador por regex."""
+    global _encoding
+    if _encoding is _UNLOADED:
+        with _encoding_lock:
+            if _encoding is _UNLOADED:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding(CONTEXT_TOKENIZER)
+                except Exception as e:
+                    logger.info(f"[ContextBuilder] tiktoken no disponible ({type(e).__name__}); se estiman los tokens por regex.")
+                    _encoding = None
+    return _encoding
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimación local sin tokenizer: un token por cada ~4 caracteres de una palabra
+    y uno por cada signo de puntuación (se queda del lado alto para español).
+    """
+    return sum(max(1, math.ceil(len(piece) / 4)) for piece in _TOKEN_RE.findall(text))
+
+
+@lru_cache(maxsize=CONTEXT_TOKEN_CACHE_SIZE)
+def count_tokens(text: str) -> int:
+    """
+    Tokens de un texto. Memoizado: los mensajes guardados se repiten turno a turno
+    en el historial, así que cada uno se tokeniza una sola vez.
+    """
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return estimate_tokens(text)
+
+
+def count_message_tokens(messages: List[Dict[str, Any]]) -> int:
+    return sum(count_tokens(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+def _anchor_of(turns: List[Dict[str, Any]], start: int, width: int = 2) -> Tuple:
+    """Identifica el inicio de una ventana por sus dos primeros turnos (menos choques que uno solo)."""
+    return tuple((m["role"], m["content"]) for m in turns[start:start + width])
+
+
+class ContextBuilder:
+    """
+    Arma la ventana de contexto del LLM con un presupuesto de tokens por tenant.
+
+    Recorre el historial desde el turno más reciente hacia atrás y agrega turnos
+    mientras quepan en el presupuesto: un hilo técnico largo envía pocos turnos y
+    una charla corta envía más, en lugar de siempre los últimos 10 mensajes.
+    El turno más reciente se incluye siempre, aunque por sí solo exceda el presupuesto.
+
+    Con `conversation_id` la ventana es estable: mientras quepa, empieza en el mismo
+    turno que la vez anterior y solo crece por el final. Cuando hay que recortar se
+    recorta de una vez hasta CONTEXT_TRIM_RATIO del presupuesto, en lugar de soltar un
+    turno por llamada, para que el prefijo del prompt se repita entre llamadas.
+
+    También lleva las métricas de tokens de prompt por llamada (para /metrics).
+    """
+
+    def __init__(
+        self,
+        default_budget: int = CONTEXT_TOKEN_BUDGET,
+        tenant_budgets: Optional[Dict[str, float]] = None,
+        max_turns: int = CONTEXT_MAX_TURNS,
+        trim_ratio: float = CONTEXT_TRIM_RATIO,
+        max_tracked: int = CONTEXT_MAX_TRACKED,
+        samples: int = 1000,
+    ):
+        self.default_budget = default_budget
+        self.tenant_budgets = tenant_budgets if tenant_budgets is not None else parse_tenant_weights(CONTEXT_TENANT_BUDGETS)
+        self.max_turns = max_turns
+        # Presupuestos de la tabla tenant_configs (src/core/tenant_config.py): tienen prioridad
+        self._budget_overrides: Dict[str, int] = {}
+        self.trim_ratio = min(1.0, max(0.0, trim_ratio))
+        self.max_tracked = max_tracked
+        self._anchors: "OrderedDict[Tuple[str, int], Tuple]" = OrderedDict()
+        self._window_reuses = 0
+        self._window_moves = 0
+        self._prompt_tokens: Deque[int] = deque(maxlen=samples)
+        self._calls = 0
+        self._total_prompt_tokens = 0
+        self._trimmed_turns = 0
+
+    def budget_for(self, tenant_id: str) -> int:
+        if tenant_id in self._budget_overrides:
+            return self._budget_overrides[tenant_id]
+        return int(self.tenant_budgets.get(tenant_id, self.default_budget))
+
+    def set_tenant_budget(self, tenant_id: str, budget: Optional[int]) -> None:
+        """Fija (o con None, retira) el presupuesto configurado para un tenant."""
+        if budget is None:
+            self._budget_overrides.pop(tenant_id, None)
+        else:
+            self._budget_overrides[tenant_id] = budget
+
+    def build(
+        self,
+        tenant_id: str,
+        history: List[Dict[str, Any]],
+        reserved_tokens: int = 0,
+        conversation_id: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Retorna el sufijo de `history` (orden cronológico) que cabe en el presupuesto del tenant.
+        `reserved_tokens` se descuenta del presupuesto (ej: el resumen de la conversación).
+        `conversation_id` activa la ventana estable (ver docstring de la clase).
+        """
+        candidates = history[-self.max_turns:]
+        budget = self.budget_for(tenant_id) - reserved_tokens
+        if conversation_id is None:
+            start = self._fit(candidates, budget)
+        else:
+            start = self._stable_start((tenant_id, conversation_id), candidates, budget)
+        self._trimmed_turns += start
+        return candidates[start:]
+
+    def _fit(self, candidates: List[Dict[str, Any]], budget: float) -> int:
+        """Primer índice desde el cual los turnos caben en `budget` (el último entra siempre)."""
+        remaining = budget
+        start = len(candidates)
+        for i in range(len(candidates) - 1, -1, -1):
+            cost = count_tokens(candidates[i]["content"]) + MESSAGE_OVERHEAD_TOKENS
+            if cost > remaining and start < len(candidates):
+                break
+            remaining -= cost
+            start = i
+        return start
+
+    def _stable_start(self, key: Tuple[str, int], candidates: List[Dict[str, Any]], budget: int) -> int:
+        anchor = self._anchors.get(key)
+        if anchor is not None:
+            for i in range(len(candidates)):
+                if _anchor_of(candidates, i, len(anchor)) == anchor:
+                    if count_message_tokens(candidates[i:]) <= budget:
+                        self._anchors.move_to_end(key)
+                        self._window_reuses += 1
+                        return i
+                    break
+
+        # Sin ventana previa, o ya no cabe: se recorta con margen para los próximos turnos
+        start = self._fit(candidates, budget)
+        if start > 0 or len(candidates) >= self.max_turns:
+            self._window_moves += 1
+            start = max(
+                self._fit(candidates, budget * self.trim_ratio),
+                len(candidates) - max(1, int(self.max_turns * self.trim_ratio)),
+            )
+        self._anchors[key] = _anchor_of(candidates, start)
+        self._anchors.move_to_end(key)
+        while len(self._anchors) > self.max_tracked:
+            self._anchors.popitem(last=False)
+        return start
+
+    def record_prompt(self, tenant_id: str, messages: List[Dict[str, Any]]) -> int:
+        """Registra los tokens del prompt completo (system + historial) de una llamada al LLM."""
+        tokens = count_message_tokens(messages)
+        self._calls += 1
+        self._total_prompt_tokens += tokens
+        self._prompt_tokens.append(tokens)
+        return tokens
+
+    def stats(self) -> dict:
+        recent = sorted(self._prompt_tokens)
+        info = count_tokens.cache_info()
+        return {
+            "tokenizer": "regex_estimate" if _encoding is None else "pending" if _encoding is _UNLOADED else CONTEXT_TOKENIZER,
+            "default_budget": self.default_budget,
+            "calls": self._calls,
+            "prompt_tokens_total": self._total_prompt_tokens,
+            "prompt_tokens_mean": round(self._total_prompt_tokens / self._calls, 1) if self._calls else 0.0,
+            "prompt_tokens_p95": recent[max(0, math.ceil(len(recent) * 0.95) - 1)] if recent else 0,
+            "prompt_tokens_max": recent[-1] if recent else 0,
+            "trimmed_turns": self._trimmed_turns,
+            "window_reuses": self._window_reuses,
+            "window_moves": self._window_moves,
+            "token_cache_hits": info.hits,
+            "token_cache_misses": info.misses,
+        }
+
+
+# Instancia global (Patrón Singleton) usada por main.py y llm.py
+context_builder = ContextBuilder()
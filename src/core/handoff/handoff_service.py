@@ -65,8 +65,7 @@ class HandoffService:
         Trigger A (explícito): el usuario pide hablar con una persona.
         Trigger B (autónomo):  el LLM incluyó [HANDOFF_REQUESTED] en su respuesta.
         """
-        user_lower = user_msg.lower()
-        trigger_a = any(kw in user_lower for kw in HANDOFF_KEYWORDS)
+        trigger_a = self.is_user_request(user_msg)
         trigger_b = HANDOFF_SIGNAL in bot_response
 
         if trigger_a:
@@ -76,6 +75,14 @@ class HandoffService:
 
         return trigger_a or trigger_b
 
+    def is_user_request(self, user_msg: str) -> bool:
+        """
+        Trigger A aislado: True si el usuario pide explícitamente un asesor.
+        Se puede evaluar ANTES de llamar al LLM (no depende de su respuesta).
+        """
+        user_lower = user_msg.lower()
+        return any(kw in user_lower for kw in HANDOFF_KEYWORDS)
+
     def strip_signal(self, response: str) -> str:
         """
         Elimina [HANDOFF_REQUESTED] del texto antes de enviarlo al canal.
@@ -1,9 +1,20 @@
 import os
+import asyncio
 import logging
+import time
 import traceback
-from typing import List, Dict, Any, Optional
-from openai import AsyncOpenAI
+from typing import List, Dict, Any, Optional, AsyncIterator
 from dotenv import load_dotenv
+import openai
+
+from src.core.response_cache import FALLBACK_MESSAGE, ResponseCache
+from src.core.context_builder import context_builder, count_message_tokens
+from src.core.resilience import CircuitOpenError, DeadlineExceededError, LLM_DEADLINE_SECONDS
+from src.core.llm_router import LLMRouter, Provider, ProviderConfig, load_provider_configs
+from src.core.tenant_config import TenantConfigStore, TenantSettings
+from src.core.usage_meter import UsageMeter
+from src.core.usage_ledger import UsageLedger
+from src.core.admission import AdmissionController, AdmissionTimeoutError, LLM_ADMISSION_COMPLETION_TOKENS
 
 # Cargar .env explícitamente aquí porque llm_engine se instancia a nivel
 # de módulo (singleton), ANTES de que main.py ejecute su propio load_dotenv().
@@ -14,7 +25,12 @@ load_dotenv()
 
 logger = logging.getLogger(__name__)
 
-# Replicamos la logica restrictiva comercial del requerimiento
+# Pide al proveedor el `usage` (tokens y aciertos de caché) al final de cada stream.
+# Desactivar para endpoints compatibles que rechacen `stream_options`.
+LLM_STREAM_INCLUDE_USAGE = os.getenv("LLM_STREAM_INCLUDE_USAGE", "true").lower() == "true"
+
+# Replicamos la logica restrictiva comercial del requerimiento.
+# Es el prompt por defecto: un tenant puede definir el suyo en la tabla tenant_configs.
 SYSTEM_PROMPT = """Eres un asistente IA útil, profesional y respetuoso, que trabaja como Asesor Comercial y Soporte Técnico para la empresa Instruments & Applied Sciences S.A.S.- INASC SAS.
 
 REGLAS ESTRICTAS DE COMPORTAMIENTO:
@@ -26,46 +42,303 @@ REGLAS ESTRICTAS DE COMPORTAMIENTO:
 6. TRANSFERENCIA A ASESOR HUMANO: Si el caso requiere atención personalizada (cotización específica, soporte técnico complejo, queja escalada, o el cliente lo solicita explícitamente), escribe la señal [HANDOFF_REQUESTED] al INICIO de tu respuesta, inmediatamente seguida del mensaje normal al cliente. Ejemplo: "[HANDOFF_REQUESTED] Entiendo tu necesidad. Un asesor especializado te contactará pronto para darte la atención que mereces. 🤝"
 """
 
+# Instrucciones para el resumen incremental de conversaciones largas (src/core/summarizer.py)
+SUMMARY_PROMPT = """Mantienes el resumen de una conversación entre un prospecto y el asesor comercial de INASC.
+Recibirás el resumen anterior (si existe) y los turnos nuevos. Devuelve UN resumen actualizado que
+conserve los datos útiles para continuar la atención: nombre y empresa del cliente, aplicación o
+problema, productos, modelos, cantidades y referencias mencionadas, compromisos y preguntas pendientes.
+Omite saludos y cortesías. Escribe en español, en tercera persona, en máximo 150 palabras."""
+SUMMARY_MAX_TOKENS = 400
+
+# Errores que el registro de llamadas (llm_calls) cuenta como outcome 'timeout'
+TIMEOUT_ERRORS = (AdmissionTimeoutError, DeadlineExceededError, asyncio.TimeoutError, openai.APITimeoutError)
+# Usage de una respuesta servida desde ResponseCache: se registra en llm_calls sin tokens
+CACHED_USAGE = {"prompt_tokens": 0, "completion_tokens": 0, "cache_hit_tokens": 0}
+
 class LLMEngine:
-    def __init__(self):
-        # Usamos AsyncOpenAI para no bloquear el Event Loop de FastAPI
-        api_key = os.getenv("DEEPSEEK_API_KEY", "dummy_key")
-        base_url = "https://api.deepseek.com"
-        
-        # En caso de no tener llave, el cliente arroja error al instanciar sin llave por defecto
-        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url)
-        self.model = "deepseek-chat"
+    def __init__(
+        self,
+        providers: Optional[List[ProviderConfig]] = None,
+        http_client=None,
+        tenant_configs: Optional[TenantConfigStore] = None,
+    ):
+        # Cada proveedor (DeepSeek, modelo auto-hospedado, stub local) tiene su propio
+        # AsyncOpenAI (no bloquea el Event Loop de FastAPI) y su política de resiliencia:
+        # deadline, reintentos con jitter, hedging y circuit breaker.
+        # `http_client` permite apuntar a un servidor falso en los tests (httpx.ASGITransport).
+        configs = providers or load_provider_configs()
+        self.router = LLMRouter([Provider(config, http_client=http_client) for config in configs])
+        # Caché de respuestas para preguntas repetidas del catálogo (por tenant)
+        self.response_cache = ResponseCache()
+        # Tokens facturados y aciertos de la caché de prefijos del proveedor, por tenant
+        self.usage = UsageMeter()
+        # Registro por llamada (latencia, tokens, modelo, resultado) escrito por lotes en llm_calls
+        self.ledger = UsageLedger()
+        # Rate limit propio (global y por tenant): las ráfagas esperan turno en vez de recibir 429
+        self.admission = AdmissionController()
+        # System prompt, modelo, temperatura y presupuesto de tokens por tenant
+        self.tenant_configs = tenant_configs or TenantConfigStore(default_prompt=SYSTEM_PROMPT)
+        self.tenant_configs.subscribe(self._on_tenant_config_change)
+
+    def _on_tenant_config_change(self, tenant_id: str, settings: TenantSettings) -> None:
+        # Las respuestas cacheadas se generaron con el prompt anterior
+        self.response_cache.invalidate_tenant(tenant_id)
+        context_builder.set_tenant_budget(tenant_id, settings.token_budget)
+
+    def _account(self, tenant_id: str, provider: Provider, reserved: int, usage: Any) -> Optional[Dict[str, int]]:
+        """Registra el usage de una respuesta y corrige con él los tokens reservados en admisión."""
+        values = self.usage.record(tenant_id, provider.name, usage)
+        if values is not None:
+            self.admission.settle(tenant_id, reserved, values["prompt_tokens"] + values["completion_tokens"])
+        return values
+
+    def _log_call(
+        self,
+        tenant_id: str,
+        kind: str,
+        conversation_id: Optional[int],
+        settings: TenantSettings,
+        started: float,
+        waited: float,
+        provider: Optional[Provider],
+        usage: Optional[Dict[str, int]],
+        error: Optional[BaseException],
+        cached: bool = False,
+    ) -> None:
+        """Deja la llamada en el registro llm_calls (en memoria; se escribe por lotes)."""
+        if error is None:
+            outcome = "ok"
+        elif isinstance(error, TIMEOUT_ERRORS):
+            outcome = "timeout"
+        else:
+            outcome = "error"
+        self.ledger.record(
+            tenant_id, kind, outcome,
+            latency_ms=int((time.monotonic() - started) * 1000),
+            wait_ms=int(waited * 1000),
+            provider=provider.name if provider else None,
+            model=self._model_for(settings, provider) if provider else None,
+            usage=usage,
+            conversation_id=conversation_id,
+            error_type=type(error).__name__ if error else None,
+            cached=cached,
+        )
+
+    def _model_for(self, settings: TenantSettings, provider: Provider) -> str:
+        """El modelo del tenant aplica solo a su proveedor; en los demás se usa el del proveedor."""
+        if settings.model and provider.name == (settings.provider or self.router.primary.name):
+            return settings.model
+        return provider.model
+
+    @staticmethod
+    def _layout(settings: TenantSettings, context_messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Arma el prompt con un prefijo estable, para aprovechar la caché de prefijos del
+        proveedor (DeepSeek cobra una fracción por los tokens de prefijo ya vistos):
+        primero lo fijo del tenant (system prompt compilado), después lo de la conversación
+        en orden cronológico (resumen, turnos). Cada mensaje se reduce a role y content,
+        en ese orden, para que la misma conversación se serialice siempre con los mismos bytes.
+        """
+        return [*settings.prefix, *({"role": m["role"], "content": m["content"]} for m in context_messages)]
+
+    @property
+    def client(self):
+        """Cliente del proveedor principal (el primero del registro)."""
+        return self.router.primary.client
+
+    @property
+    def model(self) -> str:
+        return self.router.primary.model
         
-    async def generate_response(self, context_messages: List[Dict[str, Any]], tenant_id: str = "default") -> str:
+    async def generate_response(
+        self, context_messages: List[Dict[str, Any]], tenant_id: str = "default", conversation_id: Optional[int] = None
+    ) -> str:
         """
-        Llama asíncronamente a DeepSeek inyectando el SYSTEM_PROMPT.
+        Llama asíncronamente a DeepSeek inyectando el system prompt del tenant.
         Aísla el contexto usando el tenant_id.
         """
-        # FUTURE TODO: Según el 'tenant_id', podemos buscar en la Base de Datos o en Caché (Redis) 
-        # un SYSTEM_PROMPT totalmente diferente. Ej: Para InASC actuará como consultor técnico de agua, 
-        # pero para "Empresa de Zapatos X" actuará como vendedor de moda, sin sobreescribir variables globales.
-        
-        dynamic_system_prompt = SYSTEM_PROMPT # Por ahora es igual para todos, luego será dinámico por Tenant
-        
-        # Asegurarnos de inyectar el System Prompt siempre al principio
-        messages = [{"role": "system", "content": dynamic_system_prompt}] + context_messages
-        
+        # Configuración del tenant (en memoria): ej. para InASC actúa como consultor técnico
+        # de agua y para "Empresa de Zapatos X" como vendedor de moda.
+        settings = self.tenant_configs.get(tenant_id)
+
+        # Asegurarnos de inyectar el System Prompt siempre al principio (prefijo ya compilado)
+        messages = self._layout(settings, context_messages)
+
+        cache_key = self.response_cache.make_key(tenant_id, context_messages)
+        started = time.monotonic()
+        cached = self.response_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"[{tenant_id}] ⚡ Respuesta servida desde caché.")
+            self._log_call(tenant_id, "reply", conversation_id, settings, started, 0.0, None, CACHED_USAGE, None, cached=True)
+            return cached
+
+        reserved = context_builder.record_prompt(tenant_id, messages) + LLM_ADMISSION_COMPLETION_TOKENS
+        started, waited, provider, usage, error = time.monotonic(), 0.0, None, None, None
         try:
-            response = await self.client.chat.completions.create(
-                model=self.model,
+            waited = await self.admission.acquire(tenant_id, reserved)
+            response, provider = await self.router.call(tenant_id, lambda provider: provider.client.chat.completions.create(
+                model=self._model_for(settings, provider),
                 messages=messages,
-                temperature=0.3 # Baja temperatura para respuestas técnicas deterministas
-            )
+                temperature=settings.temperature # Por defecto baja: respuestas técnicas deterministas
+            ))
+            usage = self._account(tenant_id, provider, reserved, response.usage)
             
-            return response.choices[0].message.content
+            text = response.choices[0].message.content
+            self.response_cache.put(cache_key, text)
+            return text
+        except CircuitOpenError as e:
+            error = e
+            logger.warning(f"[{tenant_id}] 🔌 Proveedores LLM marcados como caídos (circuito abierto): respuesta de contingencia.")
+            return FALLBACK_MESSAGE
+        except AdmissionTimeoutError as e:
+            error = e
+            return FALLBACK_MESSAGE
         except Exception as e:
+            error = e
             logger.error(
                 f"Error communicating with DeepSeek:\n"
                 f"  Type   : {type(e).__name__}\n"
                 f"  Message: {e}\n"
                 f"  Traceback:\n{traceback.format_exc()}"
             )
-            return "Lo lamento, en este momento me encuentro experimentando interferencia en mis sistemas centrales. ¿Podría intentarlo de nuevo en unos minutos?"
+            return FALLBACK_MESSAGE
+        finally:
+            self._log_call(tenant_id, "reply", conversation_id, settings, started, waited, provider, usage, error)
+
+    async def stream_response(
+        self, context_messages: List[Dict[str, Any]], tenant_id: str = "default", conversation_id: Optional[int] = None
+    ) -> AsyncIterator[str]:
+        """
+        Variante en streaming de generate_response(): produce los fragmentos (deltas)
+        de texto a medida que DeepSeek los genera, para reducir el time-to-first-token.
+
+        El caller es responsable de concatenar los deltas para obtener el texto
+        completo (persistencia y detección de [HANDOFF_REQUESTED]).
+        Si falla antes del primer delta, produce FALLBACK_MESSAGE. El stream completo
+        (establecimiento + lectura) está acotado por LLM_DEADLINE_SECONDS.
+        Un acierto de caché se produce como un único delta.
+        """
+        settings = self.tenant_configs.get(tenant_id)
+        messages = self._layout(settings, context_messages)
+
+        cache_key = self.response_cache.make_key(tenant_id, context_messages)
+        started = time.monotonic()
+        cached = self.response_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"[{tenant_id}] ⚡ Respuesta servida desde caché.")
+            self._log_call(tenant_id, "stream", conversation_id, settings, started, 0.0, None, CACHED_USAGE, None, cached=True)
+            yield cached
+            return
+
+        reserved = context_builder.record_prompt(tenant_id, messages) + LLM_ADMISSION_COMPLETION_TOKENS
+        produced = False
+        parts = []
+        finish_reason = None
+        stream = None
+        started, waited, provider, usage, error = time.monotonic(), 0.0, None, None, None
+        try:
+            waited = await self.admission.acquire(tenant_id, reserved)
+            # El deadline cubre el stream completo, no solo su establecimiento: un proveedor
+            # que gotea tokens no puede retener al worker más de LLM_DEADLINE_SECONDS
+            deadline_at = asyncio.get_running_loop().time() + LLM_DEADLINE_SECONDS
+            # La política de resiliencia cubre el establecimiento del stream (failover incluido,
+            # dentro del mismo deadline); sin hedging, porque dos streams en paralelo duplicarían los deltas.
+            stream, provider = await self.router.call(tenant_id, lambda provider: provider.client.chat.completions.create(
+                model=self._model_for(settings, provider),
+                messages=messages,
+                temperature=settings.temperature,
+                stream=True,
+                extra_body={"stream_options": {"include_usage": True}} if LLM_STREAM_INCLUDE_USAGE else None
+            ), hedge=False, deadline_at=deadline_at)
+            chunks = stream.__aiter__()
+            while True:
+                # El timeout envuelve solo la lectura: nunca queda activo a través de un yield
+                async with asyncio.timeout_at(deadline_at):
+                    try:
+                        chunk = await chunks.__anext__()
+                    except StopAsyncIteration:
+                        break
+                # Con include_usage el último chunk trae el usage y ningún choice
+                if getattr(chunk, "usage", None):
+                    usage = self._account(tenant_id, provider, reserved, chunk.usage)
+                if not chunk.choices:
+                    continue
+                finish_reason = chunk.choices[0].finish_reason or finish_reason
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    produced = True
+                    parts.append(delta)
+                    yield delta
+            # Solo un stream completo: cortado por longitud, filtro o EOF prematuro no se reutiliza
+            if finish_reason == "stop":
+                self.response_cache.put(cache_key, "".join(parts))
+        except asyncio.TimeoutError as e:
+            error = e
+            logger.warning(f"[{tenant_id}] ⏱️ Stream de DeepSeek superó el deadline de {LLM_DEADLINE_SECONDS:.0f}s: se corta.")
+            if not produced:
+                yield FALLBACK_MESSAGE
+        except CircuitOpenError as e:
+            error = e
+            logger.warning(f"[{tenant_id}] 🔌 Proveedores LLM marcados como caídos (circuito abierto): respuesta de contingencia.")
+            yield FALLBACK_MESSAGE
+        except AdmissionTimeoutError as e:
+            error = e
+            yield FALLBACK_MESSAGE
+        except Exception as e:
+            error = e
+            logger.error(
+                f"Error streaming from DeepSeek:\n"
+                f"  Type   : {type(e).__name__}\n"
+                f"  Message: {e}\n"
+                f"  Traceback:\n{traceback.format_exc()}"
+            )
+            if not produced:
+                yield FALLBACK_MESSAGE
+        finally:
+            self._log_call(tenant_id, "stream", conversation_id, settings, started, waited, provider, usage, error)
+            if stream is not None and hasattr(stream, "close"):
+                # Libera la conexión HTTP si el stream se cortó antes del final
+                await stream.close()
+
+    async def summarize(
+        self,
+        previous_summary: Optional[str],
+        turns: List[Dict[str, Any]],
+        tenant_id: str = "default",
+        conversation_id: Optional[int] = None,
+    ) -> Optional[str]:
+        """
+        Integra `turns` al resumen anterior de la conversación.
+        Retorna None si DeepSeek falla: un resumen nunca debe guardar FALLBACK_MESSAGE.
+        """
+        transcript = "\n".join(f"{turn['role']}: {turn['content']}" for turn in turns)
+        user_content = (
+            f"RESUMEN ANTERIOR:\n{previous_summary or '(ninguno)'}\n\n"
+            f"TURNOS NUEVOS:\n{transcript}"
+        )
+        settings = self.tenant_configs.get(tenant_id)
+        messages = [
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": user_content},
+        ]
+        reserved = count_message_tokens(messages) + SUMMARY_MAX_TOKENS
+        started, waited, provider, usage, error = time.monotonic(), 0.0, None, None, None
+        try:
+            waited = await self.admission.acquire(tenant_id, reserved)
+            response, provider = await self.router.call(tenant_id, lambda provider: provider.client.chat.completions.create(
+                model=self._model_for(settings, provider),
+                messages=messages,
+                temperature=0.2,
+                max_tokens=SUMMARY_MAX_TOKENS,
+            ), hedge=False)
+            usage = self._account(tenant_id, provider, reserved, response.usage)
+            return (response.choices[0].message.content or "").strip() or None
+        except Exception as e:
+            error = e
+            logger.error(f"[{tenant_id}] Error resumiendo conversación con DeepSeek: {type(e).__name__}: {e}")
+            return None
+        finally:
+            self._log_call(tenant_id, "summary", conversation_id, settings, started, waited, provider, usage, error)
 
 # Instancia global (Patrón Singleton) a inyectar
 llm_engine = LLMEngine()
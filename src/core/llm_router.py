@@ -0,0 +1,200 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from dotenv import load_dotenv
+from openai import AsyncOpenAI
+
+from src.core.resilience import (
+    DeadlineExceededError,
+    PROVIDER_ERRORS,
+    ResilientCaller,
+    LLM_ATTEMPT_TIMEOUT_SECONDS,
+    LLM_DEADLINE_SECONDS,
+)
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Registro de proveedores compatibles con OpenAI, como lista JSON:
+# [{"name": "deepseek", "base_url": "https://api.deepseek.com", "model": "deepseek-chat",
+#   "api_key_env": "DEEPSEEK_API_KEY"}, {"name": "local", ...}]
+# Sin definir, el único proveedor es DeepSeek (comportamiento histórico).
+LLM_PROVIDERS = os.getenv("LLM_PROVIDERS", "")
+# Proveedores permitidos por tenant, en orden de preferencia: "inasc_001:deepseek|local,otro:local"
+LLM_TENANT_PROVIDERS = os.getenv("LLM_TENANT_PROVIDERS", "")
+# Peso de la última observación en los promedios móviles (EWMA) de latencia y error.
+LLM_ROUTER_EWMA_ALPHA = float(os.getenv("LLM_ROUTER_EWMA_ALPHA", "0.2"))
+# Probabilidad de enviar una llamada al segundo mejor proveedor para refrescar su EWMA.
+LLM_ROUTER_EXPLORE = float(os.getenv("LLM_ROUTER_EXPLORE", "0.05"))
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class ProviderConfig:
+    name: str
+    base_url: str
+    model: str
+    api_key_env: str = "DEEPSEEK_API_KEY"
+
+
+DEFAULT_PROVIDERS = [ProviderConfig(name="deepseek", base_url="https://api.deepseek.com", model="deepseek-chat")]
+
+
+def load_provider_configs(raw: str = LLM_PROVIDERS) -> List[ProviderConfig]:
+    if not raw.strip():
+        return list(DEFAULT_PROVIDERS)
+    return [ProviderConfig(**item) for item in json.loads(raw)]
+
+
+def parse_tenant_providers(raw: str) -> Dict[str, List[str]]:
+    """Convierte "tenant_a:deepseek|local,tenant_b:local" en {"tenant_a": ["deepseek", "local"], ...}."""
+    overrides: Dict[str, List[str]] = {}
+    for item in filter(None, (part.strip() for part in raw.split(","))):
+        tenant, _, names = item.partition(":")
+        overrides[tenant.strip()] = [name.strip() for name in names.split("|") if name.strip()]
+    return overrides
+
+
+class Provider:
+    """Un endpoint compatible con OpenAI con su cliente, su política de resiliencia y sus EWMA."""
+
+    def __init__(self, config: ProviderConfig, http_client=None, resilience: Optional[ResilientCaller] = None):
+        self.config = config
+        self.name = config.name
+        self.model = config.model
+        # Sin reintentos propios del SDK: los gobierna self.resilience
+        self.client = AsyncOpenAI(
+            api_key=os.getenv(config.api_key_env, "dummy_key"),
+            base_url=config.base_url,
+            max_retries=0,
+            timeout=LLM_ATTEMPT_TIMEOUT_SECONDS,
+            http_client=http_client,
+        )
+        self.resilience = resilience or ResilientCaller()
+        self.latency_ewma: Optional[float] = None
+        self.error_ewma = 0.0
+        self.requests = 0
+        self.errors = 0
+
+    @property
+    def healthy(self) -> bool:
+        return self.resilience.breaker.state != "open"
+
+    def score(self) -> float:
+        """Menor es mejor: latencia esperada penalizada por la tasa de error."""
+        if self.latency_ewma is None:
+            return 0.0  # Sin muestras: se prueba primero
+        return self.latency_ewma / max(0.05, 1.0 - self.error_ewma)
+
+    def observe(self, latency: Optional[float], alpha: float) -> None:
+        self.requests += 1
+        if latency is None:
+            self.errors += 1
+            self.error_ewma = alpha + (1 - alpha) * self.error_ewma
+            return
+        self.error_ewma = (1 - alpha) * self.error_ewma
+        self.latency_ewma = latency if self.latency_ewma is None else alpha * latency + (1 - alpha) * self.latency_ewma
+
+    def stats(self) -> dict:
+        return {
+            **self.resilience.stats(),
+            "model": self.model,
+            "latency_ewma_ms": round(self.latency_ewma * 1000, 1) if self.latency_ewma is not None else None,
+            "error_rate_ewma": round(self.error_ewma, 3),
+            "requests": self.requests,
+            "errors": self.errors,
+        }
+
+
+class LLMRouter:
+    """
+    Enruta cada llamada al mejor proveedor sano (menor latencia EWMA penalizada por
+    errores) y pasa al siguiente si falla. Un proveedor con el circuito abierto solo
+    se intenta si todos los demás también lo están.
+
+    Con LLM_TENANT_PROVIDERS, un tenant solo usa los proveedores listados
+    (ej: un cliente que exige un modelo auto-hospedado por residencia de datos).
+
+    Todo el failover comparte un único deadline (LLM_DEADLINE_SECONDS): cada proveedor
+    recibe solo el tiempo que queda. Un error del request (400, 401...) no es culpa del
+    proveedor: se relanza sin failover y sin tocar sus EWMA.
+    """
+
+    def __init__(
+        self,
+        providers: List[Provider],
+        tenant_providers: Optional[Dict[str, List[str]]] = None,
+        alpha: float = LLM_ROUTER_EWMA_ALPHA,
+        explore: float = LLM_ROUTER_EXPLORE,
+        deadline: float = LLM_DEADLINE_SECONDS,
+    ):
+        if not providers:
+            raise ValueError("LLMRouter requires at least one provider")
+        self.providers: Dict[str, Provider] = {p.name: p for p in providers}
+        self.tenant_providers = tenant_providers if tenant_providers is not None else parse_tenant_providers(LLM_TENANT_PROVIDERS)
+        self.alpha = alpha
+        self.explore = explore
+        self.deadline = deadline
+        self.failovers = 0
+
+    @property
+    def primary(self) -> Provider:
+        return next(iter(self.providers.values()))
+
+    def candidates(self, tenant_id: str) -> List[Provider]:
+        names = self.tenant_providers.get(tenant_id)
+        pool = [self.providers[n] for n in names if n in self.providers] if names else list(self.providers.values())
+        if not pool:
+            pool = list(self.providers.values())
+        # sorted() es estable: a igual puntaje se respeta el orden del registro
+        ranked = sorted(pool, key=lambda p: (not p.healthy, p.score()))
+        if len(ranked) > 1 and ranked[1].healthy and random.random() < self.explore:
+            ranked[0], ranked[1] = ranked[1], ranked[0]
+        return ranked
+
+    async def call(
+        self,
+        tenant_id: str,
+        request: Callable[[Provider], Awaitable[T]],
+        hedge: Optional[bool] = None,
+        deadline_at: Optional[float] = None,
+    ) -> Tuple[T, Provider]:
+        """
+        Ejecuta `request(provider)` en el mejor proveedor, con failover. Retorna (resultado, proveedor).
+        `deadline_at` (hora del event loop) es el límite de todo el failover; por defecto, ahora + deadline.
+        """
+        loop = asyncio.get_running_loop()
+        if deadline_at is None:
+            deadline_at = loop.time() + self.deadline
+        last_error: Optional[BaseException] = None
+        for position, provider in enumerate(self.candidates(tenant_id)):
+            if loop.time() >= deadline_at:
+                break
+            if position > 0:
+                self.failovers += 1
+                logger.warning(f"[LLMRouter] [{tenant_id}] Failover al proveedor '{provider.name}'.")
+            started = time.monotonic()
+            try:
+                result = await provider.resilience.call(lambda: request(provider), hedge=hedge, deadline_at=deadline_at)
+            except PROVIDER_ERRORS as e:
+                provider.observe(None, self.alpha)
+                last_error = e
+                continue
+            provider.observe(time.monotonic() - started, self.alpha)
+            return result, provider
+        if last_error is None or loop.time() >= deadline_at:
+            raise DeadlineExceededError(f"LLM failover exceeded its deadline ({self.deadline:.1f}s)") from last_error
+        raise last_error
+
+    def stats(self) -> dict:
+        return {
+            "failovers": self.failovers,
+            "providers": {name: p.stats() for name, p in self.providers.items()},
+        }
@@ -0,0 +1,235 @@
+"""
+message_log.py — Write-ahead log durable para la cola de mensajes.
+
+Cada mensaje aceptado por un webhook se escribe en un log append-only de
+segmentos en disco ANTES de responder 200 OK al canal. Cuando el worker termina
+de procesarlo, se escribe un registro de ack. Al reiniciar el servidor, los
+mensajes sin ack se vuelven a encolar (entrega at-least-once).
+
+Group commit: un único escritor en background toma TODOS los registros
+pendientes, los escribe juntos y hace un solo fsync por lote. Bajo carga, el
+costo de durabilidad se reparte entre todos los mensajes del lote.
+
+Formato: un registro JSON por línea en `segment-NNNNNN.log`:
+    {"op": "msg", "seq": 17, "msg": {...IncomingMessage...}}
+    {"op": "ack", "seq": 17}
+Un segmento cerrado cuyos mensajes ya tienen ack se elimina.
+"""
+import asyncio
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from src.models.message import IncomingMessage
+
+logger = logging.getLogger(__name__)
+
+# Clave en IncomingMessage.metadata donde viaja el número de secuencia del WAL.
+# Se guarda en metadata (y no en un atributo privado) para sobrevivir al spill a disco.
+WAL_SEQ_KEY = "_wal_seq"
+
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".log"
+
+
+class DurableMessageLog:
+    """
+    Log de segmentos append-only con group commit (un fsync por lote).
+
+    Uso:
+        log = DurableMessageLog("queue_wal")
+        pendientes = await log.open()      # replay de mensajes sin ack
+        seq = await log.append(message)    # retorna cuando el registro es durable
+        log.ack(seq)                       # el ack viaja en el siguiente lote
+        await log.close()
+    """
+
+    def __init__(self, directory: str, segment_max_bytes: int = 16 * 1024 * 1024, commit_delay_ms: float = 0.0):
+        self.directory = Path(directory)
+        self.segment_max_bytes = segment_max_bytes
+        # Espera opcional para juntar más registros por lote (latencia vs. fsyncs)
+        self.commit_delay = commit_delay_ms / 1000.0
+        self._next_seq = 1
+        self._segment_id = 0
+        self._segment_bytes = 0
+        self._fh = None
+        # (línea serializada, future del productor o None para acks, seq de mensaje o None)
+        self._pending: List[Tuple[bytes, Optional[asyncio.Future], Optional[int]]] = []
+        self._wakeup = asyncio.Event()
+        self._flusher: Optional[asyncio.Task] = None
+        self._closing = False
+        # seq sin ack → segmento donde está escrito; segmento → mensajes vivos
+        self._seq_segment: Dict[int, int] = {}
+        self._segment_live: Dict[int, int] = {}
+        self._batches = 0
+        self._records = 0
+
+    @property
+    def is_open(self) -> bool:
+        return self._flusher is not None
+
+    # ── Ciclo de vida ─────────────────────────────────────────────────────────
+
+    async def open(self) -> List[IncomingMessage]:
+        """
+        Reproduce los segmentos existentes y retorna los mensajes sin ack, en orden.
+        Luego abre un segmento nuevo y arranca el escritor de group commit.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        pending = self._replay()
+        self._open_segment(self._segment_id + 1)
+        self._closing = False
+        self._flusher = asyncio.create_task(self._flush_loop())
+        if pending:
+            logger.info(f"[WAL] {len(pending)} mensajes sin ack recuperados de {self.directory}.")
+        return pending
+
+    async def close(self) -> None:
+        """Escribe lo pendiente y cierra el segmento activo."""
+        if self._flusher is None:
+            return
+        self._closing = True
+        self._wakeup.set()
+        await self._flusher
+        self._flusher = None
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    # ── API de la cola ────────────────────────────────────────────────────────
+
+    async def append(self, message: IncomingMessage) -> int:
+        """
+        Registra el mensaje y espera a que su lote haga fsync.
+        Asigna el seq en `message.metadata[WAL_SEQ_KEY]`.
+        """
+        if not self.is_open:
+            raise RuntimeError("DurableMessageLog.append() antes de open()")
+        seq = self._next_seq
+        self._next_seq += 1
+        message.metadata[WAL_SEQ_KEY] = seq
+        line = json.dumps({"op": "msg", "seq": seq, "msg": message.model_dump(mode="json")}, ensure_ascii=False)
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(((line + "\n").encode("utf-8"), future, seq))
+        self._wakeup.set()
+        await future
+        return seq
+
+    def ack(self, seq: int) -> None:
+        """
+        Marca el mensaje como procesado. No espera fsync: perder un ack en un crash
+        solo provoca un reproceso (at-least-once), nunca una pérdida.
+        """
+        segment = self._seq_segment.pop(seq, None)
+        if segment is None:
+            return  # ack duplicado o seq desconocido
+        self._segment_live[segment] -= 1
+        line = json.dumps({"op": "ack", "seq": seq})
+        self._pending.append(((line + "\n").encode("utf-8"), None, None))
+        self._wakeup.set()
+
+    def stats(self) -> dict:
+        return {
+            "unacked": len(self._seq_segment),
+            "segments": len(self._segment_live),
+            "batches": self._batches,
+            "records": self._records,
+            "avg_batch_size": round(self._records / self._batches, 2) if self._batches else 0.0,
+        }
+
+    # ── Group commit ──────────────────────────────────────────────────────────
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            if self.commit_delay and not self._closing:
+                await asyncio.sleep(self.commit_delay)
+            self._wakeup.clear()
+            if self._pending:
+                await self._commit_batch()
+            if self._closing and not self._pending:
+                return
+
+    async def _commit_batch(self) -> None:
+        batch, self._pending = self._pending, []
+        try:
+            segment = await asyncio.to_thread(self._write_and_sync, [line for line, _, _ in batch])
+        except Exception as e:
+            logger.error(f"[WAL] Error escribiendo lote de {len(batch)} registros: {e}")
+            for _, future, _ in batch:
+                if future is not None and not future.done():
+                    future.set_exception(e)
+            return
+
+        self._batches += 1
+        self._records += len(batch)
+        for _, future, seq in batch:
+            if seq is not None:
+                self._seq_segment[seq] = segment
+                self._segment_live[segment] = self._segment_live.get(segment, 0) + 1
+            if future is not None and not future.done():
+                future.set_result(None)
+        self._delete_dead_segments()
+
+    def _write_and_sync(self, lines: List[bytes]) -> int:
+        """Se ejecuta en un hilo: escribe el lote completo y hace UN fsync."""
+        if self._segment_bytes >= self.segment_max_bytes:
+            self._fh.close()
+            self._open_segment(self._segment_id + 1)
+        data = b"".join(lines)
+        self._fh.write(data)
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+        self._segment_bytes += len(data)
+        return self._segment_id
+
+    def _delete_dead_segments(self) -> None:
+        for segment, live in list(self._segment_live.items()):
+            if live == 0 and segment != self._segment_id:
+                self._segment_path(segment).unlink(missing_ok=True)
+                del self._segment_live[segment]
+
+    # ── Segmentos y replay ────────────────────────────────────────────────────
+
+    def _segment_path(self, segment: int) -> Path:
+        return self.directory / f"{SEGMENT_PREFIX}{segment:06d}{SEGMENT_SUFFIX}"
+
+    def _open_segment(self, segment: int) -> None:
+        self._segment_id = segment
+        self._segment_live.setdefault(segment, 0)
+        self._fh = open(self._segment_path(segment), "ab")
+        self._segment_bytes = self._fh.tell()
+
+    def _replay(self) -> List[IncomingMessage]:
+        live: Dict[int, Tuple[int, dict]] = {}
+        for path in sorted(self.directory.glob(f"{SEGMENT_PREFIX}*{SEGMENT_SUFFIX}")):
+            segment = int(path.stem[len(SEGMENT_PREFIX):])
+            self._segment_id = max(self._segment_id, segment)
+            self._segment_live.setdefault(segment, 0)
+            with open(path, "r", encoding="utf-8") as fh:
+                for line in fh:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Última línea truncada por un crash a mitad de escritura
+                        logger.warning(f"[WAL] Registro corrupto ignorado en {path.name}.")
+                        continue
+                    seq = record["seq"]
+                    self._next_seq = max(self._next_seq, seq + 1)
+                    if record["op"] == "msg":
+                        live[seq] = (segment, record["msg"])
+                    elif record["op"] == "ack":
+                        live.pop(seq, None)
+
+        pending = []
+        for seq in sorted(live):
+            segment, payload = live[seq]
+            self._seq_segment[seq] = segment
+            self._segment_live[segment] += 1
+            message = IncomingMessage.model_validate(payload)
+            message.metadata[WAL_SEQ_KEY] = seq
+            pending.append(message)
+        self._delete_dead_segments()
+        return pending
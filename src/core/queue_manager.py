@@ -1,32 +1,355 @@
 import asyncio
+import json
 import logging
+import os
+import re
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Deque, Dict, Optional
+
+from dotenv import load_dotenv
+
+from src.core.config_utils import parse_tenant_weights
+from src.core.message_log import DurableMessageLog, WAL_SEQ_KEY
 from src.models.message import IncomingMessage
 
+load_dotenv()
+
 # Configurar logging básico
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# ── Configuración de la cola multi-carril ─────────────────────────────────────
+# Capacidad máxima (en mensajes) del carril de CADA tenant.
+LANE_MAXSIZE = int(os.getenv("QUEUE_LANE_MAXSIZE", "500"))
+# Qué hacer cuando el carril de un tenant está lleno:
+#   reject      → el webhook responde 503 y el canal reintenta más tarde.
+#   drop_oldest → se descarta el mensaje más antiguo del carril.
+#   spill       → el excedente se escribe a disco y se recarga cuando hay espacio.
+OVERFLOW_POLICY = os.getenv("QUEUE_OVERFLOW_POLICY", "reject")
+SPILL_DIR = os.getenv("QUEUE_SPILL_DIR", "queue_spill")
+# Pesos del Deficit Round Robin por tenant, ej: "inasc_001:3,tenant_b:1".
+# Un tenant sin peso explícito recibe 1 (un mensaje por ronda).
+TENANT_WEIGHTS = os.getenv("QUEUE_TENANT_WEIGHTS", "")
+# Directorio del write-ahead log. Vacío → cola solo en memoria (se pierde al reiniciar).
+WAL_DIR = os.getenv("QUEUE_WAL_DIR", "")
+# Espera máxima para juntar registros en un mismo fsync (group commit).
+WAL_COMMIT_DELAY_MS = float(os.getenv("QUEUE_WAL_COMMIT_DELAY_MS", "2"))
+
+OVERFLOW_POLICIES = ("reject", "drop_oldest", "spill")
+
+
+class QueueFullError(Exception):
+    """
+    El carril del tenant está lleno y la política de desbordamiento es 'reject'.
+    Los routers la traducen a HTTP 503 para que el canal reintente.
+    """
+
+
+@dataclass
+class _Lane:
+    """Sub-cola acotada de un tenant."""
+    tenant_id: str
+    weight: float
+    items: Deque[IncomingMessage] = field(default_factory=deque)
+    deficit: float = 0.0
+    spilled: int = 0          # mensajes en disco pendientes de recargar
+    spill_offset: int = 0     # byte desde el que se lee el archivo de spill
+    dropped: int = 0
+    rejected: int = 0
+
+
+class TenantLaneQueue:
+    """
+    Cola de mensajes con un carril acotado por tenant, drenada por Deficit Round Robin.
+
+    - Memoria acotada: cada carril admite como máximo `lane_maxsize` mensajes en RAM.
+    - Equidad: en cada ronda un tenant despacha tantos mensajes como su peso, así
+      que un tenant ruidoso no puede dejar sin servicio a los demás.
+    - Contrapresión: cuando un carril se llena se aplica `overflow_policy`.
+
+    Expone la misma superficie mínima que asyncio.Queue usada en el proyecto
+    (get, qsize, task_done) para que MessageQueueManager siga siendo un wrapper delgado.
+    """
+
+    def __init__(
+        self,
+        lane_maxsize: int = LANE_MAXSIZE,
+        overflow_policy: str = OVERFLOW_POLICY,
+        spill_dir: str = SPILL_DIR,
+        weights: Optional[Dict[str, float]] = None,
+        on_discard: Optional[Callable[[IncomingMessage], None]] = None,
+        recover_spills: bool = True,
+    ):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow_policy inválida: '{overflow_policy}'. Opciones: {OVERFLOW_POLICIES}")
+        self.lane_maxsize = lane_maxsize
+        self.overflow_policy = overflow_policy
+        self.spill_dir = Path(spill_dir)
+        self.weights = weights if weights is not None else parse_tenant_weights(TENANT_WEIGHTS)
+        # Callback para mensajes descartados por drop_oldest (ej: ack en el WAL)
+        self.on_discard = on_discard
+        # False cuando el WAL ya re-encola lo que quedó en disco (ver _recover_spills)
+        self.recover_spills = recover_spills
+        self._lanes: Dict[str, _Lane] = {}
+        # Tenants con trabajo pendiente, en orden de turno del round robin
+        self._active: Deque[str] = deque()
+        self._not_empty = asyncio.Event()
+        self._size = 0
+        self._unfinished = 0
+        self._recover_spills()
+
+    # ── Productores ───────────────────────────────────────────────────────────
+
+    def would_reject(self, tenant_id: str) -> bool:
+        """True si un put_nowait() para este tenant levantaría QueueFullError."""
+        lane = self._lanes.get(tenant_id)
+        return (
+            self.overflow_policy == "reject"
+            and lane is not None
+            and len(lane.items) >= self.lane_maxsize
+        )
+
+    def put_nowait(self, message: IncomingMessage, force: bool = False) -> None:
+        """
+        Encola el mensaje en el carril de su tenant aplicando la política de desbordamiento.
+        Levanta QueueFullError si el carril está lleno y la política es 'reject'.
+
+        `force=True` omite la política (replay del WAL al arrancar: esos mensajes
+        ya fueron aceptados y no pueden rechazarse).
+        """
+        lane = self._get_lane(message.tenant_id)
+
+        # Con mensajes ya en disco, los nuevos también van a disco para conservar el orden FIFO.
+        if not force and (lane.spilled or len(lane.items) >= self.lane_maxsize):
+            if self.overflow_policy == "reject":
+                lane.rejected += 1
+                raise QueueFullError(f"Carril del tenant '{lane.tenant_id}' lleno ({self.lane_maxsize} mensajes).")
+            if self.overflow_policy == "drop_oldest" and lane.items:
+                dropped = lane.items.popleft()
+                lane.dropped += 1
+                self._size -= 1
+                self._unfinished -= 1
+                logger.warning(
+                    f"[Queue] Carril '{lane.tenant_id}' lleno. Descartado mensaje antiguo de {dropped.platform_user_id}."
+                )
+                if self.on_discard is not None:
+                    self.on_discard(dropped)
+            elif self.overflow_policy == "spill":
+                self._spill(lane, message)
+                self._activate(lane)
+                return
+
+        lane.items.append(message)
+        self._size += 1
+        self._unfinished += 1
+        self._activate(lane)
+
+    # ── Consumidor (Agent Loop) ───────────────────────────────────────────────
+
+    async def get(self) -> IncomingMessage:
+        """Bloquea asíncronamente hasta que algún carril tenga un mensaje."""
+        while True:
+            message = self._pop_next()
+            if message is not None:
+                return message
+            self._not_empty.clear()
+            await self._not_empty.wait()
+
+    def task_done(self) -> None:
+        if self._unfinished <= 0:
+            raise ValueError("task_done() llamado más veces que mensajes encolados")
+        self._unfinished -= 1
+
+    def qsize(self) -> int:
+        """Mensajes pendientes en todos los carriles (RAM + disco)."""
+        return self._size
+
+    def stats(self) -> dict:
+        return {
+            "size": self._size,
+            "overflow_policy": self.overflow_policy,
+            "lane_maxsize": self.lane_maxsize,
+            "lanes": {
+                tenant: {
+                    "in_memory": len(lane.items),
+                    "spilled": lane.spilled,
+                    "dropped": lane.dropped,
+                    "rejected": lane.rejected,
+                    "weight": lane.weight,
+                }
+                for tenant, lane in self._lanes.items()
+            },
+        }
+
+    # ── Internos ──────────────────────────────────────────────────────────────
+
+    def _get_lane(self, tenant_id: str) -> _Lane:
+        lane = self._lanes.get(tenant_id)
+        if lane is None:
+            lane = _Lane(tenant_id=tenant_id, weight=self.weights.get(tenant_id, 1.0))
+            self._lanes[tenant_id] = lane
+        return lane
+
+    def _activate(self, lane: _Lane) -> None:
+        if lane.tenant_id not in self._active:
+            self._active.append(lane.tenant_id)
+        self._not_empty.set()
+
+    def _pop_next(self) -> Optional[IncomingMessage]:
+        """
+        Deficit Round Robin con costo unitario por mensaje: el tenant al frente
+        gana `weight` créditos por turno y despacha un mensaje por crédito.
+        """
+        while self._active:
+            lane = self._lanes[self._active[0]]
+            if not lane.items and lane.spilled:
+                self._refill(lane)
+            if not lane.items:
+                # Carril vacío: sale de la rotación y pierde el crédito acumulado
+                self._active.popleft()
+                lane.deficit = 0.0
+                continue
+
+            if lane.deficit < 1:
+                lane.deficit += lane.weight
+                if lane.deficit < 1:
+                    # Peso fraccionario: acumula crédito y cede el turno
+                    self._active.rotate(-1)
+                    continue
+
+            lane.deficit -= 1
+            message = lane.items.popleft()
+            self._size -= 1
+            if lane.spilled and len(lane.items) < self.lane_maxsize // 2:
+                self._refill(lane)
+            if lane.deficit < 1:
+                self._active.rotate(-1)
+            return message
+        return None
+
+    def _spill_path(self, tenant_id: str) -> Path:
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", tenant_id)
+        return self.spill_dir / f"{safe_name}.jsonl"
+
+    def _recover_spills(self) -> None:
+        """
+        Retoma los archivos de spill de un proceso anterior. Sus contadores (spilled,
+        spill_offset) vivían en memoria: se reconstruyen contando las líneas completas,
+        y el archivo sigue siendo el spill del carril (lo viejo sale primero y lo nuevo
+        se agrega detrás). Con el WAL activo esos mensajes ya se recuperan en start():
+        el archivo se borra para no encolarlos dos veces.
+        """
+        if not self.spill_dir.is_dir():
+            return
+        for path in sorted(self.spill_dir.glob("*.jsonl")):
+            if not self.recover_spills:
+                path.unlink(missing_ok=True)
+                logger.info(f"[Queue] Spill de un proceso anterior '{path}' borrado: lo recupera el WAL.")
+                continue
+            with open(path, "r", encoding="utf-8") as fh:
+                # Una última línea sin salto quedó a medio escribir (caída): no se cuenta
+                lines = [line for line in fh if line.endswith("\n")]
+            if not lines:
+                path.unlink(missing_ok=True)
+                continue
+            lane = self._get_lane(json.loads(lines[0])["tenant_id"])
+            lane.spilled = len(lines)
+            lane.spill_offset = 0
+            self._size += len(lines)
+            self._unfinished += len(lines)
+            self._activate(lane)
+            logger.warning(f"[Queue] Recuperados {len(lines)} mensajes del spill de un proceso anterior ('{path}').")
+
+    def _spill(self, lane: _Lane, message: IncomingMessage) -> None:
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        with open(self._spill_path(lane.tenant_id), "a", encoding="utf-8") as fh:
+            fh.write(message.model_dump_json() + "\n")
+        lane.spilled += 1
+        self._size += 1
+        self._unfinished += 1
+
+    def _refill(self, lane: _Lane) -> None:
+        """Recarga desde disco hasta llenar el carril, respetando el orden de llegada."""
+        path = self._spill_path(lane.tenant_id)
+        free = self.lane_maxsize - len(lane.items)
+        with open(path, "r", encoding="utf-8") as fh:
+            fh.seek(lane.spill_offset)
+            while free > 0 and lane.spilled:
+                line = fh.readline()
+                if not line:
+                    break
+                lane.items.append(IncomingMessage.model_validate(json.loads(line)))
+                lane.spilled -= 1
+                free -= 1
+            lane.spill_offset = fh.tell()
+
+        if not lane.spilled:
+            # Todo el archivo fue consumido: se trunca para no crecer indefinidamente
+            path.unlink(missing_ok=True)
+            lane.spill_offset = 0
+
+
 class MessageQueueManager:
     """
     A Singleton queue manager that decouples the fast webhook ingestion (FastAPI)
     from the slow LLM processing (Core Engine).
+
+    With QUEUE_WAL_DIR configured, every accepted message is written to a durable
+    write-ahead log before the webhook answers 200 OK, and mark_task_done() acks it.
+    Unacked messages are replayed on start().
     """
     _instance = None
-    
+
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(MessageQueueManager, cls).__new__(cls)
-            # Inicializar la cola de asyncio. 
-            # maxsize=0 significa infinita, aunque en prod podría limitarse para evitar OOM.
-            cls._instance.queue = asyncio.Queue()
+            # Cola multi-carril: un carril acotado por tenant para evitar OOM y
+            # que un tenant ruidoso acapare el Agent Loop.
+            cls._instance.queue = TenantLaneQueue(on_discard=cls._instance._ack, recover_spills=not WAL_DIR)
+            cls._instance.log = (
+                DurableMessageLog(WAL_DIR, commit_delay_ms=WAL_COMMIT_DELAY_MS) if WAL_DIR else None
+            )
         return cls._instance
 
+    async def start(self):
+        """
+        Open the write-ahead log (if enabled) and re-enqueue unacknowledged messages.
+        Called once from the FastAPI lifespan, before the Agent Loop starts.
+        """
+        if self.log is None or self.log.is_open:
+            return
+        replayed = await self.log.open()
+        for message in replayed:
+            self.queue.put_nowait(message, force=True)
+        logger.info(f"[Queue] WAL activo en '{self.log.directory}'. Mensajes recuperados: {len(replayed)}")
+
+    async def close(self):
+        """Flush pending WAL records on shutdown."""
+        if self.log is not None:
+            await self.log.close()
+
     async def enqueue_message(self, message: IncomingMessage):
         """
         Push a new message into the processing queue.
         This is called by the FastAPI endpoints instantly.
+
+        Raises QueueFullError when the tenant lane is full and the overflow policy is 'reject'.
+        With the WAL enabled, returns only once the message is durable on disk.
         """
-        await self.queue.put(message)
+        if self.log is not None and self.log.is_open:
+            if self.queue.would_reject(message.tenant_id):
+                raise QueueFullError(f"Carril del tenant '{message.tenant_id}' lleno.")
+            await self.log.append(message)
+            try:
+                self.queue.put_nowait(message)
+            except QueueFullError:
+                # El carril se llenó mientras esperábamos el fsync: el canal reintentará
+                self._ack(message)
+                raise
+        else:
+            self.queue.put_nowait(message)
         logger.info(f"Message from {message.platform_user_id} stacked. Queue size approximate: {self.queue.qsize()}")
 
     async def get_message(self) -> IncomingMessage:
@@ -36,11 +359,20 @@ class MessageQueueManager:
         """
         return await self.queue.get()
 
-    def mark_task_done(self):
+    def mark_task_done(self, message: Optional[IncomingMessage] = None):
         """
         Acknowledge that the message has been fully processed by the LLM.
+        With the WAL enabled this is a real ack: the message will not be replayed.
         """
         self.queue.task_done()
-        
+        self._ack(message)
+
+    def _ack(self, message: Optional[IncomingMessage]):
+        if self.log is None or message is None:
+            return
+        seq = message.metadata.get(WAL_SEQ_KEY)
+        if seq is not None:
+            self.log.ack(seq)
+
 # Instancia global para ser importada en toda la app
 queue_manager = MessageQueueManager()
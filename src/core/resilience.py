@@ -0,0 +1,272 @@
+import asyncio
+import logging
+import math
+import os
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Optional, TypeVar
+
+import openai
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Tiempo máximo total de una llamada al LLM, reintentos incluidos.
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "25"))
+# Tiempo máximo de cada intento individual.
+LLM_ATTEMPT_TIMEOUT_SECONDS = float(os.getenv("LLM_ATTEMPT_TIMEOUT_SECONDS", "15"))
+# Intentos totales ante errores reintentables (timeouts, 429, 5xx, conexión).
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "3"))
+# Backoff exponencial con jitter completo: uniforme en [0, min(max, base * 2^n)].
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "0.5"))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "4"))
+# Hedging: si el intento supera el p95 de latencia, se lanza una segunda petición igual
+# y gana la primera que responda. Duplica el costo de esas llamadas: desactivado por defecto.
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+# Espera mínima antes de lanzar la petición de respaldo (y la usada sin suficientes muestras).
+LLM_HEDGE_MIN_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_MIN_DELAY_SECONDS", "2"))
+# Circuit breaker: fallos consecutivos para abrir y segundos antes de dejar pasar una prueba.
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+
+T = TypeVar("T")
+
+# Errores transitorios del API compatible con OpenAI que vale la pena reintentar
+RETRYABLE_ERRORS = (
+    asyncio.TimeoutError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+class CircuitOpenError(Exception):
+    """El proveedor está marcado como caído: se falla de inmediato sin llamarlo."""
+
+
+class DeadlineExceededError(Exception):
+    """La llamada (con sus reintentos) superó el deadline."""
+
+
+# Lo que ResilientCaller.call() deja salir cuando la culpa es del proveedor (caído, lento o
+# saturado): justifica probar otro. Cualquier otro error es del request (400, 401...).
+PROVIDER_ERRORS = RETRYABLE_ERRORS + (CircuitOpenError, DeadlineExceededError)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker clásico de tres estados.
+
+    closed     → las llamadas pasan; `failure_threshold` fallos seguidos lo abren.
+    open       → se falla de inmediato durante `reset_timeout` segundos.
+    half_open  → pasa UNA llamada de prueba: si sale bien se cierra, si falla se reabre.
+    """
+
+    def __init__(self, failure_threshold: int = LLM_BREAKER_FAILURES, reset_timeout: float = LLM_BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = "closed"
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = "half_open"
+        return self._state
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        if self._state != "closed":
+            logger.info("[CircuitBreaker] ✅ Proveedor recuperado: circuito cerrado.")
+        self._state = "closed"
+        self._consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self._consecutive_failures += 1
+        if self._state == "half_open" or self._consecutive_failures >= self.failure_threshold:
+            if self._state != "open":
+                self.times_opened += 1
+                logger.warning(
+                    f"[CircuitBreaker] 🔌 Circuito abierto tras {self._consecutive_failures} fallos; "
+                    f"se reintentará en {self.reset_timeout:.0f}s."
+                )
+            self._state = "open"
+            self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+
+    def release(self) -> None:
+        """Libera la prueba de half_open sin veredicto (ej: error no reintentable del request)."""
+        self._probe_in_flight = False
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._consecutive_failures,
+            "times_opened": self.times_opened,
+        }
+
+
+class ResilientCaller:
+    """
+    Política de resiliencia para llamadas al LLM:
+    deadline total, timeout por intento, reintentos con jitter, hedging opcional
+    basado en el p95 de latencia y circuit breaker.
+
+    `call(fn)` recibe una fábrica de corrutinas (cada intento crea una petición nueva)
+    y retorna el resultado o lanza CircuitOpenError / DeadlineExceededError / el último error.
+    Con `deadline_at` (hora del event loop) el deadline propio se acorta hasta ese instante:
+    así LLMRouter reparte un único deadline entre los proveedores del failover.
+    """
+
+    def __init__(
+        self,
+        deadline: float = LLM_DEADLINE_SECONDS,
+        attempt_timeout: float = LLM_ATTEMPT_TIMEOUT_SECONDS,
+        max_attempts: int = LLM_MAX_ATTEMPTS,
+        backoff_base: float = LLM_BACKOFF_BASE_SECONDS,
+        backoff_max: float = LLM_BACKOFF_MAX_SECONDS,
+        hedge: bool = LLM_HEDGE_ENABLED,
+        hedge_min_delay: float = LLM_HEDGE_MIN_DELAY_SECONDS,
+        breaker: Optional[CircuitBreaker] = None,
+        samples: int = 200,
+    ):
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.breaker = breaker or CircuitBreaker()
+        self._latencies: Deque[float] = deque(maxlen=samples)
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.short_circuited = 0
+        self.deadline_exceeded = 0
+
+    def p95(self) -> Optional[float]:
+        if len(self._latencies) < 20:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[math.ceil(len(ordered) * 0.95) - 1]
+
+    def hedge_delay(self) -> float:
+        return max(self.hedge_min_delay, self.p95() or 0.0)
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def call(
+        self, fn: Callable[[], Awaitable[T]], hedge: Optional[bool] = None, deadline_at: Optional[float] = None
+    ) -> T:
+        self.calls += 1
+        if not self.breaker.allow():
+            self.short_circuited += 1
+            raise CircuitOpenError("LLM provider circuit is open")
+
+        loop = asyncio.get_running_loop()
+        own_deadline_at = loop.time() + self.deadline
+        deadline_at = own_deadline_at if deadline_at is None else min(deadline_at, own_deadline_at)
+        use_hedge = self.hedge if hedge is None else hedge
+        last_error: Optional[BaseException] = None
+
+        for attempt in range(self.max_attempts):
+            remaining = deadline_at - loop.time()
+            if remaining <= 0:
+                break
+            started = loop.time()
+            try:
+                result = await asyncio.wait_for(
+                    self._attempt(fn, use_hedge), timeout=min(self.attempt_timeout, remaining)
+                )
+            except RETRYABLE_ERRORS as e:
+                last_error = e
+                logger.warning(f"[LLM] Intento {attempt + 1}/{self.max_attempts} falló: {type(e).__name__}")
+                if attempt + 1 < self.max_attempts:
+                    pause = self.backoff(attempt)
+                    if loop.time() + pause >= deadline_at:
+                        break
+                    self.retries += 1
+                    await asyncio.sleep(pause)
+                continue
+            except asyncio.CancelledError:
+                # Apagado del worker: sin veredicto sobre el proveedor
+                self.breaker.release()
+                raise
+            except Exception:
+                # Error del request (400, 401...): reintentar no ayuda y no indica caída del proveedor
+                self.breaker.release()
+                self.failures += 1
+                raise
+            self._latencies.append(loop.time() - started)
+            self.breaker.record_success()
+            self.successes += 1
+            return result
+
+        self.breaker.record_failure()
+        self.failures += 1
+        if loop.time() >= deadline_at or isinstance(last_error, asyncio.TimeoutError) or last_error is None:
+            self.deadline_exceeded += 1
+            raise DeadlineExceededError(f"LLM call exceeded its deadline ({self.deadline:.1f}s)") from last_error
+        raise last_error
+
+    async def _attempt(self, fn: Callable[[], Awaitable[T]], hedge: bool) -> T:
+        primary = asyncio.ensure_future(fn())
+        if not hedge:
+            return await primary
+
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay())
+            if not done:
+                # El intento va más lento que el p95: petición de respaldo en paralelo
+                self.hedges += 1
+                tasks.add(asyncio.ensure_future(fn()))
+            error: Optional[BaseException] = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> dict:
+        p95 = self.p95()
+        return {
+            **self.breaker.stats(),
+            "calls": self.calls,
+            "successes": self.successes,
+            "failures": self.failures,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "short_circuited": self.short_circuited,
+            "deadline_exceeded": self.deadline_exceeded,
+            "latency_p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+        }
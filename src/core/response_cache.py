@@ -0,0 +1,145 @@
+import hashlib
+import logging
+import os
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from src.core.handoff.handoff_service import HANDOFF_KEYWORDS, HANDOFF_SIGNAL
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Máximo de respuestas guardadas (entre todos los tenants). 0 desactiva la caché.
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2000"))
+# Vida máxima de una respuesta en caché (el catálogo y el prompt pueden cambiar).
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+# Turnos previos (usuario / asistente) como máximo para que un turno sea cacheable:
+# con más historial la respuesta se considera personalizada y no se cachea.
+RESPONSE_CACHE_CONTEXT_TURNS = int(os.getenv("RESPONSE_CACHE_CONTEXT_TURNS", "2"))
+
+# Temas en los que el LLM suele decidir un handoff (Trigger B): nunca se sirven desde caché.
+CACHE_BYPASS_TERMS = tuple(HANDOFF_KEYWORDS) + ("cotiza", "precio", "queja", "reclamo")
+
+CacheKey = Tuple[str, str, str]
+
+# Respuesta de contingencia cuando DeepSeek no responde. Vive aquí (llm.py la re-exporta)
+# para que put() la rechace sin importar llm.py, que a su vez importa esta caché.
+FALLBACK_MESSAGE = "Lo lamento, en este momento me encuentro experimentando interferencia en mis sistemas centrales. ¿Podría intentarlo de nuevo en unos minutos?"
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normaliza una pregunta para que variantes triviales compartan llave:
+    "¿Hacen CALIBRACIÓN?" y "hacen calibracion" → "hacen calibracion".
+    """
+    folded = unicodedata.normalize("NFKD", text.lower())
+    folded = "".join(ch for ch in folded if not unicodedata.combining(ch))
+    folded = re.sub(r"[^\w\s]", " ", folded)
+    return " ".join(folded.split())
+
+
+class ResponseCache:
+    """
+    Caché LRU + TTL de respuestas del LLM, aislada por tenant.
+
+    Llave: (tenant_id, último turno del usuario normalizado, hash de todo el contexto previo).
+    La llave no incluye la conversación: las respuestas cacheadas deben ser genéricas
+    (las mismas para cualquier prospecto del tenant). Para garantizarlo solo se cachean
+    turnos cuyo contexto completo es corto (hasta `context_turns` turnos previos), y el
+    hash cubre todo lo que ve el LLM, mensajes de sistema incluidos (resumen, catálogo):
+    dos conversaciones comparten respuesta solo si el modelo recibió exactamente lo mismo.
+
+    Nunca guarda respuestas con [HANDOFF_REQUESTED] ni FALLBACK_MESSAGE, y no se
+    consulta cuando el último mensaje del usuario toca un tema propenso a handoff.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS,
+        context_turns: int = RESPONSE_CACHE_CONTEXT_TURNS,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.context_turns = context_turns
+        self._entries: "OrderedDict[CacheKey, Tuple[float, str]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.personal = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def make_key(self, tenant_id: str, context_messages: List[Dict[str, Any]]) -> Optional[CacheKey]:
+        """
+        Calcula la llave para este turno, o None si la caché no debe usarse
+        (caché desactivada, el último mensaje no es del usuario o puede disparar un handoff,
+        o la conversación ya es larga y la respuesta dependería de ella).
+        """
+        if not self.enabled or not context_messages or context_messages[-1].get("role") != "user":
+            return None
+
+        last_user = normalize_text(context_messages[-1]["content"])
+        if any(term in last_user for term in map(normalize_text, CACHE_BYPASS_TERMS)):
+            self.bypassed += 1
+            return None
+
+        previous = context_messages[:-1]
+        if sum(1 for m in previous if m.get("role") in ("user", "assistant")) > self.context_turns:
+            self.personal += 1
+            return None
+        digest = hashlib.sha1(
+            "\n".join(f"{m['role']}:{normalize_text(m['content'])}" for m in previous).encode("utf-8")
+        ).hexdigest()[:16]
+        return (tenant_id, last_user, digest)
+
+    def get(self, key: Optional[CacheKey]) -> Optional[str]:
+        if key is None:
+            return None
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, text = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return text
+
+    def put(self, key: Optional[CacheKey], text: str) -> None:
+        if key is None or not text or HANDOFF_SIGNAL in text or FALLBACK_MESSAGE in text:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, text)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate_tenant(self, tenant_id: str) -> None:
+        """Descarta las respuestas de un tenant (ej: cambió su prompt o su catálogo)."""
+        for key in [k for k in self._entries if k[0] == tenant_id]:
+            del self._entries[key]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "personal": self.personal,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
@@ -0,0 +1,5 @@
+# src/core/retrieval/__init__.py
+from src.core.retrieval.base_retriever import BaseRetriever, Passage
+from src.core.retrieval.catalog_retrieval import CatalogRetrieval, catalog_retrieval
+
+__all__ = ["BaseRetriever", "Passage", "CatalogRetrieval", "catalog_retrieval"]
@@ -0,0 +1,69 @@
+"""
+base_retriever.py — Interfaz Strategy para los motores de búsqueda del catálogo (RAG).
+
+Cada motor (ChromaDB, índice en memoria...) implementa BaseRetriever; CatalogRetrieval
+solo conoce esta interfaz, así un motor se cambia por configuración (RAG_BACKEND)
+y dos motores se pueden comparar con las mismas consultas.
+"""
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Sequence
+
+
+@dataclass
+class Passage:
+    """Fragmento de una ficha del catálogo devuelto por una búsqueda."""
+    id: str
+    text: str
+    score: float  # Similitud coseno con la consulta: 1 = idéntico
+    metadata: Dict[str, Any] = field(default_factory=dict)  # product_sku, name, url...
+
+
+class BaseRetriever(ABC):
+    """
+    Contrato:
+    - search()   → los `k` fragmentos más parecidos a `query` dentro de `catalog`,
+                   del más al menos relevante.
+    - warm_up()  → carga lo costoso (modelo de embeddings, índice) antes del primer turno.
+                   Síncrono: CatalogRetrieval lo corre en un hilo al arrancar.
+    - saturated  → True si una búsqueda nueva tendría que esperar hilo (search_pool):
+                   CatalogRetrieval la salta.
+
+    Escritura (la usa la ingesta del catálogo, fuera del Agent Loop; todo síncrono):
+    - fingerprints() → {id del fragmento: content_hash} de lo que ya está indexado.
+    - upsert()       → agrega o reemplaza fragmentos con sus vectores ya calculados.
+    - delete()       → tombstone: los fragmentos dejan de aparecer en search().
+    Un motor de solo lectura puede no implementarlos.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    async def search(self, catalog: str, query: str, k: int) -> List[Passage]:
+        """Búsqueda semántica de `query` en el catálogo `catalog`."""
+
+    def fingerprints(self, catalog: str) -> Dict[str, str]:
+        raise NotImplementedError(f"El motor '{self.name}' es de solo lectura")
+
+    def upsert(
+        self,
+        catalog: str,
+        ids: Sequence[str],
+        texts: Sequence[str],
+        vectors: Sequence[Sequence[float]],
+        metadatas: Sequence[Dict[str, Any]],
+    ) -> None:
+        raise NotImplementedError(f"El motor '{self.name}' es de solo lectura")
+
+    def delete(self, catalog: str, ids: Sequence[str]) -> None:
+        raise NotImplementedError(f"El motor '{self.name}' es de solo lectura")
+
+    def warm_up(self) -> None:
+        """Por defecto no hay nada que precargar."""
+
+    @property
+    def saturated(self) -> bool:
+        return False
+
+    def stats(self) -> dict:
+        return {"backend": self.name}
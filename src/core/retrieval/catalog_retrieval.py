@@ -0,0 +1,205 @@
+"""
+catalog_retrieval.py — Etapa de recuperación (RAG) entre el historial y la llamada al LLM.
+
+Por cada turno busca en el catálogo las fichas más parecidas al mensaje del usuario y
+las entrega como un mensaje de sistema para el prompt. Es una etapa con presupuesto:
+si la búsqueda no termina en RAG_BUDGET_MS el turno sigue sin catálogo en lugar de
+esperar, y la latencia de cada búsqueda se mide (p50/p95 en /metrics). Las búsquedas
+corren en hilos propios (search_pool.py); con todos ocupados, el turno ni la intenta.
+"""
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from src.core.context_builder import count_tokens
+from src.core.retrieval.base_retriever import BaseRetriever, Passage
+from src.core.retrieval.search_pool import search_pool
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# "false" desactiva la etapa: el LLM responde solo con el system prompt y el historial.
+RAG_ENABLED = os.getenv("RAG_ENABLED", "true").lower() == "true"
+# Motor de búsqueda: "chroma" (ChromaDB persistente en CHROMA_PATH) o "numpy" (.npy mapeado en NUMPY_INDEX_PATH)
+RAG_BACKEND = os.getenv("RAG_BACKEND", "chroma")
+# "true" suma al motor vectorial BM25 + códigos exactos (SKU / modelo) fusionados por RRF
+RAG_HYBRID = os.getenv("RAG_HYBRID", "true").lower() == "true"
+# Fragmentos por turno y similitud mínima (coseno) para incluir uno en el prompt
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "4"))
+RAG_MIN_SCORE = float(os.getenv("RAG_MIN_SCORE", "0.3"))
+# Presupuesto de latencia de la búsqueda; al vencer, el turno sigue sin catálogo
+RAG_BUDGET_MS = float(os.getenv("RAG_BUDGET_MS", "300"))
+# Tokens máximos del mensaje de catálogo (se descuentan del presupuesto del historial)
+RAG_MAX_TOKENS = int(os.getenv("RAG_MAX_TOKENS", "600"))
+# Catálogo de cada tenant: "inasc_001:inasc,inasc_web:inasc". Sin entrada se usa RAG_DEFAULT_CATALOG.
+RAG_TENANT_CATALOGS = os.getenv("RAG_TENANT_CATALOGS", "")
+RAG_DEFAULT_CATALOG = os.getenv("RAG_DEFAULT_CATALOG", "inasc")
+
+CATALOG_HEADER = (
+    "Fichas del catálogo de INASC relacionadas con la consulta del cliente. Úsalas como fuente "
+    "de tu respuesta; si no responden la pregunta, dilo en lugar de inventar datos."
+)
+
+
+def parse_tenant_catalogs(raw: str) -> Dict[str, str]:
+    """'t1:inasc,t2:zapatos' → {'t1': 'inasc', 't2': 'zapatos'}. Ignora entradas mal formadas."""
+    catalogs = {}
+    for item in raw.split(","):
+        tenant_id, _, catalog = item.partition(":")
+        if tenant_id.strip() and catalog.strip():
+            catalogs[tenant_id.strip()] = catalog.strip()
+    return catalogs
+
+
+def build_retriever(backend: str = RAG_BACKEND, hybrid: bool = RAG_HYBRID) -> BaseRetriever:
+    """Factory del motor configurado en RAG_BACKEND (envuelto en HybridRetriever si RAG_HYBRID)."""
+    if backend == "chroma":
+        from src.core.retrieval.chroma_retriever import ChromaRetriever
+        retriever = ChromaRetriever()
+    elif backend == "numpy":
+        from src.core.retrieval.numpy_retriever import NumpyRetriever
+        retriever = NumpyRetriever()
+    else:
+        raise ValueError(f"RAG_BACKEND desconocido: '{backend}'")
+    if hybrid:
+        from src.core.retrieval.hybrid_retriever import HybridRetriever
+        return HybridRetriever(retriever)
+    return retriever
+
+
+def format_passage(index: int, passage: Passage) -> str:
+    meta = passage.metadata
+    title = meta.get("name") or passage.id
+    if meta.get("product_sku"):
+        title += f" (SKU {meta['product_sku']})"
+    if meta.get("url"):
+        title += f" — {meta['url']}"
+    return f"[{index}] {title}\n{passage.text}"
+
+
+class CatalogRetrieval:
+    """
+    Orquesta la búsqueda en el catálogo para el Agent Loop.
+
+    retrieve() nunca lanza: sin motor disponible, sin resultados o fuera de
+    presupuesto retorna [] y el turno sigue sin catálogo.
+    """
+
+    def __init__(
+        self,
+        retriever: Optional[BaseRetriever] = None,
+        enabled: bool = RAG_ENABLED,
+        top_k: int = RAG_TOP_K,
+        min_score: float = RAG_MIN_SCORE,
+        budget_ms: float = RAG_BUDGET_MS,
+        max_tokens: int = RAG_MAX_TOKENS,
+        tenant_catalogs: Optional[Dict[str, str]] = None,
+        default_catalog: str = RAG_DEFAULT_CATALOG,
+        samples: int = 1000,
+    ):
+        self.retriever = retriever
+        self.enabled = enabled
+        self.top_k = top_k
+        self.min_score = min_score
+        self.budget_ms = budget_ms
+        self.max_tokens = max_tokens
+        self.tenant_catalogs = tenant_catalogs if tenant_catalogs is not None else parse_tenant_catalogs(RAG_TENANT_CATALOGS)
+        self.default_catalog = default_catalog
+        self._latencies: Deque[float] = deque(maxlen=samples)
+        self.searches = 0
+        self.hits = 0
+        self.timeouts = 0
+        self.skipped = 0
+        self.failures = 0
+
+    @property
+    def active(self) -> bool:
+        return self.enabled and self.retriever is not None
+
+    def catalog_for(self, tenant_id: str) -> str:
+        return self.tenant_catalogs.get(tenant_id, self.default_catalog)
+
+    async def start(self) -> None:
+        """Crea el motor y precarga el modelo de embeddings. Si falla (ej: falta chromadb) la etapa se desactiva."""
+        if not self.enabled:
+            return
+        try:
+            if self.retriever is None:
+                self.retriever = build_retriever()
+            await asyncio.to_thread(self.retriever.warm_up)
+            logger.info(f"[RAG] Búsqueda en el catálogo lista ({self.retriever.name}).")
+        except Exception as e:
+            self.retriever = None
+            logger.warning(f"[RAG] Búsqueda en el catálogo desactivada: {type(e).__name__}: {e}")
+
+    async def retrieve(self, tenant_id: str, query: str) -> List[Passage]:
+        if not self.active or not query.strip():
+            return []
+        if self.retriever.saturated:
+            # Los hilos siguen ocupados (quizá con búsquedas ya abandonadas): no encolar otra
+            self.skipped += 1
+            logger.warning(f"[{tenant_id}] [RAG] Hilos de búsqueda ocupados; turno sin catálogo.")
+            return []
+        started = time.perf_counter()
+        self.searches += 1
+        try:
+            passages = await asyncio.wait_for(
+                self.retriever.search(self.catalog_for(tenant_id), query, self.top_k),
+                timeout=self.budget_ms / 1000,
+            )
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            logger.warning(f"[{tenant_id}] [RAG] Búsqueda en el catálogo superó {self.budget_ms:.0f} ms; turno sin catálogo.")
+            return []
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"[{tenant_id}] [RAG] Error buscando en el catálogo: {type(e).__name__}: {e}")
+            return []
+        finally:
+            self._latencies.append(time.perf_counter() - started)
+        passages = [p for p in passages if p.score >= self.min_score]
+        if passages:
+            self.hits += 1
+        return passages
+
+    def as_message(self, passages: List[Passage]) -> Optional[Dict[str, str]]:
+        """Mensaje de sistema con las fichas, hasta `max_tokens` (las más relevantes primero)."""
+        parts = [CATALOG_HEADER]
+        used = count_tokens(CATALOG_HEADER)
+        for passage in passages:
+            block = format_passage(len(parts), passage)
+            cost = count_tokens(block)
+            if used + cost > self.max_tokens:
+                break
+            parts.append(block)
+            used += cost
+        if len(parts) == 1:
+            return None
+        return {"role": "system", "content": "\n\n".join(parts)}
+
+    def stats(self) -> dict:
+        recent = sorted(self._latencies)
+        return {
+            "enabled": self.enabled,
+            "active": self.active,
+            "retriever": self.retriever.stats() if self.retriever else None,
+            "searches": self.searches,
+            "hits": self.hits,
+            "timeouts": self.timeouts,
+            "skipped": self.skipped,
+            "failures": self.failures,
+            "search_pool": search_pool.stats(),
+            "budget_ms": self.budget_ms,
+            "latency_ms_p50": round(recent[len(recent) // 2] * 1000, 1) if recent else 0.0,
+            "latency_ms_p95": round(recent[max(0, math.ceil(len(recent) * 0.95) - 1)] * 1000, 1) if recent else 0.0,
+        }
+
+
+# Instancia global (Patrón Singleton) usada por el Agent Loop en main.py
+catalog_retrieval = CatalogRetrieval()
@@ -0,0 +1,103 @@
+"""
+chroma_retriever.py — Búsqueda del catálogo en ChromaDB persistente (volumen chromadb_storage).
+
+Una colección por catálogo ("catalog_<catálogo>") con distancia coseno; los vectores
+los genera el Embedder local, no la función de embeddings por defecto de Chroma,
+para que la ingesta y las consultas usen siempre el mismo modelo.
+"""
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+from dotenv import load_dotenv
+
+from src.core.retrieval.base_retriever import BaseRetriever, Passage
+from src.core.retrieval.embedder import Embedder
+from src.core.retrieval.search_pool import search_pool
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Carpeta de la base persistente de Chroma (en Docker: el volumen chromadb_data montado en /app/chromadb_storage)
+CHROMA_PATH = os.getenv("CHROMA_PATH", "chromadb_storage")
+COLLECTION_PREFIX = "catalog_"
+
+
+class ChromaRetriever(BaseRetriever):
+    name = "chroma"
+
+    def __init__(self, path: str = CHROMA_PATH, embedder: Optional[Embedder] = None, client=None):
+        self.path = path
+        self.embedder = embedder or Embedder()
+        self._client = client
+        self._collections: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _get_client(self):
+        if self._client is None:
+            import chromadb
+            self._client = chromadb.PersistentClient(path=self.path)
+        return self._client
+
+    def collection(self, catalog: str):
+        """Colección del catálogo (se crea vacía si no existe)."""
+        with self._lock:
+            if catalog not in self._collections:
+                self._collections[catalog] = self._get_client().get_or_create_collection(
+                    name=f"{COLLECTION_PREFIX}{catalog}", metadata={"hnsw:space": "cosine"}
+                )
+            return self._collections[catalog]
+
+    def warm_up(self) -> None:
+        self._get_client()
+        self.embedder.warm_up()
+
+    def _search_sync(self, catalog: str, query: str, k: int) -> List[Passage]:
+        collection = self.collection(catalog)
+        if collection.count() == 0:
+            return []
+        vector = self.embedder.embed_query(query)
+        result = collection.query(
+            query_embeddings=[vector], n_results=k, include=["documents", "metadatas", "distances"]
+        )
+        return [
+            Passage(id=passage_id, text=text, score=1.0 - distance, metadata=metadata or {})
+            for passage_id, text, metadata, distance in zip(
+                result["ids"][0], result["documents"][0], result["metadatas"][0], result["distances"][0]
+            )
+        ]
+
+    def fingerprints(self, catalog: str) -> Dict[str, str]:
+        result = self.collection(catalog).get(include=["metadatas"])
+        return {
+            chunk_id: (metadata or {}).get("content_hash", "")
+            for chunk_id, metadata in zip(result["ids"], result["metadatas"])
+        }
+
+    def upsert(
+        self,
+        catalog: str,
+        ids: Sequence[str],
+        texts: Sequence[str],
+        vectors: Sequence[Sequence[float]],
+        metadatas: Sequence[Dict[str, Any]],
+    ) -> None:
+        # Chroma solo acepta str/int/float/bool en los metadatos: se descartan los None
+        clean = [{key: value for key, value in metadata.items() if value is not None} for metadata in metadatas]
+        self.collection(catalog).upsert(ids=list(ids), embeddings=list(vectors), documents=list(texts), metadatas=clean)
+
+    def delete(self, catalog: str, ids: Sequence[str]) -> None:
+        if ids:
+            self.collection(catalog).delete(ids=list(ids))
+
+    async def search(self, catalog: str, query: str, k: int) -> List[Passage]:
+        # Embedding (CPU) y consulta HNSW son bloqueantes: fuera del event loop, en hilos propios
+        return await search_pool.run(self._search_sync, catalog, query, k)
+
+    @property
+    def saturated(self) -> bool:
+        return search_pool.saturated
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "path": self.path, "embedder": self.embedder.stats()}
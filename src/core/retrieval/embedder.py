@@ -0,0 +1,94 @@
+"""
+embedder.py — Embeddings locales con sentence-transformers (sin API externa).
+
+sentence-transformers es opcional en tiempo de import: el modelo se carga en la
+primera llamada (o en warm_up), así el resto del agente arranca aunque la librería
+no esté instalada y el RAG simplemente queda desactivado.
+"""
+import logging
+import os
+import threading
+from typing import List, Optional, Sequence
+
+from dotenv import load_dotenv
+
+from src.core.retrieval.embedding_cache import EmbeddingCache, embedding_cache
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Modelo de HuggingFace. El multilingüe entiende las consultas en español contra fichas en español/inglés.
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "paraphrase-multilingual-MiniLM-L12-v2")
+# "cpu", "cuda"... vacío = el que elija sentence-transformers
+EMBEDDING_DEVICE = os.getenv("EMBEDDING_DEVICE", "") or None
+# Textos por lote al codificar (ingesta del catálogo)
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+
+
+class Embedder:
+    """
+    Convierte textos en vectores normalizados (norma 1: el producto punto es la similitud coseno).
+
+    Pasa primero por la caché de embeddings: solo se codifican los textos que no estén
+    en ella (y si todos están, ni siquiera se carga el modelo). embed() es para el
+    catálogo (usa el nivel en disco); embed_query() para los mensajes de los clientes
+    (solo memoria: nunca se escriben en disco).
+    """
+
+    def __init__(
+        self,
+        model_name: str = EMBEDDING_MODEL,
+        device: Optional[str] = EMBEDDING_DEVICE,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        cache: Optional[EmbeddingCache] = embedding_cache,
+    ):
+        self.model_name = model_name
+        self.device = device
+        self.batch_size = batch_size
+        self.cache = cache
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        # Dos hilos pueden pedir el primer embedding a la vez: el modelo se carga una sola vez
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import SentenceTransformer
+                logger.info(f"[Embedder] Cargando modelo de embeddings '{self.model_name}'...")
+                self._model = SentenceTransformer(self.model_name, device=self.device)
+        return self._model
+
+    def warm_up(self) -> None:
+        self._load()
+
+    @property
+    def dimension(self) -> int:
+        return self._load().get_sentence_embedding_dimension()
+
+    def embed(self, texts: Sequence[str], disk: bool = True) -> List[List[float]]:
+        """Bloqueante (CPU): llamarlo desde un hilo, nunca directo en el event loop."""
+        if not texts:
+            return []
+        if self.cache is None:
+            return self._encode(texts)
+        vectors = self.cache.get_many(self.model_name, texts, disk=disk)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        if missing:
+            encoded = dict(zip(missing, self._encode(missing)))
+            self.cache.put_many(self.model_name, missing, [encoded[text] for text in missing], disk=disk)
+            vectors = [encoded[text] if vector is None else vector for text, vector in zip(texts, vectors)]
+        return vectors
+
+    def embed_query(self, query: str) -> List[float]:
+        """Vector de una consulta online: caché solo en memoria."""
+        [vector] = self.embed([query], disk=False)
+        return vector
+
+    def _encode(self, texts: Sequence[str]) -> List[List[float]]:
+        vectors = self._load().encode(
+            list(texts), batch_size=self.batch_size, normalize_embeddings=True, show_progress_bar=False
+        )
+        return vectors.tolist()
+
+    def stats(self) -> dict:
+        return {"model": self.model_name, "cache": self.cache.stats() if self.cache else None}
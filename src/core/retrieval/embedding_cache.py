@@ -0,0 +1,221 @@
+"""
+embedding_cache.py — Caché de embeddings direccionada por contenido (modelo + hash del texto).
+
+Los mismos fragmentos del catálogo y muchas preguntas idénticas de los prospectos se
+vuelven a codificar en cada re-ingesta, en cada reinicio y entre tenants que venden los
+mismos equipos. Dos niveles:
+
+- Memoria: LRU acotado a EMBEDDING_CACHE_MEMORY vectores, por proceso.
+- Disco: SQLite en EMBEDDING_CACHE_PATH (modo WAL), compartido entre re-ingestas y
+  procesos; acotado a EMBEDDING_CACHE_DISK_MAX_ROWS (se podan los más viejos).
+
+El nivel en disco es solo para el texto del catálogo (`disk=True`, la ingesta). Las
+consultas del Agent Loop usan solo memoria (`disk=False`): no esperan el lock de SQLite
+detrás de una ingesta y los mensajes de los clientes nunca quedan escritos en disco.
+El lock de memoria no se retiene durante la E/S de SQLite.
+
+La clave incluye el modelo: cambiar EMBEDDING_MODEL nunca devuelve vectores del anterior.
+Un error de SQLite no rompe el embedding: la caché sigue solo en memoria y lo cuenta.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import List, Optional, Sequence
+
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# "false" desactiva la caché (cada texto se codifica siempre)
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+# Archivo SQLite del nivel en disco; vacío = solo memoria
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "vector_index/embedding_cache.sqlite3")
+# Vectores en el LRU de cada proceso. Se guardan como float32 empaquetado (igual que en
+# SQLite): ~1.6 KB cada uno con 384 dimensiones, ~16 MB con el valor por defecto
+EMBEDDING_CACHE_MEMORY = int(os.getenv("EMBEDDING_CACHE_MEMORY", "10000"))
+# Filas máximas en disco; al pasarlas se borran las de uso más antiguo
+EMBEDDING_CACHE_DISK_MAX_ROWS = int(os.getenv("EMBEDDING_CACHE_DISK_MAX_ROWS", "500000"))
+
+# Consultas IN (...) de a este tamaño (límite de variables de SQLite)
+_SQL_BATCH = 500
+# Cada cuántas escrituras se revisa si hay que podar el nivel en disco
+_PRUNE_EVERY = 1000
+
+
+def cache_key(model_name: str, text: str) -> str:
+    return hashlib.sha256(f"{model_name}\n{text}".encode("utf-8")).hexdigest()
+
+
+def _pack(vector: Sequence[float]) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def _unpack(blob: bytes) -> List[float]:
+    values = array("f")
+    values.frombytes(blob)
+    return values.tolist()
+
+
+class EmbeddingCache:
+    def __init__(
+        self,
+        path: Optional[str] = EMBEDDING_CACHE_PATH,
+        max_entries: int = EMBEDDING_CACHE_MEMORY,
+        max_disk_rows: int = EMBEDDING_CACHE_DISK_MAX_ROWS,
+        enabled: bool = EMBEDDING_CACHE_ENABLED,
+    ):
+        self.path = path or None
+        self.max_entries = max_entries
+        self.max_disk_rows = max_disk_rows
+        self.enabled = enabled
+        # Vectores empaquetados (_pack): una List[float] de 384 dimensiones ocupa ~12 KB
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()  # LRU y contadores
+        self._disk_lock = threading.Lock()  # conexión SQLite (compartida entre hilos)
+        self._writes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.disk_errors = 0
+
+    # ── Nivel en disco ───────────────────────────────────────────────────────
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        """Abre el SQLite en el primer uso (no al importar). None si no hay nivel en disco."""
+        if self._db is None and self.path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            # WAL: la ingesta escribe mientras los workers leen sin bloquearse
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL, used_at REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS ix_embeddings_used_at ON embeddings (used_at)")
+            self._db = db
+        return self._db
+
+    def _disk_error(self, action: str, error: Exception) -> None:
+        self.disk_errors += 1
+        logger.warning(f"[EmbeddingCache] Error {action} en {self.path}: {type(error).__name__}: {error}")
+
+    def _read_disk(self, keys: List[str]) -> dict:
+        found = {}
+        with self._disk_lock:
+            try:
+                db = self._connect()
+                if db is None:
+                    return found
+                for start in range(0, len(keys), _SQL_BATCH):
+                    batch = keys[start:start + _SQL_BATCH]
+                    placeholders = ",".join("?" * len(batch))
+                    rows = db.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch)
+                    found.update((key, bytes(blob)) for key, blob in rows)
+                if found:
+                    db.executemany("UPDATE embeddings SET used_at = ? WHERE key = ?", [(time.time(), key) for key in found])
+                    db.commit()
+            except sqlite3.Error as e:
+                self._disk_error("leyendo", e)
+        return found
+
+    def _write_disk(self, model_name: str, items: dict) -> None:
+        with self._disk_lock:
+            try:
+                db = self._connect()
+                if db is None:
+                    return
+                now = time.time()
+                db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, model, vector, used_at) VALUES (?, ?, ?, ?)",
+                    [(key, model_name, blob, now) for key, blob in items.items()],
+                )
+                self._writes += len(items)
+                if self._writes >= _PRUNE_EVERY:
+                    self._writes = 0
+                    [(rows,)] = db.execute("SELECT COUNT(*) FROM embeddings")
+                    if rows > self.max_disk_rows:
+                        db.execute(
+                            "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY used_at LIMIT ?)",
+                            (rows - self.max_disk_rows,),
+                        )
+                db.commit()
+            except sqlite3.Error as e:
+                self._disk_error("escribiendo", e)
+
+    # ── API ──────────────────────────────────────────────────────────────────
+
+    def _remember(self, key: str, blob: bytes) -> None:
+        self._memory[key] = blob
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get_many(self, model_name: str, texts: Sequence[str], disk: bool = True) -> List[Optional[List[float]]]:
+        """
+        Vector de cada texto, o None si no está en caché. Cuenta aciertos y fallos.
+        `disk=False` (consultas online) mira solo la memoria.
+        """
+        if not self.enabled:
+            return [None] * len(texts)
+        keys = [cache_key(model_name, text) for text in texts]
+        with self._lock:
+            result = {}
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    result[key] = self._memory[key]
+            self.memory_hits += sum(1 for key in keys if key in result)
+
+        pending = list(dict.fromkeys(key for key in keys if key not in result))
+        found = self._read_disk(pending) if disk and pending else {}
+
+        with self._lock:
+            for key, blob in found.items():
+                self._remember(key, blob)
+            result.update(found)
+            self.disk_hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in result)
+        # Se desempaqueta al retornar: cada caller recibe su propia lista
+        return [_unpack(result[key]) if key in result else None for key in keys]
+
+    def put_many(
+        self, model_name: str, texts: Sequence[str], vectors: Sequence[Sequence[float]], disk: bool = True
+    ) -> None:
+        """`disk=False` (consultas online) guarda solo en memoria."""
+        if not self.enabled or not texts:
+            return
+        items = {cache_key(model_name, text): _pack(vector) for text, vector in zip(texts, vectors)}
+        with self._lock:
+            for key, blob in items.items():
+                self._remember(key, blob)
+        if disk:
+            self._write_disk(model_name, items)
+
+    def clear_memory(self) -> None:
+        with self._lock:
+            self._memory.clear()
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "path": self.path,
+            "memory_entries": len(self._memory),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+            "disk_errors": self.disk_errors,
+        }
+
+
+# Instancia global (Patrón Singleton) compartida por el Embedder de la ingesta y del Agent Loop
+embedding_cache = EmbeddingCache()
@@ -0,0 +1,174 @@
+"""
+hybrid_retriever.py — Búsqueda híbrida: vectores + BM25 + códigos exactos, fusionados por RRF.
+
+Envuelve cualquier motor vectorial (chroma / numpy) y le suma el índice léxico del
+catálogo. Las tres listas (códigos exactos, BM25 y vectores) se fusionan con Reciprocal
+Rank Fusion: cada fragmento suma peso / (RAG_RRF_K + posición) por lista en la que
+aparece. RRF solo usa posiciones, así que no hace falta calibrar puntajes de distinta
+escala entre sí. La lista de códigos exactos pesa RAG_EXACT_WEIGHT: si el prospecto
+escribe el SKU, esa ficha va primero.
+
+Si el motor vectorial falla, no termina en RAG_HYBRID_VECTOR_BUDGET_MS (un poco menos
+que RAG_BUDGET_MS de CatalogRetrieval) o tiene todos sus hilos ocupados, la búsqueda
+sigue con las listas léxicas: un SKU escrito por el prospecto se encuentra igual.
+"""
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+
+from src.core.retrieval.base_retriever import BaseRetriever, Passage
+from src.core.retrieval.lexical_index import LexicalStore
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Constante de RRF: más alta = las primeras posiciones pesan menos frente a las siguientes
+RAG_RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+# Peso de la lista de códigos exactos (SKU / modelo) frente a BM25 y vectores (peso 1)
+RAG_EXACT_WEIGHT = float(os.getenv("RAG_EXACT_WEIGHT", "2.0"))
+# Candidatos que aporta cada lista antes de fusionar
+RAG_HYBRID_CANDIDATES = int(os.getenv("RAG_HYBRID_CANDIDATES", "20"))
+# Espera máxima del motor vectorial; debe quedar debajo de RAG_BUDGET_MS para que al
+# vencer todavía se devuelvan los códigos exactos y BM25
+RAG_HYBRID_VECTOR_BUDGET_MS = float(os.getenv("RAG_HYBRID_VECTOR_BUDGET_MS", "250"))
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Tuple[Sequence[str], float]], k: int = RAG_RRF_K) -> List[str]:
+    """[(ids en orden, peso), ...] → ids fusionados, del más al menos relevante."""
+    scores: Dict[str, float] = defaultdict(float)
+    for ids, weight in rankings:
+        for rank, doc_id in enumerate(ids, start=1):
+            scores[doc_id] += weight / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    search() devuelve los pasajes en el orden de RRF. Su `score` sigue siendo una
+    similitud en [0, 1] para que RAG_MIN_SCORE aplique igual: 1.0 si coincide un código
+    exacto, el coseno si vino del motor vectorial y, si solo lo encontró BM25, la
+    fracción de la consulta que cubre (LexicalIndex.coverage). No se normaliza contra el
+    mejor BM25: así el mejor resultado de una consulta sin relación con el catálogo
+    también queda debajo de RAG_MIN_SCORE.
+
+    La escritura (ingesta) va al motor vectorial; el índice léxico lo sincroniza
+    CatalogIngestor a través de `lexical`.
+    """
+
+    name = "hybrid"
+
+    def __init__(
+        self,
+        vector: BaseRetriever,
+        lexical: Optional[LexicalStore] = None,
+        rrf_k: int = RAG_RRF_K,
+        exact_weight: float = RAG_EXACT_WEIGHT,
+        candidates: int = RAG_HYBRID_CANDIDATES,
+        vector_budget_ms: float = RAG_HYBRID_VECTOR_BUDGET_MS,
+    ):
+        self.vector = vector
+        self.lexical = lexical or LexicalStore()
+        self.rrf_k = rrf_k
+        self.exact_weight = exact_weight
+        self.candidates = candidates
+        self.vector_budget_ms = vector_budget_ms
+        self.searches = 0
+        self.exact_hits = 0
+        self.vector_failures = 0
+        self.vector_timeouts = 0
+        self.vector_skipped = 0
+
+    @property
+    def embedder(self):
+        return self.vector.embedder
+
+    def fingerprints(self, catalog: str) -> Dict[str, str]:
+        return self.vector.fingerprints(catalog)
+
+    def upsert(self, catalog, ids, texts, vectors, metadatas) -> None:
+        self.vector.upsert(catalog, ids, texts, vectors, metadatas)
+
+    def delete(self, catalog: str, ids: Sequence[str]) -> None:
+        self.vector.delete(catalog, ids)
+
+    def warm_up(self) -> None:
+        self.vector.warm_up()
+        self.lexical.load_all()
+
+    # `saturated` queda en False (BaseRetriever): con los hilos del motor vectorial ocupados
+    # la búsqueda sigue solo con el índice léxico, que corre aquí mismo.
+
+    async def search(self, catalog: str, query: str, k: int) -> List[Passage]:
+        self.searches += 1
+        vector_task = None
+        if self.vector.saturated:
+            self.vector_skipped += 1
+        else:
+            vector_task = asyncio.create_task(self.vector.search(catalog, query, max(k, self.candidates)))
+
+        # Mientras el motor vectorial calcula el embedding (en su hilo), el léxico corre aquí: es µs/ms
+        # (la carga del índice desde disco, si toca, va en un hilo dentro de lexical.get)
+        docs: Dict[str, Dict[str, Any]] = {}
+        exact: List[str] = []
+        bm25: List[Tuple[str, float]] = []
+        coverage: Dict[str, float] = {}
+        try:
+            index = await self.lexical.get(catalog)
+            docs = index.docs
+            exact = index.lookup_codes(query)[:self.candidates]
+            bm25 = index.search(query, self.candidates)
+            coverage = index.coverage(query, [doc_id for doc_id, _ in bm25])
+        except Exception as e:
+            logger.error(f"[Hybrid] Error en el índice léxico de '{catalog}': {type(e).__name__}: {e}")
+        if exact:
+            self.exact_hits += 1
+
+        vector: List[Passage] = []
+        if vector_task is not None:
+            try:
+                vector = await asyncio.wait_for(vector_task, timeout=self.vector_budget_ms / 1000)
+            except asyncio.TimeoutError:
+                self.vector_timeouts += 1
+                logger.warning(f"[Hybrid] Motor vectorial sin respuesta en {self.vector_budget_ms:.0f} ms; solo búsqueda léxica.")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.vector_failures += 1
+                logger.warning(f"[Hybrid] Motor vectorial falló ({type(e).__name__}: {e}); solo búsqueda léxica.")
+
+        fused = reciprocal_rank_fusion(
+            [(exact, self.exact_weight), ([doc_id for doc_id, _ in bm25], 1.0), ([p.id for p in vector], 1.0)],
+            self.rrf_k,
+        )
+        by_vector = {p.id: p for p in vector}
+        scores = dict(coverage)
+        for doc_id in exact:
+            scores[doc_id] = 1.0
+
+        passages = []
+        for doc_id in fused[:k]:
+            found = by_vector.get(doc_id)
+            doc = docs.get(doc_id)
+            if found is None and not doc:
+                continue
+            score = max(found.score if found else 0.0, scores.get(doc_id, 0.0))
+            text = found.text if found else doc["text"]
+            metadata = found.metadata if found else doc["metadata"]
+            passages.append(Passage(id=doc_id, text=text, score=score, metadata=metadata))
+        return passages
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "vector": self.vector.stats(),
+            "lexical": self.lexical.stats(),
+            "searches": self.searches,
+            "exact_hits": self.exact_hits,
+            "vector_failures": self.vector_failures,
+            "vector_timeouts": self.vector_timeouts,
+            "vector_skipped": self.vector_skipped,
+        }
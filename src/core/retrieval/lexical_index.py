@@ -0,0 +1,291 @@
+"""
+lexical_index.py — Índice invertido en memoria del catálogo: BM25 + mapa exacto de códigos.
+
+Los embeddings son malos con coincidencias exactas: "TN-100", "AX-220" o "C18" se parecen
+a cualquier otro código. Por cada catálogo se mantiene:
+
+- Postings BM25 (término → {fragmento: frecuencia}) sobre el texto de cada fragmento.
+- Mapa exacto de códigos normalizados ("TN-100", "tn 100", "tn100" → "tn100"):
+  el product_sku de cada fragmento y los tokens con letras y dígitos de su texto.
+  Buscar un código es un dict.get: microsegundos.
+
+La ingesta lo sincroniza por content_hash (solo toca los fragmentos que cambiaron) y lo
+guarda en LEXICAL_INDEX_PATH/<catálogo>.json con las frecuencias ya calculadas, así los
+workers lo cargan sin volver a tokenizar y lo recargan cuando cambia el mtime.
+
+En el Agent Loop se usa LexicalStore.get(): la carga (json.load + from_dict) y la
+revisión del mtime corren en un hilo y a lo sumo cada LEXICAL_REFRESH_SECONDS por
+catálogo; el resto de las búsquedas usan el índice en memoria sin tocar el disco.
+"""
+import asyncio
+import heapq
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Carpeta de los índices léxicos (un .json por catálogo)
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", "vector_index/lexical")
+# Cada cuántos segundos se revisa si otro proceso (la ingesta) cambió el índice de un catálogo
+LEXICAL_REFRESH_SECONDS = float(os.getenv("LEXICAL_REFRESH_SECONDS", "5"))
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+_SEPARATORS = re.compile(r"[-_./]")
+STOPWORDS = frozenset(
+    "a al con de del el en es la las lo los o para por que se sin su sus un una uno y "
+    "the of for and with".split()
+)
+
+
+def fold(text: str) -> str:
+    """Minúsculas y sin tildes: 'Turbidímetro' → 'turbidimetro'."""
+    return unicodedata.normalize("NFKD", text.lower()).encode("ascii", "ignore").decode()
+
+
+def normalize_code(code: str) -> str:
+    return _SEPARATORS.sub("", fold(code))
+
+
+def tokenize(text: str) -> List[str]:
+    """Términos para BM25. Un código con separadores aporta sus partes y la forma unida: TN-100 → tn, 100, tn100."""
+    terms = []
+    for token in _TOKEN.findall(fold(text)):
+        parts = [part for part in _SEPARATORS.split(token) if part and part not in STOPWORDS]
+        terms.extend(parts)
+        if len(parts) > 1:
+            terms.append("".join(parts))
+    return terms
+
+
+def _is_code(token: str) -> bool:
+    return any(c.isdigit() for c in token) and any(c.isalpha() for c in token) and len(token) >= 3
+
+
+def text_codes(text: str) -> Set[str]:
+    """Códigos (letras + dígitos) que aparecen en un texto del catálogo, normalizados."""
+    return {code for code in (normalize_code(token) for token in _TOKEN.findall(fold(text))) if _is_code(code)}
+
+
+def query_codes(query: str) -> List[str]:
+    """
+    Candidatos a código en la consulta, en orden. Además de cada token con dígitos se
+    prueba cada par letras + número contiguo unido ("tn 100" → "tn100"), porque los
+    prospectos escriben el modelo con espacios.
+    """
+    tokens = [normalize_code(token) for token in _TOKEN.findall(fold(query))]
+    candidates = [token for token in tokens if any(c.isdigit() for c in token)]
+    candidates += [a + b for a, b in zip(tokens, tokens[1:]) if a.isalpha() and b.isdigit()]
+    return list(dict.fromkeys(candidates))
+
+
+class LexicalIndex:
+    """Índice de un catálogo. add()/remove() lo actualizan sin reconstruirlo."""
+
+    def __init__(self):
+        self.docs: Dict[str, Dict[str, Any]] = {}
+        self.postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self.skus: Dict[str, Set[str]] = defaultdict(set)
+        self.codes: Dict[str, Set[str]] = defaultdict(set)
+        self.lengths: Dict[str, int] = {}
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def add(
+        self,
+        doc_id: str,
+        text: str,
+        metadata: Dict[str, Any],
+        content_hash: str = "",
+        tf: Optional[Dict[str, int]] = None,
+        codes: Optional[List[str]] = None,
+    ) -> None:
+        """Agrega o reemplaza un fragmento. `tf` y `codes` vienen precalculados al cargar desde disco."""
+        if doc_id in self.docs:
+            self.remove(doc_id)
+        if tf is None:
+            tf = defaultdict(int)
+            for term in tokenize(text):
+                tf[term] += 1
+            tf = dict(tf)
+        codes = sorted(text_codes(text)) if codes is None else codes
+        self.docs[doc_id] = {"text": text, "metadata": metadata, "content_hash": content_hash, "tf": tf, "codes": codes}
+        self.lengths[doc_id] = sum(tf.values())
+        self.total_length += self.lengths[doc_id]
+        for term, count in tf.items():
+            self.postings[term][doc_id] = count
+        if metadata.get("product_sku"):
+            self.skus[normalize_code(str(metadata["product_sku"]))].add(doc_id)
+        for code in codes:
+            self.codes[code].add(doc_id)
+
+    def remove(self, doc_id: str) -> None:
+        doc = self.docs.pop(doc_id, None)
+        if doc is None:
+            return
+        self.total_length -= self.lengths.pop(doc_id)
+        for term in doc["tf"]:
+            self.postings[term].pop(doc_id, None)
+            if not self.postings[term]:
+                del self.postings[term]
+        sku = doc["metadata"].get("product_sku")
+        for mapping, keys in ((self.skus, [normalize_code(str(sku))] if sku else []), (self.codes, doc["codes"])):
+            for key in keys:
+                mapping[key].discard(doc_id)
+                if not mapping[key]:
+                    del mapping[key]
+
+    def lookup_codes(self, query: str) -> List[str]:
+        """Fragmentos cuyo SKU (primero) o texto contiene exactamente un código de la consulta."""
+        by_sku, by_text = [], []
+        for code in query_codes(query):
+            by_sku.extend(sorted(self.skus.get(code, ())))
+            by_text.extend(sorted(self.codes.get(code, ())))
+        return list(dict.fromkeys(by_sku + by_text))
+
+    def _idf(self, term: str) -> float:
+        df = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.docs) - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, limit: int) -> List[Tuple[str, float]]:
+        """Top `limit` fragmentos por BM25: [(id, puntaje)], del mayor al menor."""
+        if not self.docs:
+            return []
+        average = self.total_length / len(self.docs) or 1
+        scores: Dict[str, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self._idf(term)
+            for doc_id, tf in postings.items():
+                length = self.lengths[doc_id]
+                scores[doc_id] += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / average))
+        return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+    def coverage(self, query: str, doc_ids: Iterable[str]) -> Dict[str, float]:
+        """
+        Fracción (0-1) del peso IDF de los términos de la consulta que contiene cada fragmento.
+        Es absoluta: no depende de los otros resultados, así que sirve contra RAG_MIN_SCORE.
+        Un término que no está en el catálogo pesa el máximo: "turbidímetro para piscina
+        climatizada" solo cubre una parte aunque el turbidímetro sea el mejor BM25.
+        """
+        weights = {term: self._idf(term) for term in set(tokenize(query))}
+        total = sum(weights.values())
+        if not total:
+            return {doc_id: 0.0 for doc_id in doc_ids}
+        return {
+            doc_id: sum(weight for term, weight in weights.items() if doc_id in self.postings.get(term, ())) / total
+            for doc_id in doc_ids
+        }
+
+    def to_dict(self) -> dict:
+        return {"docs": self.docs}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "LexicalIndex":
+        index = cls()
+        for doc_id, doc in data["docs"].items():
+            index.add(doc_id, doc["text"], doc["metadata"], doc.get("content_hash", ""), tf=doc["tf"], codes=doc["codes"])
+        return index
+
+
+class LexicalStore:
+    """Índices léxicos por catálogo, persistidos en `path` y recargados si otro proceso los cambia."""
+
+    def __init__(self, path: str = LEXICAL_INDEX_PATH, refresh_seconds: float = LEXICAL_REFRESH_SECONDS):
+        self.path = path
+        self.refresh_seconds = refresh_seconds
+        self._indexes: Dict[str, Tuple[Optional[Tuple[int, int]], LexicalIndex]] = {}
+        self._checked: Dict[str, float] = {}  # catálogo → time.monotonic() de la última revisión del archivo
+        self._lock = threading.Lock()
+
+    def _file(self, catalog: str) -> str:
+        return os.path.join(self.path, f"{catalog}.json")
+
+    def _version(self, catalog: str) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self._file(catalog))
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def index(self, catalog: str) -> LexicalIndex:
+        """Bloqueante (stat y, si cambió, carga del .json): en el event loop usar get()."""
+        version = self._version(catalog)
+        with self._lock:
+            self._checked[catalog] = time.monotonic()
+            cached = self._indexes.get(catalog)
+            if cached is None or cached[0] != version:
+                if version is None:
+                    index = LexicalIndex()
+                else:
+                    with open(self._file(catalog), encoding="utf-8") as f:
+                        index = LexicalIndex.from_dict(json.load(f))
+                cached = self._indexes[catalog] = (version, index)
+            return cached[1]
+
+    async def get(self, catalog: str) -> LexicalIndex:
+        """Índice para una búsqueda: el de memoria, revisado en un hilo si pasó refresh_seconds."""
+        cached = self._indexes.get(catalog)
+        if cached is not None and time.monotonic() - self._checked.get(catalog, 0.0) < self.refresh_seconds:
+            return cached[1]
+        return await asyncio.to_thread(self.index, catalog)
+
+    def load_all(self) -> None:
+        """Carga todos los catálogos guardados (warm_up), así la primera búsqueda no espera el .json."""
+        if not os.path.isdir(self.path):
+            return
+        for name in sorted(os.listdir(self.path)):
+            if name.endswith(".json"):
+                self.index(name[:-len(".json")])
+
+    def save(self, catalog: str, index: LexicalIndex) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        tmp = f"{self._file(catalog)}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(index.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp, self._file(catalog))
+        with self._lock:
+            self._indexes[catalog] = (self._version(catalog), index)
+            self._checked[catalog] = time.monotonic()
+
+    def sync(self, catalog: str, chunks: Iterable[Any]) -> int:
+        """
+        Deja el índice igual a `chunks` (objetos con id, text, metadata y content_hash):
+        agrega o reemplaza los de hash distinto y quita los que ya no están. Retorna
+        cuántos fragmentos cambiaron; solo escribe el archivo si hubo cambios.
+        """
+        index = self.index(catalog)
+        current = {chunk.id: chunk for chunk in chunks}
+        changed = 0
+        for chunk_id, chunk in current.items():
+            doc = index.docs.get(chunk_id)
+            if doc is None or doc["content_hash"] != chunk.content_hash:
+                index.add(chunk_id, chunk.text, chunk.metadata, chunk.content_hash)
+                changed += 1
+        for chunk_id in [chunk_id for chunk_id in index.docs if chunk_id not in current]:
+            index.remove(chunk_id)
+            changed += 1
+        if changed:
+            self.save(catalog, index)
+        return changed
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {catalog: {"docs": len(index), "terms": len(index.postings)} for catalog, (_, index) in self._indexes.items()}
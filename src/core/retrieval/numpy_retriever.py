@@ -0,0 +1,335 @@
+"""
+numpy_retriever.py — Índice vectorial en proceso sobre archivos .npy mapeados en memoria.
+
+Para catálogos de decenas de miles de fragmentos un servidor vectorial cuesta más de lo
+que ahorra: aquí cada catálogo es una carpeta con
+
+    vectors.npy  → matriz (capacidad, dim) float32 normalizada, o int8 cuantizada
+    scales.npy   → (solo int8) escala por fila: vector ≈ fila_int8 * escala
+    meta.json    → arreglo paralelo de filas {id, text, metadata, deleted}, `count` y la
+                   generación de la matriz (vectors.<n>.npy tras crecer o compactar)
+
+La matriz se abre con np.load(mmap_mode="r"): todos los workers de uvicorn comparten las
+mismas páginas del page cache en lugar de tener cada uno su copia. Una búsqueda es un
+solo producto matriz-vector y np.argpartition para el top-k (sin ordenar todo).
+
+meta.json es el punto de commit de cada escritura, y ninguna escritura toca una fila que
+un lector pueda estar usando:
+- upsert() nunca pisa una fila: agrega una nueva al final (más allá del `count` que ven
+  los lectores) y marca la anterior como tombstone en el meta.json nuevo.
+- Crecer o compactar escribe una matriz de otra generación (vectors.<n>.npy) en lugar de
+  reemplazar la que los lectores tienen mapeada; la anterior se borra tras el commit.
+Luego meta.json se reemplaza de forma atómica. Los lectores detectan el cambio por el
+mtime de meta.json y recargan: siempre ven filas y vectores de la misma versión.
+delete() es un tombstone; la matriz se compacta cuando los tombstones superan
+NUMPY_INDEX_COMPACT_RATIO.
+"""
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from src.core.retrieval.base_retriever import BaseRetriever, Passage
+from src.core.retrieval.embedder import Embedder
+from src.core.retrieval.search_pool import search_pool
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Carpeta raíz de los índices (una subcarpeta por catálogo)
+NUMPY_INDEX_PATH = os.getenv("NUMPY_INDEX_PATH", "vector_index")
+# "float32" o "int8" (4x menos memoria, pierde ~1% de precisión en la similitud). Aplica a índices nuevos.
+NUMPY_INDEX_DTYPE = os.getenv("NUMPY_INDEX_DTYPE", "float32")
+# Fracción de filas con tombstone a partir de la cual una escritura compacta la matriz
+NUMPY_INDEX_COMPACT_RATIO = float(os.getenv("NUMPY_INDEX_COMPACT_RATIO", "0.25"))
+
+MIN_CAPACITY = 1024
+# Filas por bloque al puntuar un índice int8 (el bloque se convierte a float32 en memoria temporal)
+INT8_BLOCK_ROWS = 8192
+
+
+@dataclass
+class _Index:
+    """Estado cargado de un catálogo."""
+    dtype: str
+    dim: int
+    rows: List[Dict[str, Any]]
+    vectors: np.ndarray  # (capacidad, dim); solo las primeras len(rows) filas son válidas
+    scales: Optional[np.ndarray]
+    alive: np.ndarray  # bool (len(rows),): False = tombstone
+    positions: Dict[str, int]
+    version: Tuple[int, int]
+    generation: int = 0
+    # Generaciones de la matriz reemplazadas en esta escritura: se borran tras el commit
+    retired: List[int] = field(default_factory=list)
+
+    @property
+    def count(self) -> int:
+        return len(self.rows)
+
+    @property
+    def live(self) -> int:
+        return int(self.alive.sum())
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        """Similitud coseno de `query` (normalizada) contra cada fila válida."""
+        if self.dtype != "int8":
+            return np.asarray(self.vectors[:self.count] @ query)
+        out = np.empty(self.count, dtype=np.float32)
+        for start in range(0, self.count, INT8_BLOCK_ROWS):
+            end = min(start + INT8_BLOCK_ROWS, self.count)
+            out[start:end] = (self.vectors[start:end].astype(np.float32) @ query) * self.scales[start:end]
+        return out
+
+
+def quantize(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """float32 (n, dim) → int8 (n, dim) y escala por fila, simétrico sobre el máximo absoluto."""
+    peak = np.abs(vectors).max(axis=1)
+    scales = np.where(peak > 0, peak / 127.0, 1.0).astype(np.float32)
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales
+
+
+class NumpyRetriever(BaseRetriever):
+    name = "numpy"
+
+    def __init__(
+        self,
+        path: str = NUMPY_INDEX_PATH,
+        embedder: Optional[Embedder] = None,
+        dtype: str = NUMPY_INDEX_DTYPE,
+        compact_ratio: float = NUMPY_INDEX_COMPACT_RATIO,
+    ):
+        if dtype not in ("float32", "int8"):
+            raise ValueError(f"NUMPY_INDEX_DTYPE desconocido: '{dtype}'")
+        self.path = path
+        self.embedder = embedder or Embedder()
+        self.dtype = dtype
+        self.compact_ratio = compact_ratio
+        self._indexes: Dict[str, _Index] = {}
+        self._lock = threading.Lock()
+
+    # ── Archivos ─────────────────────────────────────────────────────────────
+
+    def _dir(self, catalog: str) -> str:
+        return os.path.join(self.path, catalog)
+
+    def _file(self, catalog: str, name: str) -> str:
+        return os.path.join(self._dir(catalog), name)
+
+    def _matrix_file(self, catalog: str, name: str, generation: int) -> str:
+        return self._file(catalog, f"{name}.npy" if generation == 0 else f"{name}.{generation}.npy")
+
+    def _version(self, catalog: str) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self._file(catalog, "meta.json"))
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _load(self, catalog: str, version: Tuple[int, int], mmap_mode: str = "r") -> _Index:
+        with open(self._file(catalog, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        rows = meta["rows"]
+        generation = meta.get("generation", 0)
+        vectors = np.load(self._matrix_file(catalog, "vectors", generation), mmap_mode=mmap_mode)
+        scales = np.load(self._matrix_file(catalog, "scales", generation), mmap_mode=mmap_mode) if meta["dtype"] == "int8" else None
+        return _Index(
+            dtype=meta["dtype"],
+            dim=meta["dim"],
+            rows=rows,
+            vectors=vectors,
+            scales=scales,
+            alive=np.array([not row["deleted"] for row in rows], dtype=bool),
+            positions={row["id"]: position for position, row in enumerate(rows)},
+            version=version,
+            generation=generation,
+        )
+
+    def index(self, catalog: str) -> Optional[_Index]:
+        """Índice de solo lectura del catálogo; se recarga si otro proceso (la ingesta) lo cambió."""
+        for attempt in range(2):
+            version = self._version(catalog)
+            if version is None:
+                return None
+            with self._lock:
+                cached = self._indexes.get(catalog)
+                if cached is None or cached.version != version:
+                    try:
+                        cached = self._indexes[catalog] = self._load(catalog, version)
+                    except FileNotFoundError:
+                        # La ingesta cambió de generación entre leer meta.json y abrir la matriz
+                        if attempt:
+                            raise
+                        continue
+                return cached
+
+    def _write_meta(self, catalog: str, index: _Index) -> None:
+        # Escritura atómica: los lectores ven el meta.json anterior o el nuevo, nunca uno a medias
+        tmp = self._file(catalog, "meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(
+                {"dtype": index.dtype, "dim": index.dim, "count": index.count, "generation": index.generation, "rows": index.rows},
+                f,
+                ensure_ascii=False,
+            )
+        os.replace(tmp, self._file(catalog, "meta.json"))
+
+    def _write_matrix(
+        self, catalog: str, index: _Index, capacity: int, keep: Sequence[int], generation: Optional[int] = None
+    ) -> None:
+        """
+        Escribe la matriz de otra generación con `capacity` filas copiando las filas `keep`,
+        y la abre en r+. La generación anterior sigue intacta (y mapeada por los lectores)
+        hasta que _commit() publica el meta.json nuevo.
+        """
+        if generation is None:
+            index.retired.append(index.generation)
+            generation = index.generation + 1
+        names = ["vectors"] + (["scales"] if index.dtype == "int8" else [])
+        for name in names:
+            old = index.vectors if name == "vectors" else index.scales
+            shape = (capacity, index.dim) if name == "vectors" else (capacity,)
+            dtype = (np.int8 if index.dtype == "int8" else np.float32) if name == "vectors" else np.float32
+            new = np.lib.format.open_memmap(self._matrix_file(catalog, name, generation), mode="w+", dtype=dtype, shape=shape)
+            if len(keep):
+                new[:len(keep)] = old[np.asarray(keep)]
+            new.flush()
+            del new
+        index.generation = generation
+        index.vectors = np.load(self._matrix_file(catalog, "vectors", generation), mmap_mode="r+")
+        if index.dtype == "int8":
+            index.scales = np.load(self._matrix_file(catalog, "scales", generation), mmap_mode="r+")
+
+    def _open_for_write(self, catalog: str, dim: int) -> _Index:
+        version = self._version(catalog)
+        if version is not None:
+            index = self._load(catalog, version, mmap_mode="r+")
+            if index.dim != dim:
+                raise ValueError(f"El índice '{catalog}' es de dimensión {index.dim}; el modelo genera {dim}")
+            return index
+        os.makedirs(self._dir(catalog), exist_ok=True)
+        empty = np.zeros((0, dim), dtype=np.float32)
+        scales = np.zeros(0, dtype=np.float32) if self.dtype == "int8" else None
+        index = _Index(self.dtype, dim, [], empty, scales, np.zeros(0, dtype=bool), {}, (0, 0))
+        self._write_matrix(catalog, index, MIN_CAPACITY, [], generation=0)
+        return index
+
+    def _compact_if_needed(self, catalog: str, index: _Index) -> None:
+        tombstones = sum(row["deleted"] for row in index.rows)
+        if tombstones and tombstones > index.count * self.compact_ratio:
+            keep = [position for position, row in enumerate(index.rows) if not row["deleted"]]
+            self._write_matrix(catalog, index, max(MIN_CAPACITY, len(keep)), keep)
+            index.rows = [index.rows[position] for position in keep]
+            index.positions = {row["id"]: position for position, row in enumerate(index.rows)}
+            logger.info(f"[NumpyRetriever] {catalog}: compactado, {tombstones} tombstones eliminados")
+
+    def _commit(self, catalog: str, index: _Index) -> None:
+        index.vectors.flush()
+        if index.scales is not None:
+            index.scales.flush()
+        self._write_meta(catalog, index)
+        # Los lectores que aún mapean una generación retirada la conservan hasta recargar
+        for generation in index.retired:
+            for name in ("vectors", "scales"):
+                try:
+                    os.remove(self._matrix_file(catalog, name, generation))
+                except FileNotFoundError:
+                    pass
+        index.retired.clear()
+        with self._lock:
+            self._indexes.pop(catalog, None)
+
+    # ── Escritura (ingesta) ──────────────────────────────────────────────────
+
+    def fingerprints(self, catalog: str) -> Dict[str, str]:
+        index = self.index(catalog)
+        if index is None:
+            return {}
+        return {row["id"]: row["metadata"].get("content_hash", "") for row in index.rows if not row["deleted"]}
+
+    def upsert(
+        self,
+        catalog: str,
+        ids: Sequence[str],
+        texts: Sequence[str],
+        vectors: Sequence[Sequence[float]],
+        metadatas: Sequence[Dict[str, Any]],
+    ) -> None:
+        if not ids:
+            return
+        matrix = np.asarray(vectors, dtype=np.float32)
+        index = self._open_for_write(catalog, matrix.shape[1])
+        previous = index.count
+
+        positions = []
+        for chunk_id, text, metadata in zip(ids, texts, metadatas):
+            replaced = index.positions.get(chunk_id)
+            if replaced is not None:
+                # Nunca en sitio: los lectores con el meta.json anterior siguen usando esa fila
+                index.rows[replaced]["deleted"] = True
+            positions.append(len(index.rows))
+            index.positions[chunk_id] = len(index.rows)
+            index.rows.append({"id": chunk_id, "text": text, "metadata": dict(metadata), "deleted": False})
+
+        capacity = index.vectors.shape[0]
+        if index.count > capacity:
+            # Crecer al doble: escrituras amortizadas O(1) por fila en una ingesta inicial grande
+            self._write_matrix(catalog, index, max(capacity * 2, index.count), range(previous))
+        # Filas nuevas, más allá del `count` que ven los lectores
+        target = np.asarray(positions)
+        if index.dtype == "int8":
+            index.vectors[target], index.scales[target] = quantize(matrix)
+        else:
+            index.vectors[target] = matrix
+        self._compact_if_needed(catalog, index)
+        self._commit(catalog, index)
+
+    def delete(self, catalog: str, ids: Sequence[str]) -> None:
+        if not ids or self._version(catalog) is None:
+            return
+        index = self._load(catalog, self._version(catalog), mmap_mode="r+")
+        for chunk_id in ids:
+            position = index.positions.get(chunk_id)
+            if position is not None:
+                index.rows[position]["deleted"] = True
+        self._compact_if_needed(catalog, index)
+        self._commit(catalog, index)
+
+    # ── Lectura (Agent Loop) ─────────────────────────────────────────────────
+
+    def warm_up(self) -> None:
+        self.embedder.warm_up()
+
+    def _search_sync(self, catalog: str, query: str, k: int) -> List[Passage]:
+        index = self.index(catalog)
+        if index is None or index.live == 0:
+            return []
+        vector = self.embedder.embed_query(query)
+        scores = index.scores(np.asarray(vector, dtype=np.float32))
+        scores[~index.alive] = -np.inf
+        k = min(k, index.live)
+        # argpartition: top-k en O(n); solo esos k se ordenan
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            Passage(id=index.rows[i]["id"], text=index.rows[i]["text"], score=float(scores[i]), metadata=index.rows[i]["metadata"])
+            for i in top
+        ]
+
+    async def search(self, catalog: str, query: str, k: int) -> List[Passage]:
+        # Embedding y producto matriz-vector son CPU (numpy libera el GIL): fuera del event loop, en hilos propios
+        return await search_pool.run(self._search_sync, catalog, query, k)
+
+    @property
+    def saturated(self) -> bool:
+        return search_pool.saturated
+
+    def stats(self) -> dict:
+        with self._lock:
+            catalogs = {catalog: {"rows": index.count, "live": index.live, "dtype": index.dtype} for catalog, index in self._indexes.items()}
+        return {"backend": self.name, "path": self.path, "embedder": self.embedder.stats(), "catalogs": catalogs}
@@ -0,0 +1,64 @@
+"""
+search_pool.py — Hilos dedicados y acotados para las búsquedas del catálogo (RAG).
+
+Las búsquedas son CPU bloqueante (embedding + consulta al índice) y corren fuera del
+event loop. No usan el executor por defecto de asyncio: ahí también corre el fsync del
+WAL de la cola (message_log.py), y cuando CatalogRetrieval abandona una búsqueda por
+RAG_BUDGET_MS solo se cancela el await, el hilo sigue hasta terminar. Con carga, las
+búsquedas abandonadas se acumularían delante del fsync y frenarían el encolado.
+
+Aquí el trabajo pendiente se cuenta hasta que el hilo termina de verdad: con todos los
+hilos ocupados `saturated` es True y CatalogRetrieval salta la búsqueda en lugar de
+encolar otra (el turno sigue sin catálogo).
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Hilos para búsquedas del catálogo (por proceso)
+RAG_SEARCH_THREADS = int(os.getenv("RAG_SEARCH_THREADS", "4"))
+
+T = TypeVar("T")
+
+
+class SearchPool:
+    def __init__(self, threads: int = RAG_SEARCH_THREADS):
+        self.threads = max(1, threads)
+        self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="rag-search")
+        self._lock = threading.Lock()
+        self._busy = 0
+        self.completed = 0
+
+    @property
+    def busy(self) -> int:
+        """Búsquedas encoladas o corriendo, incluidas las que su caller ya abandonó."""
+        return self._busy
+
+    @property
+    def saturated(self) -> bool:
+        return self._busy >= self.threads
+
+    async def run(self, fn: Callable[..., T], *args) -> T:
+        with self._lock:
+            self._busy += 1
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._done)
+        return await asyncio.wrap_future(future)
+
+    def _done(self, _future) -> None:
+        with self._lock:
+            self._busy -= 1
+            self.completed += 1
+
+    def stats(self) -> dict:
+        return {"threads": self.threads, "busy": self._busy, "completed": self.completed}
+
+
+# Instancia global (Patrón Singleton) compartida por los motores del catálogo
+search_pool = SearchPool()
@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from src.core.llm import llm_engine
+from src.database import crud
+from src.database.connection import async_session_factory
+from src.database.identity_cache import identity_cache
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Máximo de mensajes sin resumir por conversación. 0 desactiva el resumen. Por defecto
+# CONTEXT_MAX_TURNS: lo que no cabe en la ventana del historial debe estar en el resumen.
+SUMMARY_TRIGGER_TURNS = int(os.getenv("SUMMARY_TRIGGER_TURNS", os.getenv("CONTEXT_MAX_TURNS", "20")))
+# Máximo de mensajes recientes que quedan fuera del resumen en cada corrida (viajan textuales).
+# Se usa a lo sumo la mitad de la ventana real, para resumir por adelantado lo que saldrá de ella.
+SUMMARY_KEEP_TURNS = int(os.getenv("SUMMARY_KEEP_TURNS", str(int(os.getenv("CONTEXT_MAX_TURNS", "20")) // 2)))
+# Conversaciones cuyo contador se recuerda en memoria (LRU).
+SUMMARY_MAX_TRACKED = int(os.getenv("SUMMARY_MAX_TRACKED", "10000"))
+
+SummaryKey = Tuple[str, int]
+
+
+def with_summary(summary: Optional[str], context: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Antepone el resumen de la conversación (si existe) a los turnos textuales."""
+    if not summary:
+        return context
+    return [{"role": "system", "content": f"Resumen de la conversación hasta ahora: {summary}"}] + context
+
+
+class ConversationSummarizer:
+    """
+    Resumen incremental (rolling summary) de conversaciones largas.
+
+    El worker llama a note_turn() tras cada turno con `window_turns`: cuántos mensajes
+    llegaron textuales al LLM (la ventana ya recortada por presupuesto, más la respuesta).
+    Cuando los mensajes sin resumir superan esa ventana (o `trigger_turns`), hay turnos
+    que el LLM no ve ni textuales ni resumidos: una tarea en segundo plano integra los
+    más antiguos al resumen guardado en conversations.summary y avanza
+    conversations.summarized_until. Conserva sin resumir a lo sumo la mitad de la
+    ventana (y `keep_turns`), así el resumen ya cubre los turnos que el próximo recorte
+    de ContextBuilder sacará de la ventana.
+
+    La tarea no retiene una conexión durante la llamada al LLM (lectura → LLM →
+    escritura) y la escritura es condicional, así que dos procesos que resuman la
+    misma conversación no se pisan. Al guardar invalida la caché de identidad para
+    que el siguiente turno lea el resumen nuevo.
+
+    Para no consultar la BD en cada turno se lleva en memoria un conteo estimado
+    de mensajes sin resumir por conversación.
+    """
+
+    def __init__(
+        self,
+        llm=None,
+        session_factory=async_session_factory,
+        trigger_turns: int = SUMMARY_TRIGGER_TURNS,
+        keep_turns: int = SUMMARY_KEEP_TURNS,
+        max_tracked: int = SUMMARY_MAX_TRACKED,
+    ):
+        self.llm = llm or llm_engine
+        self.session_factory = session_factory
+        self.trigger_turns = trigger_turns
+        self.keep_turns = min(keep_turns, trigger_turns)
+        self.max_tracked = max_tracked
+        # Conversación → (mensajes sin resumir estimados, ventana reportada en el último turno)
+        self._unsummarized: "OrderedDict[SummaryKey, Tuple[int, int]]" = OrderedDict()
+        self._tasks: Dict[SummaryKey, asyncio.Task] = {}
+        self.runs = 0
+        self.folded_messages = 0
+        self.failures = 0
+
+    def note_turn(
+        self,
+        tenant_id: str,
+        conversation_id: int,
+        new_messages: int,
+        known_messages: int,
+        window_turns: Optional[int] = None,
+    ) -> None:
+        """
+        Registra un turno guardado. `known_messages` son los mensajes de la conversación
+        que el worker vio en este turno (historial cargado + nuevos) y `window_turns`
+        los que llegaron textuales al LLM (None = sin recorte). Si todo lo visto cupo en
+        la ventana y no alcanza `trigger_turns`, la conversación es corta: nada que resumir.
+        """
+        if self.trigger_turns <= 0:
+            return
+        key = (tenant_id, conversation_id)
+        limit = self.trigger_turns if window_turns is None else max(1, min(self.trigger_turns, window_turns))
+        count = self._unsummarized.get(key, (None, None))[0]
+        if count is None:
+            if known_messages <= limit and known_messages < self.trigger_turns:
+                return
+            # Primera vez que este proceso ve una conversación larga: revisar de inmediato
+            count = limit
+        count += new_messages
+        self._track(key, count, limit)
+        if count > limit and key not in self._tasks:
+            self._tasks[key] = asyncio.create_task(self._summarize(key))
+
+    def _keep_for(self, limit: int) -> int:
+        return max(0, min(self.keep_turns, limit // 2))
+
+    def _track(self, key: SummaryKey, count: int, limit: int) -> None:
+        self._unsummarized[key] = (count, limit)
+        self._unsummarized.move_to_end(key)
+        while len(self._unsummarized) > self.max_tracked:
+            self._unsummarized.popitem(last=False)
+
+    async def _summarize(self, key: SummaryKey) -> None:
+        tenant_id, conversation_id = key
+        limit = self._unsummarized.get(key, (0, self.trigger_turns))[1]
+        keep = self._keep_for(limit)
+        try:
+            async with self.session_factory() as session:
+                conversation = await crud.get_conversation(session, conversation_id, tenant_id)
+                if conversation is None:
+                    self._unsummarized.pop(key, None)
+                    return
+                previous, expected_until = conversation.summary, conversation.summarized_until
+                pending = await crud.get_unsummarized_messages(session, conversation_id, tenant_id, expected_until)
+
+            if len(pending) <= limit:
+                self._track(key, len(pending), limit)
+                return
+
+            to_fold = pending[:len(pending) - keep]
+            turns = [{"role": msg.role, "content": msg.content} for msg in to_fold]
+            summary = await self.llm.summarize(previous, turns, tenant_id=tenant_id, conversation_id=conversation_id)
+            if summary is None:
+                self.failures += 1
+                # Reintentar cuando se acumule otra tanda, no en cada turno
+                self._track(key, keep, limit)
+                return
+
+            async with self.session_factory() as session:
+                saved = await crud.save_conversation_summary(
+                    session, conversation_id, tenant_id, summary, to_fold[-1].id, expected_until
+                )
+                await session.commit()
+
+            self._track(key, keep, limit)
+            if saved:
+                self.runs += 1
+                self.folded_messages += len(to_fold)
+                identity_cache.invalidate_conversation(tenant_id, conversation_id)
+                logger.info(f"[{tenant_id}] 📝 Conv {conversation_id}: {len(to_fold)} mensajes integrados al resumen.")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failures += 1
+            self._track(key, keep, limit)
+            logger.error(f"[{tenant_id}] Error resumiendo conv {conversation_id}: {e}")
+        finally:
+            self._tasks.pop(key, None)
+
+    async def join(self) -> None:
+        """Espera a que terminen los resúmenes en curso (tests y scripts)."""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks.values()), return_exceptions=True)
+
+    async def shutdown(self) -> None:
+        """Cancela los resúmenes en curso (se recalculan en un turno posterior)."""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "trigger_turns": self.trigger_turns,
+            "keep_turns": self.keep_turns,
+            "tracked_conversations": len(self._unsummarized),
+            "in_flight": len(self._tasks),
+            "runs": self.runs,
+            "folded_messages": self.folded_messages,
+            "failures": self.failures,
+        }
+
+
+# Instancia global (Patrón Singleton) usada por main.py
+conversation_summarizer = ConversationSummarizer()
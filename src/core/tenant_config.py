@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from src.core.context_builder import count_message_tokens
+from src.database import crud
+from src.database.connection import async_session_factory
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Antigüedad máxima de la configuración en memoria: cada cuánto se buscan cambios en la BD.
+# Los cambios hechos desde el dashboard de ESTE proceso se aplican de inmediato.
+TENANT_CONFIG_TTL_SECONDS = float(os.getenv("TENANT_CONFIG_TTL_SECONDS", "30"))
+# Temperatura para los tenants sin configuración propia (respuestas técnicas deterministas)
+LLM_DEFAULT_TEMPERATURE = float(os.getenv("LLM_DEFAULT_TEMPERATURE", "0.3"))
+
+
+@dataclass(frozen=True)
+class TenantSettings:
+    """
+    Configuración efectiva (ya compilada) de un tenant.
+
+    `prefix` son los mensajes que encabezan cada prompt del tenant, armados una
+    sola vez al cargar la configuración: en el camino caliente el LLMEngine solo
+    concatena listas, sin consultas ni trabajo de strings.
+    """
+    tenant_id: Optional[str]  # None para los valores por defecto del proceso
+    system_prompt: str
+    model: Optional[str]  # None = el modelo del proveedor
+    provider: Optional[str]  # Proveedor al que aplica `model`; None = el principal
+    temperature: float
+    token_budget: Optional[int]  # None = CONTEXT_TOKEN_BUDGET / CONTEXT_TENANT_BUDGETS
+    prefix: Tuple[Dict[str, str], ...]
+    prefix_tokens: int
+
+
+def compile_settings(
+    tenant_id: Optional[str],
+    system_prompt: str,
+    model: Optional[str] = None,
+    provider: Optional[str] = None,
+    temperature: float = LLM_DEFAULT_TEMPERATURE,
+    token_budget: Optional[int] = None,
+) -> TenantSettings:
+    prefix = ({"role": "system", "content": system_prompt},)
+    return TenantSettings(
+        tenant_id=tenant_id,
+        system_prompt=system_prompt,
+        model=model,
+        provider=provider,
+        temperature=temperature,
+        token_budget=token_budget,
+        prefix=prefix,
+        prefix_tokens=count_message_tokens(list(prefix)),
+    )
+
+
+TenantConfigListener = Callable[[str, TenantSettings], None]
+
+
+class TenantConfigStore:
+    """
+    Registro en memoria de la configuración por tenant (tabla tenant_configs).
+
+    get() es una búsqueda en un dict, sin I/O: los tenants sin fila usan los valores
+    por defecto. La tabla completa se carga al arrancar y luego una tarea en segundo
+    plano trae cada TENANT_CONFIG_TTL_SECONDS solo las filas con updated_at nuevo,
+    así un cambio hecho en otro proceso tarda como máximo un TTL en verse.
+
+    Cada cambio efectivo se notifica a los suscriptores (subscribe), ej: el
+    LLMEngine vacía la caché de respuestas del tenant y ajusta su presupuesto de tokens.
+    """
+
+    def __init__(
+        self,
+        default_prompt: str,
+        default_temperature: float = LLM_DEFAULT_TEMPERATURE,
+        session_factory=async_session_factory,
+        ttl_seconds: float = TENANT_CONFIG_TTL_SECONDS,
+    ):
+        self.default = compile_settings(None, default_prompt, temperature=default_temperature)
+        self.session_factory = session_factory
+        self.ttl_seconds = ttl_seconds
+        self._settings: Dict[str, TenantSettings] = {}
+        self._listeners: List[TenantConfigListener] = []
+        self._watermark: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+        self.refreshes = 0
+        self.changes = 0
+        self.failures = 0
+
+    def get(self, tenant_id: str) -> TenantSettings:
+        return self._settings.get(tenant_id, self.default)
+
+    def subscribe(self, listener: TenantConfigListener) -> None:
+        self._listeners.append(listener)
+
+    def apply(self, row) -> bool:
+        """
+        Compila y guarda la configuración de una fila de tenant_configs.
+        Retorna True (y notifica) solo si la configuración efectiva cambió.
+        """
+        settings = compile_settings(
+            row.tenant_id,
+            row.system_prompt or self.default.system_prompt,
+            model=row.model or None,
+            provider=row.provider or None,
+            temperature=row.temperature if row.temperature is not None else self.default.temperature,
+            token_budget=row.token_budget,
+        )
+        if self._settings.get(row.tenant_id) == settings:
+            return False
+        self._settings[row.tenant_id] = settings
+        self.changes += 1
+        logger.info(f"[{row.tenant_id}] ⚙️ Configuración del tenant actualizada.")
+        for listener in self._listeners:
+            try:
+                listener(row.tenant_id, settings)
+            except Exception as e:
+                logger.error(f"[{row.tenant_id}] Error notificando cambio de configuración: {e}")
+        return True
+
+    async def refresh(self) -> int:
+        """Trae de la BD las filas cambiadas desde el último refresco. Retorna cuántas cambiaron."""
+        async with self.session_factory() as session:
+            rows = await crud.get_tenant_configs(session, updated_since=self._watermark)
+        changed = sum(1 for row in rows if self.apply(row))
+        if rows:
+            self._watermark = max(row.updated_at for row in rows)
+        self.refreshes += 1
+        return changed
+
+    async def start(self) -> None:
+        """Carga inicial y arranque del refresco periódico. Sin BD se sigue con los valores por defecto."""
+        try:
+            await self.refresh()
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"[TenantConfig] No se pudo cargar la configuración de tenants: {e}")
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.ttl_seconds)
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"[TenantConfig] Error refrescando la configuración de tenants: {e}")
+
+    async def shutdown(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "ttl_seconds": self.ttl_seconds,
+            "configured_tenants": len(self._settings),
+            "refreshes": self.refreshes,
+            "changes": self.changes,
+            "failures": self.failures,
+        }
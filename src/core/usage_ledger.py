@@ -0,0 +1,246 @@
+import asyncio
+import logging
+import math
+import os
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from src.database import crud
+from src.database.connection import async_session_factory
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Registro por llamada al LLM en la tabla llm_calls. "false" lo desactiva (ej: sin BD).
+LLM_LEDGER_ENABLED = os.getenv("LLM_LEDGER_ENABLED", "true").lower() == "true"
+# Cada cuántos segundos se escribe el lote pendiente, y tamaño máximo de cada INSERT.
+LLM_LEDGER_FLUSH_SECONDS = float(os.getenv("LLM_LEDGER_FLUSH_SECONDS", "5"))
+LLM_LEDGER_BATCH_SIZE = int(os.getenv("LLM_LEDGER_BATCH_SIZE", "500"))
+# Registros en memoria como máximo si la BD no responde; pasado el límite se descartan los más viejos.
+LLM_LEDGER_MAX_PENDING = int(os.getenv("LLM_LEDGER_MAX_PENDING", "20000"))
+
+
+# Límites superiores (ms) de los buckets del histograma de latencia (crud.get_llm_latency_histogram).
+# Los percentiles de /usage se reportan con esta resolución.
+LLM_LATENCY_BUCKETS_MS = (100, 250, 500, 750, 1000, 1500, 2000, 3000, 5000, 7500, 10000, 15000, 20000, 30000, 60000)
+
+# Contadores por día y por proveedor / modelo; "error" no es columna, se deriva del resto
+_COUNTERS = ("calls", "ok", "timeout", "error", "cached", "prompt_tokens", "completion_tokens", "cache_hit_tokens")
+
+
+def _histogram_percentile(buckets: Dict[int, int], p: float, maximum: int, bounds: Tuple[int, ...]) -> int:
+    """
+    Percentil estimado desde el histograma: el límite superior del bucket donde cae,
+    acotado por el máximo real (el último bucket no tiene límite).
+    """
+    total = sum(buckets.values())
+    if not total:
+        return 0
+    target, seen = max(1, math.ceil(total * p)), 0
+    for index in sorted(buckets):
+        seen += buckets[index]
+        if seen >= target:
+            return min(bounds[index], maximum) if index < len(bounds) else maximum
+    return maximum
+
+
+def _new_day() -> Dict[str, Any]:
+    return {
+        "counters": dict.fromkeys(_COUNTERS, 0),
+        "latency_sum": 0.0, "latency_ms_max": 0, "models": [], "buckets": defaultdict(int),
+    }
+
+
+def _usage_totals(row: Any) -> Dict[str, Any]:
+    totals = {name: int(getattr(row, name, 0) or 0) for name in _COUNTERS}
+    totals["error"] = totals["calls"] - totals["ok"] - totals["timeout"]
+    return totals
+
+
+def daily_usage(groups: List[Any], histogram: List[Any], bounds: Tuple[int, ...] = LLM_LATENCY_BUCKETS_MS) -> List[dict]:
+    """
+    Arma el consumo por día UTC a partir de las agregaciones SQL: `groups` de
+    crud.get_llm_usage_by_day (día, proveedor, modelo) e `histogram` de
+    crud.get_llm_latency_histogram. Por día: llamadas por resultado, aciertos de caché,
+    tokens, latencia promedio / p50 / p95 / máxima y el desglose por proveedor y modelo.
+    Los aciertos de caché cuentan como llamadas pero no entran en la latencia, que mide al proveedor.
+    """
+    days: Dict[str, Dict[str, Any]] = defaultdict(_new_day)
+    for row in groups:
+        totals = _usage_totals(row)
+        day = days[str(row.day)]
+        latency_calls = totals["calls"] - totals["cached"]
+        for name, value in totals.items():
+            day["counters"][name] += value
+        day["latency_sum"] += float(row.latency_ms_avg or 0) * latency_calls
+        day["latency_ms_max"] = max(day["latency_ms_max"], int(row.latency_ms_max or 0))
+        day["models"].append({
+            "provider": row.provider,
+            "model": row.model,
+            **totals,
+            "latency_ms_avg": round(float(row.latency_ms_avg or 0)),
+            "latency_ms_max": int(row.latency_ms_max or 0),
+        })
+    for row in histogram:
+        if str(row.day) in days:
+            days[str(row.day)]["buckets"][int(row.bucket)] += int(row.calls)
+
+    result = []
+    for date, day in sorted(days.items()):
+        counters, maximum = day["counters"], day["latency_ms_max"]
+        latency_calls = counters["calls"] - counters["cached"]
+        result.append({
+            "date": date,
+            **counters,
+            "latency_ms_avg": round(day["latency_sum"] / latency_calls) if latency_calls else 0,
+            "latency_ms_p50": _histogram_percentile(day["buckets"], 0.50, maximum, bounds),
+            "latency_ms_p95": _histogram_percentile(day["buckets"], 0.95, maximum, bounds),
+            "latency_ms_max": maximum,
+            "models": day["models"],
+        })
+    return result
+
+
+def top_conversations(rows: List[Any]) -> List[dict]:
+    """Serializa las filas de crud.get_llm_top_conversations (ya ordenadas por tokens en SQL)."""
+    return [
+        {"conversation_id": row.conversation_id, "calls": int(row.calls), "tokens": int(row.tokens), "latency_ms": int(row.latency_ms)}
+        for row in rows
+    ]
+
+
+class UsageLedger:
+    """
+    Registro append-only de cada llamada al LLM (tabla llm_calls).
+
+    record() solo agrega un dict a un buffer en memoria: el turno nunca espera a la BD.
+    Una tarea en segundo plano escribe el buffer cada `flush_seconds` (o antes, si se
+    junta un lote completo) con un INSERT multi-fila. Si la BD falla los registros
+    vuelven al buffer para el siguiente intento; pasado `max_pending` se descartan los
+    más viejos y se cuentan en `dropped`. shutdown() escribe lo que quede.
+    """
+
+    def __init__(
+        self,
+        session_factory=async_session_factory,
+        enabled: bool = LLM_LEDGER_ENABLED,
+        flush_seconds: float = LLM_LEDGER_FLUSH_SECONDS,
+        batch_size: int = LLM_LEDGER_BATCH_SIZE,
+        max_pending: int = LLM_LEDGER_MAX_PENDING,
+    ):
+        self.session_factory = session_factory
+        self.enabled = enabled
+        self.flush_seconds = flush_seconds
+        self.batch_size = batch_size
+        self._pending: Deque[Dict[str, Any]] = deque(maxlen=max_pending)
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.failures = 0
+
+    def record(
+        self,
+        tenant_id: str,
+        kind: str,
+        outcome: str,
+        latency_ms: int,
+        wait_ms: int = 0,
+        provider: Optional[str] = None,
+        model: Optional[str] = None,
+        usage: Optional[Dict[str, int]] = None,
+        conversation_id: Optional[int] = None,
+        error_type: Optional[str] = None,
+        cached: bool = False,
+    ) -> None:
+        """
+        Encola el registro de una llamada. `usage` es la salida de read_usage() (o None);
+        `cached` marca una respuesta servida desde ResponseCache, sin llamar al proveedor.
+        """
+        if not self.enabled:
+            return
+        if len(self._pending) == self._pending.maxlen:
+            self.dropped += 1
+        self._pending.append({
+            "tenant_id": tenant_id,
+            "conversation_id": conversation_id,
+            "kind": kind,
+            "provider": provider,
+            "model": model,
+            "outcome": outcome,
+            "error_type": error_type,
+            "latency_ms": latency_ms,
+            "wait_ms": wait_ms,
+            "prompt_tokens": usage["prompt_tokens"] if usage else None,
+            "completion_tokens": usage["completion_tokens"] if usage else None,
+            "cache_hit_tokens": usage["cache_hit_tokens"] if usage else None,
+            "cached": cached,
+            "created_at": datetime.now(timezone.utc),
+        })
+        self.recorded += 1
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    async def flush(self) -> int:
+        """Escribe todo lo pendiente en lotes de `batch_size`. Retorna cuántos registros se escribieron."""
+        written = 0
+        while self._pending:
+            batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+            try:
+                async with self.session_factory() as session:
+                    await crud.add_llm_calls(session, batch)
+                    await session.commit()
+            except BaseException:
+                # Devolver el lote al frente, en orden, sin pasar de max_pending. También ante
+                # CancelledError: shutdown() cancela el loop y luego vuelve a llamar a flush()
+                room = self._pending.maxlen - len(self._pending)
+                self.dropped += max(0, len(batch) - room)
+                self._pending.extendleft(reversed(batch[:room]))
+                raise
+            written += len(batch)
+            self.written += len(batch)
+        return written
+
+    async def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"[UsageLedger] Error escribiendo {len(self._pending)} registros de llamadas al LLM: {e}")
+
+    async def shutdown(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"[UsageLedger] Se pierden {len(self._pending)} registros de llamadas al LLM al apagar: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "recorded": self.recorded,
+            "written": self.written,
+            "pending": len(self._pending),
+            "dropped": self.dropped,
+            "failures": self.failures,
+        }
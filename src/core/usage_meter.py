@@ -0,0 +1,82 @@
+import logging
+from collections import defaultdict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _field(obj: Any, name: str) -> Any:
+    """Lee un campo de `usage` venga como objeto del SDK o como dict (chunks de streaming)."""
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+def read_usage(usage: Any) -> Optional[Dict[str, int]]:
+    """
+    Normaliza el campo `usage` de una respuesta compatible con OpenAI.
+
+    DeepSeek reporta la caché de prefijos en prompt_cache_hit_tokens / prompt_cache_miss_tokens;
+    OpenAI (y vLLM) en prompt_tokens_details.cached_tokens. Retorna None si la respuesta no trae usage.
+    """
+    prompt_tokens = _field(usage, "prompt_tokens")
+    if not isinstance(prompt_tokens, int):
+        return None
+    hit = _field(usage, "prompt_cache_hit_tokens")
+    if hit is None:
+        hit = _field(_field(usage, "prompt_tokens_details"), "cached_tokens")
+    hit = hit or 0
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": _field(usage, "completion_tokens") or 0,
+        "cache_hit_tokens": hit,
+        "cache_miss_tokens": max(0, prompt_tokens - hit),
+    }
+
+
+def _new_counters() -> Dict[str, int]:
+    return {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cache_hit_tokens": 0, "cache_miss_tokens": 0}
+
+
+class UsageMeter:
+    """
+    Acumula el `usage` que reporta el proveedor en cada respuesta, por tenant y por
+    proveedor: tokens de prompt y de respuesta y cuántos tokens del prompt se
+    sirvieron desde la caché de prefijos del proveedor (se facturan más baratos).
+
+    cache_hit_ratio = cache_hit_tokens / prompt_tokens es la métrica a vigilar
+    al cambiar el orden o el contenido del prompt.
+    """
+
+    def __init__(self):
+        self._tenants: Dict[str, Dict[str, int]] = defaultdict(_new_counters)
+        self._providers: Dict[str, Dict[str, int]] = defaultdict(_new_counters)
+        self.missing_usage = 0
+
+    def record(self, tenant_id: str, provider: str, usage: Any) -> Optional[Dict[str, int]]:
+        values = read_usage(usage)
+        if values is None:
+            self.missing_usage += 1
+            return None
+        for counters in (self._tenants[tenant_id], self._providers[provider]):
+            counters["calls"] += 1
+            for name, value in values.items():
+                counters[name] += value
+        return values
+
+    @staticmethod
+    def _summary(counters: Dict[str, int]) -> dict:
+        prompt = counters["prompt_tokens"]
+        return {
+            **counters,
+            "cache_hit_ratio": round(counters["cache_hit_tokens"] / prompt, 3) if prompt else 0.0,
+        }
+
+    def stats(self) -> dict:
+        return {
+            "missing_usage": self.missing_usage,
+            "tenants": {tenant: self._summary(c) for tenant, c in self._tenants.items()},
+            "providers": {name: self._summary(c) for name, c in self._providers.items()},
+        }
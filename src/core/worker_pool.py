@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import os
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Hashable, Set, Tuple
+
+from dotenv import load_dotenv
+
+from src.models.message import IncomingMessage
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Techo de concurrencia del Agent Loop (llamadas al LLM en vuelo). Los workers solo
+# toman una conexión de BD durante transacciones cortas, antes y después del LLM,
+# así que este valor puede superar el pool (pool_size + max_overflow = 30 en
+# src/database/connection.py). Ver scripts/load_test_db_pool.py.
+MAX_CONCURRENCY = int(os.getenv("AGENT_MAX_CONCURRENCY", "100"))
+# Máximo de trabajos en espera dentro del pool antes de que submit() bloquee.
+# Así el Agent Loop deja de vaciar la cola y la contrapresión llega a los webhooks.
+MAX_PENDING = int(os.getenv("AGENT_MAX_PENDING", "1000"))
+
+Job = Callable[[], Awaitable[None]]
+ConversationKey = Tuple[str, str, str]
+
+
+def conversation_key(message: IncomingMessage) -> ConversationKey:
+    """
+    Llave de orden estricto: dos mensajes con la misma llave nunca se procesan
+    en paralelo ni fuera de orden.
+    """
+    return (message.tenant_id, message.platform, message.platform_user_id)
+
+
+class ConversationWorkerPool:
+    """
+    Scheduler del Agent Loop con concurrencia acotada y orden FIFO por conversación.
+
+    Cada conversación tiene su propio carril (deque) de trabajos pendientes y, como
+    máximo, UNA tarea drenadora activa. Las tareas drenadoras de distintas
+    conversaciones compiten por un semáforo global de `max_concurrency` cupos:
+      - Mensajes del mismo (tenant, platform, user) → secuenciales, en orden de llegada.
+      - Mensajes de conversaciones distintas → en paralelo, hasta el techo configurado.
+
+    Tras cada trabajo la tarea drenadora libera su cupo y vuelve a hacer fila,
+    de modo que una conversación muy activa no acapara un worker indefinidamente.
+    """
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENCY, max_pending: int = MAX_PENDING):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency debe ser >= 1")
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._lanes: Dict[Hashable, Deque[Job]] = {}
+        self._drainers: Set[asyncio.Task] = set()
+        self._space_available = asyncio.Event()
+        self._space_available.set()
+        self._in_flight = 0
+        self._waiting = 0
+        self._completed = 0
+        self._failed = 0
+
+    @property
+    def in_flight(self) -> int:
+        """Trabajos ejecutándose en este momento."""
+        return self._in_flight
+
+    @property
+    def waiting(self) -> int:
+        """Trabajos aceptados que aún esperan cupo o turno en su conversación."""
+        return self._waiting
+
+    async def submit(self, key: Hashable, job: Job) -> None:
+        """
+        Agenda `job` en el carril de `key`.
+
+        Retorna en cuanto el trabajo queda encolado (no espera a que termine).
+        Si ya hay `max_pending` trabajos en espera, bloquea hasta que haya espacio.
+        """
+        while self._waiting >= self.max_pending:
+            self._space_available.clear()
+            await self._space_available.wait()
+
+        self._waiting += 1
+        lane = self._lanes.get(key)
+        if lane is not None:
+            # Ya hay una tarea drenando esta conversación: respetamos su orden.
+            lane.append(job)
+            return
+
+        self._lanes[key] = deque([job])
+        task = asyncio.create_task(self._drain(key))
+        self._drainers.add(task)
+        task.add_done_callback(self._drainers.discard)
+
+    async def _drain(self, key: Hashable) -> None:
+        lane = self._lanes[key]
+        try:
+            while lane:
+                async with self._semaphore:
+                    job = lane.popleft()
+                    self._waiting -= 1
+                    self._space_available.set()
+                    self._in_flight += 1
+                    try:
+                        await job()
+                        self._completed += 1
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        self._failed += 1
+                        logger.error(f"[WorkerPool] Error en trabajo de la conversación {key}: {e}")
+                    finally:
+                        self._in_flight -= 1
+        finally:
+            # Sin await entre el último `while lane` y este pop: no hay carrera con submit().
+            pending = self._lanes.pop(key, None)
+            if pending:
+                # Cancelación: los trabajos que no alcanzaron a correr dejan de contar.
+                self._waiting -= len(pending)
+                self._space_available.set()
+
+    async def join(self) -> None:
+        """Espera a que todos los carriles queden vacíos."""
+        while self._drainers:
+            await asyncio.gather(*list(self._drainers), return_exceptions=True)
+
+    async def shutdown(self) -> None:
+        """Cancela los trabajos en curso y pendientes (apagado del servidor)."""
+        for task in list(self._drainers):
+            task.cancel()
+        await asyncio.gather(*list(self._drainers), return_exceptions=True)
+
+    def stats(self) -> dict:
+        """Métricas instantáneas para /metrics."""
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self._in_flight,
+            "waiting": self._waiting,
+            "active_conversations": len(self._lanes),
+            "completed": self._completed,
+            "failed": self._failed,
+        }
+
+
+# Instancia global (Patrón Singleton) usada por el Agent Loop en main.py
+worker_pool = ConversationWorkerPool()
@@ -1,9 +1,13 @@
-from typing import List, Dict, Optional
+from datetime import datetime
+from typing import Any, List, Dict, Optional, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import desc
+from sqlalchemy.orm import aliased
+from sqlalchemy import case, desc, func, insert, null, update
 
-from src.database.models import User, Conversation, Message, Advisor
+from src.database.models import User, Conversation, Message, Advisor, TenantConfig, LLMCall
+from src.database.identity_cache import identity_cache, CachedIdentity
+from src.database.history_buffer import history_buffer
 from src.models.message import IncomingMessage
 
 async def get_or_create_user(session: AsyncSession, message: IncomingMessage) -> User:
@@ -53,6 +57,8 @@ async def get_or_create_active_conversation(session: AsyncSession, user_id: int,
         )
         session.add(conversation)
         await session.flush()
+        # Conversación nueva: su historial (vacío) ya se conoce completo
+        history_buffer.warm(tenant_id, conversation.id, [], complete=True)
         
     return conversation
 
@@ -78,6 +84,7 @@ async def save_message(session: AsyncSession, conversation_id: int, tenant_id: s
     """
     Inserts a new message (either user or agent role) into the database.
     Does not commit automatically, so the caller must handle session.commit().
+    Also appends the message to the in-memory history buffer if it is warm.
     """
     msg = Message(
         conversation_id=conversation_id,
@@ -87,16 +94,111 @@ async def save_message(session: AsyncSession, conversation_id: int, tenant_id: s
     )
     session.add(msg)
     await session.flush()
+    history_buffer.append(tenant_id, conversation_id, role, content)
     return msg
 
+async def load_conversation_context(
+    session: AsyncSession, message: IncomingMessage, history_limit: int = 10
+) -> Tuple[Optional[User], Optional[Conversation], List[Dict[str, str]]]:
+    """
+    Resolves the user, their latest conversation and its last `history_limit`
+    messages in ONE query (a single MySQL round trip).
+
+    Equivalent to get_or_create_user (read part) + get_latest_conversation +
+    get_conversation_history, but as one LEFT JOIN:
+        users
+        ⟕ conversations  ON id = (SELECT MAX(id) ... of that user/tenant)
+        ⟕ messages       ON id >= (id of the Nth most recent message)
+
+    Returns (None, None, []) for an unknown user and (user, None, []) for a user
+    without conversations; the caller creates whatever is missing.
+
+    Returning users are resolved from the in-process identity cache: only the
+    history query hits MySQL. In that case `user` and `conversation` are
+    lightweight snapshots NOT attached to the session (id, tenant, status and summary only).
+    """
+    key = (message.tenant_id, message.platform, message.platform_user_id)
+    cached = identity_cache.get(key)
+    if cached is not None:
+        user = User(
+            id=cached.user_id,
+            tenant_id=message.tenant_id,
+            platform=message.platform,
+            platform_user_id=message.platform_user_id,
+        )
+        conversation = Conversation(
+            id=cached.conversation_id,
+            user_id=cached.user_id,
+            tenant_id=message.tenant_id,
+            status=cached.status,
+            summary=cached.summary,
+        )
+        history = await get_conversation_history(session, cached.conversation_id, message.tenant_id, limit=history_limit)
+        return user, conversation, history
+
+    recent = aliased(Message)
+    latest_conversation_id = (
+        select(func.max(Conversation.id))
+        .where(Conversation.user_id == User.id, Conversation.tenant_id == message.tenant_id)
+        .correlate(User)
+        .scalar_subquery()
+    )
+    # id del N-ésimo mensaje más reciente: todo lo que esté por encima entra al historial
+    history_floor_id = (
+        select(recent.id)
+        .where(recent.conversation_id == Conversation.id, recent.tenant_id == message.tenant_id)
+        .order_by(desc(recent.id))
+        .limit(1)
+        .offset(history_limit - 1)
+        .correlate(Conversation)
+        .scalar_subquery()
+    )
+    stmt = (
+        select(User, Conversation, Message)
+        .outerjoin(Conversation, Conversation.id == latest_conversation_id)
+        .outerjoin(
+            Message,
+            (Message.conversation_id == Conversation.id)
+            & (Message.tenant_id == message.tenant_id)
+            & (Message.id >= func.coalesce(history_floor_id, 0)),
+        )
+        .where(
+            User.tenant_id == message.tenant_id,
+            User.platform == message.platform,
+            User.platform_user_id == message.platform_user_id,
+        )
+        .order_by(User.id, Message.id)
+    )
+    rows = (await session.execute(stmt)).all()
+    if not rows:
+        return None, None, []
+
+    user, conversation, _ = rows[0]
+    history = [
+        {"role": msg.role, "content": msg.content}
+        for row_user, _, msg in rows
+        if msg is not None and row_user is user
+    ]
+    if conversation is not None:
+        identity_cache.put(key, CachedIdentity(user.id, conversation.id, conversation.status, conversation.summary))
+        history_buffer.warm(message.tenant_id, conversation.id, history, complete=len(history) < history_limit)
+    return user, conversation, history
+
 async def get_conversation_history(session: AsyncSession, conversation_id: int, tenant_id: str, limit: int = 10) -> List[Dict[str, str]]:
     """
     Retrieves the last N messages for a conversation, formatting them for DeepSeek LLM consumption.
+    Served from the in-memory history buffer when the conversation is warm (no query).
     """
+    cached = history_buffer.get(tenant_id, conversation_id, limit)
+    if cached is not None:
+        return cached
+
+    # Miss: se lee el buffer completo para calentarlo (si limit cabe en él)
+    fetch = max(limit, history_buffer.turns) if history_buffer.enabled else limit
     stmt = select(Message).where(
         Message.conversation_id == conversation_id,
         Message.tenant_id == tenant_id
-    ).order_by(desc(Message.id)).limit(limit)
+    ).order_by(desc(Message.id)).limit(fetch)
     
     result = await session.execute(stmt)
     messages = result.scalars().all()
@@ -104,10 +206,66 @@ async def get_conversation_history(session: AsyncSession, conversation_id: int,
     # SQLite/MySQL returns unordered iterator when using scalars on reverse logic, so we reverse it manually
     chronological_msgs = reversed(messages)
     
-    return [
+    history = [
         {"role": msg.role, "content": msg.content}
         for msg in chronological_msgs
     ]
+    if limit <= history_buffer.turns:
+        history_buffer.warm(tenant_id, conversation_id, history, complete=len(history) < fetch)
+    return history[-limit:] if limit > 0 else []
+
+
+async def get_conversation(session: AsyncSession, conversation_id: int, tenant_id: str) -> Optional[Conversation]:
+    """
+    Retrieves a single conversation by id, scoped to the tenant.
+    """
+    stmt = select(Conversation).where(
+        Conversation.id == conversation_id,
+        Conversation.tenant_id == tenant_id,
+    )
+    result = await session.execute(stmt)
+    return result.scalars().first()
+
+
+async def get_unsummarized_messages(
+    session: AsyncSession, conversation_id: int, tenant_id: str, after_id: Optional[int]
+) -> List[Message]:
+    """
+    Returns the messages not yet folded into the conversation summary
+    (id > after_id), in chronological order.
+    """
+    stmt = select(Message).where(
+        Message.conversation_id == conversation_id,
+        Message.tenant_id == tenant_id,
+        Message.id > (after_id or 0),
+    ).order_by(Message.id)
+    result = await session.execute(stmt)
+    return list(result.scalars().all())
+
+
+async def save_conversation_summary(
+    session: AsyncSession,
+    conversation_id: int,
+    tenant_id: str,
+    summary: str,
+    summarized_until: int,
+    expected_until: Optional[int],
+) -> bool:
+    """
+    Stores a new rolling summary only if nobody else advanced it meanwhile
+    (summarized_until still equals expected_until). Returns True if it was saved.
+    Does not commit.
+    """
+    current = Conversation.summarized_until.is_(None) if expected_until is None else (
+        Conversation.summarized_until == expected_until
+    )
+    stmt = (
+        update(Conversation)
+        .where(Conversation.id == conversation_id, Conversation.tenant_id == tenant_id, current)
+        .values(summary=summary, summarized_until=summarized_until)
+    )
+    result = await session.execute(stmt)
+    return result.rowcount == 1
 
 
 async def get_available_advisor(session: AsyncSession, tenant_id: str) -> Optional[Advisor]:
@@ -132,7 +290,9 @@ async def set_conversation_status(session: AsyncSession, conversation_id: int, t
 
     Valores válidos: 'active', 'handed_off', 'pending_callback', 'closed'.
     No hace commit — el caller es responsable de session.commit().
+    Invalida la entrada de la conversación en la caché de identidad.
     """
+    identity_cache.invalidate_conversation(tenant_id, conversation_id)
     stmt = select(Conversation).where(
         Conversation.id == conversation_id,
         Conversation.tenant_id == tenant_id,
@@ -145,6 +305,22 @@ async def set_conversation_status(session: AsyncSession, conversation_id: int, t
     return conversation
 
 
+async def lock_conversation_status(session: AsyncSession, conversation_id: int, tenant_id: str) -> Optional[str]:
+    """
+    Relee el status de una conversación con SELECT ... FOR UPDATE.
+
+    El worker la llama al reabrir la transacción tras la llamada al LLM: un cambio
+    de status concurrente (handoff, cierre) o ya está confirmado y se ve aquí, o
+    espera a que esta transacción haga commit. Retorna None si la conversación no existe.
+    """
+    stmt = select(Conversation.status).where(
+        Conversation.id == conversation_id,
+        Conversation.tenant_id == tenant_id,
+    ).with_for_update()
+    result = await session.execute(stmt)
+    return result.scalars().first()
+
+
 async def get_handed_off_conversations(session: AsyncSession, tenant_id: str) -> List[Conversation]:
     """
     Retrieves all conversations with 'handed_off' status for a specific tenant.
@@ -179,3 +355,135 @@ async def get_conversation_messages(session: AsyncSession, conversation_id: int,
     )
     result = await session.execute(stmt)
     return result.scalars().all()
+
+
+async def get_tenant_configs(session: AsyncSession, updated_since: Optional[datetime] = None) -> List[TenantConfig]:
+    """
+    Configuraciones de tenant, en orden de updated_at.
+    Con `updated_since` solo las modificadas desde entonces (inclusive: updated_at
+    tiene resolución de segundos en MySQL y dos cambios pueden compartir marca).
+    """
+    stmt = select(TenantConfig).order_by(TenantConfig.updated_at)
+    if updated_since is not None:
+        stmt = stmt.where(TenantConfig.updated_at >= updated_since)
+    result = await session.execute(stmt)
+    return result.scalars().all()
+
+
+async def upsert_tenant_config(session: AsyncSession, tenant_id: str, values: Dict[str, Any]) -> TenantConfig:
+    """
+    Crea o actualiza la configuración de un tenant con los campos de `values`
+    (un valor None devuelve ese campo al valor por defecto).
+    """
+    stmt = select(TenantConfig).where(TenantConfig.tenant_id == tenant_id)
+    result = await session.execute(stmt)
+    config = result.scalars().first()
+    if config is None:
+        config = TenantConfig(tenant_id=tenant_id)
+        session.add(config)
+    for field, value in values.items():
+        setattr(config, field, value)
+    await session.flush()
+    return config
+
+
+async def add_llm_calls(session: AsyncSession, rows: List[Dict[str, Any]]) -> None:
+    """Inserta un lote de registros de llamadas al LLM en un solo INSERT multi-fila."""
+    if rows:
+        await session.execute(insert(LLMCall), rows)
+
+
+def _llm_calls_in_range(stmt, tenant_id: str, since: datetime, until: Optional[datetime]):
+    """Filtra llm_calls por tenant y [since, until): lo resuelve el índice ix_llm_calls_tenant_created."""
+    stmt = stmt.where(LLMCall.tenant_id == tenant_id, LLMCall.created_at >= since)
+    if until is not None:
+        stmt = stmt.where(LLMCall.created_at < until)
+    return stmt
+
+
+async def get_llm_usage_by_day(
+    session: AsyncSession, tenant_id: str, since: datetime, until: Optional[datetime] = None
+) -> List[Any]:
+    """
+    Totales de llm_calls del tenant en [since, until), agregados en SQL por día (UTC),
+    proveedor y modelo: una fila por grupo, sin traer las llamadas a Python.
+    La latencia (promedio y máximo) excluye los aciertos de caché, que no llegan al proveedor.
+    """
+    day = func.date(LLMCall.created_at).label("day")
+    provider_latency = case((LLMCall.cached, null()), else_=LLMCall.latency_ms)
+    stmt = select(
+        day, LLMCall.provider, LLMCall.model,
+        func.count().label("calls"),
+        func.sum(case((LLMCall.outcome == "ok", 1), else_=0)).label("ok"),
+        func.sum(case((LLMCall.outcome == "timeout", 1), else_=0)).label("timeout"),
+        func.sum(case((LLMCall.cached, 1), else_=0)).label("cached"),
+        func.coalesce(func.sum(LLMCall.prompt_tokens), 0).label("prompt_tokens"),
+        func.coalesce(func.sum(LLMCall.completion_tokens), 0).label("completion_tokens"),
+        func.coalesce(func.sum(LLMCall.cache_hit_tokens), 0).label("cache_hit_tokens"),
+        func.avg(provider_latency).label("latency_ms_avg"),
+        func.max(provider_latency).label("latency_ms_max"),
+    )
+    stmt = _llm_calls_in_range(stmt, tenant_id, since, until)
+    stmt = stmt.group_by(day, LLMCall.provider, LLMCall.model).order_by(day, LLMCall.provider, LLMCall.model)
+    result = await session.execute(stmt)
+    return result.all()
+
+
+async def get_llm_latency_histogram(
+    session: AsyncSession, tenant_id: str, since: datetime, bounds: Tuple[int, ...], until: Optional[datetime] = None
+) -> List[Any]:
+    """
+    Llamadas al proveedor (sin aciertos de caché) del tenant en [since, until) por día y
+    bucket de latencia: el bucket i cuenta las de latency_ms <= bounds[i] (y > bounds[i - 1]);
+    el bucket len(bounds), las que superan el último límite. MySQL no tiene PERCENTILE_CONT:
+    los percentiles se estiman con este histograma (src/core/usage_ledger.py).
+    """
+    day = func.date(LLMCall.created_at).label("day")
+    bucket = case(
+        *((LLMCall.latency_ms <= bound, index) for index, bound in enumerate(bounds)), else_=len(bounds)
+    ).label("bucket")
+    stmt = select(day, bucket, func.count().label("calls")).where(~LLMCall.cached)
+    stmt = _llm_calls_in_range(stmt, tenant_id, since, until).group_by(day, bucket)
+    result = await session.execute(stmt)
+    return result.all()
+
+
+async def get_llm_top_conversations(
+    session: AsyncSession, tenant_id: str, since: datetime, until: Optional[datetime] = None, limit: int = 10
+) -> List[Any]:
+    """Las `limit` conversaciones del tenant con más tokens (prompt + respuesta) en [since, until), agregadas en SQL."""
+    tokens = func.coalesce(func.sum(LLMCall.prompt_tokens), 0) + func.coalesce(func.sum(LLMCall.completion_tokens), 0)
+    stmt = select(
+        LLMCall.conversation_id,
+        func.count().label("calls"),
+        tokens.label("tokens"),
+        func.sum(LLMCall.latency_ms).label("latency_ms"),
+    ).where(LLMCall.conversation_id.is_not(None))
+    stmt = _llm_calls_in_range(stmt, tenant_id, since, until)
+    stmt = stmt.group_by(LLMCall.conversation_id).order_by(desc("tokens"), LLMCall.conversation_id).limit(limit)
+    result = await session.execute(stmt)
+    return result.all()
+
+
+async def get_llm_calls(
+    session: AsyncSession,
+    tenant_id: str,
+    since: datetime,
+    until: Optional[datetime] = None,
+    limit: int = 100,
+    offset: int = 0,
+) -> List[Any]:
+    """
+    Llamadas al LLM del tenant en [since, until), de la más reciente a la más antigua,
+    paginadas con limit / offset. Es para listar llamadas sueltas; los totales salen de
+    get_llm_usage_by_day. Solo columnas, sin cargar objetos ORM.
+    """
+    stmt = select(
+        LLMCall.id, LLMCall.created_at, LLMCall.conversation_id, LLMCall.kind, LLMCall.provider, LLMCall.model,
+        LLMCall.outcome, LLMCall.error_type, LLMCall.latency_ms, LLMCall.wait_ms,
+        LLMCall.prompt_tokens, LLMCall.completion_tokens, LLMCall.cache_hit_tokens, LLMCall.cached,
+    )
+    stmt = _llm_calls_in_range(stmt, tenant_id, since, until)
+    stmt = stmt.order_by(desc(LLMCall.created_at), desc(LLMCall.id)).limit(limit).offset(offset)
+    result = await session.execute(stmt)
+    return result.all()
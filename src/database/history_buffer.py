@@ -0,0 +1,154 @@
+"""
+history_buffer.py — Buffer circular en memoria con los últimos turnos de cada conversación.
+
+get_conversation_history() consulta la BD en cada turno aunque el turno anterior
+lo acabamos de escribir nosotros. Este buffer guarda los últimos `turns` mensajes
+{role, content} de cada conversación:
+
+- Se calienta desde la BD en un miss (get_conversation_history / load_conversation_context).
+- crud.save_message() agrega cada mensaje nuevo, pero SOLO si la conversación ya
+  está caliente: un buffer parcial nunca se hace pasar por historial completo.
+- Un tope global de caracteres desaloja las conversaciones inactivas (LRU).
+
+Consistencia:
+- save_message() agrega tras el flush, antes del commit. Si el turno falla,
+  el worker llama a invalidate() para no servir mensajes que nunca se guardaron.
+- Con varios workers de uvicorn, un proceso no ve lo que escribe otro: el TTL
+  acota ese desfase (mismo criterio que identity_cache.py).
+"""
+import os
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Turnos guardados por conversación (debe cubrir el history_limit del worker)
+HISTORY_BUFFER_TURNS = int(os.getenv("HISTORY_BUFFER_TURNS", "20"))
+# Tope global de memoria, en caracteres de contenido. 0 desactiva el buffer.
+HISTORY_BUFFER_MAX_CHARS = int(os.getenv("HISTORY_BUFFER_MAX_CHARS", "20000000"))
+HISTORY_BUFFER_TTL_SECONDS = float(os.getenv("HISTORY_BUFFER_TTL_SECONDS", "300"))
+
+BufferKey = Tuple[str, int]
+
+
+@dataclass
+class _Ring:
+    turns: Deque[Dict[str, str]]
+    expires_at: float
+    # True si el buffer contiene la conversación desde su primer mensaje
+    complete: bool
+    chars: int = field(default=0)
+
+
+class ConversationHistoryBuffer:
+    """Ring buffer por conversación, con LRU global acotado por caracteres."""
+
+    def __init__(
+        self,
+        turns: int = HISTORY_BUFFER_TURNS,
+        max_chars: int = HISTORY_BUFFER_MAX_CHARS,
+        ttl_seconds: float = HISTORY_BUFFER_TTL_SECONDS,
+    ):
+        self.turns = turns
+        self.max_chars = max_chars
+        self.ttl_seconds = ttl_seconds
+        self._rings: "OrderedDict[BufferKey, _Ring]" = OrderedDict()
+        self._chars = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_chars > 0 and self.turns > 0
+
+    def get(self, tenant_id: str, conversation_id: int, limit: int) -> Optional[List[Dict[str, str]]]:
+        """Últimos `limit` turnos en orden cronológico, o None si hay que ir a la BD."""
+        key = (tenant_id, conversation_id)
+        ring = self._rings.get(key)
+        if ring is None or limit > self.turns:
+            self.misses += 1
+            return None
+        if ring.expires_at < time.monotonic() or (len(ring.turns) < limit and not ring.complete):
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._rings.move_to_end(key)
+        self.hits += 1
+        return list(ring.turns)[-limit:] if limit > 0 else []
+
+    def warm(self, tenant_id: str, conversation_id: int, history: List[Dict[str, str]], complete: bool) -> None:
+        """
+        Carga el historial leído de la BD. `complete` indica que la consulta devolvió
+        menos filas de las pedidas, es decir, la conversación entera.
+        """
+        if not self.enabled:
+            return
+        key = (tenant_id, conversation_id)
+        self._remove(key)
+        ring = _Ring(
+            turns=deque(maxlen=self.turns),
+            expires_at=time.monotonic() + self.ttl_seconds,
+            complete=complete,
+        )
+        self._rings[key] = ring
+        for turn in history[-self.turns:]:
+            self._push(ring, {"role": turn["role"], "content": turn["content"]})
+        self._evict()
+
+    def append(self, tenant_id: str, conversation_id: int, role: str, content: str) -> None:
+        """Agrega un mensaje recién guardado. No hace nada si la conversación está fría."""
+        ring = self._rings.get((tenant_id, conversation_id))
+        if ring is None:
+            return
+        self._push(ring, {"role": role, "content": content})
+        self._rings.move_to_end((tenant_id, conversation_id))
+        self._evict()
+
+    def invalidate(self, tenant_id: str, conversation_id: int) -> None:
+        self._remove((tenant_id, conversation_id))
+
+    def clear(self) -> None:
+        self._rings.clear()
+        self._chars = 0
+
+    def _push(self, ring: _Ring, turn: Dict[str, str]) -> None:
+        if len(ring.turns) == ring.turns.maxlen:
+            dropped = ring.turns[0]
+            ring.chars -= len(dropped["content"])
+            self._chars -= len(dropped["content"])
+        ring.turns.append(turn)
+        ring.chars += len(turn["content"])
+        self._chars += len(turn["content"])
+
+    def _remove(self, key: BufferKey) -> None:
+        ring = self._rings.pop(key, None)
+        if ring is not None:
+            self._chars -= ring.chars
+
+    def _evict(self) -> None:
+        # Desaloja las conversaciones inactivas; siempre conserva la más reciente
+        while self._chars > self.max_chars and len(self._rings) > 1:
+            oldest = next(iter(self._rings))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "conversations": len(self._rings),
+            "chars": self._chars,
+            "max_chars": self.max_chars,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+# Instancia global (Patrón Singleton) usada por crud.py
+history_buffer = ConversationHistoryBuffer()
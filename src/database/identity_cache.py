@@ -0,0 +1,103 @@
+"""
+identity_cache.py — Caché en proceso de la identidad de un prospecto.
+
+Mapea (tenant_id, platform, platform_user_id) → (user_id, conversation_id, status, summary).
+Ese mapeo casi nunca cambia, así que un prospecto que vuelve a escribir evita
+los SELECT de usuario y de última conversación.
+
+Consistencia:
+- crud.set_conversation_status() invalida la entrada de esa conversación
+  (handoff, cierre desde el dashboard), así que el status nunca queda obsoleto
+  dentro del mismo proceso. El summarizer hace lo mismo al guardar un resumen.
+- Con varios workers de uvicorn, cada proceso tiene su caché: el TTL acota
+  cuánto puede tardar un proceso en ver un cambio hecho por otro.
+"""
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+IDENTITY_CACHE_MAX_ENTRIES = int(os.getenv("IDENTITY_CACHE_MAX_ENTRIES", "10000"))
+IDENTITY_CACHE_TTL_SECONDS = float(os.getenv("IDENTITY_CACHE_TTL_SECONDS", "300"))
+
+IdentityKey = Tuple[str, str, str]
+
+
+@dataclass(frozen=True)
+class CachedIdentity:
+    user_id: int
+    conversation_id: int
+    status: str
+    summary: Optional[str] = None
+
+
+class IdentityCache:
+    """LRU acotado con TTL y un índice inverso por conversación para invalidar."""
+
+    def __init__(self, max_entries: int = IDENTITY_CACHE_MAX_ENTRIES, ttl_seconds: float = IDENTITY_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[IdentityKey, Tuple[float, CachedIdentity]]" = OrderedDict()
+        # (tenant_id, conversation_id) → llave, para invalidar desde set_conversation_status()
+        self._by_conversation: Dict[Tuple[str, int], IdentityKey] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key: IdentityKey) -> Optional[CachedIdentity]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, identity = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return identity
+
+    def put(self, key: IdentityKey, identity: CachedIdentity) -> None:
+        if self.max_entries <= 0:
+            return
+        self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, identity)
+        self._by_conversation[(key[0], identity.conversation_id)] = key
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+
+    def invalidate_conversation(self, tenant_id: str, conversation_id: int) -> None:
+        key = self._by_conversation.get((tenant_id, conversation_id))
+        if key is not None:
+            self._remove(key)
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._by_conversation.clear()
+
+    def _remove(self, key: IdentityKey) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._by_conversation.pop((key[0], entry[1].conversation_id), None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+# Instancia global (Patrón Singleton) usada por crud.py
+identity_cache = IdentityCache()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Text, BigInteger, Boolean, ForeignKey
+from sqlalchemy import Column, String, Text, BigInteger, Boolean, ForeignKey, Float, Integer, Index, DateTime, false
 from sqlalchemy.orm import relationship
 from src.database.base import Base, TenantMixin, SoftDeleteMixin, AuditableMixin
 
@@ -78,6 +78,10 @@ class Conversation(Base, TenantMixin, SoftDeleteMixin, AuditableMixin):
     # Status: 'active', 'closed', 'handed_off_to_human', 'ignored'
     status = Column(String(50), default="active", nullable=False, index=True)
     intent_category = Column(String(100), nullable=True) # e.g., 'sales', 'support'
+
+    # Rolling summary of the older turns (see src/core/summarizer.py)
+    summary = Column(Text, nullable=True)
+    summarized_until = Column(BigInteger, nullable=True) # Last messages.id folded into the summary
     
     # Relationships
     user = relationship("User", back_populates="conversations")
@@ -160,3 +164,57 @@ class Advisor(Base, TenantMixin, AuditableMixin):
     whatsapp_number = Column(String(50), nullable=True)     # E.164 sin '+', ej: "573001234567"
     email = Column(String(255), nullable=True)              # Fallback universal
 
+
+class TenantConfig(Base, AuditableMixin):
+    """
+    Configuración del agente por tenant: system prompt, modelo, temperatura y
+    presupuesto de tokens del historial. Una columna en NULL usa el valor por
+    defecto del proceso (SYSTEM_PROMPT, modelo del proveedor, CONTEXT_TOKEN_BUDGET).
+
+    La lee src/core/tenant_config.py y la mantiene en memoria; los cambios se
+    propagan a otros procesos por updated_at en el siguiente refresco.
+    """
+    __tablename__ = "tenant_configs"
+    # El refresco periódico busca las filas cambiadas desde el último updated_at visto
+    __table_args__ = (Index("ix_tenant_configs_updated_at", "updated_at"),)
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    tenant_id = Column(String(50), nullable=False, unique=True)
+
+    system_prompt = Column(Text, nullable=True)
+    model = Column(String(100), nullable=True)
+    # Proveedor (LLM_PROVIDERS) al que aplica `model`; NULL = el proveedor principal
+    provider = Column(String(50), nullable=True)
+    temperature = Column(Float, nullable=True)
+    token_budget = Column(Integer, nullable=True)
+
+
+class LLMCall(Base):
+    """
+    Registro append-only de cada llamada al LLM: latencia, tokens, modelo y resultado.
+    Lo escribe por lotes src/core/usage_ledger.py, fuera del camino del turno; sirve
+    para saber qué tenant o conversación concentra el costo o la lentitud.
+    Sin AuditableMixin: las filas nunca se actualizan.
+    """
+    __tablename__ = "llm_calls"
+    # Las consultas agregan por tenant y rango de fechas
+    __table_args__ = (Index("ix_llm_calls_tenant_created", "tenant_id", "created_at"),)
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    tenant_id = Column(String(50), nullable=False)
+    conversation_id = Column(BigInteger, nullable=True)  # Sin FK: el registro sobrevive a la conversación
+
+    kind = Column(String(20), nullable=False)       # 'reply', 'stream', 'summary'
+    provider = Column(String(50), nullable=True)    # NULL si falló antes de elegir proveedor
+    model = Column(String(100), nullable=True)
+    outcome = Column(String(20), nullable=False)    # 'ok', 'timeout', 'error'
+    error_type = Column(String(100), nullable=True) # Clase de la excepción, ej: 'CircuitOpenError'
+
+    latency_ms = Column(Integer, nullable=False)    # Desde la admisión hasta la respuesta completa
+    wait_ms = Column(Integer, nullable=False, default=0)  # De esos, los que esperó en el rate limit
+    prompt_tokens = Column(Integer, nullable=True)  # NULL si el proveedor no reportó usage
+    completion_tokens = Column(Integer, nullable=True)
+    cache_hit_tokens = Column(Integer, nullable=True)
+    cached = Column(Boolean, nullable=False, default=False, server_default=false())  # Servida desde ResponseCache (0 tokens)
+
+    created_at = Column(DateTime, nullable=False)
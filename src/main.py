@@ -7,71 +7,188 @@ from starlette.staticfiles import StaticFiles
 from dotenv import load_dotenv
 
 from src.core.queue_manager import queue_manager
+from src.core.worker_pool import worker_pool
+from src.core.coalescer import MessageCoalescer
 from src.core.connection_manager import connection_manager
 from src.core.telegram_responder import telegram_responder
 from src.core.whatsapp_responder import whatsapp_responder
 from src.core.llm import llm_engine
+from src.core.context_builder import context_builder, count_tokens, count_message_tokens
+from src.core.summarizer import conversation_summarizer, with_summary
 from src.core.handoff import handoff_service
+from src.core.handoff.handoff_service import HANDOFF_SIGNAL
+from src.core.retrieval import catalog_retrieval
 from src.database.connection import async_session_factory
 from src.database import crud
+from src.database.identity_cache import identity_cache
+from src.database.history_buffer import history_buffer
 
 # Setup environment variables configuration
 load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+async def stream_to_web_client(message, context, user_text, conversation_id=None):
+    """
+    Llama al LLM en modo streaming y reenvía cada delta al widget web a medida que llega.
+    Retorna el texto completo (para persistencia y detección de handoff).
+
+    Si el usuario pidió un asesor (Trigger A) no se reenvían deltas: la respuesta
+    será reemplazada por el mensaje de handoff. Si el LLM abre con la señal
+    [HANDOFF_REQUESTED] (Trigger B), el prefijo se retiene y el resto del turno
+    tampoco se reenvía. El frame final (send_to_client) siempre lleva el texto definitivo.
+    """
+    suppress = handoff_service.is_user_request(user_text)
+    parts = []
+    emitted = 0
+    async for delta in llm_engine.stream_response(context, tenant_id=message.tenant_id, conversation_id=conversation_id):
+        parts.append(delta)
+        if suppress:
+            continue
+        text = "".join(parts)
+        head = text.lstrip()
+        if head.startswith(HANDOFF_SIGNAL):
+            suppress = True
+            continue
+        if HANDOFF_SIGNAL.startswith(head):
+            # Aún puede ser la señal: retenemos hasta saberlo
+            continue
+        await connection_manager.send_stream_delta(message.platform_user_id, text[emitted:])
+        emitted = len(text)
+    return "".join(parts)
+
 async def process_single_message(message):
     """
-    Worker individual que procesa el mensaje de UNA sola conversación concurrente.
-    Al crearse como una Task independiente de Asyncio, Aisla totalmente a un Tenant de otro o
-    a un Prospecto A de un Prospecto B.
+    Procesa un único mensaje (lote de un elemento). Ver process_message_batch().
+    """
+    await process_message_batch([message])
+
+async def notify_advisors_of_inbound(conversation_id, messages):
+    """Reenvía al dashboard los mensajes entrantes de una conversación atendida por un asesor."""
+    for incoming in messages:
+        await connection_manager.notify_advisors(incoming.tenant_id, {
+            "type": "new_message",
+            "conversation_id": conversation_id,
+            "message": {
+                "role": "user",
+                "content": incoming.content
+            }
+        })
+
+async def process_message_batch(messages):
+    """
+    Worker individual que procesa un turno de UNA sola conversación concurrente.
+    Lo ejecuta el ConversationWorkerPool: aísla a un Tenant de otro o a un Prospecto A
+    de un Prospecto B, y garantiza que los turnos de un mismo prospecto se procesan
+    uno a la vez y en orden de llegada.
+
+    `messages` son los mensajes que el MessageCoalescer fusionó en este turno
+    (todos del mismo tenant, canal y usuario). Cada uno se guarda por separado en
+    la BD, pero se hace UNA sola llamada al LLM y se envía UNA sola respuesta.
+
+    El turno usa dos transacciones cortas y NO retiene una conexión del pool
+    mientras espera al LLM (varios segundos):
+        A. cargar contexto + guardar entrantes → commit (libera la conexión)
+        B. llamada al LLM, sin sesión de BD
+        C. releer el status con bloqueo + handoff + guardar respuesta → commit
     """
+    # El mensaje más reciente representa al lote (mismo tenant, canal y usuario)
+    message = messages[-1]
+    conversation = None
     try:
-        # Abrimos Sesión de BD por Transacción
+        # ── Transacción A: contexto + mensajes entrantes ──────────────────────
         async with async_session_factory() as session:
-            # 1. Recuperar el contexto de la BD cruzando Tenant y Usuario
-            user = await crud.get_or_create_user(session, message)
-            
-            # Detectar si hay una conversación previa (activa o en handoff)
-            conversation = await crud.get_latest_conversation(session, user.id, message.tenant_id)
-            
-            # Si no hay ninguna, o si la última está cerrada (por ahora no cerramos), creamos una nueva.
+            # 1. Recuperar el contexto de la BD cruzando Tenant y Usuario en UN solo round trip:
+            #    usuario + última conversación (activa o en handoff) + turnos candidatos del historial.
+            user, conversation, context = await crud.load_conversation_context(
+                session, message, history_limit=context_builder.max_turns
+            )
+            loaded_turns = len(context)
+
+            # Prospecto nuevo: se crea el registro (camino poco frecuente)
+            if not user:
+                user = await crud.get_or_create_user(session, message)
+
+            # Si no hay ninguna conversación, o si la última está cerrada (por ahora no cerramos), creamos una nueva.
             if not conversation:
                 conversation = await crud.get_or_create_active_conversation(session, user.id, message.tenant_id)
 
-            # 2. Guardamos SIEMPRE el mensaje entrante del prospecto.
-            # Esto garantiza que aparezca en el Advisor Dashboard aunque el bot no responda.
-            await crud.save_message(session, conversation.id, message.tenant_id, role="user", content=message.content)
+            # 2. Guardamos SIEMPRE los mensajes entrantes del prospecto, uno por uno.
+            # Esto garantiza que aparezcan en el Advisor Dashboard aunque el bot no responda.
+            for incoming in messages:
+                await crud.save_message(session, conversation.id, message.tenant_id, role="user", content=incoming.content)
+                context.append({"role": "user", "content": incoming.content})
+
+            # Commit inmediato: los entrantes quedan persistidos y la conexión vuelve al pool
+            await session.commit()
+
+        # [HANDOFF] Verificar si la conversación ya fue transferida o está pendiente.
+        # Si es así, el bot NO responde — el asesor humano tiene el control.
+        if conversation.status in ("handed_off", "pending_callback"):
+            logger.info(
+                f"[{message.tenant_id}] 🔇 Conv {conversation.id} silenciada "
+                f"(status='{conversation.status}'). Bot no responde pero mensaje guardado."
+            )
+            # Notificar al dashboard en tiempo real vía WebSocket
+            await notify_advisors_of_inbound(conversation.id, messages)
+            return
+
+        user_text = "\n".join(incoming.content for incoming in messages)
+        # [HANDOFF] Trigger A: el usuario pidió un asesor. El mensaje de handoff reemplazaría
+        # la respuesta del LLM de todos modos, así que no se le llama (milisegundos, no segundos).
+        user_requested_handoff = handoff_service.is_user_request(user_text)
+
+        # 3. [RAG] Fichas del catálogo relevantes para el turno (búsqueda con presupuesto de latencia)
+        catalog_message = None
+        if not user_requested_handoff:
+            catalog_message = catalog_retrieval.as_message(await catalog_retrieval.retrieve(message.tenant_id, user_text))
 
-            # [HANDOFF] Verificar si la conversación ya fue transferida o está pendiente.
-            # Si es así, el bot NO responde — el asesor humano tiene el control.
-            if conversation.status in ("handed_off", "pending_callback"):
+        # 4. Historial de memoria dinámico: resumen de los turnos antiguos (si la conversación
+        #    es larga) + los turnos más recientes que caben en el presupuesto de tokens del tenant
+        #    (descontando el resumen y las fichas del catálogo).
+        summary = conversation.summary
+        reserved_tokens = (count_tokens(summary) if summary else 0) + (count_message_tokens([catalog_message]) if catalog_message else 0)
+        context = context_builder.build(
+            message.tenant_id, context, reserved_tokens=reserved_tokens, conversation_id=conversation.id
+        )
+        # Mensajes que el LLM ve textuales: lo anterior debe quedar cubierto por el resumen
+        window_turns = len(context)
+        context = with_summary(summary, context)
+        if catalog_message:
+            # Justo antes de los mensajes del turno: el historial previo conserva su prefijo estable
+            context.insert(max(0, len(context) - len(messages)), catalog_message)
+
+        # ── Fase B: llamada al LLM (DeepSeek), sin conexión de BD ─────────────
+        # 5. Una sola llamada para todo el lote
+        logger.info(f"[{message.tenant_id}] 🤔 Thinking about message from {message.platform_user_id}: '{user_text}'...")
+        if user_requested_handoff:
+            logger.info(f"[{message.tenant_id}] 🙋 {message.platform_user_id} pidió un asesor: handoff sin llamar al LLM.")
+            response_text = ""
+        elif message.platform == "web" and connection_manager.is_connected(message.platform_user_id):
+            # Canal web: streaming de tokens al widget (menor time-to-first-token)
+            response_text = await stream_to_web_client(message, context, user_text, conversation_id=conversation.id)
+        else:
+            response_text = await llm_engine.generate_response(context, tenant_id=message.tenant_id, conversation_id=conversation.id)
+
+        # ── Transacción C: handoff + respuesta ───────────────────────────────
+        async with async_session_factory() as session:
+            # El status pudo cambiar mientras esperábamos al LLM (otro proceso, el dashboard).
+            # El bloqueo de fila serializa este turno con cualquier cambio de status concurrente.
+            status = await crud.lock_conversation_status(session, conversation.id, message.tenant_id)
+            if status in ("handed_off", "pending_callback"):
                 logger.info(
-                    f"[{message.tenant_id}] 🔇 Conv {conversation.id} silenciada "
-                    f"(status='{conversation.status}'). Bot no responde pero mensaje guardado."
+                    f"[{message.tenant_id}] 🔇 Conv {conversation.id} pasó a '{status}' durante la "
+                    f"llamada al LLM. Se descarta la respuesta del bot."
                 )
-                await session.commit()
-                # Notificar al dashboard en tiempo real vía WebSocket
-                await connection_manager.notify_advisors(message.tenant_id, {
-                    "type": "new_message",
-                    "conversation_id": conversation.id,
-                    "message": {
-                        "role": "user",
-                        "content": message.content
-                    }
-                })
+                await notify_advisors_of_inbound(conversation.id, messages)
+                if message.platform == "web":
+                    # El widget pudo recibir deltas y el endpoint WS espera el cierre del turno
+                    await connection_manager.send_stream_abort(message.platform_user_id)
                 return
 
-            # 3. Recuperamos el historial de memoria dinámico (Últimos 10 mensajes)
-            context = await crud.get_conversation_history(session, conversation.id, message.tenant_id, limit=10)
-
-            # 4. Call LLM (DeepSeek)
-            logger.info(f"[{message.tenant_id}] 🤔 Thinking about message from {message.platform_user_id}: '{message.content}'...")
-            response_text = await llm_engine.generate_response(context, tenant_id=message.tenant_id)
-
-            # 5. [HANDOFF] Detectar trigger de handoff en la respuesta del LLM o en el mensaje del usuario.
+            # 6. [HANDOFF] Trigger A (ya evaluado antes del LLM) o Trigger B en la respuesta del LLM.
             # Si se activa, HandoffService cambia el status en BD y retorna el mensaje al cliente.
-            if handoff_service.detect_trigger(message.content, response_text):
+            if user_requested_handoff or handoff_service.detect_trigger(user_text, response_text):
                 handoff_msg = await handoff_service.execute(
                     session, conversation, message, context_messages=context
                 )
@@ -79,14 +196,21 @@ async def process_single_message(message):
                     # Limpiar la señal interna [HANDOFF_REQUESTED] antes de guardar/enviar
                     response_text = handoff_msg
 
-            # 6. Guardar la respuesta generada por el agente en la base de datos
+            # 7. Guardar la respuesta generada por el agente en la base de datos
             await crud.save_message(session, conversation.id, message.tenant_id, role="assistant", content=response_text)
 
-            # 7. ¡Commit! Guardamos todo permanentemente en MySQL si ocurrió sin errores
+            # 8. ¡Commit! Guardamos la respuesta (y el cambio de status, si hubo handoff)
             await session.commit()
 
             logger.info(f"[{message.tenant_id}] ✅ Finished and saved to DB. LLM Response: {response_text[:50]}...")
 
+        # Resumen incremental en segundo plano si ya hay turnos fuera de la ventana
+        new_messages = len(messages) + 1
+        conversation_summarizer.note_turn(
+            message.tenant_id, conversation.id, new_messages,
+            known_messages=loaded_turns + new_messages, window_turns=window_turns + 1,
+        )
+
         from src.models.message import AgentResponse
         agent_response = AgentResponse(
             recipient_id=message.platform_user_id,
@@ -108,9 +232,25 @@ async def process_single_message(message):
         
     except Exception as e:
         logger.error(f"[{message.tenant_id}] Error in worker processing message: {e}")
+        if conversation is not None:
+            # Una transacción del turno falló: el buffer podría tener mensajes que hicieron rollback
+            history_buffer.invalidate(message.tenant_id, conversation.id)
     finally:
-        # Siempre marcar la tarea principal de la cola como hecha
-        queue_manager.mark_task_done()
+        # Siempre marcar cada mensaje del lote como hecho (ack en el WAL)
+        for incoming in messages:
+            queue_manager.mark_task_done(incoming)
+
+async def dispatch_batch(key, messages):
+    """
+    Entrega un lote ya fusionado al pool de workers.
+    El pool limita la concurrencia total (llamadas al LLM en vuelo) y
+    mantiene el orden FIFO por conversación. Si el pool está saturado,
+    submit() bloquea y la cola absorbe la ráfaga.
+    """
+    await worker_pool.submit(key, lambda: process_message_batch(messages))
+
+# Etapa de debounce entre la cola y el pool de workers
+coalescer = MessageCoalescer(dispatch=dispatch_batch)
 
 async def run_agent_loop():
     """
@@ -125,8 +265,9 @@ async def run_agent_loop():
             message = await queue_manager.get_message()
             logger.info(f"📥 Agent picked up message from: {message.platform_user_id} on {message.platform}")
             
-            # Lanzamos una tarea de Background (Worker Concurrente) y seguimos vaciando el buzón INMEDIATAMENTE
-            asyncio.create_task(process_single_message(message))
+            # 2. Pasamos el mensaje por la ventana de debounce de su conversación.
+            #    Al cerrarse la ventana, el lote se entrega al pool de workers.
+            await coalescer.add(message)
             
         except asyncio.CancelledError:
             logger.warning("Agent Loop was cancelled. Shutting down brain safely.")
@@ -136,7 +277,13 @@ async def run_agent_loop():
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup: Launch the perpetual background Agent loop
+    # Startup: Recover unacknowledged messages from the WAL, then launch the Agent loop
+    await queue_manager.start()
+    # Configuración por tenant (system prompt, modelo...) en memoria antes del primer turno
+    await llm_engine.tenant_configs.start()
+    await llm_engine.ledger.start()
+    # Búsqueda en el catálogo (RAG): carga el modelo de embeddings antes del primer turno
+    await catalog_retrieval.start()
     agent_task = asyncio.create_task(run_agent_loop())
     
     yield # API is running and accepting requests here
@@ -147,6 +294,13 @@ async def lifespan(app: FastAPI):
         await agent_task
     except asyncio.CancelledError:
         pass
+    await coalescer.shutdown()
+    await worker_pool.shutdown()
+    await conversation_summarizer.shutdown()
+    await llm_engine.tenant_configs.shutdown()
+    # Escribir los registros de llamadas pendientes antes de cerrar
+    await llm_engine.ledger.shutdown()
+    await queue_manager.close()
     # Cerrar los clientes HTTP limpiamente al apagar el servidor
     await telegram_responder.close()
     await whatsapp_responder.close()
@@ -192,3 +346,27 @@ async def health_check():
         "status": "healthy",
         "queue_size": queue_manager.queue.qsize()
     }
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Métricas operativas en JSON del Agent Loop (cola por tenant, concurrencia y trabajos en espera).
+    """
+    return {
+        "queue_size": queue_manager.queue.qsize(),
+        "queue": queue_manager.queue.stats(),
+        "wal": queue_manager.log.stats() if queue_manager.log else None,
+        "coalescer": coalescer.stats(),
+        "response_cache": llm_engine.response_cache.stats(),
+        "llm": llm_engine.router.stats(),
+        "llm_usage": llm_engine.usage.stats(),
+        "llm_admission": llm_engine.admission.stats(),
+        "llm_ledger": llm_engine.ledger.stats(),
+        "rag": catalog_retrieval.stats(),
+        "tenant_configs": llm_engine.tenant_configs.stats(),
+        "identity_cache": identity_cache.stats(),
+        "context": context_builder.stats(),
+        "summarizer": conversation_summarizer.stats(),
+        "history_buffer": history_buffer.stats(),
+        "workers": worker_pool.stats(),
+    }
@@ -27,6 +27,7 @@
         ws: null,
         isOpen: false,           // panel visible
         isSending: false,        // esperando respuesta del LLM
+        streamingBubble: null,   // burbuja del agente que recibe deltas en streaming
         reconnectTries: 0,
         reconnectTimer: null,
         unreadCount: 0,
@@ -75,7 +76,36 @@
             catch { data = { role: 'agent', content: event.data }; }
 
             hideTyping();
-            appendMessage('agent', data.content || '');
+
+            // Frame incremental: se acumula en la burbuja en curso
+            if (data.type === 'delta') {
+                if (!STATE.streamingBubble) {
+                    STATE.streamingBubble = appendMessage('agent', '');
+                }
+                STATE.streamingBubble.textContent += data.content || '';
+                scrollToBottom();
+                return;
+            }
+
+            // Turno sin respuesta del bot (un asesor tomó la conversación): se descarta lo acumulado
+            if (data.type === 'abort') {
+                if (STATE.streamingBubble) {
+                    STATE.streamingBubble.parentElement.remove();
+                    STATE.streamingBubble = null;
+                }
+                STATE.isSending = false;
+                setInputEnabled(true);
+                return;
+            }
+
+            // Frame final: reemplaza lo acumulado (puede diferir, ej: handoff)
+            if (STATE.streamingBubble) {
+                STATE.streamingBubble.textContent = data.content || '';
+                STATE.streamingBubble = null;
+                scrollToBottom();
+            } else {
+                appendMessage('agent', data.content || '');
+            }
             STATE.isSending = false;
             setInputEnabled(true);
 
@@ -92,6 +122,7 @@
 
         ws.onclose = function (event) {
             hideTyping();
+            STATE.streamingBubble = null;
             STATE.isSending = false;
             setInputEnabled(false);
 
@@ -180,6 +211,7 @@
         row.appendChild(bubble);
         messages.appendChild(row);
         scrollToBottom();
+        return bubble;
     }
 
     function showTyping() {
@@ -0,0 +1,19 @@
+"""
+Fixtures compartidas por todas las suites.
+
+Las cachés en proceso (singletons) sobreviven entre tests; las suites de
+integración recrean las tablas y reutilizan ids, así que se vacían antes de cada test.
+"""
+import pytest
+
+from src.database.history_buffer import history_buffer
+from src.database.identity_cache import identity_cache
+
+
+@pytest.fixture(autouse=True)
+def clear_in_process_caches():
+    identity_cache.clear()
+    history_buffer.clear()
+    yield
+    identity_cache.clear()
+    history_buffer.clear()
@@ -0,0 +1,143 @@
+"""
+Servidor falso compatible con el API de chat completions de OpenAI/DeepSeek.
+
+Es una app ASGI: los tests la montan con httpx.ASGITransport, sin red ni puertos,
+y se la pasan a LLMEngine(http_client=...). El comportamiento de cada petición
+se programa con un guion (script) de pasos:
+
+    server = FakeOpenAIServer()
+    server.script = [
+        Step(status=503),                 # primera petición: error 5xx
+        Step(delay=0.2, content="hola"),  # segunda: responde tarde
+    ]
+    # Cuando el guion se agota se usa `server.default`.
+
+El `usage` de cada respuesta imita la caché de prefijos de DeepSeek: los tokens del
+prompt que coinciden (en bloques de 64 caracteres) con el inicio de un prompt anterior
+se reportan en prompt_cache_hit_tokens. Un token = 4 caracteres del JSON de `messages`.
+
+Uso fuera de los tests (servidor local para pruebas manuales):
+    uvicorn tests.fakes.fake_openai_server:app --port 8900
+"""
+import asyncio
+import json
+import os
+import random
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+@dataclass
+class Step:
+    status: int = 200
+    delay: float = 0.0
+    content: str = "Respuesta del servidor falso."
+    jitter: float = 0.0  # Se suma a `delay` un valor uniforme en [0, jitter]
+
+
+class FakeOpenAIServer:
+    def __init__(self, default: Optional[Step] = None):
+        self.default = default or Step()
+        self.script: List[Step] = []
+        self.requests: List[dict] = []
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._seen_prompts: List[str] = []
+        self.app = FastAPI()
+        # El SDK agrega "/chat/completions" al base_url, con o sin "/v1"
+        self.app.post("/chat/completions")(self._chat_completions)
+        self.app.post("/v1/chat/completions")(self._chat_completions)
+
+    def http_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=httpx.ASGITransport(app=self.app), base_url="http://fake-llm")
+
+    @property
+    def base_url(self) -> str:
+        return "http://fake-llm"
+
+    async def _chat_completions(self, request: Request):
+        body = await request.json()
+        self.requests.append(body)
+        usage = self._usage(body)
+        step = self.script.pop(0) if self.script else self.default
+
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(step.delay + (random.uniform(0, step.jitter) if step.jitter else 0.0))
+        finally:
+            self.in_flight -= 1
+
+        if step.status != 200:
+            return JSONResponse(
+                status_code=step.status,
+                content={"error": {"message": f"fake error {step.status}", "type": "server_error"}},
+            )
+        if body.get("stream"):
+            return StreamingResponse(self._sse(body, step.content, usage), media_type="text/event-stream")
+        return JSONResponse(self._completion(body, step.content, usage))
+
+    def _usage(self, body: dict) -> dict:
+        prompt = json.dumps(body.get("messages", []), ensure_ascii=False)
+        common = max((len(os.path.commonprefix([prompt, seen])) for seen in self._seen_prompts), default=0)
+        self._seen_prompts.append(prompt)
+        prompt_tokens = len(prompt) // 4
+        hit = (common // 64) * 64 // 4
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": 5,
+            "total_tokens": prompt_tokens + 5,
+            "prompt_cache_hit_tokens": hit,
+            "prompt_cache_miss_tokens": prompt_tokens - hit,
+        }
+
+    def _completion(self, body: dict, content: str, usage: dict) -> dict:
+        return {
+            "id": f"fake-{len(self.requests)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake-model"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        }
+
+    async def _sse(self, body: dict, content: str, usage: dict):
+        words = content.split(" ")
+        for i, word in enumerate(words):
+            chunk = {
+                "id": f"fake-{len(self.requests)}",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "fake-model"),
+                "choices": [{
+                    "index": 0,
+                    "delta": {"content": word if i == len(words) - 1 else word + " "},
+                    "finish_reason": "stop" if i == len(words) - 1 else None,
+                }],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+        if (body.get("stream_options") or {}).get("include_usage"):
+            final = {
+                "id": f"fake-{len(self.requests)}",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "fake-model"),
+                "choices": [],
+                "usage": usage,
+            }
+            yield f"data: {json.dumps(final)}\n\n"
+        yield "data: [DONE]\n\n"
+
+
+# Instancia para `uvicorn tests.fakes.fake_openai_server:app`
+server = FakeOpenAIServer()
+app = server.app
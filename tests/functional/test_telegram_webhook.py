@@ -39,6 +39,23 @@ class TestTelegramWebhookEndpoint:
         assert response.status_code == 200
         assert response.json() == {"ok": True}
 
+    def test_webhook_retorna_503_si_la_cola_esta_llena(self):
+        """Con el carril del tenant lleno, responde 503 para que Telegram reintente."""
+        from src.core.queue_manager import QueueFullError
+
+        with patch("src.api.routers.telegram.TelegramProducer") as MockProducer:
+            mock_instance = MockProducer.return_value
+            mock_instance.enqueue = AsyncMock(side_effect=QueueFullError("lleno"))
+
+            response = client.post(
+                "/webhook/telegram",
+                json=VALID_UPDATE,
+                headers=VALID_HEADERS,
+            )
+
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "5"
+
     def test_webhook_encola_mensaje(self):
         """El endpoint encola el mensaje via TelegramProducer.enqueue()."""
         with patch("src.api.routers.telegram.TelegramProducer") as MockProducer:
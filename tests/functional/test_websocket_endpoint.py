@@ -109,6 +109,55 @@ def test_websocket_multiple_turns(client):
                 assert response["content"] == expected
 
 
+def test_websocket_reenvia_deltas_de_streaming(client):
+    """
+    Streaming: los deltas depositados con send_stream_delta() llegan como frames
+    type='delta' y el turno cierra con el frame final type='message'.
+    """
+    async def streaming_enqueue(self, raw_payload):
+        client_id = raw_payload["client_id"]
+        await connection_manager.send_stream_delta(client_id, "Hola, ")
+        await connection_manager.send_stream_delta(client_id, "¿en qué te ayudo?")
+        await connection_manager.send_to_client(client_id, "Hola, ¿en qué te ayudo?")
+
+    with patch.object(WebSocketProducer, "enqueue", streaming_enqueue):
+        with client.websocket_connect("/ws/chat/stream_user") as ws:
+            ws.send_json({"text": "Hola"})
+            frames = [ws.receive_json() for _ in range(3)]
+
+    assert [f["type"] for f in frames] == ["delta", "delta", "message"]
+    assert "".join(f["content"] for f in frames[:2]) == frames[2]["content"]
+    assert all(f["role"] == "agent" for f in frames)
+
+
+def test_websocket_abort_cierra_el_turno(client):
+    """
+    Handoff mientras el LLM generaba: tras los deltas llega un frame type='abort'
+    (sin contenido) y el endpoint queda listo para el turno siguiente.
+    """
+    turns = [0]
+
+    async def aborting_enqueue(self, raw_payload):
+        client_id = raw_payload["client_id"]
+        turns[0] += 1
+        if turns[0] == 1:
+            await connection_manager.send_stream_delta(client_id, "Claro, las bal")
+            await connection_manager.send_stream_abort(client_id)
+        else:
+            await connection_manager.send_to_client(client_id, "Siguiente turno")
+
+    with patch.object(WebSocketProducer, "enqueue", aborting_enqueue):
+        with client.websocket_connect("/ws/chat/abort_user") as ws:
+            ws.send_json({"text": "Hola"})
+            frames = [ws.receive_json() for _ in range(2)]
+            ws.send_json({"text": "¿Sigue ahí?"})
+            following = ws.receive_json()
+
+    assert [f["type"] for f in frames] == ["delta", "abort"]
+    assert "content" not in frames[1]
+    assert following["content"] == "Siguiente turno"
+
+
 def test_simulate_endpoint_no_regression(client):
     """
     No-regresión: /simulate/message debe seguir respondiendo 200 OK
@@ -18,7 +18,8 @@ def client():
 
     Los responders (telegram, whatsapp) se pasan como AsyncMock con .close
     explícitamente awaitable porque lifespan hace `await responder.close()`
-    al apagar el servidor.
+    al apagar el servidor. Igual con la configuración de tenants del LLM,
+    que lifespan carga al arrancar y detiene al apagar.
     """
     from unittest.mock import MagicMock, AsyncMock
 
@@ -26,10 +27,15 @@ def client():
     tg_mock.close = AsyncMock()
     wa_mock = MagicMock()
     wa_mock.close = AsyncMock()
+    llm_mock = MagicMock()
+    llm_mock.tenant_configs.start = AsyncMock()
+    llm_mock.tenant_configs.shutdown = AsyncMock()
+    llm_mock.ledger.start = AsyncMock()
+    llm_mock.ledger.shutdown = AsyncMock()
 
     with (
         patch("src.main.run_agent_loop", new_callable=AsyncMock),
-        patch("src.main.llm_engine"),
+        patch("src.main.llm_engine", llm_mock),
         patch("src.main.async_session_factory"),
         patch("src.main.telegram_responder", tg_mock),
         patch("src.main.whatsapp_responder", wa_mock),
@@ -1,10 +1,14 @@
 import pytest
 import pytest_asyncio
+from datetime import datetime
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 
 from src.database.base import Base
 from src.database.models import Company, CompanyDivision, User, Conversation, Message
-from src.database.crud import get_or_create_user, get_or_create_active_conversation, save_message, get_conversation_history
+from src.database.crud import get_or_create_user, get_or_create_active_conversation, save_message, get_conversation_history, load_conversation_context
+from src.database.crud import get_conversation, get_unsummarized_messages, save_conversation_summary
+from src.database.crud import get_tenant_configs, upsert_tenant_config, add_llm_calls, get_llm_calls
+from src.database.crud import get_llm_usage_by_day, get_llm_latency_histogram, get_llm_top_conversations
 from src.models.message import IncomingMessage
 
 # Use MariaDB for testing to exactly match the production dialect.
@@ -114,3 +118,151 @@ async def test_crud_chat_flow(async_db_session: AsyncSession):
     assert "problemas con el cloro" in history[0]["content"]
     assert history[1]["role"] == "assistant"
     assert history[1]["content"] == "¡Hola María! ¿En qué puedo ayudarte con el cloro?"
+
+@pytest.mark.asyncio
+async def test_load_conversation_context_single_query(async_db_session: AsyncSession):
+    """
+    The combined loader returns the same user, latest conversation and history
+    as the step-by-step functions, and handles unknown users.
+    """
+    incoming = IncomingMessage(platform="telegram", platform_user_id="777", tenant_id="client_y", content="hola")
+
+    # Unknown user → nothing loaded
+    assert await load_conversation_context(async_db_session, incoming) == (None, None, [])
+
+    user = await get_or_create_user(async_db_session, incoming)
+    old_convo = await get_or_create_active_conversation(async_db_session, user.id, "client_y")
+    await save_message(async_db_session, old_convo.id, "client_y", "user", "mensaje viejo")
+    old_convo.status = "closed"
+    await async_db_session.flush()
+
+    convo = await get_or_create_active_conversation(async_db_session, user.id, "client_y")
+    for i in range(12):
+        await save_message(async_db_session, convo.id, "client_y", "user" if i % 2 == 0 else "assistant", f"m{i}")
+    await async_db_session.commit()
+
+    loaded_user, loaded_convo, history = await load_conversation_context(async_db_session, incoming, history_limit=10)
+
+    assert loaded_user.id == user.id
+    assert loaded_convo.id == convo.id
+    assert history == await get_conversation_history(async_db_session, convo.id, "client_y", limit=10)
+    assert [m["content"] for m in history] == [f"m{i}" for i in range(2, 12)]
+
+@pytest.mark.asyncio
+async def test_rolling_summary_is_saved_conditionally(async_db_session: AsyncSession):
+    """
+    The summary advances summarized_until only if nobody advanced it meanwhile,
+    and get_unsummarized_messages returns what comes after it.
+    """
+    incoming = IncomingMessage(platform="web", platform_user_id="555", tenant_id="client_z", content="hola")
+    user = await get_or_create_user(async_db_session, incoming)
+    convo = await get_or_create_active_conversation(async_db_session, user.id, "client_z")
+    saved = [await save_message(async_db_session, convo.id, "client_z", "user", f"m{i}") for i in range(5)]
+    await async_db_session.commit()
+    ids = [m.id for m in saved]
+
+    assert len(await get_unsummarized_messages(async_db_session, convo.id, "client_z", None)) == 5
+
+    assert await save_conversation_summary(async_db_session, convo.id, "client_z", "resumen 1", ids[2], None)
+    # A second writer that read the old state loses the race
+    assert not await save_conversation_summary(async_db_session, convo.id, "client_z", "resumen viejo", ids[1], None)
+    await async_db_session.commit()
+
+    await async_db_session.refresh(convo)
+    reloaded = await get_conversation(async_db_session, convo.id, "client_z")
+    assert reloaded.summary == "resumen 1"
+    assert reloaded.summarized_until == ids[2]
+    pending = await get_unsummarized_messages(async_db_session, convo.id, "client_z", reloaded.summarized_until)
+    assert [m.content for m in pending] == ["m3", "m4"]
+
+@pytest.mark.asyncio
+async def test_tenant_config_upsert_and_changes_since(async_db_session: AsyncSession):
+    """
+    upsert_tenant_config keeps one row per tenant and get_tenant_configs
+    filters by updated_at for the periodic refresh.
+    """
+    first = await upsert_tenant_config(async_db_session, "shoes", {"system_prompt": "Eres vendedor de zapatos."})
+    await async_db_session.commit()
+    watermark = first.updated_at
+
+    updated = await upsert_tenant_config(async_db_session, "shoes", {"model": "deepseek-reasoner", "token_budget": 900})
+    await async_db_session.commit()
+
+    assert updated.id == first.id
+    rows = await get_tenant_configs(async_db_session)
+    assert [(r.tenant_id, r.system_prompt, r.model, r.token_budget) for r in rows] == [
+        ("shoes", "Eres vendedor de zapatos.", "deepseek-reasoner", 900)
+    ]
+    assert len(await get_tenant_configs(async_db_session, updated_since=watermark)) == 1
+
+
+@pytest.mark.asyncio
+async def test_llm_calls_batch_insert_and_range(async_db_session: AsyncSession):
+    """
+    add_llm_calls inserts a whole batch and get_llm_calls pages through the
+    tenant's calls inside the date range, newest first.
+    """
+    def call(tenant_id, created_at, latency_ms):
+        return {
+            "tenant_id": tenant_id, "conversation_id": 7, "kind": "reply", "provider": "deepseek",
+            "model": "deepseek-chat", "outcome": "ok", "error_type": None, "latency_ms": latency_ms, "wait_ms": 0,
+            "prompt_tokens": 120, "completion_tokens": 30, "cache_hit_tokens": 64, "created_at": created_at,
+        }
+
+    await add_llm_calls(async_db_session, [
+        call("client_x", datetime(2026, 10, 16, 23, 0), 100),
+        call("client_x", datetime(2026, 10, 17, 9, 0), 300),
+        call("client_x", datetime(2026, 10, 17, 8, 0), 200),
+        call("client_y", datetime(2026, 10, 17, 9, 0), 900),
+    ])
+    await async_db_session.commit()
+
+    rows = await get_llm_calls(async_db_session, "client_x", since=datetime(2026, 10, 17))
+    assert [r.latency_ms for r in rows] == [300, 200]
+    assert rows[0].cache_hit_tokens == 64 and rows[0].cached is False
+    page = await get_llm_calls(async_db_session, "client_x", since=datetime(2026, 10, 16), limit=1, offset=2)
+    assert [r.latency_ms for r in page] == [100]
+    assert await get_llm_calls(async_db_session, "client_x", since=datetime(2026, 10, 16), until=datetime(2026, 10, 17)) != []
+
+
+@pytest.mark.asyncio
+async def test_llm_usage_is_aggregated_in_sql(async_db_session: AsyncSession):
+    """
+    The /usage queries group llm_calls by day, provider and model, bucket the provider
+    latencies (cache hits excluded) and rank conversations by tokens.
+    """
+    def call(created_at, latency_ms, conversation_id=7, provider="deepseek", outcome="ok", cached=False):
+        return {
+            "tenant_id": "client_x", "conversation_id": conversation_id, "kind": "reply",
+            "provider": None if cached else provider, "model": None if cached else f"{provider}-model",
+            "outcome": outcome, "error_type": None, "latency_ms": latency_ms, "wait_ms": 0,
+            "prompt_tokens": 0 if cached else 100, "completion_tokens": 0 if cached else 10, "cache_hit_tokens": 0,
+            "cached": cached, "created_at": created_at,
+        }
+
+    await add_llm_calls(async_db_session, [
+        call(datetime(2026, 10, 17, 9, 0), 200),
+        call(datetime(2026, 10, 17, 9, 5), 800),
+        call(datetime(2026, 10, 17, 9, 6), 1, conversation_id=8, cached=True),
+        call(datetime(2026, 10, 17, 10, 0), 3000, conversation_id=9, provider="openai", outcome="timeout"),
+        call(datetime(2026, 10, 18, 10, 0), 400, conversation_id=None),
+    ])
+    await async_db_session.commit()
+    since = datetime(2026, 10, 17)
+
+    groups = await get_llm_usage_by_day(async_db_session, "client_x", since=since)
+    assert [(str(g.day), g.provider, g.calls) for g in groups] == [
+        ("2026-10-17", None, 1), ("2026-10-17", "deepseek", 2), ("2026-10-17", "openai", 1), ("2026-10-18", "deepseek", 1),
+    ]
+    cached, deepseek, openai, _ = groups
+    assert cached.cached == 1 and cached.latency_ms_avg is None
+    assert deepseek.prompt_tokens == 200 and float(deepseek.latency_ms_avg) == 500 and deepseek.latency_ms_max == 800
+    assert openai.timeout == 1 and openai.ok == 0
+
+    histogram = await get_llm_latency_histogram(async_db_session, "client_x", since=since, bounds=(250, 1000))
+    assert sorted((str(h.day), h.bucket, h.calls) for h in histogram) == [
+        ("2026-10-17", 0, 1), ("2026-10-17", 1, 1), ("2026-10-17", 2, 1), ("2026-10-18", 1, 1),
+    ]
+
+    top = await get_llm_top_conversations(async_db_session, "client_x", since=since, limit=2)
+    assert [(t.conversation_id, t.calls, t.tokens) for t in top] == [(7, 2, 220), (9, 1, 110)]
@@ -0,0 +1,434 @@
+"""
+Harness de carga de extremo a extremo: ¿cuánto tráfico sostiene el servidor?
+
+Levanta la app de FastAPI real (uvicorn, en este proceso) con el LLM reemplazado por
+el servidor falso compatible con OpenAI (tests/fakes/fake_openai_server.py, latencia
+configurable) y reproduce tráfico por los endpoints públicos a un ritmo objetivo:
+
+    simulate   POST /simulate/message
+    telegram   POST /webhook/telegram
+    whatsapp   POST /webhook/whatsapp
+    ws         /ws/chat/{client_id} (una conexión por prospecto)
+
+La latencia de extremo a extremo va desde el envío del mensaje hasta la entrega de la
+respuesta: en ws, cuando el cliente recibe el frame final; en los webhooks, cuando el
+worker llama al responder del canal (interceptado: no sale nada a Telegram ni a Meta).
+Si el coalescer fusiona varios mensajes en un turno, la respuesta cierra todos.
+
+El reporte incluye throughput, p50/p95/p99 por canal, la profundidad de la cola y
+del pool de workers en el tiempo y la saturación del pool de conexiones de la BD.
+
+Los prospectos usan ids "load-<canal>-<usuario>" y se borran al terminar (--keep-data
+para conservarlos). Usa la BD del .env salvo --db-url.
+
+Uso (desde la raíz del repo):
+    python -m tests.load.harness --rps 20 --duration 30 --llm-latency 1.5
+    python -m tests.load.harness --traffic tests/load/sample_traffic.jsonl --speed 2
+    python -m tests.load.harness --generate 2000 --users 300 --save-traffic /tmp/trafico.jsonl
+    python -m tests.load.harness --db-url sqlite+aiosqlite:////tmp/load.db --create-schema --report /tmp/load.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import sys
+import time
+from collections import defaultdict, deque
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Deque, Dict, List, Optional
+from unittest.mock import patch
+
+# Asegurar que el path sea correcto para importar desde src y tests
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+import httpx
+import uvicorn
+import websockets
+from sqlalchemy import BigInteger, delete, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.ext.compiler import compiles
+
+from src import main as agent
+from src.core.connection_manager import connection_manager
+from src.core.llm_router import LLMRouter, Provider, ProviderConfig
+from src.core.queue_manager import queue_manager
+from src.core.summarizer import conversation_summarizer
+from src.core.worker_pool import worker_pool
+from src.database import connection
+from src.database.base import Base
+from src.database.models import Conversation, Message, User
+from tests.fakes.fake_openai_server import FakeOpenAIServer, Step
+from tests.load.traffic import CHANNELS, TrafficEvent, generate_traffic, load_traffic, save_traffic, schedule
+
+USER_PREFIX = "load-"
+CHANNEL_TAGS = {"simulate": "sim", "telegram": "tg", "whatsapp": "wa", "ws": "ws"}
+REPLY_TEXT = "Sí, manejamos ese equipo. Con gusto le comparto la ficha técnica y los modelos disponibles."
+
+
+@compiles(BigInteger, "sqlite")
+def _sqlite_bigint(type_, compiler, **kw):
+    # SQLite solo autoincrementa "INTEGER PRIMARY KEY"; los ids del modelo son BIGINT (MySQL)
+    return "INTEGER"
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(len(ordered) * p) - 1)]
+
+
+class DeliveryProbe:
+    """Relaciona cada mensaje enviado con la respuesta que lo cierra."""
+
+    def __init__(self):
+        self.pending: Dict[str, Deque[float]] = defaultdict(deque)
+        self.channel_of: Dict[str, str] = {}
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.replies = 0
+        self.last_reply_at = 0.0
+
+    def sent(self, recipient: str, channel: str) -> None:
+        self.channel_of[recipient] = channel
+        self.pending[recipient].append(time.perf_counter())
+
+    def delivered(self, recipient: str) -> None:
+        waiting = self.pending.get(recipient)
+        if not waiting:
+            return
+        now = time.perf_counter()
+        channel = self.channel_of[recipient]
+        while waiting:
+            self.latencies[channel].append(now - waiting.popleft())
+        self.replies += 1
+        self.last_reply_at = now
+
+    def outstanding(self) -> int:
+        return sum(len(q) for q in self.pending.values())
+
+
+class Sampler:
+    """Muestrea cola, pool de workers y pool de conexiones cada `interval` segundos."""
+
+    def __init__(self, db_engine, interval: float):
+        self.pool = db_engine.pool
+        # QueuePool no expone max_overflow públicamente; NullPool (SQLite) no tiene límite
+        self.pool_capacity = self.pool.size() + getattr(self.pool, "_max_overflow", 0) if hasattr(self.pool, "checkedout") else None
+        self.interval = interval
+        self.samples: List[dict] = []
+        self._started = time.perf_counter()
+
+    async def run(self) -> None:
+        while True:
+            workers = worker_pool.stats()
+            self.samples.append({
+                "t": round(time.perf_counter() - self._started, 2),
+                "queue": queue_manager.queue.qsize(),
+                "workers_in_flight": workers["in_flight"],
+                "workers_waiting": workers["waiting"],
+                "db_checked_out": self.pool.checkedout() if self.pool_capacity is not None else None,
+            })
+            await asyncio.sleep(self.interval)
+
+    def summary(self) -> dict:
+        checked = [s["db_checked_out"] for s in self.samples if s["db_checked_out"] is not None]
+        saturated = sum(1 for c in checked if c >= self.pool_capacity) if checked else 0
+        return {
+            "queue_max": max((s["queue"] for s in self.samples), default=0),
+            "workers_in_flight_max": max((s["workers_in_flight"] for s in self.samples), default=0),
+            "db_pool_capacity": self.pool_capacity,
+            "db_checked_out_max": max(checked) if checked else None,
+            "db_saturated_fraction": round(saturated / len(checked), 3) if checked else None,
+        }
+
+
+class LoadClient:
+    """Envía cada TrafficEvent por su endpoint y registra el envío en el probe."""
+
+    def __init__(self, base_url: str, probe: DeliveryProbe, tenant_id: str):
+        self.base_url = base_url
+        self.ws_url = base_url.replace("http://", "ws://")
+        self.probe = probe
+        self.tenant_id = tenant_id
+        self.http = httpx.AsyncClient(base_url=base_url, timeout=30.0)
+        self.sockets: Dict[str, websockets.WebSocketClientProtocol] = {}
+        self.readers: List[asyncio.Task] = []
+        self.statuses: Dict[str, int] = defaultdict(int)
+        self.errors = 0
+        self._update_id = 0
+
+    @staticmethod
+    def recipient(event: TrafficEvent) -> str:
+        return f"{USER_PREFIX}{CHANNEL_TAGS[event.channel]}-{event.user}"
+
+    async def send(self, event: TrafficEvent) -> None:
+        recipient = self.recipient(event)
+        try:
+            if event.channel == "ws":
+                await self._send_ws(recipient, event.text)
+                return
+            self.probe.sent(recipient, event.channel)
+            response = await self._post(event.channel, recipient, event.text)
+            self.statuses[str(response.status_code)] += 1
+            if response.status_code != 200:
+                # Rechazado (503 por contrapresión): no habrá respuesta para este mensaje
+                self.probe.pending[recipient].pop()
+        except Exception:
+            self.errors += 1
+
+    async def _post(self, channel: str, recipient: str, text: str) -> httpx.Response:
+        if channel == "simulate":
+            return await self.http.post("/simulate/message", json={
+                "platform": "web", "platform_user_id": recipient, "tenant_id": self.tenant_id, "content": text,
+            })
+        self._update_id += 1
+        if channel == "telegram":
+            return await self.http.post(
+                "/webhook/telegram",
+                json={"update_id": self._update_id, "message": {
+                    "message_id": self._update_id, "chat": {"id": recipient},
+                    "from": {"first_name": "Carga"}, "text": text,
+                }},
+                headers={"X-Telegram-Bot-Api-Secret-Token": os.getenv("TELEGRAM_WEBHOOK_SECRET", "")},
+            )
+        return await self.http.post("/webhook/whatsapp", json={"entry": [{"changes": [{"value": {
+            "contacts": [{"profile": {"name": "Carga"}}],
+            "messages": [{"from": recipient, "id": f"wamid.{self._update_id}", "type": "text", "text": {"body": text}}],
+        }}]}]})
+
+    async def _send_ws(self, recipient: str, text: str) -> None:
+        socket = self.sockets.get(recipient)
+        if socket is None:
+            socket = await websockets.connect(f"{self.ws_url}/ws/chat/{recipient}")
+            self.sockets[recipient] = socket
+            self.readers.append(asyncio.create_task(self._read_ws(recipient, socket)))
+        self.probe.sent(recipient, "ws")
+        await socket.send(json.dumps({"text": text, "user_name": "Carga"}))
+        self.statuses["ws"] += 1
+
+    async def _read_ws(self, recipient: str, socket) -> None:
+        try:
+            async for frame in socket:
+                if json.loads(frame).get("type") != "delta":
+                    self.probe.delivered(recipient)
+        except websockets.ConnectionClosed:
+            pass
+
+    async def close(self) -> None:
+        for socket in self.sockets.values():
+            await socket.close()
+        for reader in self.readers:
+            reader.cancel()
+        await asyncio.gather(*self.readers, return_exceptions=True)
+        await self.http.aclose()
+
+
+def build_traffic(args) -> List[TrafficEvent]:
+    if args.traffic:
+        return load_traffic(Path(args.traffic))
+    count = args.generate or int(args.rps * args.duration)
+    channels = [c.strip() for c in args.channels.split(",") if c.strip()]
+    return generate_traffic(count, args.users, channels, seed=args.seed)
+
+
+async def cleanup(session_factory) -> None:
+    async with session_factory() as session:
+        user_ids = select(User.id).where(User.platform_user_id.like(f"{USER_PREFIX}%"))
+        conversation_ids = select(Conversation.id).where(Conversation.user_id.in_(user_ids))
+        await session.execute(delete(Message).where(Message.conversation_id.in_(conversation_ids)))
+        await session.execute(delete(Conversation).where(Conversation.user_id.in_(user_ids)))
+        await session.execute(delete(User).where(User.platform_user_id.like(f"{USER_PREFIX}%")))
+        await session.commit()
+
+
+async def run(args) -> dict:
+    events = build_traffic(args)
+    if args.save_traffic:
+        save_traffic(events, Path(args.save_traffic))
+    offsets = schedule(events, args.rps, args.speed)
+
+    # ── BD: la del .env o --db-url con el pool pedido ─────────────────────
+    if args.db_url:
+        pool_kwargs = {} if args.db_url.startswith("sqlite") else {
+            "pool_size": args.pool_size, "max_overflow": args.max_overflow, "pool_timeout": args.pool_timeout,
+        }
+        db_engine = create_async_engine(args.db_url, pool_pre_ping=True, **pool_kwargs)
+    else:
+        db_engine = connection.engine
+    session_factory = async_sessionmaker(db_engine, class_=AsyncSession, expire_on_commit=False, autoflush=False)
+    if args.create_schema:
+        async with db_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    # ── LLM falso con latencia configurable ─────────────────────────────
+    llm_server = FakeOpenAIServer(default=Step(delay=args.llm_latency, jitter=args.llm_jitter, content=REPLY_TEXT))
+    llm = agent.llm_engine
+    router = LLMRouter([Provider(ProviderConfig("fake", llm_server.base_url, "fake-model"), http_client=llm_server.http_client())])
+    if not args.response_cache:
+        llm.response_cache.max_entries = 0
+
+    probe = DeliveryProbe()
+    original_send_to_client = connection_manager.send_to_client
+
+    async def channel_reply(recipient, text):
+        probe.delivered(recipient)
+        return True
+
+    async def web_reply(client_id, text):
+        # En ws la latencia se mide del lado del cliente, al recibir el frame final
+        if probe.channel_of.get(client_id) == "simulate":
+            probe.delivered(client_id)
+        await original_send_to_client(client_id, text)
+
+    sampler = Sampler(db_engine, args.sample_interval)
+    server = uvicorn.Server(uvicorn.Config(agent.app, host="127.0.0.1", port=args.port, log_level="warning", lifespan="on"))
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    with ExitStack() as stack:
+        stack.enter_context(patch.object(agent, "async_session_factory", session_factory))
+        stack.enter_context(patch.object(conversation_summarizer, "session_factory", session_factory))
+        stack.enter_context(patch.object(llm.tenant_configs, "session_factory", session_factory))
+        stack.enter_context(patch.object(llm.ledger, "session_factory", session_factory))
+        stack.enter_context(patch.object(llm, "router", router))
+        stack.enter_context(patch.object(agent.telegram_responder, "send_message", channel_reply))
+        stack.enter_context(patch.object(agent.whatsapp_responder, "send_message", channel_reply))
+        stack.enter_context(patch.object(connection_manager, "send_to_client", web_reply))
+
+        await cleanup(session_factory)
+        server_task = asyncio.create_task(server.serve())
+        while not server.started:
+            if server_task.done():
+                raise RuntimeError(f"No se pudo iniciar el servidor en el puerto {args.port}")
+            await asyncio.sleep(0.05)
+
+        client = LoadClient(base_url, probe, args.tenant)
+        sampler_task = asyncio.create_task(sampler.run())
+        started = time.perf_counter()
+        sends = []
+        for event, offset in zip(events, offsets):
+            delay = started + offset - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            sends.append(asyncio.create_task(client.send(event)))
+        await asyncio.gather(*sends)
+        send_elapsed = time.perf_counter() - started
+
+        # Esperar las respuestas pendientes
+        drain_deadline = time.perf_counter() + args.drain_timeout
+        while probe.outstanding() and time.perf_counter() < drain_deadline:
+            await asyncio.sleep(0.1)
+        elapsed = (probe.last_reply_at or time.perf_counter()) - started
+
+        sampler_task.cancel()
+        await client.close()
+        server.should_exit = True
+        await server_task
+        if not args.keep_data:
+            await cleanup(session_factory)
+    if args.db_url:
+        await db_engine.dispose()
+
+    all_latencies = [v for values in probe.latencies.values() for v in values]
+    return {
+        "messages": len(events),
+        "target_rps": args.rps if not all(e.at is not None for e in events) else None,
+        "send_seconds": round(send_elapsed, 2),
+        "sent_rps": round(len(events) / send_elapsed, 2) if send_elapsed else None,
+        "elapsed_seconds": round(elapsed, 2),
+        "answered_messages": len(all_latencies),
+        "answered_per_second": round(len(all_latencies) / elapsed, 2) if elapsed > 0 else None,
+        "replies": probe.replies,
+        "unanswered": probe.outstanding(),
+        "http_status": dict(client.statuses),
+        "client_errors": client.errors,
+        "latency_ms": {
+            channel: {
+                "n": len(values),
+                "p50": round(percentile(values, 0.50) * 1000, 1),
+                "p95": round(percentile(values, 0.95) * 1000, 1),
+                "p99": round(percentile(values, 0.99) * 1000, 1),
+                "max": round(max(values) * 1000, 1),
+            }
+            for channel, values in sorted(probe.latencies.items()) + [("total", all_latencies)] if values
+        },
+        "llm": {"latency_s": args.llm_latency, "jitter_s": args.llm_jitter, "requests": len(llm_server.requests),
+                "peak_in_flight": llm_server.peak_in_flight},
+        "workers": worker_pool.stats(),
+        "sampling": sampler.summary(),
+        "timeline": sampler.samples,
+    }
+
+
+def print_report(report: dict, max_rows: int = 20) -> None:
+    target = f"objetivo {report['target_rps']:.1f} rps, " if report["target_rps"] else ""
+    print(f"\n📊 {report['messages']} mensajes enviados en {report['send_seconds']:.1f} s ({target}enviado {report['sent_rps']} rps)")
+    print(
+        f"Respondidos: {report['answered_messages']} ({report['answered_per_second']}/s, {report['replies']} respuestas) | "
+        f"sin respuesta: {report['unanswered']} | HTTP: {report['http_status']} | errores cliente: {report['client_errors']}"
+    )
+    print(f"LLM falso: {report['llm']['requests']} llamadas, pico {report['llm']['peak_in_flight']} simultáneas")
+
+    print(f"\nLatencia de extremo a extremo (ms)\n{'canal':<10}{'n':>7}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for channel, row in report["latency_ms"].items():
+        print(f"{channel:<10}{row['n']:>7}{row['p50']:>10}{row['p95']:>10}{row['p99']:>10}{row['max']:>10}")
+
+    sampling = report["sampling"]
+    timeline = report["timeline"]
+    step = max(1, math.ceil(len(timeline) / max_rows))
+    print(f"\nCola y workers en el tiempo\n{'t (s)':>7}{'cola':>7}{'en vuelo':>10}{'esperando':>11}{'conexiones BD':>15}")
+    for sample in timeline[::step]:
+        db = sample["db_checked_out"] if sample["db_checked_out"] is not None else "-"
+        print(f"{sample['t']:>7}{sample['queue']:>7}{sample['workers_in_flight']:>10}{sample['workers_waiting']:>11}{db:>15}")
+
+    if sampling["db_pool_capacity"] is None:
+        print("\nPool BD: sin pool (NullPool), no se mide saturación")
+    else:
+        print(
+            f"\nPool BD: máximo {sampling['db_checked_out_max']}/{sampling['db_pool_capacity']} conexiones, "
+            f"saturado {sampling['db_saturated_fraction'] * 100:.0f}% de las muestras"
+        )
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--traffic", help="Archivo JSONL de tráfico a reproducir (ver tests/load/traffic.py)")
+    parser.add_argument("--generate", type=int, default=0, help="Mensajes a generar (por defecto rps * duration)")
+    parser.add_argument("--users", type=int, default=100, help="Prospectos distintos en el tráfico generado")
+    parser.add_argument("--channels", default=",".join(CHANNELS), help="Canales del tráfico generado")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--save-traffic", help="Guardar el tráfico usado como JSONL (para repetir la corrida)")
+    parser.add_argument("--rps", type=float, default=10.0, help="Mensajes por segundo (tráfico sin 'at')")
+    parser.add_argument("--duration", type=float, default=30.0, help="Segundos de tráfico generado")
+    parser.add_argument("--speed", type=float, default=1.0, help="Multiplicador del ritmo grabado ('at')")
+    parser.add_argument("--tenant", default="load_tenant", help="tenant_id de los mensajes de /simulate")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="Segundos que tarda el LLM falso")
+    parser.add_argument("--llm-jitter", type=float, default=0.5, help="Variación uniforme extra de la latencia")
+    parser.add_argument("--response-cache", action="store_true", help="Dejar activa la caché de respuestas")
+    parser.add_argument("--db-url", help="URL async de SQLAlchemy (por defecto la del .env)")
+    parser.add_argument("--create-schema", action="store_true", help="Crear las tablas (BD desechable)")
+    parser.add_argument("--pool-size", type=int, default=10)
+    parser.add_argument("--max-overflow", type=int, default=20)
+    parser.add_argument("--pool-timeout", type=float, default=30.0)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--sample-interval", type=float, default=0.5)
+    parser.add_argument("--drain-timeout", type=float, default=60.0, help="Espera máxima de respuestas al terminar")
+    parser.add_argument("--keep-data", action="store_true", help="No borrar los prospectos de carga")
+    parser.add_argument("--report", help="Guardar el reporte completo (con la serie de tiempo) en JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    logging.getLogger().setLevel(logging.WARNING)
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.report:
+        Path(args.report).write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"\nReporte completo: {args.report}")
+
+
+if __name__ == "__main__":
+    main()
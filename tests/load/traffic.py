@@ -0,0 +1,85 @@
+"""
+Tráfico para el harness de carga (tests/load/harness.py): lectura, generación y programación.
+
+Formato JSONL, un mensaje entrante por línea:
+
+    {"at": 0.25, "channel": "telegram", "user": "u17", "text": "¿Tienen turbidímetros portátiles?"}
+
+    channel   simulate | telegram | whatsapp | ws   (endpoint por el que entra el mensaje)
+    user      identificador del prospecto; el harness le antepone "load-" en cada canal
+    text      contenido del mensaje
+    at        opcional: segundos desde el inicio. Si TODAS las líneas lo traen, se respeta
+              el ritmo grabado (escalado con --speed); si no, se envía a --rps constante.
+"""
+import json
+import random
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+CHANNELS = ("simulate", "telegram", "whatsapp", "ws")
+
+# Consultas típicas de catálogo. Ninguna contiene palabras de HANDOFF_KEYWORDS:
+# una conversación transferida a un asesor deja de recibir respuestas del bot.
+QUESTIONS = [
+    "Buenos días, ¿tienen turbidímetros portátiles?",
+    "¿Qué rango de medición tiene el pHmetro de mesa?",
+    "Necesito medir conductividad en agua de caldera, ¿qué equipo sirve?",
+    "¿El medidor de oxígeno disuelto incluye sonda de repuesto?",
+    "¿Manejan reactivos para cloro libre y total?",
+    "¿Cada cuánto se debe calibrar un electrodo de pH?",
+    "¿Tienen fotómetros multiparamétricos para laboratorio?",
+    "¿Qué diferencia hay entre el modelo portátil y el de mesa?",
+    "¿Ofrecen capacitación en el uso de los equipos?",
+    "Gracias, ¿me pueden enviar la ficha técnica?",
+]
+
+
+@dataclass
+class TrafficEvent:
+    channel: str
+    user: str
+    text: str
+    at: Optional[float] = None
+
+
+def load_traffic(path: Path) -> List[TrafficEvent]:
+    events = []
+    with open(path, encoding="utf-8") as fh:
+        for line_no, line in enumerate(fh, start=1):
+            if not line.strip():
+                continue
+            event = TrafficEvent(**json.loads(line))
+            if event.channel not in CHANNELS:
+                raise ValueError(f"{path}:{line_no}: canal desconocido '{event.channel}'")
+            events.append(event)
+    return events
+
+
+def save_traffic(events: Sequence[TrafficEvent], path: Path) -> None:
+    with open(path, "w", encoding="utf-8") as fh:
+        for event in events:
+            fh.write(json.dumps({k: v for k, v in asdict(event).items() if v is not None}, ensure_ascii=False) + "\n")
+
+
+def generate_traffic(count: int, users: int, channels: Sequence[str] = CHANNELS, seed: int = 7) -> List[TrafficEvent]:
+    """
+    `count` mensajes repartidos entre `users` prospectos. Cada prospecto usa un solo
+    canal y recorre QUESTIONS en orden, como una conversación real.
+    """
+    rng = random.Random(seed)
+    user_channels = {f"u{i}": channels[i % len(channels)] for i in range(users)}
+    turns = {user: 0 for user in user_channels}
+    events = []
+    for _ in range(count):
+        user = rng.choice(list(user_channels))
+        events.append(TrafficEvent(channel=user_channels[user], user=user, text=QUESTIONS[turns[user] % len(QUESTIONS)]))
+        turns[user] += 1
+    return events
+
+
+def schedule(events: Sequence[TrafficEvent], rps: float, speed: float = 1.0) -> List[float]:
+    """Segundos desde el inicio en que se envía cada evento."""
+    if events and all(event.at is not None for event in events):
+        return [event.at / speed for event in events]
+    return [i / rps for i in range(len(events))]
@@ -0,0 +1,112 @@
+"""
+Tests unitarios para AdmissionController (rate limit con cubetas de tokens).
+
+Cubre:
+- Sin límites configurados se admite de inmediato
+- Una ráfaga mayor que la cubeta espera su turno en vez de fallar
+- Al vencer el deadline se lanza AdmissionTimeoutError
+- Round robin entre tenants: una ráfaga de un tenant no bloquea a los demás
+- El límite de un tenant no frena a los otros
+- settle() devuelve los tokens reservados de más
+- LLMEngine responde con el mensaje de contingencia sin llamar al proveedor
+"""
+import asyncio
+import time
+
+import pytest
+
+from src.core.admission import AdmissionController, AdmissionTimeoutError, TokenBucket
+from src.core.llm import FALLBACK_MESSAGE, LLMEngine
+from src.core.llm_router import ProviderConfig
+from tests.fakes.fake_openai_server import FakeOpenAIServer
+
+
+@pytest.mark.asyncio
+async def test_sin_limites_admite_de_inmediato():
+    admission = AdmissionController(rpm=0, tpm=0, tenant_rpm={}, tenant_tpm={})
+    assert not admission.enabled
+    assert await admission.acquire("t1", 10_000) == 0.0
+
+
+def test_cubeta_se_rellena_con_el_tiempo():
+    bucket = TokenBucket(per_minute=600, burst_seconds=1)  # 10/s, capacidad 10
+    bucket.take(10)
+    assert bucket.wait_time(5) == pytest.approx(0.5, abs=0.05)
+    # Una petición mayor que la capacidad solo espera a que la cubeta se llene
+    assert bucket.wait_time(50) == pytest.approx(1.0, abs=0.05)
+
+
+@pytest.mark.asyncio
+async def test_rafaga_espera_su_turno():
+    admission = AdmissionController(rpm=1200, tpm=0, tenant_rpm={}, tenant_tpm={}, burst_seconds=0.25, deadline=2)
+    started = time.monotonic()
+    waits = await asyncio.gather(*(admission.acquire("t1", 100) for _ in range(8)))
+
+    # Capacidad 5: las 3 últimas esperan ~50 ms cada una (20 peticiones/s)
+    assert sum(1 for w in waits if w == 0.0) == 5
+    assert time.monotonic() - started >= 0.12
+    stats = admission.stats()
+    assert stats["admitted"] == 8 and stats["waiting"] == 0 and stats["wait_ms_max"] > 0
+
+
+@pytest.mark.asyncio
+async def test_deadline_vencido():
+    admission = AdmissionController(rpm=6, tpm=0, tenant_rpm={}, tenant_tpm={}, burst_seconds=1, deadline=0.05)
+    await admission.acquire("t1", 1)
+
+    with pytest.raises(AdmissionTimeoutError):
+        await admission.acquire("t1", 1)
+    assert admission.stats()["timed_out"] == 1
+    await asyncio.sleep(0.01)
+    assert admission.stats()["waiting"] == 0
+
+
+@pytest.mark.asyncio
+async def test_round_robin_entre_tenants():
+    admission = AdmissionController(rpm=600, tpm=0, tenant_rpm={}, tenant_tpm={}, burst_seconds=0.1, deadline=3)
+    await admission.acquire("ruidoso", 1)  # Agota la cubeta (capacidad 1)
+    order = []
+
+    async def call(tenant_id):
+        await admission.acquire(tenant_id, 1)
+        order.append(tenant_id)
+
+    tasks = [asyncio.create_task(call("ruidoso")) for _ in range(4)]
+    await asyncio.sleep(0)
+    tasks.append(asyncio.create_task(call("tranquilo")))
+    await asyncio.gather(*tasks)
+
+    # El tenant tranquilo llegó después de 4 llamadas del ruidoso pero entra segundo
+    assert order.index("tranquilo") <= 1
+
+
+@pytest.mark.asyncio
+async def test_limite_de_tenant_no_frena_a_otros():
+    admission = AdmissionController(rpm=0, tpm=0, tenant_rpm={"limitado": 6}, tenant_tpm={}, burst_seconds=1, deadline=1)
+    await admission.acquire("limitado", 1)
+    blocked = asyncio.create_task(admission.acquire("limitado", 1))
+    await asyncio.sleep(0)
+
+    assert await asyncio.wait_for(admission.acquire("libre", 1), timeout=0.1) == 0.0
+    blocked.cancel()
+
+
+@pytest.mark.asyncio
+async def test_settle_devuelve_tokens_reservados_de_mas():
+    admission = AdmissionController(rpm=0, tpm=6000, tenant_rpm={}, tenant_tpm={}, burst_seconds=1, deadline=0.05)
+    await admission.acquire("t1", 100)  # Capacidad 100 tokens
+    admission.settle("t1", reserved=100, actual=40)
+
+    assert await admission.acquire("t1", 50) == 0.0
+
+
+@pytest.mark.asyncio
+async def test_llm_engine_sin_cupo_responde_contingencia():
+    server = FakeOpenAIServer()
+    engine = LLMEngine(providers=[ProviderConfig("fake", server.base_url, "fake-model")], http_client=server.http_client())
+    engine.response_cache.max_entries = 0
+    engine.admission = AdmissionController(rpm=6, tpm=0, tenant_rpm={}, tenant_tpm={}, burst_seconds=1, deadline=0.05)
+
+    assert await engine.generate_response([{"role": "user", "content": "hola"}]) != FALLBACK_MESSAGE
+    assert await engine.generate_response([{"role": "user", "content": "¿sigues ahí?"}]) == FALLBACK_MESSAGE
+    assert len(server.requests) == 1
@@ -0,0 +1,152 @@
+"""
+Tests unitarios para la ingesta incremental del catálogo (src/core/retrieval/ingestion.py).
+
+Cubre:
+- clean_html() quita etiquetas y entidades y deja un párrafo por línea
+- chunk_text() agrupa oraciones sin pasar de max_tokens (corta las muy largas por palabras)
+- row_to_product() descarta filas inactivas/eliminadas y arma la URL /producto/{sku}/{slug}
+- Segunda corrida sin cambios: todo sin cambios y ningún embedding calculado
+- Solo se recalculan los fragmentos cuyo texto cambió; los de productos borrados se eliminan
+- Fuente vacía con índice lleno: falla en lugar de vaciar el índice
+- load_products_from_dump() lee .json por tabla y .jsonl
+"""
+import json
+
+import pytest
+
+from src.core.context_builder import count_tokens
+from src.core.retrieval import BaseRetriever
+from src.core.retrieval.ingestion import (
+    CatalogIngestor,
+    chunk_text,
+    clean_html,
+    load_products_from_dump,
+    row_to_product,
+)
+
+ROWS = [
+    {"numero_catalogo": "TN-100", "nombre": "Turbidímetro TN-100", "marca": "Lovibond",
+     "descripcion": "<p>Turbidímetro <b>portátil</b>, rango 0-1000 NTU.</p><p>Incluye maletín &amp; estándares.</p>",
+     "inactivo": 0, "eliminado": 0},
+    {"numero_catalogo": "PH-700", "nombre": "pHmetro de mesa", "descripcion": "Compensación automática de temperatura.",
+     "inactivo": "0", "eliminado": "0"},
+    {"numero_catalogo": "OLD-1", "nombre": "Equipo descontinuado", "descripcion": "Ya no se vende.", "inactivo": 1},
+]
+
+
+class FakeEmbedder:
+    model_name = "modelo-prueba"
+
+    def __init__(self):
+        self.batches = []
+
+    def embed(self, texts):
+        self.batches.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+
+class InMemoryIndex(BaseRetriever):
+    name = "memoria"
+
+    def __init__(self):
+        self.catalogs = {}
+
+    async def search(self, catalog, query, k):
+        return []
+
+    def fingerprints(self, catalog):
+        return {chunk_id: row["content_hash"] for chunk_id, row in self.catalogs.get(catalog, {}).items()}
+
+    def upsert(self, catalog, ids, texts, vectors, metadatas):
+        index = self.catalogs.setdefault(catalog, {})
+        for chunk_id, text, vector, metadata in zip(ids, texts, vectors, metadatas):
+            index[chunk_id] = {"text": text, "vector": vector, **metadata}
+
+    def delete(self, catalog, ids):
+        for chunk_id in ids:
+            self.catalogs.get(catalog, {}).pop(chunk_id, None)
+
+
+def products(rows=ROWS):
+    return [p for p in (row_to_product(dict(row), base_url="https://inasc.test") for row in rows) if p]
+
+
+def test_clean_html_deja_texto_plano():
+    text = clean_html("<div><h3>Usos</h3><ul><li>Agua <b>cruda</b></li><li>Efluentes</li></ul>Rango&nbsp;0-14<br>pH</div>")
+    assert text == "Usos\nAgua cruda\nEfluentes\nRango 0-14\npH"
+    assert clean_html(None) == ""
+
+
+def test_chunk_text_respeta_max_tokens():
+    sentences = " ".join(f"Frase número {i} sobre el equipo de laboratorio." for i in range(40))
+    chunks = chunk_text(sentences, max_tokens=50)
+    assert len(chunks) > 1
+    assert all(count_tokens(chunk) <= 55 for chunk in chunks)
+    assert " ".join(chunks) == sentences
+
+    long_sentence = chunk_text("palabra " * 300, max_tokens=50)
+    assert len(long_sentence) > 1 and all(count_tokens(chunk) <= 50 for chunk in long_sentence)
+
+
+def test_row_to_product_filtra_y_arma_la_url():
+    tn, ph = products()
+    assert tn.url == "https://inasc.test/producto/TN-100/turbidimetro-tn-100"
+    assert tn.brand == "Lovibond"
+    assert tn.description == "Turbidímetro portátil, rango 0-1000 NTU.\nIncluye maletín & estándares."
+    assert ph.sku == "PH-700"
+    assert row_to_product({"numero_catalogo": "X", "nombre": "Y", "eliminado": 1}) is None
+    assert row_to_product({"nombre": "Sin SKU"}) is None
+    assert row_to_product({"sku": "C18-250", "nombre": "Columna C18"}, table="in_columnas").url.endswith("/columna/C18-250/columna-c18")
+
+
+def test_segunda_corrida_sin_cambios_no_calcula_embeddings():
+    index, embedder = InMemoryIndex(), FakeEmbedder()
+    ingestor = CatalogIngestor(index, embedder, batch_size=1)
+
+    first = ingestor.run("inasc", products())
+    assert (first.products, first.added, first.changed, first.skipped, first.removed) == (2, 2, 0, 0, 0)
+    assert len(embedder.batches) == 2
+    stored = index.catalogs["inasc"]["i3_productos:TN-100#0"]
+    assert stored["text"].startswith("Turbidímetro TN-100 (TN-100) — Lovibond\n")
+    assert stored["url"] == "https://inasc.test/producto/TN-100/turbidimetro-tn-100"
+
+    second = ingestor.run("inasc", products())
+    assert (second.added, second.changed, second.skipped) == (0, 0, 2)
+    assert len(embedder.batches) == 2
+
+
+def test_solo_reindexa_lo_cambiado_y_elimina_lo_borrado():
+    index, embedder = InMemoryIndex(), FakeEmbedder()
+    ingestor = CatalogIngestor(index, embedder)
+    ingestor.run("inasc", products())
+
+    rows = [dict(ROWS[0], descripcion="Turbidímetro portátil con Bluetooth."), dict(ROWS[1], eliminado=1)]
+    preview = ingestor.run("inasc", products(rows), dry_run=True)
+    assert (preview.changed, preview.removed) == (1, 1)
+    assert set(index.catalogs["inasc"]) == {"i3_productos:TN-100#0", "i3_productos:PH-700#0"}
+
+    report = ingestor.run("inasc", products(rows))
+    assert (report.added, report.changed, report.skipped, report.removed) == (0, 1, 0, 1)
+    assert embedder.batches[-1] == ["Turbidímetro TN-100 (TN-100) — Lovibond\nTurbidímetro portátil con Bluetooth."]
+    assert set(index.catalogs["inasc"]) == {"i3_productos:TN-100#0"}
+
+
+def test_fuente_vacia_no_vacia_el_indice():
+    index = InMemoryIndex()
+    ingestor = CatalogIngestor(index, FakeEmbedder())
+    ingestor.run("inasc", products())
+
+    with pytest.raises(ValueError):
+        ingestor.run("inasc", [])
+    assert len(index.catalogs["inasc"]) == 2
+    assert ingestor.run("inasc", [], allow_empty=True).removed == 2
+
+
+def test_load_products_from_dump(tmp_path):
+    by_table = tmp_path / "catalogo.json"
+    by_table.write_text(json.dumps({"i3_productos": ROWS, "in_columnas": [{"sku": "C18-250", "nombre": "Columna C18"}]}))
+    assert [p.sku for p in load_products_from_dump(str(by_table))] == ["TN-100", "PH-700", "C18-250"]
+
+    lines = tmp_path / "catalogo.jsonl"
+    lines.write_text("\n".join(json.dumps(row) for row in ROWS) + "\n")
+    assert [p.source for p in load_products_from_dump(str(lines))] == ["i3_productos", "i3_productos"]
@@ -0,0 +1,179 @@
+"""
+Tests unitarios para CatalogRetrieval (etapa RAG del catálogo).
+
+Cubre:
+- Sin motor o desactivada no busca y retorna []
+- Filtra por similitud mínima y usa el catálogo configurado para el tenant
+- Una búsqueda fuera de presupuesto o con error deja el turno sin catálogo
+- SearchPool cuenta los hilos ocupados hasta que terminan; saturado, la búsqueda se salta
+- El mensaje de sistema lista las fichas sin pasar de max_tokens
+- Si el motor no arranca (ej: falta chromadb) la etapa se desactiva
+- process_message_batch() inyecta las fichas justo antes del turno del usuario
+"""
+import asyncio
+import threading
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from src.core.retrieval import BaseRetriever, CatalogRetrieval, Passage
+from src.core.context_builder import count_tokens
+from src.core.retrieval.catalog_retrieval import CATALOG_HEADER, format_passage, parse_tenant_catalogs
+from src.core.retrieval.search_pool import SearchPool
+from src.models.message import IncomingMessage
+
+PASSAGES = [
+    Passage("p1", "Turbidímetro portátil, rango 0-1000 NTU.", 0.82, {"name": "Turbidímetro TN-100", "product_sku": "TN-100"}),
+    Passage("p2", "pHmetro de mesa con compensación de temperatura.", 0.41, {"name": "pHmetro PH-700"}),
+    Passage("p3", "Balanza analítica 0,1 mg.", 0.12, {"name": "Balanza AX-220"}),
+]
+
+
+class InMemoryRetriever(BaseRetriever):
+    name = "memoria"
+
+    def __init__(self, passages=PASSAGES, delay=0.0, error=None):
+        self.passages = passages
+        self.delay = delay
+        self.error = error
+        self.calls = []
+
+    async def search(self, catalog, query, k):
+        self.calls.append((catalog, query, k))
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return self.passages[:k]
+
+
+def make_retrieval(retriever=None, **kwargs):
+    defaults = {"top_k": 3, "min_score": 0.3, "budget_ms": 100, "max_tokens": 600, "tenant_catalogs": {}}
+    return CatalogRetrieval(retriever=retriever or InMemoryRetriever(), **{**defaults, **kwargs})
+
+
+@pytest.mark.asyncio
+async def test_sin_motor_o_desactivada_no_busca():
+    assert await CatalogRetrieval(retriever=None, tenant_catalogs={}).retrieve("t1", "pH") == []
+    retriever = InMemoryRetriever()
+    assert await make_retrieval(retriever, enabled=False).retrieve("t1", "pH") == []
+    assert retriever.calls == []
+
+
+@pytest.mark.asyncio
+async def test_filtra_por_similitud_y_usa_el_catalogo_del_tenant():
+    retriever = InMemoryRetriever()
+    retrieval = make_retrieval(retriever, tenant_catalogs=parse_tenant_catalogs("inasc_001:inasc, zapatos_x:zapatos"))
+
+    passages = await retrieval.retrieve("zapatos_x", "¿tienen turbidímetros?")
+
+    assert [p.id for p in passages] == ["p1", "p2"]
+    assert retriever.calls == [("zapatos", "¿tienen turbidímetros?", 3)]
+    assert retrieval.catalog_for("otro") == "inasc"
+    assert retrieval.stats()["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_fuera_de_presupuesto_o_con_error_sigue_sin_catalogo():
+    slow = make_retrieval(InMemoryRetriever(delay=0.5), budget_ms=20)
+    assert await slow.retrieve("t1", "pH") == []
+    assert slow.stats()["timeouts"] == 1
+    assert slow.stats()["latency_ms_p95"] < 200
+
+    broken = make_retrieval(InMemoryRetriever(error=RuntimeError("índice corrupto")))
+    assert await broken.retrieve("t1", "pH") == []
+    assert broken.stats()["failures"] == 1
+
+
+class PooledRetriever(InMemoryRetriever):
+    """Búsqueda bloqueante en un SearchPool propio, como chroma / numpy."""
+
+    def __init__(self, pool, release):
+        super().__init__()
+        self.pool = pool
+        self.release = release
+
+    def _search_sync(self, k):
+        self.release.wait(timeout=5)
+        return self.passages[:k]
+
+    async def search(self, catalog, query, k):
+        self.calls.append((catalog, query, k))
+        return await self.pool.run(self._search_sync, k)
+
+    @property
+    def saturated(self):
+        return self.pool.saturated
+
+
+@pytest.mark.asyncio
+async def test_hilos_ocupados_saltan_la_busqueda():
+    release = threading.Event()
+    retriever = PooledRetriever(SearchPool(threads=1), release)
+    retrieval = make_retrieval(retriever, budget_ms=20)
+
+    # La búsqueda vence el presupuesto pero su hilo sigue ocupado: la siguiente ni se encola
+    assert await retrieval.retrieve("t1", "pH") == []
+    assert retriever.pool.busy == 1
+    assert await retrieval.retrieve("t1", "pH") == []
+    assert len(retriever.calls) == 1
+    assert retrieval.stats()["timeouts"] == 1 and retrieval.stats()["skipped"] == 1
+
+    release.set()
+    for _ in range(100):
+        if not retriever.pool.saturated:
+            break
+        await asyncio.sleep(0.01)
+    assert [p.id for p in await retrieval.retrieve("t1", "pH")] == ["p1", "p2"]
+
+
+def test_mensaje_de_catalogo_respeta_max_tokens():
+    message = make_retrieval().as_message(PASSAGES[:2])
+    assert message["role"] == "system"
+    assert "[1] Turbidímetro TN-100 (SKU TN-100)\nTurbidímetro portátil" in message["content"]
+    assert "[2] pHmetro PH-700" in message["content"]
+
+    first_only = count_tokens(CATALOG_HEADER) + count_tokens(format_passage(1, PASSAGES[0])) + 1
+    short = make_retrieval(max_tokens=first_only).as_message(PASSAGES[:2])
+    assert "[1]" in short["content"] and "[2]" not in short["content"]
+    assert make_retrieval().as_message([]) is None
+
+
+@pytest.mark.asyncio
+async def test_motor_que_no_arranca_desactiva_la_etapa():
+    retrieval = CatalogRetrieval(retriever=None, tenant_catalogs={})
+    with patch("src.core.retrieval.catalog_retrieval.build_retriever", side_effect=ModuleNotFoundError("chromadb")):
+        await retrieval.start()
+    assert retrieval.active is False
+    assert await retrieval.retrieve("t1", "pH") == []
+
+
+@pytest.mark.asyncio
+async def test_process_message_batch_inyecta_las_fichas_antes_del_turno():
+    from src.main import process_message_batch
+    from tests.unit.test_short_transactions import FakeSessions
+
+    contexts = []
+
+    async def generate_response(context, tenant_id="default", conversation_id=None):
+        contexts.append(context)
+        return "Sí, el TN-100."
+
+    history = [{"role": "user", "content": "Hola"}, {"role": "assistant", "content": "¡Hola! ¿En qué le ayudo?"}]
+    conversation = MagicMock(id=7, status="active", summary=None)
+    message = IncomingMessage(platform="telegram", platform_user_id="tg_1", tenant_id="t1", content="¿turbidímetro portátil?")
+    with (
+        patch("src.main.catalog_retrieval", make_retrieval()),
+        patch("src.main.async_session_factory", FakeSessions()),
+        patch("src.main.crud.load_conversation_context", new=AsyncMock(return_value=(MagicMock(id=1), conversation, list(history)))),
+        patch("src.main.crud.save_message", new_callable=AsyncMock),
+        patch("src.main.crud.lock_conversation_status", new=AsyncMock(return_value="active")),
+        patch("src.main.llm_engine.generate_response", side_effect=generate_response),
+        patch("src.main.telegram_responder.send_message", new_callable=AsyncMock),
+        patch("src.main.queue_manager.mark_task_done"),
+    ):
+        await process_message_batch([message])
+
+    [context] = contexts
+    assert context[:2] == history
+    assert context[2]["role"] == "system" and "TN-100" in context[2]["content"]
+    assert context[3] == {"role": "user", "content": "¿turbidímetro portátil?"}
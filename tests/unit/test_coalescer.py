@@ -0,0 +1,105 @@
+"""
+Tests unitarios para MessageCoalescer (debounce de mensajes por conversación).
+
+Cubre:
+- Mensajes dentro de la ventana se fusionan en un solo lote
+- Conversaciones distintas no se mezclan
+- Canales excluidos y ventana 0 despachan inmediatamente
+- Tope de tamaño de lote y ventana máxima
+"""
+import asyncio
+
+import pytest
+
+from src.core.coalescer import MessageCoalescer
+from src.models.message import IncomingMessage
+
+
+def make_message(content, user="u1", platform="telegram", tenant_id="t1"):
+    return IncomingMessage(platform=platform, platform_user_id=user, tenant_id=tenant_id, content=content)
+
+
+class Recorder:
+    def __init__(self):
+        self.batches = []
+
+    async def __call__(self, key, messages):
+        self.batches.append((key, [m.content for m in messages]))
+
+
+@pytest.mark.asyncio
+async def test_mensajes_en_la_ventana_se_fusionan():
+    recorder = Recorder()
+    coalescer = MessageCoalescer(recorder, window_ms=30, max_window_ms=500, max_batch=10, platforms={"telegram"})
+
+    for text in ("hola", "tienen pHmetros?", "para agua residual"):
+        await coalescer.add(make_message(text))
+        await asyncio.sleep(0.01)
+    assert recorder.batches == []
+
+    await asyncio.sleep(0.06)
+    assert recorder.batches == [
+        (("t1", "telegram", "u1"), ["hola", "tienen pHmetros?", "para agua residual"])
+    ]
+    stats = coalescer.stats()
+    assert stats["messages_in"] == 3
+    assert stats["batches_out"] == 1
+    assert stats["merged"] == 2
+
+
+@pytest.mark.asyncio
+async def test_conversaciones_distintas_no_se_mezclan():
+    recorder = Recorder()
+    coalescer = MessageCoalescer(recorder, window_ms=20, max_window_ms=200, max_batch=10, platforms={"telegram"})
+
+    await coalescer.add(make_message("a1", user="a"))
+    await coalescer.add(make_message("b1", user="b"))
+    await coalescer.add(make_message("a2", user="a"))
+    await asyncio.sleep(0.05)
+
+    assert sorted(batch for _, batch in recorder.batches) == [["a1", "a2"], ["b1"]]
+
+
+@pytest.mark.asyncio
+async def test_canal_excluido_se_despacha_inmediatamente():
+    recorder = Recorder()
+    coalescer = MessageCoalescer(recorder, window_ms=1000, platforms={"telegram"})
+
+    await coalescer.add(make_message("hola", platform="web"))
+    assert recorder.batches == [(("t1", "web", "u1"), ["hola"])]
+
+
+@pytest.mark.asyncio
+async def test_ventana_cero_desactiva_la_fusion():
+    recorder = Recorder()
+    coalescer = MessageCoalescer(recorder, window_ms=0, platforms={"telegram"})
+
+    await coalescer.add(make_message("uno"))
+    await coalescer.add(make_message("dos"))
+    assert [batch for _, batch in recorder.batches] == [["uno"], ["dos"]]
+
+
+@pytest.mark.asyncio
+async def test_tope_de_lote_despacha_sin_esperar():
+    recorder = Recorder()
+    coalescer = MessageCoalescer(recorder, window_ms=1000, max_batch=2, platforms={"telegram"})
+
+    await coalescer.add(make_message("uno"))
+    await coalescer.add(make_message("dos"))
+    assert [batch for _, batch in recorder.batches] == [["uno", "dos"]]
+    await coalescer.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_ventana_maxima_limita_el_debounce():
+    recorder = Recorder()
+    coalescer = MessageCoalescer(recorder, window_ms=30, max_window_ms=60, max_batch=100, platforms={"telegram"})
+
+    # Escribe sin parar cada 20 ms: el debounce solo no cerraría nunca la ventana
+    for i in range(6):
+        await coalescer.add(make_message(f"m{i}"))
+        await asyncio.sleep(0.02)
+    await asyncio.sleep(0.05)
+
+    assert len(recorder.batches) >= 2
+    assert [m for _, batch in recorder.batches for m in batch] == [f"m{i}" for i in range(6)]
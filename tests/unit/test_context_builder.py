@@ -0,0 +1,142 @@
+"""
+Tests unitarios para ContextBuilder (ventana de contexto por presupuesto de tokens).
+
+Cubre:
+- Se llenan turnos desde el más reciente hacia atrás hasta el presupuesto
+- El turno más reciente siempre entra
+- Presupuesto por tenant y tope de turnos candidatos
+- Conteo de tokens memoizado y métricas de prompt
+- El encoding de tiktoken se carga en el primer conteo (no al importar), con el estimador si falla
+- Ventana estable por conversación: el inicio no se mueve hasta que hay que recortar
+"""
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+import src.core.context_builder as context_builder_module
+from src.core.context_builder import (
+    MESSAGE_OVERHEAD_TOKENS,
+    ContextBuilder,
+    count_tokens,
+    estimate_tokens,
+)
+
+
+def turn(content, role="user"):
+    return {"role": role, "content": content}
+
+
+def cost(content):
+    return count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+
+
+def test_estimador_cuenta_palabras_y_signos():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("hola") == 1
+    assert estimate_tokens("¿pHmetro?") == 4  # ¿ + pHme/tro + ?
+
+
+@pytest.fixture
+def fresh_encoding(monkeypatch):
+    """Vuelve al estado de recién importado (encoding sin cargar, memo vacío) y lo restaura al final."""
+    monkeypatch.setattr(context_builder_module, "_encoding", context_builder_module._UNLOADED)
+    count_tokens.cache_clear()
+    yield monkeypatch
+    count_tokens.cache_clear()
+
+
+def test_encoding_se_carga_en_el_primer_conteo(fresh_encoding):
+    loads = []
+
+    def get_encoding(name):
+        loads.append(name)
+        return SimpleNamespace(encode=lambda text, disallowed_special: text.split())
+
+    fresh_encoding.setitem(sys.modules, "tiktoken", SimpleNamespace(get_encoding=get_encoding))
+    builder = ContextBuilder(default_budget=1000, tenant_budgets={}, max_turns=20)
+    assert builder.stats()["tokenizer"] == "pending" and loads == []
+
+    assert count_tokens("uno dos tres") == 3
+    assert count_tokens("cuatro cinco") == 2
+    assert len(loads) == 1 and builder.stats()["tokenizer"] == loads[0]
+
+
+def test_sin_archivo_bpe_usa_el_estimador(fresh_encoding):
+    def get_encoding(name):
+        raise OSError("sin red para descargar el BPE")
+
+    fresh_encoding.setitem(sys.modules, "tiktoken", SimpleNamespace(get_encoding=get_encoding))
+    assert count_tokens("¿pHmetro?") == estimate_tokens("¿pHmetro?")
+    assert ContextBuilder(default_budget=1000, tenant_budgets={}, max_turns=20).stats()["tokenizer"] == "regex_estimate"
+
+
+def test_llena_desde_el_turno_mas_reciente():
+    history = [turn("a " * 200), turn("respuesta corta", "assistant"), turn("¿y en acero?")]
+    budget = cost("respuesta corta") + cost("¿y en acero?")
+    builder = ContextBuilder(default_budget=budget, tenant_budgets={}, max_turns=20)
+
+    assert builder.build("t1", history) == history[1:]
+
+
+def test_turno_mas_reciente_siempre_entra():
+    builder = ContextBuilder(default_budget=1, tenant_budgets={}, max_turns=20)
+    history = [turn("hola"), turn("una pregunta técnica bastante larga sobre conductividad")]
+
+    assert builder.build("t1", history) == history[-1:]
+
+
+def test_presupuesto_por_tenant_y_tope_de_turnos():
+    history = [turn(f"mensaje {i}") for i in range(30)]
+    builder = ContextBuilder(default_budget=10_000, tenant_budgets={"chico": cost("mensaje 29") * 2}, max_turns=5)
+
+    assert builder.build("grande", history) == history[-5:]
+    assert builder.build("chico", history) == history[-2:]
+
+
+def test_conteo_memoizado_y_metricas_de_prompt():
+    builder = ContextBuilder(default_budget=1000, tenant_budgets={}, max_turns=20)
+    history = [turn("texto repetido en cada turno para la caché")]
+    builder.build("t1", history)
+    hits_before = count_tokens.cache_info().hits
+    builder.build("t1", history)
+    assert count_tokens.cache_info().hits > hits_before
+
+    tokens = builder.record_prompt("t1", [turn("system", "system")] + history)
+    stats = builder.stats()
+    assert stats["calls"] == 1
+    assert stats["prompt_tokens_total"] == tokens
+    assert stats["prompt_tokens_max"] == tokens
+
+
+def test_ventana_estable_por_conversacion():
+    turns = [turn(f"mensaje número {i}") for i in range(40)]
+    per_turn = cost("mensaje número 10")
+    builder = ContextBuilder(default_budget=per_turn * 8, tenant_budgets={}, max_turns=20, trim_ratio=0.5)
+
+    starts = []
+    for n in range(1, 21):
+        window = builder.build("t1", turns[:n], conversation_id=7)
+        starts.append(window[0]["content"])
+        assert count_message_tokens_of(window) <= per_turn * 8
+
+    # Hasta 8 turnos cabe todo; al pasarse se recorta a la mitad del presupuesto (4 turnos)
+    # y el inicio queda fijo mientras los turnos nuevos quepan
+    assert starts[:8] == ["mensaje número 0"] * 8
+    assert starts[8:13] == ["mensaje número 5"] * 5
+    assert starts[13] == "mensaje número 10"
+    stats = builder.stats()
+    assert stats["window_moves"] == 3 and stats["window_reuses"] == 16
+
+
+def test_sin_conversation_id_se_recorta_turno_a_turno():
+    turns = [turn(f"mensaje número {i}") for i in range(12)]
+    builder = ContextBuilder(default_budget=cost("mensaje número 10") * 8, tenant_budgets={}, max_turns=20, trim_ratio=0.5)
+
+    assert builder.build("t1", turns[:9])[0]["content"] == "mensaje número 1"
+    assert builder.build("t1", turns[:10])[0]["content"] == "mensaje número 2"
+
+
+def count_message_tokens_of(window):
+    return sum(cost(m["content"]) for m in window)
+
@@ -114,3 +114,42 @@ async def test_close_conversation():
             assert response.status_code == 200
             assert response.json()["status"] == "active"
             mock_set.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_get_llm_usage():
+    """Verifica que /usage arma el consumo diario con las agregaciones SQL del tenant."""
+    from types import SimpleNamespace
+    groups = [SimpleNamespace(day="2026-10-17", provider="deepseek", model="deepseek-chat", calls=2, ok=2, timeout=0, cached=0,
+                              prompt_tokens=200, completion_tokens=40, cache_hit_tokens=120, latency_ms_avg=300.0, latency_ms_max=400)]
+    histogram = [SimpleNamespace(day="2026-10-17", bucket=1, calls=1), SimpleNamespace(day="2026-10-17", bucket=2, calls=1)]
+    top = [SimpleNamespace(conversation_id=5, calls=2, tokens=240, latency_ms=600)]
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        with patch("src.api.routers.dashboard.crud.get_llm_usage_by_day", new_callable=AsyncMock, return_value=groups) as mock_groups, \
+             patch("src.api.routers.dashboard.crud.get_llm_latency_histogram", new_callable=AsyncMock, return_value=histogram), \
+             patch("src.api.routers.dashboard.crud.get_llm_top_conversations", new_callable=AsyncMock, return_value=top):
+
+            headers = {"X-Tenant-ID": "t1"}
+            response = await ac.get("/api/dashboard/usage?days=3", headers=headers)
+
+            assert response.status_code == 200
+            [day] = response.json()["days"]
+            assert day["date"] == "2026-10-17" and day["calls"] == 2 and day["latency_ms_p95"] == 400
+            assert day["models"][0]["model"] == "deepseek-chat"
+            assert response.json()["top_conversations"][0] == {"conversation_id": 5, "calls": 2, "tokens": 240, "latency_ms": 600}
+            assert mock_groups.await_args.args[1] == "t1"
+
+@pytest.mark.asyncio
+async def test_list_llm_calls_paginado():
+    """El listado de llamadas sueltas pasa limit / offset a la consulta y rechaza páginas enormes."""
+    from types import SimpleNamespace
+    rows = [SimpleNamespace(_mapping={"id": 9, "kind": "reply", "latency_ms": 300})]
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        with patch("src.api.routers.dashboard.crud.get_llm_calls", new_callable=AsyncMock, return_value=rows) as mock_get:
+            headers = {"X-Tenant-ID": "t1"}
+            response = await ac.get("/api/dashboard/usage/calls?limit=50&offset=100", headers=headers)
+            too_big = await ac.get("/api/dashboard/usage/calls?limit=100000", headers=headers)
+
+    assert response.status_code == 200
+    assert response.json() == {"limit": 50, "offset": 100, "calls": [{"id": 9, "kind": "reply", "latency_ms": 300}]}
+    assert mock_get.await_args.kwargs["limit"] == 50 and mock_get.await_args.kwargs["offset"] == 100
+    assert too_big.status_code == 422
@@ -0,0 +1,113 @@
+"""
+Tests unitarios para EmbeddingCache y su uso en el Embedder.
+
+Cubre:
+- Nivel en memoria: LRU acotado a max_entries, cuenta aciertos y fallos
+- El LRU guarda float32 empaquetado (4 bytes por dimensión) y retorna una lista nueva por llamada
+- Nivel en disco: otra instancia (otro proceso) con el mismo archivo acierta sin recalcular
+- La clave incluye el modelo: otro modelo no reutiliza vectores
+- Poda del nivel en disco a max_disk_rows (los de uso más antiguo)
+- Un error de SQLite deja la caché solo en memoria sin romper el embedding
+- Embedder codifica solo los textos que faltan (una vez cada uno) y con todo en caché no carga el modelo
+- Las consultas online (disk=False / embed_query) quedan solo en memoria: no leen ni escriben el SQLite
+"""
+import pytest
+from unittest.mock import patch
+
+from src.core.retrieval import embedding_cache as cache_module
+from src.core.retrieval.embedder import Embedder
+from src.core.retrieval.embedding_cache import EmbeddingCache
+
+MODEL = "modelo-prueba"
+
+
+def test_lru_en_memoria(tmp_path):
+    cache = EmbeddingCache(path=None, max_entries=2)
+    cache.put_many(MODEL, ["a", "b"], [[1.0], [2.0]])
+    assert cache.get_many(MODEL, ["a"]) == [[1.0]]  # "a" pasa a ser el más reciente
+
+    cache.put_many(MODEL, ["c"], [[3.0]])
+    assert cache.get_many(MODEL, ["a", "b", "c"]) == [[1.0], None, [3.0]]
+    stats = cache.stats()
+    assert (stats["memory_hits"], stats["misses"], stats["memory_entries"]) == (3, 1, 2)
+    assert stats["hit_rate"] == 0.75
+
+
+def test_memoria_guarda_float32_empaquetado():
+    cache = EmbeddingCache(path=None)
+    vector = [i / 512 for i in range(384)]
+    cache.put_many(MODEL, ["a"], [vector])
+
+    [blob] = cache._memory.values()
+    assert isinstance(blob, bytes) and len(blob) == 384 * 4
+    first, second = cache.get_many(MODEL, ["a", "a"])
+    assert first == vector and first is not second
+
+
+def test_nivel_en_disco_se_comparte_entre_procesos(tmp_path):
+    path = str(tmp_path / "cache" / "embeddings.sqlite3")
+    EmbeddingCache(path=path).put_many(MODEL, ["turbidímetro"], [[0.25, -0.5, 0.125]])
+
+    other = EmbeddingCache(path=path)
+    assert other.get_many(MODEL, ["turbidímetro", "balanza"]) == [[0.25, -0.5, 0.125], None]
+    assert other.get_many(MODEL, ["turbidímetro"]) == [[0.25, -0.5, 0.125]]
+    assert (other.disk_hits, other.memory_hits, other.misses) == (1, 1, 1)
+    assert other.get_many("otro-modelo", ["turbidímetro"]) == [None]
+
+
+def test_poda_el_disco(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    cache = EmbeddingCache(path=path, max_disk_rows=2)
+    with patch.object(cache_module, "_PRUNE_EVERY", 1):
+        for i, text in enumerate(["a", "b", "c"]):
+            cache.put_many(MODEL, [text], [[float(i)]])
+
+    fresh = EmbeddingCache(path=path)
+    assert fresh.get_many(MODEL, ["a", "b", "c"]) == [None, [1.0], [2.0]]
+
+
+def test_error_de_sqlite_sigue_en_memoria(tmp_path):
+    cache = EmbeddingCache(path=str(tmp_path))  # una carpeta: SQLite no la puede abrir
+    cache.put_many(MODEL, ["a"], [[1.0]])
+    assert cache.get_many(MODEL, ["a", "b"]) == [[1.0], None]
+    assert cache.stats()["disk_errors"] >= 1
+
+
+def test_embedder_solo_codifica_lo_que_falta(tmp_path):
+    embedder = Embedder(model_name=MODEL, cache=EmbeddingCache(path=str(tmp_path / "e.sqlite3")))
+    encoded = []
+
+    def fake_encode(texts):
+        encoded.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+    with patch.object(embedder, "_encode", side_effect=fake_encode):
+        assert embedder.embed(["pH", "turbidez", "pH"]) == [[2.0], [8.0], [2.0]]
+        assert embedder.embed(["turbidez", "balanza"]) == [[8.0], [7.0]]
+    assert encoded == [["pH", "turbidez"], ["balanza"]]
+
+    # Todo en caché: ni siquiera se carga el modelo (sentence-transformers)
+    with patch.object(embedder, "_load", side_effect=AssertionError("no debería cargar el modelo")):
+        assert embedder.embed(["pH", "balanza"]) == [[2.0], [7.0]]
+    assert embedder.stats()["cache"]["hit_rate"] == pytest.approx(3 / 7, abs=0.001)
+
+
+def test_consultas_online_no_tocan_el_disco(tmp_path):
+    path = str(tmp_path / "e.sqlite3")
+    EmbeddingCache(path=path).put_many(MODEL, ["ficha"], [[1.0]])
+
+    cache = EmbeddingCache(path=path)
+    embedder = Embedder(model_name=MODEL, cache=cache)
+    with (
+        patch.object(cache, "_read_disk", side_effect=AssertionError("no debería leer el disco")),
+        patch.object(cache, "_write_disk", side_effect=AssertionError("no debería escribir el disco")),
+        patch.object(embedder, "_encode", side_effect=lambda texts: [[float(len(t))] for t in texts]),
+    ):
+        assert cache.get_many(MODEL, ["ficha"], disk=False) == [None]
+        assert embedder.embed_query("¿precio del turbidímetro?") == [25.0]
+        assert embedder.embed_query("¿precio del turbidímetro?") == [25.0]  # desde memoria
+    assert cache.stats()["memory_hits"] == 1
+
+    # El mensaje del cliente no quedó en disco; la ficha de la ingesta sí
+    fresh = EmbeddingCache(path=path)
+    assert fresh.get_many(MODEL, ["¿precio del turbidímetro?", "ficha"]) == [None, [1.0]]
@@ -68,6 +68,12 @@ def test_no_trigger_conversacion_normal(svc):
     ) is False
 
 
+def test_is_user_request_solo_evalua_trigger_a(svc):
+    """is_user_request() no depende de la respuesta del LLM (se usa antes de llamarlo)."""
+    assert svc.is_user_request("Quiero un ASESOR por favor") is True
+    assert svc.is_user_request(f"{HANDOFF_SIGNAL} hola") is False
+
+
 # ── Tests strip_signal ────────────────────────────────────────────────────────
 
 def test_strip_signal_elimina_marca(svc):
@@ -0,0 +1,85 @@
+"""
+Tests unitarios para ConversationHistoryBuffer (historial reciente en memoria).
+
+Cubre:
+- Miss en frío, hit tras calentar y append solo en conversaciones calientes
+- Buffer parcial vs conversación completa
+- Capacidad del ring y tope global con desalojo LRU
+- get_conversation_history no consulta la BD en estado estable
+"""
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from src.database.history_buffer import ConversationHistoryBuffer, history_buffer
+
+
+def turn(i, role="user"):
+    return {"role": role, "content": f"m{i}"}
+
+
+def test_append_en_frio_no_calienta():
+    buffer = ConversationHistoryBuffer(turns=5, max_chars=1000, ttl_seconds=60)
+    buffer.append("t1", 1, "user", "hola")
+    assert buffer.get("t1", 1, limit=1) is None
+
+
+def test_hit_tras_calentar_y_append():
+    buffer = ConversationHistoryBuffer(turns=5, max_chars=1000, ttl_seconds=60)
+    buffer.warm("t1", 1, [turn(0), turn(1, "assistant")], complete=True)
+    buffer.append("t1", 1, "user", "m2")
+
+    assert buffer.get("t1", 1, limit=10) is None  # limit mayor que el ring: va a la BD
+    assert buffer.get("t1", 1, limit=5) == [turn(0), turn(1, "assistant"), turn(2)]
+    assert buffer.get("t1", 1, limit=2) == [turn(1, "assistant"), turn(2)]
+    assert buffer.get("otro_tenant", 1, limit=2) is None
+
+
+def test_buffer_parcial_no_se_hace_pasar_por_completo():
+    buffer = ConversationHistoryBuffer(turns=5, max_chars=1000, ttl_seconds=60)
+    buffer.warm("t1", 1, [turn(0), turn(1)], complete=False)
+
+    assert buffer.get("t1", 1, limit=2) == [turn(0), turn(1)]
+    assert buffer.get("t1", 1, limit=3) is None
+
+
+def test_ring_conserva_los_ultimos_turnos():
+    buffer = ConversationHistoryBuffer(turns=3, max_chars=1000, ttl_seconds=60)
+    buffer.warm("t1", 1, [], complete=True)
+    for i in range(5):
+        buffer.append("t1", 1, "user", f"m{i}")
+
+    assert buffer.get("t1", 1, limit=3) == [turn(2), turn(3), turn(4)]
+    assert buffer.stats()["chars"] == 6
+
+
+def test_tope_global_desaloja_la_conversacion_inactiva():
+    buffer = ConversationHistoryBuffer(turns=5, max_chars=8, ttl_seconds=60)
+    buffer.warm("t1", 1, [turn(0), turn(1)], complete=True)  # 4 caracteres
+    buffer.warm("t1", 2, [turn(0), turn(1)], complete=True)  # 8 caracteres
+    buffer.append("t1", 1, "user", "m2")  # conv 1 pasa a ser la más reciente
+
+    assert buffer.get("t1", 2, limit=1) is None
+    assert buffer.get("t1", 1, limit=3) == [turn(0), turn(1), turn(2)]
+    assert buffer.stats()["evictions"] == 1
+
+
+@pytest.mark.asyncio
+async def test_get_conversation_history_sirve_desde_el_buffer():
+    from src.database.crud import get_conversation_history, save_message
+
+    messages = [MagicMock(role="assistant", content="m1"), MagicMock(role="user", content="m0")]
+    mock_result = MagicMock()
+    mock_result.scalars.return_value.all.return_value = messages
+    session = AsyncMock()
+    session.add = MagicMock()
+    session.execute = AsyncMock(return_value=mock_result)
+
+    # Miss: una consulta (orden DESC de la BD) y el buffer queda caliente y completo
+    assert await get_conversation_history(session, 9, "t1", limit=10) == [turn(0), turn(1, "assistant")]
+    assert session.execute.await_count == 1
+
+    # El worker escribe el siguiente turno: se agrega al buffer sin releer
+    await save_message(session, 9, "t1", role="user", content="m2")
+    assert await get_conversation_history(session, 9, "t1", limit=10) == [turn(0), turn(1, "assistant"), turn(2)]
+    assert session.execute.await_count == 1
+    assert history_buffer.stats()["hits"] == 1
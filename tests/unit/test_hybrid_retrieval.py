@@ -0,0 +1,201 @@
+"""
+Tests unitarios para la búsqueda híbrida (lexical_index.py + hybrid_retriever.py).
+
+Cubre:
+- tokenize() / query_codes(): TN-100, "tn 100" y tn100 llegan al mismo código
+- LexicalIndex: código exacto por SKU (primero) y por texto, BM25, remove() incremental
+- LexicalIndex.coverage(): fracción absoluta de la consulta, no relativa al mejor BM25
+- La búsqueda de un código exacto tarda microsegundos
+- reciprocal_rank_fusion() suma peso / (k + posición) por lista
+- HybridRetriever: el SKU escrito por el prospecto va primero con score 1.0; sin motor vectorial sigue con
+  BM25 y un acierto que cubre poco de la consulta queda debajo de RAG_MIN_SCORE
+- HybridRetriever: motor vectorial lento (vence su presupuesto) o saturado → códigos exactos y BM25 igual
+- La ingesta sincroniza el índice léxico por hash; otro worker lo recarga y una corrida cortada se pone al día
+- LexicalStore.get(): carga y revisa el archivo en un hilo, a lo sumo cada refresh_seconds
+"""
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+from unittest.mock import PropertyMock, patch
+
+from src.core.retrieval.hybrid_retriever import HybridRetriever, reciprocal_rank_fusion
+from src.core.retrieval.ingestion import CatalogIngestor, row_to_product
+from src.core.retrieval.lexical_index import LexicalIndex, LexicalStore, query_codes, tokenize
+from src.core.retrieval.numpy_retriever import NumpyRetriever
+from tests.unit.test_numpy_retriever import BagOfWordsEmbedder
+
+ROWS = [
+    {"numero_catalogo": "TN-100", "nombre": "Turbidímetro TN-100", "descripcion": "Turbidímetro portátil para agua potable, 0-1000 NTU."},
+    {"numero_catalogo": "AX-220", "nombre": "Balanza AX-220", "descripcion": "Balanza analítica de precisión 0,1 mg."},
+    {"numero_catalogo": "AX-200", "nombre": "Balanza AX-200", "descripcion": "Balanza analítica de precisión 1 mg."},
+    {"numero_catalogo": "COL-25", "nombre": "Columna Hypersil", "descripcion": "Columna HPLC C18 de 250 mm para fase reversa."},
+]
+
+
+def make_index():
+    index = LexicalIndex()
+    for row in ROWS:
+        product = row_to_product(row)
+        index.add(f"i3_productos:{product.sku}#0", f"{product.name} ({product.sku})\n{product.description}", {"product_sku": product.sku})
+    return index
+
+
+def test_tokenize_y_codigos():
+    assert tokenize("Turbidímetro TN-100 de mesa") == ["turbidimetro", "tn", "100", "tn100", "mesa"]
+    assert query_codes("¿precio del tn 100?") == ["100", "tn100"]
+    assert query_codes("precio TN-100") == ["tn100"]
+    assert query_codes("balanza analítica") == []
+
+
+def test_indice_lexico():
+    index = make_index()
+    assert index.lookup_codes("¿tienen el ax 220?") == ["i3_productos:AX-220#0"]
+    assert index.lookup_codes("columna c18") == ["i3_productos:COL-25#0"]  # código en el texto, no en el SKU
+    assert index.lookup_codes("hola") == []
+
+    [(best, _), *_] = index.search("balanza analítica de precisión", 3)
+    assert best.startswith("i3_productos:AX-2")
+    assert index.search("turbidímetro portátil", 1)[0][0] == "i3_productos:TN-100#0"
+
+    index.remove("i3_productos:TN-100#0")
+    assert index.lookup_codes("TN-100") == [] and index.search("turbidímetro", 5) == []
+    assert "turbidimetro" not in index.postings and len(index) == 3
+
+
+def test_cobertura_absoluta_de_la_consulta():
+    index = make_index()
+    tn = "i3_productos:TN-100#0"
+    assert index.coverage("turbidímetro portátil", [tn]) == {tn: 1.0}
+    # Es el mejor (y único) BM25, pero la mayor parte de la consulta no está en el catálogo
+    assert index.search("turbidímetro para piscina climatizada", 5)[0][0] == tn
+    assert index.coverage("turbidímetro para piscina climatizada", [tn])[tn] < 0.3
+    assert index.coverage("de la", [tn]) == {tn: 0.0}
+
+
+def test_codigo_exacto_en_microsegundos():
+    index = make_index()
+    for i in range(5000):
+        index.add(f"relleno#{i}", f"Equipo genérico modelo GX-{i}", {"product_sku": f"GX-{i}"})
+
+    lookups = 2000
+    start = time.perf_counter()
+    for _ in range(lookups):
+        assert index.lookup_codes("precio del AX-220")
+    per_lookup_us = (time.perf_counter() - start) / lookups * 1e6
+    assert per_lookup_us < 200
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([(["a", "b"], 1.0), (["b", "c"], 1.0), (["c"], 3.0)], k=60)
+    assert fused == ["c", "b", "a"]
+
+
+def ingest(tmp_path, rows=ROWS):
+    retriever = HybridRetriever(
+        NumpyRetriever(path=str(tmp_path / "vectores"), embedder=BagOfWordsEmbedder()),
+        LexicalStore(path=str(tmp_path / "lexico")),
+    )
+    report = CatalogIngestor(retriever).run("inasc", [row_to_product(row) for row in rows])
+    return retriever, report
+
+
+@pytest.mark.asyncio
+async def test_hybrid_pone_primero_el_sku_escrito(tmp_path):
+    retriever, report = ingest(tmp_path)
+    assert report.lexical == 4
+
+    passages = await retriever.search("inasc", "precio de la balanza AX-200", 3)
+    assert passages[0].metadata["product_sku"] == "AX-200"
+    assert passages[0].score == 1.0
+    assert {p.metadata["product_sku"] for p in passages[1:]} >= {"AX-220"}
+    assert retriever.stats()["exact_hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_sin_motor_vectorial_sigue_con_bm25(tmp_path):
+    retriever, _ = ingest(tmp_path)
+
+    async def broken(*args):
+        raise RuntimeError("índice corrupto")
+
+    retriever.vector.search = broken
+    [passage] = await retriever.search("inasc", "turbidímetro portátil", 1)
+    assert passage.metadata["product_sku"] == "TN-100"
+    assert passage.text.startswith("Turbidímetro TN-100 (TN-100)")
+    assert passage.score == 1.0  # cubre toda la consulta
+
+    [passage] = await retriever.search("inasc", "turbidímetro para piscina climatizada", 1)
+    assert passage.metadata["product_sku"] == "TN-100"
+    assert passage.score < 0.3  # RAG_MIN_SCORE lo descarta
+    assert retriever.stats()["vector_failures"] == 2
+
+
+@pytest.mark.asyncio
+async def test_motor_vectorial_lento_o_saturado_sigue_con_el_sku(tmp_path):
+    retriever, _ = ingest(tmp_path)
+    retriever.vector_budget_ms = 20
+
+    async def slow(*args):
+        await asyncio.sleep(1)
+        return []
+
+    retriever.vector.search = slow
+    start = time.perf_counter()
+    passages = await asyncio.wait_for(retriever.search("inasc", "precio del AX-220", 2), timeout=0.2)
+    assert time.perf_counter() - start < 0.2
+    assert passages[0].metadata["product_sku"] == "AX-220" and passages[0].score == 1.0
+    assert retriever.stats()["vector_timeouts"] == 1
+
+    # Hilos del motor vectorial ocupados: ni se lanza, y la híbrida no se declara saturada
+    with patch.object(NumpyRetriever, "saturated", new_callable=PropertyMock, return_value=True):
+        assert retriever.saturated is False
+        passages = await retriever.search("inasc", "precio del AX-220", 2)
+    assert passages[0].metadata["product_sku"] == "AX-220"
+    assert retriever.stats()["vector_skipped"] == 1 and retriever.stats()["vector_timeouts"] == 1
+
+
+def test_ingesta_sincroniza_el_indice_lexico(tmp_path):
+    retriever, _ = ingest(tmp_path)
+    worker = LexicalStore(path=str(tmp_path / "lexico"))
+    assert worker.index("inasc").lookup_codes("AX-220")
+
+    rows = [dict(ROWS[0], descripcion="Turbidímetro con Bluetooth."), *ROWS[2:]]
+    report = CatalogIngestor(retriever).run("inasc", [row_to_product(row) for row in rows])
+    assert (report.changed, report.removed, report.lexical) == (1, 1, 2)
+    assert worker.index("inasc").lookup_codes("AX-220") == []
+    assert worker.index("inasc").search("bluetooth", 1)[0][0] == "i3_productos:TN-100#0"
+
+    # Corrida cortada antes de guardar el índice léxico: la siguiente lo reconstruye aunque los vectores estén al día
+    os.remove(tmp_path / "lexico" / "inasc.json")
+    report = CatalogIngestor(retriever).run("inasc", [row_to_product(row) for row in rows])
+    assert (report.skipped, report.lexical) == (3, 3)
+    assert worker.index("inasc").lookup_codes("TN-100") == ["i3_productos:TN-100#0"]
+
+
+@pytest.mark.asyncio
+async def test_get_carga_el_indice_fuera_del_event_loop(tmp_path):
+    retriever, _ = ingest(tmp_path)
+    worker = LexicalStore(path=str(tmp_path / "lexico"), refresh_seconds=60)
+    loaders = []
+    original = LexicalIndex.from_dict
+
+    def from_dict(data):
+        loaders.append(threading.current_thread())
+        return original(data)
+
+    with patch.object(LexicalIndex, "from_dict", side_effect=from_dict):
+        assert (await worker.get("inasc")).lookup_codes("AX-220")
+        assert loaders and threading.main_thread() not in loaders
+
+        # La ingesta cambia el archivo: dentro de refresh_seconds se sigue usando el de memoria, sin revisar el disco
+        rows = [dict(ROWS[0], descripcion="Turbidímetro con Bluetooth."), *ROWS[2:]]
+        CatalogIngestor(retriever).run("inasc", [row_to_product(row) for row in rows])
+        with patch.object(worker, "_version", side_effect=AssertionError("no debería tocar el disco")):
+            assert (await worker.get("inasc")).lookup_codes("AX-220")
+
+        worker.refresh_seconds = 0
+        assert (await worker.get("inasc")).lookup_codes("AX-220") == []
+    assert len(loaders) == 2 and threading.main_thread() not in loaders
@@ -0,0 +1,92 @@
+"""
+Tests unitarios para IdentityCache (caché en proceso usuario → conversación).
+
+Cubre:
+- Hit / miss y expiración por TTL
+- Desalojo LRU al superar el tope
+- Invalidación por conversación (y desde set_conversation_status)
+- load_conversation_context evita los SELECT de identidad en un hit
+"""
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from src.database.identity_cache import CachedIdentity, IdentityCache, identity_cache
+from src.models.message import IncomingMessage
+
+KEY = ("t1", "telegram", "u1")
+
+
+def test_hit_y_miss():
+    cache = IdentityCache(max_entries=10, ttl_seconds=60)
+    assert cache.get(KEY) is None
+
+    cache.put(KEY, CachedIdentity(user_id=1, conversation_id=7, status="active"))
+    assert cache.get(KEY) == CachedIdentity(1, 7, "active")
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_entrada_expirada_es_miss():
+    cache = IdentityCache(max_entries=10, ttl_seconds=60)
+    cache.put(KEY, CachedIdentity(1, 7, "active"))
+
+    with patch("src.database.identity_cache.time.monotonic", return_value=10**9):
+        assert cache.get(KEY) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_desalojo_lru():
+    cache = IdentityCache(max_entries=2, ttl_seconds=60)
+    cache.put(("t1", "web", "a"), CachedIdentity(1, 1, "active"))
+    cache.put(("t1", "web", "b"), CachedIdentity(2, 2, "active"))
+    cache.get(("t1", "web", "a"))  # 'a' pasa a ser el más reciente
+    cache.put(("t1", "web", "c"), CachedIdentity(3, 3, "active"))
+
+    assert cache.get(("t1", "web", "b")) is None
+    assert cache.get(("t1", "web", "a")) is not None
+    assert cache.get(("t1", "web", "c")) is not None
+
+
+def test_invalidate_conversation_respeta_el_tenant():
+    cache = IdentityCache(max_entries=10, ttl_seconds=60)
+    cache.put(KEY, CachedIdentity(1, 7, "active"))
+
+    cache.invalidate_conversation("otro_tenant", 7)
+    assert cache.get(KEY) is not None
+
+    cache.invalidate_conversation("t1", 7)
+    assert cache.get(KEY) is None
+    assert cache.stats()["invalidations"] == 1
+
+
+@pytest.mark.asyncio
+async def test_set_conversation_status_invalida_la_cache():
+    """Un handoff debe verse en el siguiente mensaje aunque la identidad esté en caché."""
+    from src.database.crud import set_conversation_status
+
+    identity_cache.put(KEY, CachedIdentity(1, 7, "active"))
+
+    mock_result = MagicMock()
+    mock_result.scalars.return_value.first.return_value = MagicMock()
+    session = AsyncMock()
+    session.execute = AsyncMock(return_value=mock_result)
+
+    await set_conversation_status(session, 7, "t1", "handed_off")
+    assert identity_cache.get(KEY) is None
+
+
+@pytest.mark.asyncio
+async def test_load_conversation_context_en_hit_solo_consulta_historial():
+    from src.database.crud import load_conversation_context
+
+    identity_cache.put(KEY, CachedIdentity(1, 7, "handed_off"))
+    message = IncomingMessage(platform="telegram", platform_user_id="u1", tenant_id="t1", content="hola")
+
+    with patch("src.database.crud.get_conversation_history", new=AsyncMock(return_value=[])) as history:
+        user, conversation, context = await load_conversation_context(AsyncMock(), message, history_limit=10)
+
+    history.assert_awaited_once()
+    assert user.id == 1
+    assert conversation.id == 7
+    assert conversation.status == "handed_off"
+    assert context == []
@@ -1,3 +1,5 @@
+import asyncio
+
 import pytest
 from unittest.mock import AsyncMock, patch, MagicMock
 from src.core.llm import LLMEngine, SYSTEM_PROMPT
@@ -58,3 +60,120 @@ async def test_generate_response_exception(llm_engine):
         result = await llm_engine.generate_response([{"role": "user", "content": "Hola"}], tenant_id="inasc_1")
         
         assert "interferencia en mis sistemas centrales" in result
+
+
+def make_stream_chunk(content, finish_reason=None):
+    chunk = MagicMock()
+    choice = MagicMock()
+    choice.delta.content = content
+    choice.finish_reason = finish_reason
+    chunk.choices = [choice]
+    return chunk
+
+
+class FakeStream:
+    """Imita el AsyncStream de openai: iterable asíncrono de chunks."""
+    def __init__(self, chunks, error=None, delay=0.0):
+        self._chunks = chunks
+        self._error = error
+        self._delay = delay
+        self.closed = False
+
+    def __aiter__(self):
+        return self._gen()
+
+    async def _gen(self):
+        for chunk in self._chunks:
+            await asyncio.sleep(self._delay)
+            yield chunk
+        if self._error:
+            raise self._error
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.mark.asyncio
+async def test_stream_response_produce_deltas(llm_engine):
+    """El modo streaming produce cada fragmento y omite chunks vacíos."""
+    chunks = [make_stream_chunk("Hola"), make_stream_chunk(None), make_stream_chunk(", ¿en qué"), make_stream_chunk(" ayudo?")]
+    with patch.object(llm_engine.client.chat.completions, 'create', new_callable=AsyncMock) as mock_create:
+        mock_create.return_value = FakeStream(chunks)
+
+        deltas = [d async for d in llm_engine.stream_response([{"role": "user", "content": "Hola"}])]
+
+    assert deltas == ["Hola", ", ¿en qué", " ayudo?"]
+    call_args = mock_create.call_args[1]
+    assert call_args['stream'] is True
+    assert call_args['messages'][0]['content'] == SYSTEM_PROMPT
+
+
+@pytest.mark.asyncio
+async def test_stream_response_fallback_si_falla_antes_del_primer_delta(llm_engine):
+    with patch.object(llm_engine.client.chat.completions, 'create', new_callable=AsyncMock) as mock_create:
+        mock_create.side_effect = Exception("Connection Timeout")
+
+        deltas = [d async for d in llm_engine.stream_response([{"role": "user", "content": "Hola"}])]
+
+    assert len(deltas) == 1
+    assert "interferencia en mis sistemas centrales" in deltas[0]
+
+
+@pytest.mark.asyncio
+async def test_stream_response_corte_a_mitad_conserva_lo_recibido(llm_engine):
+    with patch.object(llm_engine.client.chat.completions, 'create', new_callable=AsyncMock) as mock_create:
+        mock_create.return_value = FakeStream([make_stream_chunk("Parcial")], error=Exception("reset"))
+
+        deltas = [d async for d in llm_engine.stream_response([{"role": "user", "content": "Hola"}])]
+
+    assert deltas == ["Parcial"]
+
+
+@pytest.mark.asyncio
+async def test_stream_response_lento_se_corta_al_vencer_el_deadline(llm_engine, monkeypatch):
+    """El deadline cubre toda la lectura del stream, no solo su establecimiento."""
+    monkeypatch.setattr("src.core.llm.LLM_DEADLINE_SECONDS", 0.3)
+    stream = FakeStream([make_stream_chunk(f"t{i} ") for i in range(20)], delay=0.1)
+    with patch.object(llm_engine.client.chat.completions, 'create', new_callable=AsyncMock) as mock_create:
+        mock_create.return_value = stream
+        deltas = [d async for d in llm_engine.stream_response([{"role": "user", "content": "Hola"}])]
+
+    assert 1 <= len(deltas) <= 3
+    assert stream.closed
+    assert llm_engine.response_cache.stats()["entries"] == 0
+
+
+@pytest.mark.asyncio
+async def test_stream_response_solo_guarda_en_cache_un_stream_completo(llm_engine):
+    """Un stream que termina sin finish_reason 'stop' (cortado o truncado) no se reutiliza."""
+    question = [{"role": "user", "content": "¿Hacen calibración?"}]
+    with patch.object(llm_engine.client.chat.completions, 'create', new_callable=AsyncMock) as mock_create:
+        mock_create.return_value = FakeStream([make_stream_chunk("Sí, calib"), make_stream_chunk(None, "length")])
+        assert [d async for d in llm_engine.stream_response(question, tenant_id="t1")] == ["Sí, calib"]
+        assert llm_engine.response_cache.stats()["entries"] == 0
+
+        mock_create.return_value = FakeStream([make_stream_chunk("Sí, ofrecemos calibración."), make_stream_chunk(None, "stop")])
+        [d async for d in llm_engine.stream_response(question, tenant_id="t1")]
+        assert [d async for d in llm_engine.stream_response(question, tenant_id="t1")] == ["Sí, ofrecemos calibración."]
+
+    assert mock_create.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_generate_response_usa_cache_en_pregunta_repetida(llm_engine):
+    """La segunda pregunta idéntica (normalizada) no llama a DeepSeek."""
+    with patch.object(llm_engine.client.chat.completions, 'create', new_callable=AsyncMock) as mock_create:
+        mock_message = MagicMock()
+        mock_message.content = "Sí, ofrecemos calibración acreditada."
+        mock_choice = MagicMock()
+        mock_choice.message = mock_message
+        mock_response = MagicMock()
+        mock_response.choices = [mock_choice]
+        mock_create.return_value = mock_response
+
+        first = await llm_engine.generate_response([{"role": "user", "content": "¿Hacen calibración?"}], tenant_id="t1")
+        second = await llm_engine.generate_response([{"role": "user", "content": "hacen calibracion"}], tenant_id="t1")
+
+    assert first == second
+    mock_create.assert_called_once()
+    assert llm_engine.response_cache.stats()["hits"] == 1
@@ -0,0 +1,140 @@
+"""
+Tests unitarios para LLMRouter (selección de proveedor por latencia EWMA y failover).
+
+Cubre:
+- Registro de proveedores desde JSON y overrides por tenant
+- Failover al siguiente proveedor cuando el mejor falla
+- Un proveedor con el circuito abierto no recibe tráfico
+- Se prefiere el proveedor con menor latencia observada
+- Un tenant con override solo usa sus proveedores
+- Todo el failover comparte un único deadline (cada proveedor recibe lo que queda)
+- Un error del request (400) no hace failover ni cuenta como fallo del proveedor
+"""
+import asyncio
+import time
+
+import openai
+import pytest
+
+from src.core.llm import LLMEngine
+from src.core.llm_router import (
+    LLMRouter,
+    Provider,
+    ProviderConfig,
+    load_provider_configs,
+    parse_tenant_providers,
+)
+from src.core.resilience import CircuitBreaker, DeadlineExceededError, ResilientCaller
+from tests.fakes.fake_openai_server import FakeOpenAIServer, Step
+
+CONTEXT = [{"role": "user", "content": "¿tienen turbidímetros?"}]
+
+
+def make_provider(name, server, breaker=None, deadline=2.0):
+    resilience = ResilientCaller(deadline=deadline, attempt_timeout=deadline, max_attempts=1, hedge=False, breaker=breaker)
+    config = ProviderConfig(name=name, base_url=server.base_url, model=f"{name}-model")
+    return Provider(config, http_client=server.http_client(), resilience=resilience)
+
+
+def make_engine(*providers, tenant_providers=None):
+    engine = LLMEngine(providers=[p.config for p in providers])
+    engine.router = LLMRouter(list(providers), tenant_providers=tenant_providers or {}, explore=0.0)
+    engine.response_cache.max_entries = 0
+    return engine
+
+
+def test_registro_y_overrides_desde_env():
+    configs = load_provider_configs(
+        '[{"name": "deepseek", "base_url": "https://api.deepseek.com", "model": "deepseek-chat"},'
+        ' {"name": "local", "base_url": "http://vllm:8000/v1", "model": "qwen", "api_key_env": "LOCAL_KEY"}]'
+    )
+    assert [c.name for c in configs] == ["deepseek", "local"]
+    assert configs[1].api_key_env == "LOCAL_KEY"
+    assert load_provider_configs("")[0].model == "deepseek-chat"
+    assert parse_tenant_providers("inasc_001:local|deepseek, otro:local") == {
+        "inasc_001": ["local", "deepseek"], "otro": ["local"]
+    }
+
+
+@pytest.mark.asyncio
+async def test_failover_si_el_proveedor_falla():
+    primary, backup = FakeOpenAIServer(default=Step(status=503)), FakeOpenAIServer(default=Step(content="desde backup"))
+    engine = make_engine(make_provider("deepseek", primary), make_provider("local", backup))
+
+    assert await engine.generate_response(CONTEXT) == "desde backup"
+    assert backup.requests[0]["model"] == "local-model"
+    stats = engine.router.stats()
+    assert stats["failovers"] == 1
+    assert stats["providers"]["deepseek"]["errors"] == 1
+
+
+@pytest.mark.asyncio
+async def test_circuito_abierto_no_recibe_trafico():
+    primary, backup = FakeOpenAIServer(), FakeOpenAIServer(default=Step(content="desde backup"))
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    breaker.record_failure()
+    engine = make_engine(make_provider("deepseek", primary, breaker=breaker), make_provider("local", backup))
+
+    assert await engine.generate_response(CONTEXT) == "desde backup"
+    assert primary.requests == []
+    assert engine.router.stats()["failovers"] == 0
+
+
+@pytest.mark.asyncio
+async def test_prefiere_el_proveedor_mas_rapido():
+    slow, fast = FakeOpenAIServer(default=Step(delay=0.05, content="lento")), FakeOpenAIServer(default=Step(content="rápido"))
+    engine = make_engine(make_provider("slow", slow), make_provider("fast", fast))
+
+    # Las dos primeras llamadas exploran cada proveedor sin muestras; luego gana el rápido
+    answers = [await engine.generate_response(CONTEXT) for _ in range(5)]
+    assert answers[-3:] == ["rápido"] * 3
+    assert len(slow.requests) == 1
+
+
+@pytest.mark.asyncio
+async def test_override_por_tenant():
+    shared, private = FakeOpenAIServer(default=Step(content="compartido")), FakeOpenAIServer(default=Step(content="privado"))
+    engine = make_engine(
+        make_provider("deepseek", shared), make_provider("selfhosted", private),
+        tenant_providers={"banco_x": ["selfhosted"]},
+    )
+
+    assert await engine.generate_response(CONTEXT, tenant_id="banco_x") == "privado"
+    assert await engine.generate_response(CONTEXT, tenant_id="inasc_001") == "compartido"
+
+
+@pytest.mark.asyncio
+async def test_el_failover_comparte_un_unico_deadline():
+    slow_a, slow_b = FakeOpenAIServer(default=Step(delay=1.0)), FakeOpenAIServer(default=Step(delay=1.0))
+    router = LLMRouter(
+        [make_provider("a", slow_a, deadline=5.0), make_provider("b", slow_b, deadline=5.0)],
+        tenant_providers={}, explore=0.0, deadline=0.3,
+    )
+
+    def request(provider):
+        return provider.client.chat.completions.create(model=provider.model, messages=CONTEXT)
+
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceededError):
+        await router.call("t1", request)
+    # Cada proveedor tiene 5 s propios, pero la llamada completa no pasa de 0.3 s
+    assert time.monotonic() - started < 0.6
+
+    # Un deadline que ya venció no intenta ningún proveedor
+    requests = len(slow_a.requests) + len(slow_b.requests)
+    with pytest.raises(DeadlineExceededError):
+        await router.call("t1", request, deadline_at=asyncio.get_running_loop().time())
+    assert len(slow_a.requests) + len(slow_b.requests) == requests
+
+
+@pytest.mark.asyncio
+async def test_error_del_request_no_hace_failover():
+    primary, backup = FakeOpenAIServer(default=Step(status=400)), FakeOpenAIServer(default=Step(content="desde backup"))
+    router = LLMRouter([make_provider("deepseek", primary), make_provider("local", backup)], tenant_providers={}, explore=0.0)
+
+    with pytest.raises(openai.BadRequestError):
+        await router.call("t1", lambda provider: provider.client.chat.completions.create(model=provider.model, messages=CONTEXT))
+    assert backup.requests == []
+    stats = router.stats()
+    assert stats["failovers"] == 0
+    assert stats["providers"]["deepseek"]["errors"] == 0 and stats["providers"]["deepseek"]["requests"] == 0
@@ -0,0 +1,55 @@
+"""
+Tests unitarios para el tráfico del harness de carga (tests/load/traffic.py).
+
+Cubre:
+- Guardar y leer JSONL conserva los eventos (y omite 'at' si no viene)
+- Un canal desconocido se rechaza con el número de línea
+- La generación es determinista y no dispara un handoff
+- schedule() usa --rps o el ritmo grabado, escalado con speed
+"""
+import pytest
+
+from src.core.handoff.handoff_service import HANDOFF_KEYWORDS
+from tests.load.traffic import QUESTIONS, TrafficEvent, generate_traffic, load_traffic, save_traffic, schedule
+
+
+def test_jsonl_ida_y_vuelta(tmp_path):
+    events = [
+        TrafficEvent(channel="telegram", user="u1", text="¿Tienen pHmetros?", at=0.5),
+        TrafficEvent(channel="ws", user="u2", text="Hola"),
+    ]
+    path = tmp_path / "trafico.jsonl"
+    save_traffic(events, path)
+
+    assert '"at"' not in path.read_text(encoding="utf-8").splitlines()[1]
+    assert load_traffic(path) == events
+
+
+def test_canal_desconocido(tmp_path):
+    path = tmp_path / "trafico.jsonl"
+    path.write_text('{"channel": "ws", "user": "u1", "text": "a"}\n\n{"channel": "fax", "user": "u1", "text": "b"}\n')
+
+    with pytest.raises(ValueError, match=":3:"):
+        load_traffic(path)
+
+
+def test_generacion_determinista_y_sin_handoff():
+    events = generate_traffic(50, users=8, channels=("telegram", "whatsapp"))
+
+    assert events == generate_traffic(50, users=8, channels=("telegram", "whatsapp"))
+    assert {e.channel for e in events} == {"telegram", "whatsapp"}
+    # Cada prospecto conserva su canal y arranca por la primera pregunta
+    first = {}
+    for event in events:
+        first.setdefault(event.user, event)
+        assert event.channel == first[event.user].channel
+    assert all(e.text == QUESTIONS[0] for e in first.values())
+    assert not any(k in q.lower() for q in QUESTIONS for k in HANDOFF_KEYWORDS)
+
+
+def test_schedule_por_rps_o_ritmo_grabado():
+    sin_at = [TrafficEvent("ws", "u1", "a"), TrafficEvent("ws", "u1", "b"), TrafficEvent("ws", "u1", "c")]
+    assert schedule(sin_at, rps=4) == [0.0, 0.25, 0.5]
+
+    grabado = [TrafficEvent("ws", "u1", "a", at=0.0), TrafficEvent("ws", "u1", "b", at=3.0)]
+    assert schedule(grabado, rps=100, speed=2) == [0.0, 1.5]
@@ -0,0 +1,184 @@
+"""
+Tests unitarios para NumpyRetriever (índice .npy mapeado en memoria).
+
+Cubre:
+- upsert() + search(): top-k por similitud coseno, del más al menos parecido
+- int8: mismas posiciones y similitudes a ~0.02 de float32
+- delete() es un tombstone (sale de search() y de fingerprints()) y compacta pasado el umbral
+- La matriz crece al doble sin perder filas; upsert() de un id existente agrega una fila y deja tombstone
+- Un lector con la versión anterior ve filas y vectores consistentes mientras la ingesta escribe o compacta
+- Otra instancia (otro worker) ve los cambios de la ingesta sin reiniciar
+- CatalogIngestor indexa en NumpyRetriever y RAG_BACKEND="numpy" lo construye
+"""
+import zlib
+
+import numpy as np
+import pytest
+from unittest.mock import patch
+
+from src.core.retrieval import numpy_retriever
+from src.core.retrieval.catalog_retrieval import build_retriever
+from src.core.retrieval.ingestion import CatalogIngestor, row_to_product
+from src.core.retrieval.numpy_retriever import NumpyRetriever
+
+DOCS = {
+    "tn": "turbidímetro portátil rango 0-1000 NTU",
+    "ph": "phmetro de mesa con compensación de temperatura",
+    "bal": "balanza analítica de precisión 0,1 mg",
+    "col": "columna hplc c18 de fase reversa",
+}
+
+
+class BagOfWordsEmbedder:
+    """Embeddings deterministas: bolsa de palabras en 64 dimensiones, normalizada."""
+    model_name = "bolsa-de-palabras"
+
+    def embed(self, texts):
+        vectors = []
+        for text in texts:
+            vector = np.zeros(64)
+            for word in text.lower().split():
+                vector[zlib.crc32(word.encode()) % 64] += 1
+            vectors.append((vector / (np.linalg.norm(vector) or 1)).tolist())
+        return vectors
+
+    def embed_query(self, query):
+        [vector] = self.embed([query])
+        return vector
+
+    def warm_up(self):
+        pass
+
+    def stats(self):
+        return {"model": self.model_name, "cache": None}
+
+
+def make_retriever(tmp_path, **kwargs):
+    return NumpyRetriever(path=str(tmp_path), embedder=BagOfWordsEmbedder(), **kwargs)
+
+
+def fill(retriever, docs=DOCS, catalog="inasc"):
+    ids = list(docs)
+    texts = list(docs.values())
+    metadatas = [{"name": chunk_id, "content_hash": f"h-{chunk_id}"} for chunk_id in ids]
+    retriever.upsert(catalog, ids, texts, retriever.embedder.embed(texts), metadatas)
+
+
+@pytest.mark.asyncio
+async def test_busca_el_top_k_por_similitud(tmp_path):
+    retriever = make_retriever(tmp_path)
+    assert await retriever.search("inasc", "turbidímetro", 2) == []
+    fill(retriever)
+
+    passages = await retriever.search("inasc", "turbidímetro portátil", 2)
+    assert len(passages) == 2 and passages[0].id == "tn"
+    assert passages[0].score > passages[1].score
+    assert passages[0].metadata == {"name": "tn", "content_hash": "h-tn"}
+    assert [p.id for p in await retriever.search("inasc", "columna hplc c18", 10)][0] == "col"
+    assert len(await retriever.search("inasc", "columna", 10)) == 4
+
+
+@pytest.mark.asyncio
+async def test_int8_aproxima_a_float32(tmp_path):
+    exact = make_retriever(tmp_path / "f32")
+    quantized = make_retriever(tmp_path / "i8", dtype="int8")
+    fill(exact)
+    fill(quantized)
+    assert np.load(tmp_path / "i8" / "inasc" / "vectors.npy", mmap_mode="r").dtype == np.int8
+
+    for query in ("turbidímetro portátil", "balanza de precisión", "fase reversa c18"):
+        a = await exact.search("inasc", query, 4)
+        b = {p.id: p.score for p in await quantized.search("inasc", query, 4)}
+        assert all(abs(p.score - b[p.id]) < 0.02 for p in a)
+
+
+@pytest.mark.asyncio
+async def test_delete_es_tombstone_y_compacta(tmp_path):
+    retriever = make_retriever(tmp_path, compact_ratio=0.5)
+    fill(retriever)
+
+    retriever.delete("inasc", ["tn"])
+    assert "tn" not in retriever.fingerprints("inasc")
+    assert "tn" not in [p.id for p in await retriever.search("inasc", "turbidímetro portátil", 4)]
+    assert retriever.index("inasc").count == 4  # tombstone, sin compactar
+
+    retriever.delete("inasc", ["ph", "bal"])
+    index = retriever.index("inasc")
+    assert (index.count, index.live) == (1, 1)
+    assert [p.id for p in await retriever.search("inasc", "columna hplc", 4)] == ["col"]
+
+    # Un id borrado que vuelve a la fuente se indexa de nuevo
+    fill(retriever, {"tn": DOCS["tn"]})
+    assert set(retriever.fingerprints("inasc")) == {"col", "tn"}
+
+
+@pytest.mark.asyncio
+async def test_crece_y_reemplaza_sin_pisar_filas(tmp_path):
+    retriever = make_retriever(tmp_path)
+    with patch.object(numpy_retriever, "MIN_CAPACITY", 2):
+        fill(retriever)
+        assert retriever.index("inasc").vectors.shape[0] == 4
+        fill(retriever, {"ph": "turbidímetro de laboratorio ratio"})
+
+    index = retriever.index("inasc")
+    assert (index.count, index.live, index.vectors.shape[0]) == (5, 4, 8)
+    # Solo queda la matriz de la generación vigente
+    assert sorted(p.name for p in (tmp_path / "inasc").glob("vectors*.npy")) == [f"vectors.{index.generation}.npy"]
+    assert [row["text"] for row in index.rows if row["id"] == "ph" and not row["deleted"]] == ["turbidímetro de laboratorio ratio"]
+    assert [p.id for p in await retriever.search("inasc", "balanza analítica", 1)] == ["bal"]
+    assert [p.id for p in await retriever.search("inasc", "turbidímetro de laboratorio", 1)] == ["ph"]
+
+
+@pytest.mark.asyncio
+async def test_lector_con_la_version_anterior_no_ve_filas_mezcladas(tmp_path):
+    writer = make_retriever(tmp_path, compact_ratio=0.3)
+    reader = make_retriever(tmp_path)
+    fill(writer)
+    before = reader.index("inasc")
+    [ph_vector] = writer.embedder.embed([DOCS["ph"]])
+
+    # Reemplazo: la fila que el lector ya tiene sigue emparejada con su vector
+    fill(writer, {"ph": "balanza de laboratorio"})
+    assert before.rows[before.positions["ph"]]["text"] == DOCS["ph"]
+    assert before.scores(np.asarray(ph_vector, dtype=np.float32))[before.positions["ph"]] == pytest.approx(1.0)
+
+    # Compactación: matriz de otra generación; la mapeada por el lector sigue intacta
+    writer.delete("inasc", ["tn", "bal"])
+    assert writer.index("inasc").generation > before.generation
+    assert before.scores(np.asarray(ph_vector, dtype=np.float32))[before.positions["ph"]] == pytest.approx(1.0)
+
+    after = reader.index("inasc")
+    assert after is not before and (after.count, after.live) == (2, 2)
+    assert [p.id for p in await reader.search("inasc", "balanza de laboratorio", 1)] == ["ph"]
+
+
+@pytest.mark.asyncio
+async def test_otro_worker_ve_los_cambios(tmp_path):
+    writer = make_retriever(tmp_path)
+    reader = make_retriever(tmp_path)
+    fill(writer, {"tn": DOCS["tn"]})
+    assert [p.id for p in await reader.search("inasc", "balanza", 4)] == ["tn"]
+
+    fill(writer, {"bal": DOCS["bal"]})
+    assert [p.id for p in await reader.search("inasc", "balanza analítica", 1)] == ["bal"]
+    assert reader.stats()["catalogs"]["inasc"]["live"] == 2
+
+
+@pytest.mark.asyncio
+async def test_ingesta_en_numpy(tmp_path):
+    retriever = make_retriever(tmp_path)
+    rows = [
+        {"numero_catalogo": "TN-100", "nombre": "Turbidímetro TN-100", "descripcion": "<p>Turbidímetro portátil 0-1000 NTU.</p>"},
+        {"numero_catalogo": "AX-220", "nombre": "Balanza AX-220", "descripcion": "Balanza analítica de 0,1 mg."},
+    ]
+    report = CatalogIngestor(retriever).run("inasc", [row_to_product(row) for row in rows])
+    assert report.added == 2
+
+    [passage] = await retriever.search("inasc", "balanza analítica", 1)
+    assert passage.metadata["product_sku"] == "AX-220"
+    assert CatalogIngestor(retriever).run("inasc", [row_to_product(row) for row in rows]).skipped == 2
+
+    with pytest.raises(ValueError):
+        retriever.upsert("inasc", ["x"], ["x"], [[1.0, 0.0]], [{}])
+    with patch("src.core.retrieval.numpy_retriever.Embedder"):
+        assert isinstance(build_retriever("numpy", hybrid=False), NumpyRetriever)
@@ -0,0 +1,169 @@
+"""
+Tests unitarios para TenantLaneQueue (cola multi-carril por tenant).
+
+Cubre:
+- Orden FIFO dentro de un tenant
+- Reparto equitativo (round robin) y ponderado entre tenants
+- Políticas de desbordamiento: reject, drop_oldest y spill a disco
+- El spill de un proceso anterior se recupera al arrancar (antes que lo nuevo), incluso tras dos
+  reinicios seguidos; con WAL se borra porque lo re-encola el WAL
+- Contabilidad de qsize / task_done
+"""
+import asyncio
+
+import pytest
+
+from src.core.config_utils import parse_tenant_weights
+from src.core.queue_manager import QueueFullError, TenantLaneQueue
+from src.models.message import IncomingMessage
+
+
+def make_message(tenant_id="t1", content="hola", user="u1"):
+    return IncomingMessage(platform="telegram", platform_user_id=user, tenant_id=tenant_id, content=content)
+
+
+async def drain(queue, n):
+    return [await queue.get() for _ in range(n)]
+
+
+def test_parse_tenant_weights():
+    assert parse_tenant_weights("a:3, b:1,c") == {"a": 3.0, "b": 1.0, "c": 1.0}
+    assert parse_tenant_weights("") == {}
+
+
+def test_politica_invalida():
+    with pytest.raises(ValueError):
+        TenantLaneQueue(overflow_policy="ignorar")
+
+
+@pytest.mark.asyncio
+async def test_fifo_dentro_de_un_tenant():
+    queue = TenantLaneQueue(lane_maxsize=10, weights={})
+    for i in range(3):
+        queue.put_nowait(make_message(content=f"m{i}"))
+
+    got = await drain(queue, 3)
+    assert [m.content for m in got] == ["m0", "m1", "m2"]
+    assert queue.qsize() == 0
+
+
+@pytest.mark.asyncio
+async def test_tenant_ruidoso_no_acapara_la_cola():
+    """Con pesos iguales los tenants se alternan aunque uno haya encolado mucho antes."""
+    queue = TenantLaneQueue(lane_maxsize=100, weights={})
+    for i in range(5):
+        queue.put_nowait(make_message(tenant_id="ruidoso", content=f"r{i}"))
+    queue.put_nowait(make_message(tenant_id="tranquilo", content="t0"))
+
+    got = await drain(queue, 3)
+    assert [m.tenant_id for m in got] == ["ruidoso", "tranquilo", "ruidoso"]
+
+
+@pytest.mark.asyncio
+async def test_pesos_del_round_robin():
+    queue = TenantLaneQueue(lane_maxsize=100, weights={"a": 2, "b": 1})
+    for i in range(4):
+        queue.put_nowait(make_message(tenant_id="a"))
+        queue.put_nowait(make_message(tenant_id="b"))
+
+    got = await drain(queue, 6)
+    assert [m.tenant_id for m in got] == ["a", "a", "b", "a", "a", "b"]
+
+
+@pytest.mark.asyncio
+async def test_reject_cuando_el_carril_esta_lleno():
+    queue = TenantLaneQueue(lane_maxsize=2, overflow_policy="reject", weights={})
+    queue.put_nowait(make_message())
+    queue.put_nowait(make_message())
+
+    with pytest.raises(QueueFullError):
+        queue.put_nowait(make_message())
+    # Otro tenant no se ve afectado
+    queue.put_nowait(make_message(tenant_id="t2"))
+
+    assert queue.qsize() == 3
+    assert queue.stats()["lanes"]["t1"]["rejected"] == 1
+
+
+@pytest.mark.asyncio
+async def test_drop_oldest_descarta_el_mas_antiguo():
+    queue = TenantLaneQueue(lane_maxsize=2, overflow_policy="drop_oldest", weights={})
+    for i in range(3):
+        queue.put_nowait(make_message(content=f"m{i}"))
+
+    got = await drain(queue, 2)
+    assert [m.content for m in got] == ["m1", "m2"]
+    assert queue.stats()["lanes"]["t1"]["dropped"] == 1
+
+
+@pytest.mark.asyncio
+async def test_spill_a_disco_conserva_orden_y_acota_memoria(tmp_path):
+    queue = TenantLaneQueue(lane_maxsize=2, overflow_policy="spill", spill_dir=str(tmp_path), weights={})
+    for i in range(6):
+        queue.put_nowait(make_message(content=f"m{i}"))
+
+    lane_stats = queue.stats()["lanes"]["t1"]
+    assert lane_stats["in_memory"] == 2
+    assert lane_stats["spilled"] == 4
+    assert queue.qsize() == 6
+
+    got = await drain(queue, 6)
+    assert [m.content for m in got] == [f"m{i}" for i in range(6)]
+    assert list(tmp_path.iterdir()) == []
+
+
+def make_spill_queue(tmp_path, **kwargs):
+    return TenantLaneQueue(lane_maxsize=1, overflow_policy="spill", spill_dir=str(tmp_path), weights={}, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_spill_de_un_proceso_anterior_se_recupera(tmp_path):
+    previous = make_spill_queue(tmp_path)
+    for i in range(3):
+        previous.put_nowait(make_message(content=f"old{i}"))  # old0 en memoria (se pierde sin WAL), old1-2 en disco
+
+    # Dos reinicios seguidos sin consumir: el segundo no pisa lo que recuperó el primero
+    make_spill_queue(tmp_path)
+    queue = make_spill_queue(tmp_path)
+    assert queue.qsize() == 2 and queue.stats()["lanes"]["t1"]["spilled"] == 2
+
+    for i in range(2):
+        queue.put_nowait(make_message(content=f"new{i}"))
+    got = await drain(queue, 4)
+    assert [m.content for m in got] == ["old1", "old2", "new0", "new1"]
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_spill_incompleto_o_con_wal(tmp_path):
+    previous = make_spill_queue(tmp_path)
+    for i in range(3):
+        previous.put_nowait(make_message(content=f"old{i}"))
+    with open(tmp_path / "t1.jsonl", "a", encoding="utf-8") as fh:
+        fh.write('{"platform": "tele')  # escritura cortada por la caída
+
+    assert make_spill_queue(tmp_path).qsize() == 2
+    # Con WAL los mensajes vuelven por el replay: el spill se borra
+    assert make_spill_queue(tmp_path, recover_spills=False).qsize() == 0
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.asyncio
+async def test_get_bloquea_hasta_que_llega_un_mensaje():
+    queue = TenantLaneQueue(lane_maxsize=10, weights={})
+    waiter = asyncio.create_task(queue.get())
+    await asyncio.sleep(0.01)
+    assert not waiter.done()
+
+    queue.put_nowait(make_message(content="tarde"))
+    message = await asyncio.wait_for(waiter, timeout=1)
+    assert message.content == "tarde"
+
+
+@pytest.mark.asyncio
+async def test_task_done_sin_mensajes_falla():
+    queue = TenantLaneQueue(lane_maxsize=10, weights={})
+    queue.put_nowait(make_message())
+    await queue.get()
+    queue.task_done()
+    with pytest.raises(ValueError):
+        queue.task_done()
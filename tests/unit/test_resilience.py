@@ -0,0 +1,130 @@
+"""
+Tests unitarios para la capa de resiliencia del LLM (src/core/resilience.py).
+
+Cubre:
+- Circuit breaker: abre tras N fallos, prueba en half_open y se cierra al recuperarse
+- Reintentos con jitter ante 5xx y sin reintentos ante errores del request (400)
+- Deadline por intento: un proveedor lento no retiene al worker
+- Hedging: la petición de respaldo gana si la primera es lenta
+- LLMEngine contra un servidor falso compatible con OpenAI (httpx.ASGITransport)
+"""
+import asyncio
+import time
+
+import pytest
+
+from src.core.llm import FALLBACK_MESSAGE, LLMEngine
+from src.core.llm_router import ProviderConfig
+from src.core.resilience import CircuitBreaker, CircuitOpenError, DeadlineExceededError, ResilientCaller
+from tests.fakes.fake_openai_server import FakeOpenAIServer, Step
+
+
+def make_engine(server, **resilience):
+    engine = LLMEngine(providers=[ProviderConfig("fake", server.base_url, "fake-model")], http_client=server.http_client())
+    engine.router.primary.resilience = ResilientCaller(
+        **{"deadline": 2.0, "attempt_timeout": 1.0, "backoff_base": 0.0, "hedge": False, **resilience}
+    )
+    engine.response_cache.max_entries = 0
+    return engine
+
+
+def test_breaker_abre_prueba_y_cierra(monkeypatch):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+    now = time.monotonic()
+    monkeypatch.setattr("src.core.resilience.time.monotonic", lambda: now + 11)
+    assert breaker.state == "half_open"
+    assert breaker.allow()          # una sola prueba
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+@pytest.mark.asyncio
+async def test_reintenta_errores_5xx_y_luego_responde():
+    server = FakeOpenAIServer()
+    server.script = [Step(status=503), Step(status=500), Step(content="Sí, tenemos pHmetros.")]
+    engine = make_engine(server, max_attempts=3)
+
+    assert await engine.generate_response([{"role": "user", "content": "hola"}]) == "Sí, tenemos pHmetros."
+    assert len(server.requests) == 3
+    assert engine.router.primary.resilience.stats()["retries"] == 2
+
+
+@pytest.mark.asyncio
+async def test_error_del_request_no_se_reintenta():
+    server = FakeOpenAIServer()
+    server.script = [Step(status=400)]
+    engine = make_engine(server, max_attempts=3)
+
+    assert await engine.generate_response([{"role": "user", "content": "hola"}]) == FALLBACK_MESSAGE
+    assert len(server.requests) == 1
+    assert engine.router.primary.resilience.breaker.state == "closed"
+
+
+@pytest.mark.asyncio
+async def test_proveedor_lento_respeta_el_deadline():
+    server = FakeOpenAIServer(default=Step(delay=5))
+    engine = make_engine(server, deadline=0.3, attempt_timeout=0.1, max_attempts=5)
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    assert await engine.generate_response([{"role": "user", "content": "hola"}]) == FALLBACK_MESSAGE
+    assert loop.time() - started < 1.0
+    assert engine.router.primary.resilience.stats()["deadline_exceeded"] == 1
+
+
+@pytest.mark.asyncio
+async def test_circuito_abierto_falla_rapido_sin_llamar_al_proveedor():
+    server = FakeOpenAIServer(default=Step(status=503))
+    engine = make_engine(server, max_attempts=1, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60))
+
+    for _ in range(2):
+        await engine.generate_response([{"role": "user", "content": "hola"}])
+    calls_before = len(server.requests)
+
+    assert await engine.generate_response([{"role": "user", "content": "hola"}]) == FALLBACK_MESSAGE
+    assert len(server.requests) == calls_before
+    stats = engine.router.primary.resilience.stats()
+    assert stats["state"] == "open"
+    assert stats["short_circuited"] == 1
+
+
+@pytest.mark.asyncio
+async def test_hedging_gana_la_peticion_de_respaldo():
+    server = FakeOpenAIServer()
+    server.script = [Step(delay=1.0, content="lenta"), Step(content="rápida")]
+    engine = make_engine(server, hedge=True, hedge_min_delay=0.05, attempt_timeout=2.0)
+
+    assert await engine.generate_response([{"role": "user", "content": "hola"}]) == "rápida"
+    stats = engine.router.primary.resilience.stats()
+    assert stats["hedges"] == 1
+    assert stats["hedge_wins"] == 1
+
+
+@pytest.mark.asyncio
+async def test_caller_propaga_circuit_open():
+    caller = ResilientCaller(breaker=CircuitBreaker(failure_threshold=1, reset_timeout=60), max_attempts=1)
+
+    async def boom():
+        raise asyncio.TimeoutError()
+
+    with pytest.raises(DeadlineExceededError):
+        await caller.call(boom)
+    with pytest.raises(CircuitOpenError):
+        await caller.call(boom)
+
+
+@pytest.mark.asyncio
+async def test_stream_contra_el_servidor_falso():
+    server = FakeOpenAIServer(default=Step(content="Sí tenemos balanzas"))
+    engine = make_engine(server)
+
+    deltas = [d async for d in engine.stream_response([{"role": "user", "content": "hola"}])]
+    assert "".join(deltas) == "Sí tenemos balanzas"
+    assert server.requests[0]["stream"] is True
@@ -0,0 +1,107 @@
+"""
+Tests unitarios para ResponseCache (caché de respuestas del LLM por tenant).
+
+Cubre:
+- Normalización (mayúsculas, tildes, signos)
+- Aislamiento por tenant y por contexto previo completo (mensajes de sistema incluidos)
+- Conversaciones con más de context_turns turnos previos no se cachean (respuesta personalizada)
+- Bypass en temas propensos a handoff; nunca guarda respuestas con la señal ni FALLBACK_MESSAGE
+- Expiración por TTL y desalojo LRU
+"""
+import pytest
+
+from src.core.handoff.handoff_service import HANDOFF_SIGNAL
+from src.core.response_cache import FALLBACK_MESSAGE, ResponseCache, normalize_text
+
+
+def turn(content, role="user"):
+    return {"role": role, "content": content}
+
+
+@pytest.fixture
+def cache():
+    return ResponseCache(max_entries=3, ttl_seconds=60, context_turns=2)
+
+
+def test_normalize_text():
+    assert normalize_text("¿Hacen  CALIBRACIÓN?") == "hacen calibracion"
+
+
+def test_variantes_triviales_comparten_llave(cache):
+    key = cache.make_key("t1", [turn("¿Hacen calibración?")])
+    cache.put(key, "Sí, calibramos balanzas.")
+    assert cache.get(cache.make_key("t1", [turn("hacen calibracion")])) == "Sí, calibramos balanzas."
+    assert cache.stats()["hits"] == 1
+
+
+def test_aislado_por_tenant(cache):
+    cache.put(cache.make_key("t1", [turn("¿dónde están ubicados?")]), "Bogotá")
+    assert cache.get(cache.make_key("t2", [turn("¿dónde están ubicados?")])) is None
+
+
+def test_contexto_previo_forma_parte_de_la_llave(cache):
+    ctx_a = [turn("busco pHmetros"), turn("Tenemos varios", "assistant"), turn("¿y portátiles?")]
+    ctx_b = [turn("busco balanzas"), turn("Tenemos varias", "assistant"), turn("¿y portátiles?")]
+    cache.put(cache.make_key("t1", ctx_a), "pHmetro portátil X")
+    assert cache.get(cache.make_key("t1", ctx_b)) is None
+
+
+def test_contexto_incluye_mensajes_de_sistema(cache):
+    question = [turn("hola"), turn("¡Hola!", "assistant"), turn("¿y portátiles?")]
+    summary = turn("Resumen de la conversación hasta ahora: Ana, de Aguas del Sur, busca pHmetros.", "system")
+    assert cache.make_key("t1", question) != cache.make_key("t1", [summary] + question)
+
+
+def test_conversacion_larga_no_se_cachea(cache):
+    ctx = [turn("busco pHmetros"), turn("Tenemos varios", "assistant"), turn("para campo"), turn("¿y portátiles?")]
+    assert cache.make_key("t1", ctx) is None
+    assert cache.make_key("t1", ctx[-3:]) is not None
+    assert cache.stats()["personal"] == 1
+
+
+def test_bypass_en_temas_de_handoff(cache):
+    assert cache.make_key("t1", [turn("quiero un asesor")]) is None
+    assert cache.make_key("t1", [turn("¿Cuál es el precio?")]) is None
+    assert cache.stats()["bypassed"] == 2
+
+
+def test_no_guarda_respuestas_con_senal(cache):
+    key = cache.make_key("t1", [turn("necesito soporte con mi equipo")])
+    cache.put(key, f"{HANDOFF_SIGNAL} Un asesor te contactará.")
+    assert cache.get(key) is None
+
+
+def test_no_guarda_la_respuesta_de_contingencia(cache):
+    key = cache.make_key("t1", [turn("¿hacen calibración?")])
+    cache.put(key, FALLBACK_MESSAGE)
+    assert cache.get(key) is None
+
+
+def test_ultimo_turno_debe_ser_del_usuario(cache):
+    assert cache.make_key("t1", [turn("hola"), turn("¡Hola!", "assistant")]) is None
+
+
+def test_ttl_expira(cache, monkeypatch):
+    key = cache.make_key("t1", [turn("hola")])
+    cache.put(key, "¡Hola!")
+    import src.core.response_cache as module
+    real = module.time.monotonic()
+    monkeypatch.setattr(module.time, "monotonic", lambda: real + 120)
+    assert cache.get(key) is None
+
+
+def test_desalojo_lru(cache):
+    keys = [cache.make_key("t1", [turn(f"pregunta {i}")]) for i in range(4)]
+    for i, key in enumerate(keys[:3]):
+        cache.put(key, f"r{i}")
+    cache.get(keys[0])  # pregunta 0 pasa a ser la más reciente
+    cache.put(keys[3], "r3")
+
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) == "r0"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_desactivada_con_cero_entradas():
+    cache = ResponseCache(max_entries=0)
+    assert cache.make_key("t1", [turn("hola")]) is None
@@ -0,0 +1,105 @@
+"""
+Tests unitarios para las transacciones cortas de process_message_batch() en main.py.
+
+Cubre:
+- Ninguna sesión de BD queda abierta mientras se espera al LLM
+- Los entrantes se confirman antes de llamar al LLM
+- Si el status cambia a handoff durante la llamada, la respuesta del bot se descarta
+  (en el canal web se cierra el turno con un frame abort)
+- Si el usuario pide un asesor (Trigger A) se hace el handoff sin llamar al LLM
+"""
+import pytest
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from src.main import process_message_batch
+from src.models.message import IncomingMessage
+
+
+def make_message(content="¿tienen balanzas?", platform="telegram"):
+    return IncomingMessage(platform=platform, platform_user_id="tg_1", tenant_id="t1", content=content)
+
+
+class FakeSessions:
+    """Fábrica de sesiones que registra cuántas hay abiertas y sus commits."""
+
+    def __init__(self):
+        self.open = 0
+        self.commits = []
+
+    @asynccontextmanager
+    async def __call__(self):
+        session = AsyncMock()
+        session.commit = AsyncMock(side_effect=lambda: self.commits.append(self.open))
+        self.open += 1
+        try:
+            yield session
+        finally:
+            self.open -= 1
+
+
+async def run_turn(locked_status="active", response="Sí, tenemos balanzas.", content="¿tienen balanzas?", platform="telegram"):
+    sessions = FakeSessions()
+    open_during_llm = []
+
+    async def generate_response(context, tenant_id="default", conversation_id=None):
+        open_during_llm.append(sessions.open)
+        return response
+
+    conversation = MagicMock(id=7, status="active", summary=None)
+    with (
+        patch("src.main.async_session_factory", sessions),
+        patch("src.main.crud.load_conversation_context", new=AsyncMock(return_value=(MagicMock(id=1), conversation, []))),
+        patch("src.main.crud.save_message", new_callable=AsyncMock) as save_message,
+        patch("src.main.crud.lock_conversation_status", new=AsyncMock(return_value=locked_status)),
+        patch("src.main.llm_engine.generate_response", side_effect=generate_response),
+        patch("src.main.telegram_responder.send_message", new_callable=AsyncMock) as send_message,
+        patch("src.main.connection_manager.notify_advisors", new_callable=AsyncMock),
+        patch("src.main.queue_manager.mark_task_done"),
+        patch("src.main.handoff_service.execute", new=AsyncMock(return_value="Un asesor te contactará.")),
+    ):
+        await process_message_batch([make_message(content, platform)])
+    return sessions, open_during_llm, save_message, send_message
+
+
+@pytest.mark.asyncio
+async def test_no_hay_sesion_abierta_durante_el_llm():
+    sessions, open_during_llm, save_message, send_message = await run_turn()
+
+    assert open_during_llm == [0]
+    # Dos transacciones: entrantes y respuesta
+    assert len(sessions.commits) == 2
+    roles = [call.kwargs["role"] for call in save_message.await_args_list]
+    assert roles == ["user", "assistant"]
+    send_message.assert_awaited_once_with("tg_1", "Sí, tenemos balanzas.")
+
+
+@pytest.mark.asyncio
+async def test_handoff_durante_el_llm_descarta_la_respuesta():
+    sessions, _, save_message, send_message = await run_turn(locked_status="handed_off")
+
+    roles = [call.kwargs["role"] for call in save_message.await_args_list]
+    assert roles == ["user"]
+    send_message.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_handoff_durante_el_llm_cierra_el_turno_del_widget():
+    with (
+        patch("src.main.connection_manager.send_stream_abort", new_callable=AsyncMock) as send_abort,
+        patch("src.main.connection_manager.send_to_client", new_callable=AsyncMock) as send_to_client,
+    ):
+        await run_turn(locked_status="handed_off", platform="web")
+
+    send_abort.assert_awaited_once_with("tg_1")
+    send_to_client.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_trigger_a_hace_handoff_sin_llamar_al_llm():
+    sessions, open_during_llm, save_message, send_message = await run_turn(content="Quiero un asesor, por favor")
+
+    assert open_during_llm == []
+    assert len(sessions.commits) == 2
+    assert save_message.await_args_list[-1].kwargs["content"] == "Un asesor te contactará."
+    send_message.assert_awaited_once_with("tg_1", "Un asesor te contactará.")
@@ -0,0 +1,113 @@
+"""
+Tests unitarios para ConversationSummarizer (resumen incremental en segundo plano).
+
+Cubre:
+- Las conversaciones cortas nunca disparan un resumen
+- Se integran los mensajes antiguos y se conservan los últimos keep_turns
+- Si el recorte por presupuesto deja turnos fuera de la ventana, se resumen aunque no se llegue a trigger_turns
+- Un fallo del LLM no guarda nada
+- with_summary() antepone el resumen al contexto
+"""
+import pytest
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from src.core.summarizer import ConversationSummarizer, with_summary
+from src.database.identity_cache import CachedIdentity, identity_cache
+
+
+@asynccontextmanager
+async def fake_session_factory():
+    yield AsyncMock()
+
+
+def stored_messages(n):
+    return [MagicMock(id=i + 1, role="user" if i % 2 == 0 else "assistant", content=f"m{i}") for i in range(n)]
+
+
+def make_summarizer(summary="Cliente busca pHmetros."):
+    llm = MagicMock()
+    llm.summarize = AsyncMock(return_value=summary)
+    summarizer = ConversationSummarizer(
+        llm=llm, session_factory=fake_session_factory, trigger_turns=8, keep_turns=4
+    )
+    return summarizer, llm
+
+
+def test_with_summary():
+    context = [{"role": "user", "content": "hola"}]
+    assert with_summary(None, context) is context
+    assert with_summary("resumen", context)[0] == {
+        "role": "system", "content": "Resumen de la conversación hasta ahora: resumen"
+    }
+
+
+@pytest.mark.asyncio
+async def test_conversacion_corta_no_dispara_resumen():
+    summarizer, llm = make_summarizer()
+    summarizer.note_turn("t1", 7, new_messages=2, known_messages=3)
+    assert summarizer.stats()["in_flight"] == 0
+    assert summarizer.stats()["tracked_conversations"] == 0
+
+
+@pytest.mark.asyncio
+async def test_integra_mensajes_antiguos_y_conserva_los_recientes():
+    summarizer, llm = make_summarizer()
+    identity_cache.put(("t1", "web", "u1"), CachedIdentity(1, 7, "active"))
+    conversation = MagicMock(summary="Resumen previo.", summarized_until=None)
+
+    with (
+        patch("src.core.summarizer.crud.get_conversation", new=AsyncMock(return_value=conversation)),
+        patch("src.core.summarizer.crud.get_unsummarized_messages", new=AsyncMock(return_value=stored_messages(10))),
+        patch("src.core.summarizer.crud.save_conversation_summary", new=AsyncMock(return_value=True)) as save,
+    ):
+        summarizer.note_turn("t1", 7, new_messages=2, known_messages=10)
+        await summarizer.join()
+
+    previous, turns = llm.summarize.await_args.args
+    assert previous == "Resumen previo."
+    assert [t["content"] for t in turns] == [f"m{i}" for i in range(6)]
+    # Resumen nuevo hasta el id del último mensaje integrado, condicionado al estado leído
+    assert save.await_args.args[1:] == (7, "t1", "Cliente busca pHmetros.", 6, None)
+    assert summarizer.stats()["folded_messages"] == 6
+    # El siguiente turno debe releer la conversación (con el resumen nuevo)
+    assert identity_cache.get(("t1", "web", "u1")) is None
+
+
+@pytest.mark.asyncio
+async def test_resume_lo_que_queda_fuera_de_la_ventana():
+    summarizer, llm = make_summarizer()
+    conversation = MagicMock(summary=None, summarized_until=None)
+
+    # Conversación corta pero con mensajes largos: la ventana solo llevó 4 de los 6 mensajes
+    with (
+        patch("src.core.summarizer.crud.get_conversation", new=AsyncMock(return_value=conversation)),
+        patch("src.core.summarizer.crud.get_unsummarized_messages", new=AsyncMock(return_value=stored_messages(6))),
+        patch("src.core.summarizer.crud.save_conversation_summary", new=AsyncMock(return_value=True)),
+    ):
+        summarizer.note_turn("t1", 8, new_messages=2, known_messages=6, window_turns=6)
+        await summarizer.join()
+        assert llm.summarize.await_count == 0
+
+        summarizer.note_turn("t1", 9, new_messages=2, known_messages=6, window_turns=4)
+        await summarizer.join()
+
+    # Conserva la mitad de la ventana: el resumen se adelanta al próximo recorte
+    _, turns = llm.summarize.await_args.args
+    assert [t["content"] for t in turns] == ["m0", "m1", "m2", "m3"]
+
+
+@pytest.mark.asyncio
+async def test_fallo_del_llm_no_guarda_resumen():
+    summarizer, llm = make_summarizer(summary=None)
+
+    with (
+        patch("src.core.summarizer.crud.get_conversation", new=AsyncMock(return_value=MagicMock(summary=None, summarized_until=None))),
+        patch("src.core.summarizer.crud.get_unsummarized_messages", new=AsyncMock(return_value=stored_messages(10))),
+        patch("src.core.summarizer.crud.save_conversation_summary", new=AsyncMock()) as save,
+    ):
+        summarizer.note_turn("t1", 7, new_messages=2, known_messages=10)
+        await summarizer.join()
+
+    save.assert_not_awaited()
+    assert summarizer.stats()["failures"] == 1
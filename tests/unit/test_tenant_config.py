@@ -0,0 +1,129 @@
+"""
+Tests unitarios para TenantConfigStore (configuración del agente por tenant).
+
+Cubre:
+- Los tenants sin configuración usan SYSTEM_PROMPT y la temperatura por defecto
+- apply() compila el prefijo y solo notifica cuando la configuración cambia
+- refresh() trae únicamente las filas con updated_at nuevo
+- LLMEngine usa el prompt, el modelo y la temperatura del tenant
+- El modelo del tenant solo aplica a su proveedor
+- Un cambio vacía la caché de respuestas del tenant y ajusta su presupuesto de tokens
+"""
+import pytest
+from contextlib import asynccontextmanager
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+from src.core.context_builder import context_builder
+from src.core.llm import LLMEngine, SYSTEM_PROMPT
+from src.core.llm_router import LLMRouter, Provider, ProviderConfig
+from src.core.resilience import ResilientCaller
+from src.core.tenant_config import TenantConfigStore
+from tests.fakes.fake_openai_server import FakeOpenAIServer, Step
+
+CONTEXT = [{"role": "user", "content": "¿Tienen zapatos de seguridad?"}]
+
+
+@asynccontextmanager
+async def fake_session_factory():
+    yield AsyncMock()
+
+
+def make_row(tenant_id="shoes", updated_at=datetime(2026, 1, 1, 10, 0, 0), **values):
+    fields = {"system_prompt": None, "model": None, "provider": None, "temperature": None, "token_budget": None}
+    fields.update(values)
+    return SimpleNamespace(tenant_id=tenant_id, updated_at=updated_at, **fields)
+
+
+def make_provider(name, server):
+    resilience = ResilientCaller(deadline=2.0, attempt_timeout=1.0, max_attempts=1, hedge=False)
+    config = ProviderConfig(name=name, base_url=server.base_url, model=f"{name}-model")
+    return Provider(config, http_client=server.http_client(), resilience=resilience)
+
+
+def test_tenant_sin_configuracion_usa_los_valores_por_defecto():
+    store = TenantConfigStore(default_prompt=SYSTEM_PROMPT)
+    settings = store.get("desconocido")
+    assert settings.prefix == ({"role": "system", "content": SYSTEM_PROMPT},)
+    assert settings.temperature == 0.3
+    assert settings.model is None and settings.token_budget is None
+    assert settings.prefix_tokens > 0
+
+
+def test_apply_compila_el_prefijo_y_notifica_solo_cambios():
+    store = TenantConfigStore(default_prompt="base")
+    events = []
+    store.subscribe(lambda tenant_id, settings: events.append((tenant_id, settings.system_prompt)))
+
+    assert store.apply(make_row(system_prompt="Eres vendedor de zapatos.", temperature=0.7)) is True
+    settings = store.get("shoes")
+    assert settings.prefix[0]["content"] == "Eres vendedor de zapatos."
+    assert settings.temperature == 0.7
+    # La misma configuración otra vez: sin notificación
+    assert store.apply(make_row(system_prompt="Eres vendedor de zapatos.", temperature=0.7)) is False
+    # Volver a NULL recupera el valor por defecto
+    assert store.apply(make_row()) is True
+    assert store.get("shoes").system_prompt == "base"
+    assert events == [("shoes", "Eres vendedor de zapatos."), ("shoes", "base")]
+
+
+@pytest.mark.asyncio
+async def test_refresh_trae_solo_los_cambios_desde_el_ultimo_updated_at():
+    store = TenantConfigStore(default_prompt="base", session_factory=fake_session_factory)
+    first = [make_row("a", datetime(2026, 1, 1, 10, 0, 0), system_prompt="A"),
+             make_row("b", datetime(2026, 1, 1, 10, 0, 5), system_prompt="B")]
+
+    with patch("src.core.tenant_config.crud.get_tenant_configs", new=AsyncMock(side_effect=[first, first[1:]])) as get:
+        assert await store.refresh() == 2
+        # La fila con la marca del watermark vuelve (>=) pero no cuenta como cambio
+        assert await store.refresh() == 0
+
+    assert get.await_args_list[0].kwargs["updated_since"] is None
+    assert get.await_args_list[1].kwargs["updated_since"] == datetime(2026, 1, 1, 10, 0, 5)
+    assert store.get("a").system_prompt == "A"
+    assert store.stats()["configured_tenants"] == 2
+
+
+@pytest.mark.asyncio
+async def test_llm_engine_usa_la_configuracion_del_tenant():
+    server = FakeOpenAIServer(default=Step(content="Tenemos botas dieléctricas."))
+    engine = LLMEngine(providers=[ProviderConfig("fake", server.base_url, "fake-model")], http_client=server.http_client())
+    engine.tenant_configs.apply(make_row(system_prompt="Eres vendedor de zapatos.", model="shoes-model", temperature=0.9))
+
+    await engine.generate_response(CONTEXT, tenant_id="shoes")
+    await engine.generate_response(CONTEXT, tenant_id="otro")
+
+    shoes, other = server.requests
+    assert shoes["messages"][0] == {"role": "system", "content": "Eres vendedor de zapatos."}
+    assert shoes["model"] == "shoes-model" and shoes["temperature"] == 0.9
+    assert other["messages"][0]["content"] == SYSTEM_PROMPT
+    assert other["model"] == "fake-model" and other["temperature"] == 0.3
+
+
+@pytest.mark.asyncio
+async def test_el_modelo_del_tenant_solo_aplica_a_su_proveedor():
+    primary, local = FakeOpenAIServer(default=Step(status=500)), FakeOpenAIServer()
+    engine = LLMEngine(providers=[ProviderConfig("deepseek", primary.base_url, "deepseek-chat")])
+    engine.router = LLMRouter([make_provider("deepseek", primary), make_provider("local", local)], tenant_providers={}, explore=0.0)
+    engine.tenant_configs.apply(make_row(model="deepseek-reasoner"))
+
+    await engine.generate_response(CONTEXT, tenant_id="shoes")
+
+    assert primary.requests[0]["model"] == "deepseek-reasoner"
+    # Failover: el proveedor local recibe su propio modelo
+    assert local.requests[0]["model"] == "local-model"
+
+
+def test_un_cambio_invalida_la_cache_y_ajusta_el_presupuesto():
+    engine = LLMEngine(providers=[ProviderConfig("fake", "http://fake-llm", "fake-model")])
+    key = engine.response_cache.make_key("shoes", CONTEXT)
+    engine.response_cache.put(key, "respuesta con el prompt anterior")
+
+    engine.tenant_configs.apply(make_row(token_budget=900))
+    try:
+        assert engine.response_cache.get(key) is None
+        assert context_builder.budget_for("shoes") == 900
+    finally:
+        engine.tenant_configs.apply(make_row())
+    assert context_builder.budget_for("shoes") == context_builder.default_budget
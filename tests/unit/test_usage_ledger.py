@@ -0,0 +1,192 @@
+"""
+Tests unitarios para UsageLedger (registro por llamada al LLM en llm_calls).
+
+Cubre:
+- record() no toca la BD; flush() escribe en lotes de batch_size
+- Si la BD falla el lote vuelve al buffer, sin pasar de max_pending
+- shutdown() a mitad de un commit no pierde el lote en curso
+- LLMEngine registra latencia, tokens, modelo y resultado (ok / timeout / error)
+- Los aciertos de ResponseCache se registran con cached=True y cero tokens
+- daily_usage() arma el consumo diario desde las agregaciones SQL: totales por proveedor / modelo y
+  percentiles de latencia estimados con el histograma (sin los aciertos de caché)
+"""
+import asyncio
+
+import pytest
+from contextlib import asynccontextmanager
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+from src.core.admission import AdmissionController
+from src.core.llm import LLMEngine
+from src.core.llm_router import LLMRouter, Provider, ProviderConfig
+from src.core.resilience import ResilientCaller
+from src.core.usage_ledger import UsageLedger, daily_usage, top_conversations
+from tests.fakes.fake_openai_server import FakeOpenAIServer, Step
+
+CONTEXT = [{"role": "user", "content": "¿Tienen turbidímetros?"}]
+
+
+@asynccontextmanager
+async def fake_session_factory():
+    yield AsyncMock()
+
+
+def make_engine(server, **resilience):
+    policy = ResilientCaller(**{"deadline": 2.0, "attempt_timeout": 1.0, "max_attempts": 1, "hedge": False, **resilience})
+    provider = Provider(ProviderConfig("fake", server.base_url, "fake-model"), http_client=server.http_client(), resilience=policy)
+    engine = LLMEngine(providers=[ProviderConfig("fake", server.base_url, "fake-model")], http_client=server.http_client())
+    engine.router = LLMRouter([provider])
+    engine.response_cache.max_entries = 0
+    return engine
+
+
+def pending(ledger):
+    return list(ledger._pending)
+
+
+@pytest.mark.asyncio
+async def test_flush_escribe_en_lotes():
+    ledger = UsageLedger(session_factory=fake_session_factory, batch_size=2)
+    for _ in range(5):
+        ledger.record("t1", "reply", "ok", latency_ms=120)
+
+    with patch("src.core.usage_ledger.crud.add_llm_calls", new_callable=AsyncMock) as add:
+        assert await ledger.flush() == 5
+
+    assert [len(call.args[1]) for call in add.await_args_list] == [2, 2, 1]
+    assert ledger.stats()["written"] == 5 and ledger.stats()["pending"] == 0
+
+
+@pytest.mark.asyncio
+async def test_falla_de_bd_devuelve_el_lote():
+    ledger = UsageLedger(session_factory=fake_session_factory, batch_size=10, max_pending=3)
+    for latency in (1, 2, 3):
+        ledger.record("t1", "reply", "ok", latency_ms=latency)
+
+    with patch("src.core.usage_ledger.crud.add_llm_calls", new_callable=AsyncMock, side_effect=RuntimeError("BD caída")):
+        with pytest.raises(RuntimeError):
+            await ledger.flush()
+    assert [row["latency_ms"] for row in pending(ledger)] == [1, 2, 3]
+
+    # Buffer lleno: se descarta el registro más viejo
+    ledger.record("t1", "reply", "ok", latency_ms=4)
+    assert [row["latency_ms"] for row in pending(ledger)] == [2, 3, 4]
+    assert ledger.stats()["dropped"] == 1
+
+
+@pytest.mark.asyncio
+async def test_shutdown_durante_el_commit_no_pierde_el_lote():
+    ledger = UsageLedger(session_factory=fake_session_factory, batch_size=10, flush_seconds=0.01)
+    ledger.record("t1", "reply", "ok", latency_ms=1)
+    committing = asyncio.Event()
+
+    async def slow_insert(session, batch):
+        committing.set()
+        await asyncio.sleep(10)
+
+    with patch("src.core.usage_ledger.crud.add_llm_calls", new=slow_insert):
+        await ledger.start()
+        await committing.wait()
+        ledger._task.cancel()
+        await asyncio.gather(ledger._task, return_exceptions=True)
+        ledger._task = None
+    assert [row["latency_ms"] for row in pending(ledger)] == [1]
+
+    with patch("src.core.usage_ledger.crud.add_llm_calls", new_callable=AsyncMock) as add:
+        await ledger.shutdown()
+    assert len(add.await_args.args[1]) == 1 and ledger.stats()["pending"] == 0
+
+
+@pytest.mark.asyncio
+async def test_llm_engine_registra_cada_llamada():
+    server = FakeOpenAIServer(default=Step(content="Sí, tenemos turbidímetros portátiles."))
+    engine = make_engine(server)
+
+    await engine.generate_response(CONTEXT, tenant_id="t1", conversation_id=42)
+    [d async for d in engine.stream_response(CONTEXT, tenant_id="t1", conversation_id=42)]
+
+    reply, stream = pending(engine.ledger)
+    assert reply["kind"] == "reply" and stream["kind"] == "stream"
+    assert reply["outcome"] == "ok" and reply["conversation_id"] == 42
+    assert reply["provider"] == "fake" and reply["model"] == "fake-model"
+    assert reply["prompt_tokens"] > 0 and reply["completion_tokens"] > 0
+    assert stream["completion_tokens"] == reply["completion_tokens"]
+
+
+@pytest.mark.asyncio
+async def test_llm_engine_registra_timeout_y_error():
+    server = FakeOpenAIServer(default=Step(delay=0.5))
+    engine = make_engine(server, deadline=0.1, attempt_timeout=0.1)
+    await engine.generate_response(CONTEXT, tenant_id="t1")
+
+    engine.admission = AdmissionController(rpm=6, tpm=0, tenant_rpm={}, tenant_tpm={}, burst_seconds=1, deadline=0.05)
+    await engine.admission.acquire("t1", 1)
+    await engine.generate_response(CONTEXT, tenant_id="t1")
+
+    failing = make_engine(FakeOpenAIServer(default=Step(status=400)))
+    await failing.generate_response(CONTEXT, tenant_id="t1")
+
+    deadline, admission = pending(engine.ledger)
+    assert deadline["outcome"] == "timeout" and deadline["prompt_tokens"] is None
+    assert admission["outcome"] == "timeout" and admission["error_type"] == "AdmissionTimeoutError"
+    assert admission["provider"] is None
+    assert admission["latency_ms"] >= 50
+    [error] = pending(failing.ledger)
+    assert error["outcome"] == "error" and error["error_type"] == "BadRequestError"
+
+
+@pytest.mark.asyncio
+async def test_acierto_de_cache_se_registra_sin_tokens():
+    server = FakeOpenAIServer(default=Step(content="Sí, tenemos turbidímetros portátiles."))
+    engine = make_engine(server)
+    engine.response_cache.max_entries = 10
+
+    await engine.generate_response(CONTEXT, tenant_id="t1", conversation_id=1)
+    await engine.generate_response(CONTEXT, tenant_id="t1", conversation_id=2)
+    [d async for d in engine.stream_response(CONTEXT, tenant_id="t1", conversation_id=3)]
+
+    miss, hit, stream_hit = pending(engine.ledger)
+    assert not miss["cached"] and miss["prompt_tokens"] > 0
+    assert hit["cached"] and stream_hit["cached"] and stream_hit["kind"] == "stream"
+    assert (hit["outcome"], hit["conversation_id"], hit["provider"]) == ("ok", 2, None)
+    assert hit["prompt_tokens"] == hit["completion_tokens"] == hit["cache_hit_tokens"] == 0
+    assert len(server.requests) == 1
+
+
+def test_agregacion_diaria_y_top_conversaciones():
+    def group(day, provider, calls, ok, timeout=0, cached=0, latency_avg=500.0, latency_max=1000):
+        return SimpleNamespace(
+            day=f"2026-10-{day}", provider=provider, model=f"{provider}-model" if provider else None,
+            calls=calls, ok=ok, timeout=timeout, cached=cached, prompt_tokens=100 * (calls - cached),
+            completion_tokens=10 * (calls - cached), cache_hit_tokens=0,
+            latency_ms_avg=latency_avg, latency_ms_max=latency_max,
+        )
+
+    def bucket(day, index, calls):
+        return SimpleNamespace(day=f"2026-10-{day}", bucket=index, calls=calls)
+
+    bounds = (250, 500, 1000, 2000)
+    groups = [
+        group(17, "deepseek", 18, 18, latency_avg=1000.0, latency_max=1900),
+        group(17, "openai", 2, 1, timeout=1, latency_avg=2500.0, latency_max=3000),
+        group(17, None, 1, 1, cached=1, latency_avg=None, latency_max=None),  # acierto de caché
+        group(18, "deepseek", 1, 0, latency_avg=200.0, latency_max=200),
+    ]
+    # 17: 20 llamadas al proveedor; la 10ª cae en <= 1000 ms y la 19ª por encima de 2000 ms
+    histogram = [bucket(17, 0, 2), bucket(17, 2, 8), bucket(17, 3, 8), bucket(17, 4, 2), bucket(18, 0, 1)]
+
+    first, second = daily_usage(groups, histogram, bounds)
+    assert first["date"] == "2026-10-17" and first["calls"] == 21 and first["cached"] == 1
+    assert (first["ok"], first["timeout"], first["error"]) == (20, 1, 0)
+    assert first["prompt_tokens"] == 2000
+    assert first["latency_ms_avg"] == 1150  # (18 * 1000 + 2 * 2500) / 20: sin el acierto de caché
+    assert (first["latency_ms_p50"], first["latency_ms_p95"], first["latency_ms_max"]) == (1000, 3000, 3000)
+    assert [m["provider"] for m in first["models"]] == ["deepseek", "openai", None]
+    assert first["models"][1]["timeout"] == 1 and first["models"][1]["model"] == "openai-model"
+    # Con una sola llamada el percentil no pasa del máximo real (el bucket llega a 250)
+    assert (second["error"], second["latency_ms_p50"], second["latency_ms_p95"]) == (1, 200, 200)
+
+    top = top_conversations([SimpleNamespace(conversation_id=2, calls=1, tokens=5010, latency_ms=300)])
+    assert top == [{"conversation_id": 2, "calls": 1, "tokens": 5010, "latency_ms": 300}]
@@ -0,0 +1,90 @@
+"""
+Tests unitarios para UsageMeter y el armado del prompt con prefijo estable.
+
+Cubre:
+- read_usage() con el formato de DeepSeek y con el de OpenAI
+- Acumulado por tenant y por proveedor con su cache_hit_ratio
+- LLMEngine registra el usage con y sin streaming
+- Un segundo turno de la misma conversación reutiliza el prefijo del primero
+- Los mensajes se reducen a role y content en orden fijo
+"""
+import pytest
+
+from src.core.llm import LLMEngine
+from src.core.llm_router import ProviderConfig
+from src.core.usage_meter import UsageMeter, read_usage
+from tests.fakes.fake_openai_server import FakeOpenAIServer, Step
+
+
+def make_engine(server):
+    engine = LLMEngine(providers=[ProviderConfig("fake", server.base_url, "fake-model")], http_client=server.http_client())
+    engine.response_cache.max_entries = 0
+    return engine
+
+
+def test_read_usage_deepseek_y_openai():
+    assert read_usage({"prompt_tokens": 100, "completion_tokens": 7, "prompt_cache_hit_tokens": 64}) == {
+        "prompt_tokens": 100, "completion_tokens": 7, "cache_hit_tokens": 64, "cache_miss_tokens": 36,
+    }
+    openai_style = {"prompt_tokens": 50, "completion_tokens": 3, "prompt_tokens_details": {"cached_tokens": 32}}
+    assert read_usage(openai_style)["cache_hit_tokens"] == 32
+    assert read_usage({"prompt_tokens": 10})["cache_hit_tokens"] == 0
+    assert read_usage(None) is None
+
+
+def test_acumula_por_tenant_y_proveedor():
+    meter = UsageMeter()
+    meter.record("t1", "deepseek", {"prompt_tokens": 100, "completion_tokens": 5, "prompt_cache_hit_tokens": 80})
+    meter.record("t1", "deepseek", {"prompt_tokens": 100, "completion_tokens": 5, "prompt_cache_hit_tokens": 0})
+    meter.record("t2", "local", None)
+
+    stats = meter.stats()
+    assert stats["tenants"]["t1"]["calls"] == 2
+    assert stats["tenants"]["t1"]["cache_hit_ratio"] == 0.4
+    assert stats["providers"]["deepseek"]["completion_tokens"] == 10
+    assert stats["missing_usage"] == 1
+    assert "t2" not in stats["tenants"]
+
+
+@pytest.mark.asyncio
+async def test_registra_usage_con_y_sin_streaming():
+    server = FakeOpenAIServer(default=Step(content="Tenemos varios modelos de pHmetros."))
+    engine = make_engine(server)
+
+    await engine.generate_response([{"role": "user", "content": "¿Tienen pHmetros?"}], tenant_id="t1")
+    deltas = [d async for d in engine.stream_response([{"role": "user", "content": "¿Y conductímetros?"}], tenant_id="t1")]
+
+    assert "".join(deltas) == "Tenemos varios modelos de pHmetros."
+    assert server.requests[1]["stream_options"] == {"include_usage": True}
+    stats = engine.usage.stats()["tenants"]["t1"]
+    assert stats["calls"] == 2
+    assert stats["completion_tokens"] == 10
+
+
+@pytest.mark.asyncio
+async def test_el_segundo_turno_reutiliza_el_prefijo():
+    server = FakeOpenAIServer(default=Step(content="Claro, tenemos turbidímetros portátiles y de laboratorio."))
+    engine = make_engine(server)
+    first_turn = [{"role": "user", "content": "Buenos días, necesito un turbidímetro para agua potable."}]
+    answer = await engine.generate_response(first_turn, tenant_id="t1")
+    first_prompt_tokens = engine.usage.stats()["tenants"]["t1"]["prompt_tokens"]
+    second_turn = first_turn + [
+        {"role": "assistant", "content": answer},
+        {"role": "user", "content": "¿Cuál recomiendan para campo?"},
+    ]
+
+    await engine.generate_response(second_turn, tenant_id="t1")
+
+    stats = engine.usage.stats()["tenants"]["t1"]
+    # El system prompt y el primer turno vuelven byte a byte: el proveedor los sirve desde caché
+    assert stats["cache_hit_tokens"] >= first_prompt_tokens * 0.9
+    assert server.requests[1]["messages"][:2] == server.requests[0]["messages"]
+
+
+def test_layout_normaliza_los_mensajes():
+    engine = LLMEngine(providers=[ProviderConfig("fake", "http://fake-llm", "fake-model")])
+    settings = engine.tenant_configs.get("t1")
+    messages = engine._layout(settings, [{"content": "hola", "role": "user", "id": 9}])
+
+    assert messages[0] is settings.prefix[0]
+    assert list(messages[1].items()) == [("role", "user"), ("content", "hola")]
@@ -0,0 +1,61 @@
+"""
+Tests unitarios para stream_to_web_client() en main.py.
+
+Cubre:
+- Los deltas del LLM se reenvían al widget y se ensambla el texto completo
+- La señal [HANDOFF_REQUESTED] nunca llega al widget (aunque venga partida en deltas)
+- Trigger A (usuario pide asesor) suprime el streaming
+"""
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from src.main import stream_to_web_client
+from src.models.message import IncomingMessage
+
+
+def make_message(content="¿tienen balanzas?"):
+    return IncomingMessage(platform="web", platform_user_id="web_1", tenant_id="t1", content=content)
+
+
+def fake_stream(*deltas):
+    async def stream_response(context, tenant_id="default", conversation_id=None):
+        for delta in deltas:
+            yield delta
+    return stream_response
+
+
+async def run(deltas, user_text="¿tienen balanzas?"):
+    with (
+        patch("src.main.llm_engine.stream_response", fake_stream(*deltas)),
+        patch("src.main.connection_manager.send_stream_delta", new_callable=AsyncMock) as mock_delta,
+    ):
+        full_text = await stream_to_web_client(make_message(user_text), [], user_text)
+    sent = [call.args[1] for call in mock_delta.await_args_list]
+    return full_text, sent
+
+
+@pytest.mark.asyncio
+async def test_reenvia_deltas_y_ensambla_texto():
+    full_text, sent = await run(["Sí, ", "tenemos ", "balanzas OHAUS."])
+    assert full_text == "Sí, tenemos balanzas OHAUS."
+    assert sent == ["Sí, ", "tenemos ", "balanzas OHAUS."]
+
+
+@pytest.mark.asyncio
+async def test_senal_de_handoff_partida_no_llega_al_widget():
+    full_text, sent = await run(["[HAND", "OFF_REQUESTED]", " Un asesor ", "te contactará."])
+    assert full_text.startswith("[HANDOFF_REQUESTED]")
+    assert sent == []
+
+
+@pytest.mark.asyncio
+async def test_prefijo_parecido_a_la_senal_se_libera():
+    full_text, sent = await run(["[", "Nota] hola"])
+    assert "".join(sent) == "[Nota] hola"
+
+
+@pytest.mark.asyncio
+async def test_trigger_a_suprime_el_streaming():
+    full_text, sent = await run(["Claro, ", "te ayudo."], user_text="quiero un asesor")
+    assert full_text == "Claro, te ayudo."
+    assert sent == []
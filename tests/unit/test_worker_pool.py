@@ -0,0 +1,117 @@
+"""
+Tests unitarios para ConversationWorkerPool.
+
+Cubre:
+- Orden FIFO estricto dentro de una misma conversación
+- Paralelismo entre conversaciones distintas
+- Techo de concurrencia global
+- Métricas in_flight / waiting
+- Un trabajo que falla no detiene el carril
+"""
+import asyncio
+
+import pytest
+
+from src.core.worker_pool import ConversationWorkerPool, conversation_key
+from src.models.message import IncomingMessage
+
+
+def make_job(log, label, delay=0.0, gate=None):
+    async def job():
+        if gate is not None:
+            await gate.wait()
+        await asyncio.sleep(delay)
+        log.append(label)
+    return job
+
+
+def test_conversation_key_usa_tenant_platform_y_usuario():
+    msg = IncomingMessage(platform="telegram", platform_user_id="42", tenant_id="t1", content="hola")
+    assert conversation_key(msg) == ("t1", "telegram", "42")
+
+
+@pytest.mark.asyncio
+async def test_orden_fifo_por_conversacion():
+    """El segundo mensaje del mismo usuario espera al primero aunque sea más rápido."""
+    pool = ConversationWorkerPool(max_concurrency=4)
+    log = []
+
+    await pool.submit("u1", make_job(log, "m1", delay=0.05))
+    await pool.submit("u1", make_job(log, "m2", delay=0.0))
+    await pool.submit("u1", make_job(log, "m3", delay=0.0))
+    await pool.join()
+
+    assert log == ["m1", "m2", "m3"]
+
+
+@pytest.mark.asyncio
+async def test_conversaciones_distintas_corren_en_paralelo():
+    pool = ConversationWorkerPool(max_concurrency=4)
+    log = []
+
+    await pool.submit("lento", make_job(log, "lento", delay=0.05))
+    await pool.submit("rapido", make_job(log, "rapido", delay=0.0))
+    await pool.join()
+
+    assert log == ["rapido", "lento"]
+
+
+@pytest.mark.asyncio
+async def test_techo_de_concurrencia_y_metricas():
+    pool = ConversationWorkerPool(max_concurrency=2)
+    gate = asyncio.Event()
+    log = []
+
+    for i in range(5):
+        await pool.submit(f"u{i}", make_job(log, i, gate=gate))
+    await asyncio.sleep(0.01)
+
+    assert pool.in_flight == 2
+    assert pool.waiting == 3
+    stats = pool.stats()
+    assert stats["active_conversations"] == 5
+    assert stats["max_concurrency"] == 2
+
+    gate.set()
+    await pool.join()
+
+    assert sorted(log) == [0, 1, 2, 3, 4]
+    assert pool.in_flight == 0
+    assert pool.waiting == 0
+    assert pool.stats()["completed"] == 5
+
+
+@pytest.mark.asyncio
+async def test_trabajo_fallido_no_bloquea_el_carril():
+    pool = ConversationWorkerPool(max_concurrency=1)
+    log = []
+
+    async def boom():
+        raise RuntimeError("falla del LLM")
+
+    await pool.submit("u1", boom)
+    await pool.submit("u1", make_job(log, "siguiente"))
+    await pool.join()
+
+    assert log == ["siguiente"]
+    assert pool.stats()["failed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_submit_bloquea_cuando_se_alcanza_max_pending():
+    pool = ConversationWorkerPool(max_concurrency=1, max_pending=1)
+    gate = asyncio.Event()
+    log = []
+
+    await pool.submit("u1", make_job(log, "a", gate=gate))
+    await asyncio.sleep(0)  # "a" toma el único cupo → waiting vuelve a 0
+    await pool.submit("u2", make_job(log, "b"))
+
+    blocked = asyncio.create_task(pool.submit("u3", make_job(log, "c")))
+    await asyncio.sleep(0.01)
+    assert not blocked.done()
+
+    gate.set()
+    await blocked
+    await pool.join()
+    assert sorted(log) == ["a", "b", "c"]